@@ -1,9 +1,10 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS, cross_origin
 import snowflake.connector
 
 from Modules.CourseMaterials import uploadCourseMaterial
-from credentials import get_db_connection
+from ConnectionPool import get_pool, get_pooled_connection, pooled_connection, pool_metrics
+from Modules.MessageLogger import message_logger_metrics
 
 TESTING = False
 
@@ -11,9 +12,28 @@ from Modules.Users import register
 from Modules.Courses import newCourse
 from Modules.Courses import registerUserForCourse
 from Modules.ChatGPT import create_blank_conversation, get_user_conversation, ingest_pdf_to_snowflake, ingest_pptx_to_snowflake, start_new_thread
-from Modules.ChatGPT import ask_question, generate_quiz
+from Modules.ChatGPT import ask_question
+from Modules.LLMEndpoints import (
+    handle_send_message, handle_send_message_stream, handle_generate_quiz, handle_start_quiz_session,
+    handle_quiz_session, handle_quiz_session_stream, handle_explain_page, handle_assignment_helper, handle_generate_exam
+)
 from Modules.Auth import login_user, register_user, validate_session, delete_session
 from Modules.CanvasAPI import sync_course_materials
+from Modules.Ingestion import bulk_insert_materials, material_row
+from Modules.Progress import record_attempt, get_progress as get_user_progress
+from Modules.Insights import get_insights as get_course_insights, invalidate_insights
+from Modules.ConversationPool import claim_conversation, conversation_pool_metrics
+from Modules.MaterialEvents import materials_changed
+from Modules.SearchIndex import search_index_metrics
+from Modules.RetrievalCache import retrieval_cache_metrics
+from Modules.PromptBudget import prompt_budget_metrics
+from Modules.AnswerCache import answer_cache_metrics
+from Modules.CompletionCache import completion_cache_metrics
+from Modules.QuizBank import quiz_bank_metrics
+from Modules.ExamGenerator import exam_metrics
+from Modules.Cortex import llm_metrics, router_metrics
+from Modules.SingleFlight import single_flight_metrics
+from Modules.QuizSessions import quiz_session_metrics
 from InitDatabase import clean_database
 
 app = Flask(__name__)
@@ -32,12 +52,10 @@ def register_endpoint():
     if not all([canvas_id, name, email, password]):
         return jsonify({"success": False, "message": "Missing required fields"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
-    success, message, user_id = register_user(canvas_id, name, email, password, connection)
-    connection.close()
+    with pooled_connection() as connection:
+        if not connection:
+            return jsonify({"success": False, "message": "Database connection error"}), 500
+        success, message, user_id = register_user(canvas_id, name, email, password, connection)
 
     if success:
         return jsonify({"success": True, "message": message, "userId": user_id}), 201
@@ -54,12 +72,10 @@ def login_endpoint():
     if not canvas_id or not password:
         return jsonify({"success": False, "message": "Missing canvasId or password"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
-    success, message, user_id, session_token = login_user(canvas_id, password, connection)
-    connection.close()
+    with pooled_connection() as connection:
+        if not connection:
+            return jsonify({"success": False, "message": "Database connection error"}), 500
+        success, message, user_id, session_token = login_user(canvas_id, password, connection)
 
     if success:
         return jsonify({
@@ -120,23 +136,21 @@ def sync_materials_endpoint():
     if not course_id or not canvas_token:
         return jsonify({"success": False, "message": "Missing courseID or canvasToken"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
     # Define material ingestion functions
     material_funcs = {
         'pdf': ingest_pdf_to_snowflake,
         'pptx': ingest_pptx_to_snowflake
     }
 
-    success, message, stats = sync_course_materials(
-        course_id,
-        canvas_token,
-        connection,
-        material_funcs
-    )
-    connection.close()
+    with pooled_connection() as connection:
+        if not connection:
+            return jsonify({"success": False, "message": "Database connection error"}), 500
+        success, message, stats = sync_course_materials(
+            course_id,
+            canvas_token,
+            connection,
+            material_funcs
+        )
 
     if success:
         return jsonify({
@@ -167,22 +181,12 @@ def sync_page_content_endpoint():
     if len(content) < 50:
         return jsonify({"success": False, "message": "Content too short to be meaningful"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
     try:
-        cursor = connection.cursor()
-
-        # Store scraped content as course material
-        cursor.execute("""
-            INSERT INTO course_materials (course_id, title, content, source_url)
-            VALUES (%s, %s, %s, %s)
-        """, (course_id, page_title, content, page_url))
-
-        connection.commit()
-        cursor.close()
-        connection.close()
+        with pooled_connection() as connection:
+            if not connection:
+                return jsonify({"success": False, "message": "Database connection error"}), 500
+            # Store scraped content as course material
+            bulk_insert_materials(course_id, [material_row(page_title, content, source_url=page_url)], connection)
 
         return jsonify({
             "success": True,
@@ -191,7 +195,6 @@ def sync_page_content_endpoint():
         }), 200
 
     except Exception as e:
-        connection.close()
         return jsonify({
             "success": False,
             "message": f"Database error: {str(e)}"
@@ -207,23 +210,22 @@ def get_materials_endpoint():
         if not course_id:
             return jsonify({"success": False, "message": "Course ID is required"}), 400
 
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"success": False, "message": "Database connection error"}), 500
+        with pooled_connection() as connection:
+            if not connection:
+                return jsonify({"success": False, "message": "Database connection error"}), 500
 
-        cursor = connection.cursor()
-        # OPTIMIZATION: Limit to 100 most recent materials for faster loading
-        cursor.execute("""
-            SELECT material_id, title, created_at
-            FROM course_materials
-            WHERE course_id = %s
-            ORDER BY created_at DESC
-            LIMIT 100
-        """, (course_id,))
-
-        materials = cursor.fetchall()
-        cursor.close()
-        connection.close()
+            cursor = connection.cursor()
+            # OPTIMIZATION: Limit to 100 most recent materials for faster loading
+            cursor.execute("""
+                SELECT material_id, title, created_at
+                FROM course_materials
+                WHERE course_id = %s
+                ORDER BY created_at DESC
+                LIMIT 100
+            """, (course_id,))
+
+            materials = cursor.fetchall()
+            cursor.close()
 
         # OPTIMIZATION: Use list comprehension for faster processing
         materials_list = [
@@ -258,25 +260,30 @@ def delete_material_endpoint():
         if not material_id:
             return jsonify({"success": False, "message": "Material ID is required"}), 400
 
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"success": False, "message": "Database connection error"}), 500
+        with pooled_connection() as connection:
+            if not connection:
+                return jsonify({"success": False, "message": "Database connection error"}), 500
 
-        cursor = connection.cursor()
+            cursor = connection.cursor()
 
-        # Delete material from course_materials table
-        cursor.execute("""
-            DELETE FROM course_materials
-            WHERE material_id = %s
-        """, (material_id,))
+            # Look up the course first so its derived state (baseline context etc.) can be refreshed
+            cursor.execute("SELECT course_id FROM course_materials WHERE material_id = %s", (material_id,))
+            row = cursor.fetchone()
 
-        connection.commit()
-        deleted_count = cursor.rowcount
+            # Delete material from course_materials table (and its chunks)
+            cursor.execute("DELETE FROM course_material_chunks WHERE material_id = %s", (material_id,))
+            cursor.execute("""
+                DELETE FROM course_materials
+                WHERE material_id = %s
+            """, (material_id,))
 
-        cursor.close()
-        connection.close()
+            connection.commit()
+            deleted_count = cursor.rowcount
+
+            cursor.close()
 
         if deleted_count > 0:
+            materials_changed(row[0] if row else None, removed=[material_id])
             return jsonify({
                 "success": True,
                 "message": "Material deleted successfully"
@@ -304,23 +311,25 @@ def delete_all_materials_endpoint():
         if not course_id:
             return jsonify({"success": False, "message": "Course ID is required"}), 400
 
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"success": False, "message": "Database connection error"}), 500
+        with pooled_connection() as connection:
+            if not connection:
+                return jsonify({"success": False, "message": "Database connection error"}), 500
 
-        cursor = connection.cursor()
+            cursor = connection.cursor()
 
-        # Delete all materials for this course
-        cursor.execute("""
-            DELETE FROM course_materials
-            WHERE course_id = %s
-        """, (course_id,))
+            # Delete all materials for this course (and their chunks)
+            cursor.execute("DELETE FROM course_material_chunks WHERE course_id = %s", (course_id,))
+            cursor.execute("""
+                DELETE FROM course_materials
+                WHERE course_id = %s
+            """, (course_id,))
 
-        connection.commit()
-        deleted_count = cursor.rowcount
+            connection.commit()
+            deleted_count = cursor.rowcount
 
-        cursor.close()
-        connection.close()
+            cursor.close()
+
+        materials_changed(course_id, cleared=True)
 
         return jsonify({
             "success": True,
@@ -368,19 +377,12 @@ def upload_pdf_endpoint():
         temp_path = os.path.join(temp_dir, file.filename)
         file.save(temp_path)
 
-        # Get database connection
-        connection = get_db_connection()
-        if not connection:
-            os.remove(temp_path)
-            return jsonify({"success": False, "message": "Database connection error"}), 500
-
         # Ingest PDF to Snowflake
         try:
-            success, message, error = ingest_pdf_to_snowflake(temp_path, course_id, connection)
-
-            # Clean up temp file
-            os.remove(temp_path)
-            connection.close()
+            with pooled_connection() as connection:
+                if not connection:
+                    return jsonify({"success": False, "message": "Database connection error"}), 500
+                success, message, error = ingest_pdf_to_snowflake(temp_path, course_id, connection)
 
             if success:
                 return jsonify({
@@ -396,12 +398,13 @@ def upload_pdf_endpoint():
                 }), 500
 
         except Exception as e:
-            os.remove(temp_path)
-            connection.close()
             return jsonify({
                 "success": False,
                 "message": f"Error processing PDF: {str(e)}"
             }), 500
+        finally:
+            # Clean up temp file
+            os.remove(temp_path)
 
     except Exception as e:
         return jsonify({
@@ -412,21 +415,21 @@ def upload_pdf_endpoint():
 @app.route('/register', methods=['POST'])
 @cross_origin()
 def register2():
-    connection = get_db_connection()
-    if not connection:
-        print("Database connection error")
-        return False, "Database connection error", 500
-    status, message, error = register(1, "John Doe","email", "password", connection)
+    with pooled_connection() as connection:
+        if not connection:
+            print("Database connection error")
+            return False, "Database connection error", 500
+        status, message, error = register(1, "John Doe","email", "password", connection)
     print(message)
     
 @app.route('/newCourse', methods=['POST'])
 @cross_origin()
 def newCourse2():
-    connection = get_db_connection()
-    if not connection:
-        print("Database connection error")
-        return False, "Database connection error", 500
-    status, message, error = newCourse(231849, "434: Computer Networks", connection)
+    with pooled_connection() as connection:
+        if not connection:
+            print("Database connection error")
+            return False, "Database connection error", 500
+        status, message, error = newCourse(231849, "434: Computer Networks", connection)
     print(message)
     
 # New conversation endpoint (API prefix)
@@ -440,13 +443,11 @@ def new_conversation_api():
     if not userID or not courseID:
         return jsonify({"success": False, "message": "Missing userID or courseID"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
-    convID = create_blank_conversation(courseID, connection)
-    status, message, convID = start_new_thread(userID, courseID, connection)
-    connection.close()
+    with pooled_connection() as connection:
+        if not connection:
+            return jsonify({"success": False, "message": "Database connection error"}), 500
+        # Claim a preloaded conversation; the pool refills itself in the background
+        status, message, convID = claim_conversation(userID, courseID, connection)
 
     print(message)
     print("Assigned conversation ID:", convID)
@@ -469,62 +470,27 @@ def grab_quiz_question():
     userID = data.get("userID")
     quizID = data.get("quizID")
     
-    connection = get_db_connection()
+    connection = get_pooled_connection()
     
 # Send message endpoint (API prefix)
 @app.route('/api/sendMessage', methods=['POST'])
 @cross_origin()
 def send_message_api():
-    data = request.get_json()
-
-    # Extract values from frontend request
-    userID = data.get("userID")
-    courseID = data.get("courseID")
-    question = data.get("question")
+    payload, code = handle_send_message(request.get_json())
+    return jsonify(payload), code
 
-    if not userID or not question or not courseID:
-        return jsonify({"success": False, "message": "Missing userID, question, or courseID"}), 400
-
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
-    status, message, response_data = ask_question(
-        userID,
-        courseID,
-        question,
-        connection
-    )
-    connection.close()
-
-    print(message)
-    print(question)
-
-    # Check if grounded (has citations)
-    grounded = False
-    if status and isinstance(response_data, dict):
-        citations = response_data.get("citations", [])
-        grounded = len(citations) > 0
-
-        print("Answer:", response_data.get("answer"))
-        print("Citations:", citations)
-        print("Grounded:", grounded)
-
-        return jsonify({
-            "success": status,
-            "message": message,
-            "answer": response_data.get("answer"),
-            "citations": citations,
-            "grounded": grounded
-        }), 200
-    else:
-        # Fallback for error cases
-        return jsonify({
-            "success": status,
-            "message": message,
-            "answer": response_data if isinstance(response_data, str) else "",
-            "grounded": False
-        }), 200
+# Streaming variant: server-sent events with the answer as it is generated
+@app.route('/api/sendMessage/stream', methods=['POST'])
+@cross_origin()
+def send_message_stream_api():
+    events, error = handle_send_message_stream(request.get_json())
+    if error:
+        payload, code = error
+        return jsonify(payload), code
+    return Response(events, mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # don't let a reverse proxy buffer the stream
+    })
 
 # OLD ROUTE - Deprecated (kept for backwards compatibility)
 @app.route('/sendMessage', methods=['POST'])
@@ -537,44 +503,35 @@ def sendMessage():
 @app.route('/api/generateQuiz', methods=['POST'])
 @cross_origin()
 def generate_quiz_api():
-    data = request.get_json()
-
-    # Extract values from frontend request
-    courseID = data.get("courseID")
-    topic = data.get("topic", "General Course Review")
-    difficulty = data.get("difficulty", "Intermediate")
-    num_questions = data.get("numQuestions", 5)  # Default to 5 for faster generation
-    material_id = data.get("materialId")  # NEW: Get specific material ID
-
-    print(f"DEBUG API: courseID={courseID}, topic={topic}, material_id={material_id}, num_questions={num_questions}")
+    payload, code = handle_generate_quiz(request.get_json())
+    return jsonify(payload), code
 
-    if not courseID:
-        return jsonify({"success": False, "message": "Missing courseID"}), 400
-
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
-    status, message, quiz_data = generate_quiz(
-        courseID,
-        topic,
-        difficulty,
-        num_questions,
-        connection,
-        None,        # model - use default
-        material_id  # NEW: Pass material ID to generate_quiz from specific material
-    )
-    connection.close()
+# Progressive quiz: starts generation and returns a session id at once
+@app.route('/api/quizSession', methods=['POST'])
+@cross_origin()
+def start_quiz_session_api():
+    payload, code = handle_start_quiz_session(request.get_json())
+    return jsonify(payload), code
 
-    print(message)
-    if status:
-        print(f"Generated quiz: {quiz_data['title']}")
+# Long-poll for a quiz session's questions (?after=<questions held>&wait=<seconds>)
+@app.route('/api/quizSession/<session_id>', methods=['GET'])
+@cross_origin()
+def quiz_session_api(session_id):
+    payload, code = handle_quiz_session(session_id, request.args)
+    return jsonify(payload), code
 
-    return jsonify({
-        "success": status,
-        "message": message,
-        "quiz": quiz_data
-    }), 200 if status else 500
+# Server-sent events: each question of a quiz session as it is generated
+@app.route('/api/quizSession/<session_id>/stream', methods=['GET'])
+@cross_origin()
+def quiz_session_stream_api(session_id):
+    events, error = handle_quiz_session_stream(session_id, request.args)
+    if error:
+        payload, code = error
+        return jsonify(payload), code
+    return Response(events, mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 # OLD ROUTE - Deprecated (kept for backwards compatibility)
 @app.route('/generateQuiz', methods=['POST'])
@@ -595,27 +552,30 @@ def log_quiz_attempt():
     correct_option = data.get("correctOption")
     is_correct = data.get("isCorrect")
     quiz_title = data.get("quizTitle", "Unknown Quiz")
+    question_id = data.get("questionId")  # set for quiz-bank questions (Modules/QuizBank.py)
 
     if not all([user_id, question_text, selected_option is not None, is_correct is not None]):
         return jsonify({"success": False, "message": "Missing required fields"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
     try:
-        cursor = connection.cursor()
+        with pooled_connection() as connection:
+            if not connection:
+                return jsonify({"success": False, "message": "Database connection error"}), 500
 
-        # Store quiz attempt with course_id
-        cursor.execute("""
-            INSERT INTO user_quiz_attempts
-            (user_id, course_id, question_text, quiz_title, selected_option, correct_option, is_correct)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (user_id, course_id, question_text, quiz_title, selected_option, correct_option, is_correct))
+            cursor = connection.cursor()
 
-        connection.commit()
-        cursor.close()
-        connection.close()
+            # Store quiz attempt with course_id
+            cursor.execute("""
+                INSERT INTO user_quiz_attempts
+                (user_id, course_id, question_id, question_text, quiz_title, selected_option, correct_option, is_correct)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (user_id, course_id, question_id, question_text, quiz_title, selected_option, correct_option, is_correct))
+
+            # Keep /api/progress aggregates current (commits together with the attempt)
+            record_attempt(user_id, quiz_title, is_correct, connection)
+            invalidate_insights(course_id)
+
+            cursor.close()
 
         return jsonify({
             "success": True,
@@ -623,7 +583,6 @@ def log_quiz_attempt():
         }), 200
 
     except Exception as e:
-        connection.close()
         return jsonify({
             "success": False,
             "message": f"Database error: {str(e)}"
@@ -639,102 +598,19 @@ def get_progress():
     if not user_id:
         return jsonify({"success": False, "message": "Missing userID"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
     try:
-        cursor = connection.cursor()
-
-        # Get total quiz attempts (with error handling for missing table)
-        try:
-            cursor.execute("""
-                SELECT COUNT(*) FROM user_quiz_attempts WHERE user_id = %s
-            """, (user_id,))
-            total_attempts = cursor.fetchone()[0] or 0
-        except:
-            total_attempts = 0
-
-        # Get correct answers
-        try:
-            cursor.execute("""
-                SELECT COUNT(*) FROM user_quiz_attempts
-                WHERE user_id = %s AND is_correct = TRUE
-            """, (user_id,))
-            correct_answers = cursor.fetchone()[0] or 0
-        except:
-            correct_answers = 0
-
-        # Calculate accuracy
-        accuracy = (correct_answers / total_attempts * 100) if total_attempts > 0 else 0
-
-        # Calculate streak (consecutive days with quiz activity)
-        streak = 0
-        quiz_stats = []
-
-        try:
-            cursor.execute("""
-                SELECT DISTINCT DATE(created_at) as quiz_date
-                FROM user_quiz_attempts
-                WHERE user_id = %s
-                ORDER BY quiz_date DESC
-                LIMIT 30
-            """, (user_id,))
-            quiz_dates = cursor.fetchall()
-
-            if quiz_dates:
-                from datetime import datetime, timedelta
-                today = datetime.now().date()
-                current_date = today
-
-                for (quiz_date,) in quiz_dates:
-                    if quiz_date == current_date or quiz_date == current_date - timedelta(days=1):
-                        streak += 1
-                        current_date = quiz_date - timedelta(days=1)
-                    else:
-                        break
-        except:
-            pass
-
-        # Get quiz completion by title
-        try:
-            cursor.execute("""
-                SELECT quiz_title, COUNT(*) as questions_answered,
-                       SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct_count
-                FROM user_quiz_attempts
-                WHERE user_id = %s
-                GROUP BY quiz_title
-            """, (user_id,))
-            quiz_stats = cursor.fetchall()
-        except:
-            quiz_stats = []
-
-        quizzes_completed = len(quiz_stats)
-
-        cursor.close()
-        connection.close()
+        with pooled_connection() as connection:
+            if not connection:
+                return jsonify({"success": False, "message": "Database connection error"}), 500
+            # O(1) keyed lookup of incrementally maintained aggregates (see Modules/Progress.py)
+            progress = get_user_progress(user_id, connection)
 
         return jsonify({
             "success": True,
-            "progress": {
-                "totalAttempts": total_attempts,
-                "correctAnswers": correct_answers,
-                "accuracy": round(accuracy, 1),
-                "streak": streak,
-                "quizzesCompleted": quizzes_completed,
-                "quizStats": [
-                    {
-                        "title": title,
-                        "questionsAnswered": questions,
-                        "correctCount": correct
-                    }
-                    for title, questions, correct in quiz_stats
-                ]
-            }
+            "progress": progress
         }), 200
 
     except Exception as e:
-        connection.close()
         return jsonify({
             "success": False,
             "message": f"Database error: {str(e)}"
@@ -752,23 +628,21 @@ def syncCanvasMaterials():
     if not courseID or not canvasToken:
         return jsonify({"success": False, "message": "Missing courseID or canvasToken"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
     # Provide material ingestion functions
     material_funcs = {
         'pdf': ingest_pdf_to_snowflake,
         'pptx': ingest_pptx_to_snowflake
     }
 
-    status, message, stats = sync_course_materials(
-        courseID,
-        canvasToken,
-        connection,
-        material_funcs
-    )
-    connection.close()
+    with pooled_connection() as connection:
+        if not connection:
+            return jsonify({"success": False, "message": "Database connection error"}), 500
+        status, message, stats = sync_course_materials(
+            courseID,
+            canvasToken,
+            connection,
+            material_funcs
+        )
 
     print(message)
     if status and stats:
@@ -793,127 +667,19 @@ def get_insights():
     if not course_id:
         return jsonify({"success": False, "message": "Missing courseID"}), 400
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
     try:
-        cursor = connection.cursor()
-
-        # 1. Active users in last 7 days (from quiz attempts or messages)
-        active_users_7d = 0
-        try:
-            cursor.execute("""
-                SELECT COUNT(DISTINCT user_id)
-                FROM user_quiz_attempts
-                WHERE created_at >= DATEADD(day, -7, CURRENT_TIMESTAMP())
-            """)
-            active_users_7d = cursor.fetchone()[0] or 0
-        except:
-            pass
-
-        # 2. Top topics (from course materials titles and synced pages)
-        top_topics = []
-        try:
-            cursor.execute("""
-                SELECT title, COUNT(*) as freq
-                FROM course_materials
-                WHERE course_id = %s
-                GROUP BY title
-                ORDER BY freq DESC
-                LIMIT 5
-            """, (course_id,))
-            top_topics = [{"topic": title, "frequency": freq} for title, freq in cursor.fetchall()]
-        except:
-            pass
-
-        # 3. Most missed questions (questions with lowest accuracy)
-        most_missed_questions = []
-        try:
-            cursor.execute("""
-                SELECT
-                    question_text,
-                    COUNT(*) as total_attempts,
-                    SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct_attempts,
-                    ROUND(100.0 * SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) / COUNT(*), 1) as accuracy
-                FROM user_quiz_attempts
-                WHERE question_text IS NOT NULL
-                GROUP BY question_text
-                HAVING COUNT(*) >= 3
-                ORDER BY accuracy ASC
-                LIMIT 5
-            """)
-            most_missed_questions = [
-                {
-                    "question": q_text,
-                    "totalAttempts": total,
-                    "correctAttempts": correct,
-                    "accuracy": acc
-                }
-                for q_text, total, correct, acc in cursor.fetchall()
-            ]
-        except:
-            pass
-
-        # 4. Quiz accuracy by quiz title
-        quiz_accuracy = []
-        try:
-            cursor.execute("""
-                SELECT
-                    quiz_title,
-                    COUNT(*) as total_attempts,
-                    SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct_attempts,
-                    ROUND(100.0 * SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) / COUNT(*), 1) as accuracy
-                FROM user_quiz_attempts
-                WHERE quiz_title IS NOT NULL
-                GROUP BY quiz_title
-                ORDER BY quiz_title
-            """)
-            quiz_accuracy = [
-                {
-                    "quizTitle": title,
-                    "totalAttempts": total,
-                    "correctAttempts": correct,
-                    "accuracy": acc
-                }
-                for title, total, correct, acc in cursor.fetchall()
-            ]
-        except:
-            pass
-
-        # 5. Recent student questions (from edwin_messages where userorAI = FALSE)
-        recent_questions = []
-        try:
-            cursor.execute("""
-                SELECT message, created_at
-                FROM edwin_messages
-                WHERE userorAI = FALSE
-                ORDER BY created_at DESC
-                LIMIT 10
-            """)
-            recent_questions = [
-                {"question": msg, "timestamp": str(ts)}
-                for msg, ts in cursor.fetchall()
-            ]
-        except:
-            pass
-
-        cursor.close()
-        connection.close()
+        with pooled_connection() as connection:
+            if not connection:
+                return jsonify({"success": False, "message": "Database connection error"}), 500
+            # Single-pass, course-scoped and cached per course (see Modules/Insights.py)
+            insights = get_course_insights(course_id, connection)
 
         return jsonify({
             "success": True,
-            "insights": {
-                "activeUsers7d": active_users_7d,
-                "topTopics": top_topics,
-                "mostMissedQuestions": most_missed_questions,
-                "quizAccuracy": quiz_accuracy,
-                "recentQuestions": recent_questions
-            }
+            "insights": insights
         }), 200
 
     except Exception as e:
-        connection.close()
         return jsonify({
             "success": False,
             "message": f"Error fetching insights: {str(e)}"
@@ -925,10 +691,10 @@ def get_insights():
 def health_check():
     """Health check endpoint for frontend to verify backend is online"""
     try:
-        # Quick database connectivity check
-        connection = get_db_connection()
-        if connection:
-            connection.close()
+        # Quick database connectivity check (reuses a pooled connection, no new login)
+        with pooled_connection() as connection:
+            connected = connection is not None
+        if connected:
             return jsonify({
                 "success": True,
                 "status": "online",
@@ -947,305 +713,54 @@ def health_check():
             "message": f"Health check failed: {str(e)}"
         }), 500
 
+# Metrics endpoint
+@app.route('/api/metrics', methods=['GET'])
+@cross_origin()
+def metrics_endpoint():
+    """Operational metrics (connection pool, message write-behind queue, ready-conversation pool, search index, retrieval cache, prompt budgets, answer and completion caches, quiz bank, quiz sessions, exam fan-out, LLM calls, model routing, coalesced in-flight calls)"""
+    return jsonify({
+        "success": True,
+        "metrics": {
+            "connectionPool": pool_metrics(),
+            "messageLogger": message_logger_metrics(),
+            "conversationPool": conversation_pool_metrics(),
+            "searchIndex": search_index_metrics(),
+            "retrievalCache": retrieval_cache_metrics(),
+            "promptBudget": prompt_budget_metrics(),
+            "answerCache": answer_cache_metrics(),
+            "completionCache": completion_cache_metrics(),
+            "quizBank": quiz_bank_metrics(),
+            "quizSessions": quiz_session_metrics(),
+            "examGenerator": exam_metrics(),
+            "llm": llm_metrics(),
+            "modelRouter": router_metrics(),
+            "singleFlight": single_flight_metrics()
+        }
+    }), 200
+
 # Explain page endpoint
 @app.route('/api/explainPage', methods=['POST'])
 @cross_origin()
 def explain_page():
     """Generate explanation or practice questions from page content"""
-    data = request.get_json()
-    userID = data.get("userID")
-    courseID = data.get("courseID")
-    pageTitle = data.get("pageTitle")
-    content = data.get("content")
-    mode = data.get("mode", "explain")  # 'explain' or 'practice'
-
-    if not all([userID, courseID, pageTitle, content]):
-        return jsonify({"success": False, "message": "Missing required fields"}), 400
-
-    if mode not in ['explain', 'practice']:
-        return jsonify({"success": False, "message": "Mode must be 'explain' or 'practice'"}), 400
-
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
-    try:
-        cursor = connection.cursor()
-
-        # Limit content to avoid token overflow
-        content_preview = content[:3000]
-
-        if mode == 'explain':
-            # Generate explanation using Snowflake Cortex
-            prompt = f"""You are an educational AI assistant. Analyze the following course page and provide:
-
-1. A brief summary (2-3 sentences)
-2. Key points (3-5 bullet points)
-3. Common mistakes students make with this topic (2-3 points)
-
-Page Title: {pageTitle}
-Content:
-{content_preview}
-
-Respond in JSON format:
-{{
-  "summary": "...",
-  "keyPoints": ["...", "..."],
-  "commonMistakes": ["...", "..."]
-}}"""
-
-            cursor.execute(f"""
-                SELECT SNOWFLAKE.CORTEX.COMPLETE('llama3-70b', '{prompt.replace("'", "''")}')
-            """)
-            result = cursor.fetchone()[0]
-
-            # Parse JSON response
-            import json
-            try:
-                explanation_data = json.loads(result)
-            except:
-                explanation_data = {
-                    "summary": result,
-                    "keyPoints": [],
-                    "commonMistakes": []
-                }
-
-            cursor.close()
-            connection.close()
-
-            return jsonify({
-                "success": True,
-                "data": explanation_data
-            }), 200
-
-        elif mode == 'practice':
-            # Generate practice questions using quiz generation logic
-            status, message, quiz_data = generate_quiz(
-                courseID,
-                f"{pageTitle} Practice",
-                "Intermediate",
-                5,
-                connection,
-                None,  # model
-                None   # material_id - use all course materials
-            )
-
-            connection.close()
-
-            if status:
-                return jsonify({
-                    "success": True,
-                    "data": {
-                        "quiz": quiz_data,
-                        "message": f"Generated {len(quiz_data.get('questions', []))} practice questions"
-                    }
-                }), 200
-            else:
-                return jsonify({
-                    "success": False,
-                    "message": "Failed to generate practice questions"
-                }), 500
-
-    except Exception as e:
-        connection.close()
-        return jsonify({
-            "success": False,
-            "message": f"Error: {str(e)}"
-        }), 500
+    payload, code = handle_explain_page(request.get_json())
+    return jsonify(payload), code
 
 
 @app.route('/api/assignmentHelper', methods=['POST'])
 @cross_origin()
 def assignment_helper():
     """Generate assignment summaries, checklists, or study plans"""
-    data = request.get_json()
-    userID = data.get("userID")
-    courseID = data.get("courseID")
-    assignmentText = data.get("assignmentText")
-    dueDate = data.get("dueDate")  # Optional
-    mode = data.get("mode", "summary")  # 'summary', 'checklist', 'plan'
-
-    if not all([userID, courseID, assignmentText, mode]):
-        return jsonify({"success": False, "message": "Missing required fields"}), 400
-
-    if mode not in ['summary', 'checklist', 'plan']:
-        return jsonify({"success": False, "message": "Mode must be 'summary', 'checklist', or 'plan'"}), 400
-
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
-    try:
-        cursor = connection.cursor()
-
-        # Limit content to avoid token overflow
-        content_preview = assignmentText[:4000]
-
-        if mode == 'summary':
-            prompt = f"""You are an educational AI assistant helping a student understand their assignment.
-
-Assignment:
-{content_preview}
-
-Provide a clear, concise summary of what the student needs to do. Include:
-1. Main objective (1-2 sentences)
-2. Key requirements (3-5 bullet points)
-3. Important notes or warnings
-
-Respond in JSON format:
-{{
-  "summary": "Main objective...",
-  "requirements": ["req1", "req2", "req3"],
-  "notes": ["note1", "note2"]
-}}"""
-
-        elif mode == 'checklist':
-            prompt = f"""You are an educational AI assistant creating an actionable checklist for a student.
-
-Assignment:
-{content_preview}
-{f"Due Date: {dueDate}" if dueDate else ""}
-
-Create a step-by-step checklist of tasks the student should complete. Be specific and actionable.
-Include time estimates if the due date is provided.
-
-Respond in JSON format:
-{{
-  "checklist": [
-    {{"task": "Step 1 description", "estimated_hours": 2}},
-    {{"task": "Step 2 description", "estimated_hours": 1}}
-  ],
-  "totalHours": 8,
-  "tips": ["tip1", "tip2"]
-}}"""
-
-        elif mode == 'plan':
-            due_date_info = f"Due Date: {dueDate}\n\n" if dueDate else ""
-            prompt = f"""You are an educational AI assistant creating a study plan for a student.
-
-Assignment:
-{content_preview}
-
-{due_date_info}Create a day-by-day study plan. Break down the work into manageable daily tasks.
-If no due date is provided, create a 7-day plan.
-
-Respond in JSON format:
-{{
-  "studyPlan": [
-    {{"day": 1, "dayLabel": "Today", "tasks": ["task1", "task2"], "hours": 2}},
-    {{"day": 2, "dayLabel": "Tomorrow", "tasks": ["task3"], "hours": 1}}
-  ],
-  "totalDays": 7,
-  "advice": ["advice1", "advice2"]
-}}"""
-
-        # Execute Snowflake Cortex query
-        cursor.execute(f"""
-            SELECT SNOWFLAKE.CORTEX.COMPLETE('llama3-70b', '{prompt.replace("'", "''")}')
-        """)
-        result = cursor.fetchone()[0]
-
-        # Parse JSON response
-        import json
-        try:
-            response_data = json.loads(result)
-        except:
-            response_data = {
-                "summary": result if mode == 'summary' else "",
-                "checklist": [] if mode == 'checklist' else None,
-                "studyPlan": [] if mode == 'plan' else None
-            }
-
-        # Check if response is grounded (has course materials)
-        cursor.execute(f"""
-            SELECT COUNT(*) FROM COURSE_MATERIALS
-            WHERE COURSE_ID = {courseID}
-        """)
-        materials_count = cursor.fetchone()[0]
-        grounded = materials_count > 0
-
-        cursor.close()
-        connection.close()
-
-        return jsonify({
-            "success": True,
-            "mode": mode,
-            "data": response_data,
-            "grounded": grounded,
-            "message": f"Generated {mode} for assignment"
-        }), 200
-
-    except Exception as e:
-        if connection:
-            connection.close()
-        return jsonify({
-            "success": False,
-            "message": f"Error: {str(e)}"
-        }), 500
+    payload, code = handle_assignment_helper(request.get_json())
+    return jsonify(payload), code
 
 
 @app.route('/api/generateExam', methods=['POST'])
 @cross_origin()
 def generate_exam():
     """Generate a comprehensive exam with 20-30 questions"""
-    data = request.get_json()
-    userID = data.get("userID")
-    courseID = data.get("courseID")
-    topic = data.get("topic", "all")  # Optional topic filter
-    numQuestions = data.get("numQuestions", 25)
-    difficulty = data.get("difficulty", "mixed")  # 'beginner', 'intermediate', 'advanced', 'mixed'
-
-    if not all([userID, courseID]):
-        return jsonify({"success": False, "message": "Missing required fields"}), 400
-
-    if numQuestions < 20 or numQuestions > 30:
-        return jsonify({"success": False, "message": "Number of questions must be between 20 and 30"}), 400
-
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"success": False, "message": "Database connection error"}), 500
-
-    try:
-        # Generate exam using quiz generation logic with higher question count
-        topic_str = topic if topic != "all" else "Comprehensive Exam"
-        status, message, quiz_data = generate_quiz(
-            courseID,
-            topic_str,
-            difficulty,
-            numQuestions,
-            connection,
-            None,  # model
-            None   # material_id - use all course materials
-        )
-
-        connection.close()
-
-        if status:
-            # Add exam ID for tracking
-            import uuid
-            exam_id = str(uuid.uuid4())
-
-            return jsonify({
-                "success": True,
-                "examID": exam_id,
-                "topic": topic_str,
-                "numQuestions": len(quiz_data.get('questions', [])),
-                "questions": quiz_data.get('questions', []),
-                "message": f"Generated exam with {len(quiz_data.get('questions', []))} questions"
-            }), 200
-        else:
-            return jsonify({
-                "success": False,
-                "message": "Failed to generate exam"
-            }), 500
-
-    except Exception as e:
-        if connection:
-            connection.close()
-        return jsonify({
-            "success": False,
-            "message": f"Error: {str(e)}"
-        }), 500
+    payload, code = handle_generate_exam(request.get_json())
+    return jsonify(payload), code
 
 
 @app.route('/api/mastery', methods=['GET'])
@@ -1258,7 +773,7 @@ def get_mastery():
     if not all([userID, courseID]):
         return jsonify({"success": False, "message": "Missing required parameters"}), 400
 
-    connection = get_db_connection()
+    connection = get_pooled_connection()
     if not connection:
         return jsonify({"success": False, "message": "Database connection error"}), 500
 
@@ -1335,11 +850,12 @@ if __name__ == "__main__":
     #connection = get_db_connection()
     #status, message, error = ingest_pdf_to_snowflake("Lab1CSE434-2.pdf", 231849, connection)
     #print("Lab 1:",message)
+    get_pool().prefill()  # Open min_size connections up front so the first requests don't pay the login
     app.run(debug=True, port=5000, host='0.0.0.0')
     
     if TESTING:
         clean_database()
-        connection = get_db_connection()
+        connection = get_pooled_connection()
         status, message, error = register(1, "Andrey","email", "password", connection)
         print(message)
         status, message, error = newCourse(231849, "434: Computer Networks", connection)
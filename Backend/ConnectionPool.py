@@ -0,0 +1,427 @@
+"""
+Connection pool for the Edwin backend.
+
+Opening a Snowflake connection costs a full login handshake, so instead of
+calling credentials.get_db_connection() on every request the endpoints borrow
+an already-open connection from this pool and hand it back when they are done.
+
+Usage:
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        ...
+
+    # or, for code that already calls connection.close() when finished:
+    connection = get_pooled_connection()
+    ...
+    connection.close()   # returns the connection to the pool
+
+A PooledConnection that is dropped without close() (a handler that raised
+before reaching it) is reclaimed when it is garbage collected: its raw
+connection is closed and its slot freed, so a leak can't exhaust the pool.
+
+    # from async code (asgi.py): runs fn(*args, connection) in the default executor
+    result = await run_with_pooled_connection(fn, *args)
+
+    # several writes that must land together (Snowflake autocommits each statement otherwise)
+    with transaction(connection) as cursor:
+        ...
+"""
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from credentials import get_db_connection
+
+# Pool sizing (tune against the number of Flask worker threads)
+POOL_MIN_SIZE = 2                 # connections kept open even when idle
+POOL_MAX_SIZE = 10                # hard cap on open connections
+POOL_CHECKOUT_TIMEOUT = 10.0      # seconds to wait for a free connection
+POOL_MAX_IDLE_SECONDS = 300       # idle connections above min size are closed after this
+POOL_HEALTH_CHECK_AFTER = 30      # only ping connections idle longer than this (seconds)
+POOL_REAP_INTERVAL = 60           # how often the background reaper runs (seconds)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when no database connection can be obtained."""
+
+
+class PoolTimeout(DatabaseUnavailable):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a raw DB connection that belongs to a pool.
+    close() returns the connection to the pool instead of closing it,
+    so existing code that calls connection.close() keeps working.
+    If it is garbage collected unreleased, the pool reclaims its slot.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        # Doubles as the released flag: detach() returns None once it has run or been detached
+        self._finalizer = weakref.finalize(self, pool.reclaim, raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)."""
+        if self._finalizer.detach():
+            self._pool.release(self._raw)
+
+    def discard(self):
+        """Close the underlying connection instead of returning it (e.g. after a fatal error)."""
+        if self._finalizer.detach():
+            self._pool.release(self._raw, discard=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB connections with min/max size, health checks and idle reaping."""
+
+    def __init__(self, connect_func, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, max_idle_seconds=POOL_MAX_IDLE_SECONDS,
+                 health_check_after=POOL_HEALTH_CHECK_AFTER, reap_interval=POOL_REAP_INTERVAL):
+        self._connect = connect_func
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_after = health_check_after
+        self.reap_interval = reap_interval
+
+        self._cond = threading.Condition()
+        self._idle = []          # list of (raw_connection, last_used_timestamp)
+        self._open_count = 0     # idle + checked out
+        self._in_use = 0
+        self._closed = False
+        self._reaper = None
+
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "closed": 0,
+            "failed_health_checks": 0,
+            "connect_errors": 0,
+            "reclaimed": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    # -------------------------------
+    # Checkout / release
+    # -------------------------------
+    def acquire(self, timeout=None):
+        """
+        Borrow a connection from the pool.
+        Returns a PooledConnection, or None if a new connection could not be opened.
+        Raises PoolTimeout if the pool is exhausted for longer than the timeout.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        self._ensure_reaper()
+
+        while True:
+            raw = None
+            create = False
+
+            with self._cond:
+                while not self._idle and self._open_count >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"No database connection available after {timeout}s")
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    needs_check = time.monotonic() - last_used > self.health_check_after
+                else:
+                    # Reserve a slot before connecting so we never exceed max_size
+                    self._open_count += 1
+                    create = True
+                    needs_check = False
+
+            if create:
+                raw = self._open_raw()
+                if raw is None:
+                    with self._cond:
+                        self._open_count -= 1
+                        self._cond.notify()
+                    return None
+            elif needs_check and not self._is_healthy(raw):
+                self._close_raw(raw)
+                continue  # try the next idle connection (or open a fresh one)
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use += 1
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return PooledConnection(self, raw)
+
+    def release(self, raw, discard=False):
+        """Return a raw connection to the pool (or close it if discard=True)."""
+        if not discard:
+            try:
+                # Don't leak an open transaction to the next borrower
+                raw.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed or self._raw_is_closed(raw):
+                pass
+            else:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+                return
+
+        self._close_raw(raw)
+
+    def reclaim(self, raw):
+        """Free the slot of a connection whose PooledConnection was dropped without close()."""
+        with self._cond:
+            self._stats["reclaimed"] += 1
+        print("WARNING: Pool reclaimed a connection that was never returned")
+        # Its state (open cursors, a half-done transaction) is unknown, so it isn't reused
+        self.release(raw, discard=True)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that yields a pooled connection and always returns it."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            if conn is not None:
+                conn.close()
+
+    # -------------------------------
+    # Maintenance
+    # -------------------------------
+    def prefill(self):
+        """Open connections until min_size are available."""
+        while True:
+            with self._cond:
+                if self._closed or self._open_count >= self.min_size:
+                    return
+                self._open_count += 1
+            raw = self._open_raw()
+            with self._cond:
+                if raw is None:
+                    self._open_count -= 1
+                    return
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+
+    def reap_idle(self):
+        """Close connections that have been idle too long, keeping at least min_size open."""
+        now = time.monotonic()
+        to_close = []
+        with self._cond:
+            keep = []
+            # Oldest connections sit at the front of the list
+            for raw, last_used in self._idle:
+                if now - last_used > self.max_idle_seconds and self._open_count - len(to_close) > self.min_size:
+                    to_close.append(raw)
+                else:
+                    keep.append((raw, last_used))
+            self._idle = keep
+        for raw in to_close:
+            self._close_raw(raw)
+        return len(to_close)
+
+    def close_all(self):
+        """Close every idle connection and stop handing out new ones."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for raw, _ in idle:
+            self._close_raw(raw)
+
+    def metrics(self):
+        """Snapshot of pool usage for sizing against worker count."""
+        with self._cond:
+            stats = dict(self._stats)
+            checkouts = stats["checkouts"]
+            stats.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "open": self._open_count,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "wait_time_avg": (stats["wait_time_total"] / checkouts) if checkouts else 0.0,
+                # Connections opened per checkout; close to 0 means the pool is doing its job
+                "churn_ratio": (stats["created"] / checkouts) if checkouts else 0.0,
+            })
+        stats["wait_time_total"] = round(stats["wait_time_total"], 4)
+        stats["wait_time_max"] = round(stats["wait_time_max"], 4)
+        stats["wait_time_avg"] = round(stats["wait_time_avg"], 4)
+        stats["churn_ratio"] = round(stats["churn_ratio"], 4)
+        return stats
+
+    # -------------------------------
+    # Internals
+    # -------------------------------
+    def _open_raw(self):
+        try:
+            raw = self._connect()
+        except Exception as e:
+            print(f"ERROR: Pool could not open a connection: {e}")
+            raw = None
+        with self._cond:
+            if raw is None:
+                self._stats["connect_errors"] += 1
+            else:
+                self._stats["created"] += 1
+        return raw
+
+    def _close_raw(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open_count -= 1
+            self._stats["closed"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, raw):
+        if self._raw_is_closed(raw):
+            ok = False
+        else:
+            try:
+                cursor = raw.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+                cursor.close()
+                ok = True
+            except Exception:
+                ok = False
+        if not ok:
+            with self._cond:
+                self._stats["failed_health_checks"] += 1
+        return ok
+
+    @staticmethod
+    def _raw_is_closed(raw):
+        is_closed = getattr(raw, "is_closed", None)
+        if callable(is_closed):
+            try:
+                return is_closed()
+            except Exception:
+                return True
+        return False
+
+    def _ensure_reaper(self):
+        if self._reaper is not None or self.reap_interval <= 0:
+            return
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="edwin-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._closed:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap_idle()
+            except Exception as e:
+                print(f"ERROR: Pool reaper failed: {e}")
+
+
+# -------------------------------
+# Shared default pool
+# -------------------------------
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = ConnectionPool(get_db_connection)
+    return _default_pool
+
+
+def get_pooled_connection(timeout=None):
+    """
+    Borrow a connection from the shared pool.
+    Returns None if no connection could be obtained (same contract as get_db_connection()).
+    """
+    try:
+        return get_pool().acquire(timeout)
+    except PoolTimeout as e:
+        print(f"ERROR: {e}")
+        return None
+
+
+@contextmanager
+def pooled_connection(timeout=None):
+    """Context manager over the shared pool; yields None if no connection is available."""
+    conn = get_pooled_connection(timeout)
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@contextmanager
+def transaction(connection):
+    """
+    Yield a cursor inside an explicit transaction: committed when the block ends, rolled back if it raises.
+    Snowflake connections are opened with autocommit on, so without the BEGIN every statement would
+    commit on its own and a rollback would undo nothing.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("BEGIN")
+        yield cursor
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+async def run_with_pooled_connection(fn, *args, **kwargs):
+    """
+    Await fn(*args, connection, **kwargs) run on a pooled connection in the default executor,
+    so blocking DB work never runs on the event loop. Raises DatabaseUnavailable.
+    """
+    def work():
+        with pooled_connection() as connection:
+            if connection is None:
+                raise DatabaseUnavailable("Database connection error")
+            return fn(*args, connection, **kwargs)
+
+    return await asyncio.get_running_loop().run_in_executor(None, work)
+
+
+def pool_metrics():
+    """Metrics for the shared pool (empty if it was never used)."""
+    if _default_pool is None:
+        return {}
+    return _default_pool.metrics()
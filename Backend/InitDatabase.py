@@ -1,15 +1,23 @@
-from credentials import get_db_connection
+from credentials import get_db_connection, STORAGE_BACKEND
 
 
 def initialize_database():
     """
     Creates all required tables in Snowflake if they do not already exist.
+    With the local storage backend, creates the mirrored SQLite schema instead.
     """
     connection = get_db_connection()
     if not connection:
         print("ERROR: Could not get Snowflake connection in initialize_database().")
         return False, "Could not connect to Snowflake.", 500
 
+    if STORAGE_BACKEND == "local":
+        from LocalStorage import initialize_local_schema
+        initialize_local_schema(connection)
+        connection.close()
+        print("SUCCESS: Local database initialized successfully.")
+        return True, "Database initialized successfully.", 200
+
     cursor = connection.cursor()
 
     # Create tables
@@ -77,22 +85,45 @@ def initialize_database():
             content STRING,         -- raw text (syllabus, notes, extracted PDFs, etc.)
             file_url VARCHAR(500),  -- optional link to storage
             source_url VARCHAR(500),  -- URL of scraped Canvas page
+            ingest_batch VARCHAR(64), -- id shared by all rows written in one bulk insert
+            ingest_ordinal INT,       -- the row's position in its bulk insert
             created_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE
         );
     """)
 
+    # Columns added after the first release
+    cursor.execute("ALTER TABLE course_materials ADD COLUMN IF NOT EXISTS ingest_batch VARCHAR(64);")
+    cursor.execute("ALTER TABLE course_materials ADD COLUMN IF NOT EXISTS ingest_ordinal INT;")
+
+    # Bounded, overlapping pieces of each material (see Modules/Ingestion.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS course_material_chunks (
+            chunk_id INT AUTOINCREMENT PRIMARY KEY,
+            material_id INT NOT NULL,
+            course_id INT NOT NULL,
+            chunk_index INT NOT NULL,   -- position within the material
+            page_number INT,            -- PDF page or PPTX slide, if known
+            char_start INT NOT NULL,    -- offsets into course_materials.content
+            char_end INT NOT NULL,
+            content STRING,
+            FOREIGN KEY (material_id) REFERENCES course_materials(material_id) ON DELETE CASCADE
+        );
+    """)
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS quizzes (
             quiz_id INT AUTOINCREMENT PRIMARY KEY,
             course_id INT NOT NULL,
             unit_name VARCHAR(255) NOT NULL,
             material_id INT,
+            difficulty VARCHAR(20),     -- set on quiz-bank quizzes (see Modules/QuizBank.py)
             created_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE,
             FOREIGN KEY (material_id) REFERENCES course_materials(material_id) ON DELETE SET NULL
         );
     """)
+    cursor.execute("ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS difficulty VARCHAR(20);")
 
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS quiz_questions (
@@ -125,6 +156,28 @@ def initialize_database():
         );
     """)
 
+    # Incrementally maintained progress aggregates (see Modules/Progress.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id VARCHAR(255) PRIMARY KEY,
+            total_attempts INT DEFAULT 0,
+            correct_answers INT DEFAULT 0,
+            last_active_date DATE,
+            current_streak INT DEFAULT 0,
+            updated_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_quiz_progress (
+            user_id VARCHAR(255) NOT NULL,
+            quiz_title STRING NOT NULL,
+            questions_answered INT DEFAULT 0,
+            correct_count INT DEFAULT 0,
+            PRIMARY KEY (user_id, quiz_title)
+        );
+    """)
+
     cursor.close()
     connection.close()
     print("SUCCESS: Database initialized successfully.")
@@ -146,6 +199,7 @@ def clean_database():
 
         # Drop tables in order from most dependent to least dependent
         cursor.execute("DROP TABLE IF EXISTS conversation_templates;")
+        cursor.execute("DROP TABLE IF EXISTS course_material_chunks;")
         cursor.execute("DROP TABLE IF EXISTS course_materials;")
         cursor.execute("DROP TABLE IF EXISTS conversations;")
         cursor.execute("DROP TABLE IF EXISTS user_courses;")
@@ -155,6 +209,8 @@ def clean_database():
         cursor.execute("DROP TABLE IF EXISTS courses;")
         cursor.execute("DROP TABLE IF EXISTS users;")
         cursor.execute("DROP TABLE IF EXISTS edwin_messages;")
+        cursor.execute("DROP TABLE IF EXISTS user_quiz_progress;")
+        cursor.execute("DROP TABLE IF EXISTS user_progress;")
 
         cursor.close()
         connection.close()
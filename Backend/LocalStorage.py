@@ -0,0 +1,359 @@
+"""
+Local embedded storage backend (SQLite) that mirrors the Snowflake schema.
+
+Selected with EDWIN_STORAGE_BACKEND=local (see credentials.py). It lets the
+whole Flask app, load tests and CI benchmarks run without a warehouse.
+
+The connection/cursor objects returned here expose the same subset of the
+DB-API that the rest of the backend uses with snowflake.connector:
+    connection.cursor(), .commit(), .rollback(), .close(), .is_closed()
+    cursor.execute(sql, params), .executemany(), .fetchone(), .fetchall(), .rowcount
+
+Queries are written for Snowflake (%s placeholders, CURRENT_TIMESTAMP(),
+DATEADD, SNOWFLAKE.CORTEX.COMPLETE, the MERGE upserts of Modules/Progress.py);
+translate_sql() rewrites the handful of constructs the backend uses into
+their SQLite equivalents. CORTEX_COMPLETE is answered by the local stand-in
+model (Modules/LocalCortex.py).
+"""
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from Modules.LocalCortex import local_complete
+
+# Same tables as InitDatabase.initialize_database(), in SQLite types.
+# Timestamps default to local time with millisecond precision so that
+# "ORDER BY created_at" is stable for rows written in the same second.
+LOCAL_NOW = "(strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))"
+
+LOCAL_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS edwin_messages (
+        conv_id VARCHAR(255) NOT NULL,
+        user_id VARCHAR(255),
+        userorAI BOOLEAN,
+        message TEXT,
+        created_at TIMESTAMP DEFAULT {LOCAL_NOW}
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        canvas_id VARCHAR(255) UNIQUE NOT NULL,
+        name VARCHAR(255),
+        email VARCHAR(255) UNIQUE,
+        password_hash VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT {LOCAL_NOW},
+        used_tokens INT DEFAULT 0,
+        openAI_key VARCHAR(255),
+        updated_at TIMESTAMP DEFAULT {LOCAL_NOW}
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS courses (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        current_template_id INT,
+        updated_at TIMESTAMP DEFAULT {LOCAL_NOW},
+        created_at TIMESTAMP DEFAULT {LOCAL_NOW}
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_courses (
+        user_id VARCHAR(255) NOT NULL,
+        course_id INT NOT NULL,
+        role TEXT DEFAULT 'student',
+        PRIMARY KEY (user_id, course_id)
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INT NOT NULL,
+        user_id VARCHAR(255) NULL,
+        conv_id VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT {LOCAL_NOW},
+        is_assigned BOOLEAN DEFAULT FALSE
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS course_materials (
+        material_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INT NOT NULL,
+        title VARCHAR(255),
+        content TEXT,
+        file_url VARCHAR(500),
+        source_url VARCHAR(500),
+        ingest_batch VARCHAR(64),
+        ingest_ordinal INT,
+        created_at TIMESTAMP DEFAULT {LOCAL_NOW}
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS course_material_chunks (
+        chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        material_id INT NOT NULL,
+        course_id INT NOT NULL,
+        chunk_index INT NOT NULL,
+        page_number INT,
+        char_start INT NOT NULL,
+        char_end INT NOT NULL,
+        content TEXT
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS quizzes (
+        quiz_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INT NOT NULL,
+        unit_name VARCHAR(255) NOT NULL,
+        material_id INT,
+        difficulty VARCHAR(20),
+        created_at TIMESTAMP DEFAULT {LOCAL_NOW}
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS quiz_questions (
+        question_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        quiz_id INT NOT NULL,
+        question_text TEXT NOT NULL,
+        option_a VARCHAR(500) NOT NULL,
+        option_b VARCHAR(500) NOT NULL,
+        option_c VARCHAR(500) NOT NULL,
+        option_d VARCHAR(500) NOT NULL,
+        correct_option CHAR(1) NOT NULL,
+        explanation VARCHAR(500),
+        created_at TIMESTAMP DEFAULT {LOCAL_NOW}
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS user_quiz_attempts (
+        attempt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id VARCHAR(255) NOT NULL,
+        course_id INT,
+        question_id INT,
+        question_text TEXT,
+        quiz_title TEXT,
+        selected_option INT,
+        correct_option INT,
+        is_correct BOOLEAN,
+        created_at TIMESTAMP DEFAULT {LOCAL_NOW}
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS user_progress (
+        user_id VARCHAR(255) PRIMARY KEY,
+        total_attempts INT DEFAULT 0,
+        correct_answers INT DEFAULT 0,
+        last_active_date DATE,
+        current_streak INT DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT {LOCAL_NOW}
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_quiz_progress (
+        user_id VARCHAR(255) NOT NULL,
+        quiz_title TEXT NOT NULL,
+        questions_answered INT DEFAULT 0,
+        correct_count INT DEFAULT 0,
+        PRIMARY KEY (user_id, quiz_title)
+    );
+    """,
+    # Indexes for the hot lookups (Snowflake doesn't need these)
+    "CREATE INDEX IF NOT EXISTS idx_messages_conv ON edwin_messages (conv_id, created_at);",
+    "CREATE INDEX IF NOT EXISTS idx_conversations_course_user ON conversations (course_id, user_id, is_assigned);",
+    "CREATE INDEX IF NOT EXISTS idx_materials_course ON course_materials (course_id, created_at);",
+    "CREATE INDEX IF NOT EXISTS idx_attempts_user ON user_quiz_attempts (user_id, created_at);",
+    "CREATE INDEX IF NOT EXISTS idx_materials_batch ON course_materials (ingest_batch);",
+    "CREATE INDEX IF NOT EXISTS idx_chunks_course ON course_material_chunks (course_id);",
+    "CREATE INDEX IF NOT EXISTS idx_chunks_material ON course_material_chunks (material_id, chunk_index);",
+    "CREATE INDEX IF NOT EXISTS idx_quizzes_course ON quizzes (course_id, difficulty, material_id);",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_questions_quiz ON quiz_questions (quiz_id);",
+    "CREATE INDEX IF NOT EXISTS idx_attempts_question ON user_quiz_attempts (user_id, question_id);",
+]
+
+# Columns added after the first release: (table, column, type).
+# Applied to existing local databases that were created before the column existed.
+LOCAL_MIGRATIONS = [
+    ("course_materials", "ingest_batch", "VARCHAR(64)"),
+    ("course_materials", "ingest_ordinal", "INT"),
+    ("quizzes", "difficulty", "VARCHAR(20)"),
+]
+
+
+# -------------------------------
+# Type conversion (match snowflake.connector return types)
+# -------------------------------
+def _convert_timestamp(value):
+    return datetime.fromisoformat(value.decode())
+
+
+def _convert_date(value):
+    return date.fromisoformat(value.decode()[:10])
+
+
+def _convert_boolean(value):
+    return value not in (b"0", b"", b"false", b"FALSE")
+
+
+def _adapt_datetime(value):
+    # Stored as local time, like the column defaults (TIMESTAMP_LTZ semantics)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_converter("BOOLEAN", _convert_boolean)
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+# -------------------------------
+# SQL translation (Snowflake dialect -> SQLite)
+# -------------------------------
+_DATEADD_RE = re.compile(
+    r"DATEADD\(\s*(day|hour|minute)\s*,\s*(-?\d+)\s*,\s*CURRENT_TIMESTAMP(?:\(\))?\s*\)",
+    re.IGNORECASE,
+)
+# MERGE INTO t USING (SELECT ...) s ON ... WHEN MATCHED THEN UPDATE SET ... WHEN NOT MATCHED THEN INSERT (...) VALUES (...)
+_MERGE_RE = re.compile(
+    r"^\s*MERGE INTO (\w+) t\s+USING \((SELECT .*?)\) s\s+ON .*?\s+"
+    r"WHEN MATCHED THEN UPDATE SET (.*?)\s+WHEN NOT MATCHED THEN INSERT \((.*?)\) VALUES \((.*?)\)\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _merge_to_upsert(match):
+    """A MERGE whose inserted columns are the source's, as an upsert on the table's primary key."""
+    table, source, updates, columns, values = match.groups()
+    updates = re.sub(r"\bs\.(\w+)", r"excluded.\1", updates)
+    # "WHERE true" keeps SQLite from reading ON CONFLICT as a join constraint
+    return f"INSERT INTO {table} ({columns}) SELECT {values} FROM ({source}) s WHERE true ON CONFLICT DO UPDATE SET {updates}"
+
+
+def translate_sql(sql):
+    """Rewrite the Snowflake-specific constructs used by the backend into SQLite."""
+    sql = sql.replace("%s", "?")
+    sql = _MERGE_RE.sub(_merge_to_upsert, sql)
+    sql = re.sub(r"SNOWFLAKE\.CORTEX\.COMPLETE\s*\(", "CORTEX_COMPLETE(", sql, flags=re.IGNORECASE)
+    sql = _DATEADD_RE.sub(lambda m: f"strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', '{m.group(2)} {m.group(1).lower()}s')", sql)
+    sql = re.sub(r"CURRENT_TIMESTAMP\(\)", LOCAL_NOW, sql, flags=re.IGNORECASE)
+    return sql
+
+
+# -------------------------------
+# Connection / cursor wrappers
+# -------------------------------
+class LocalCursor:
+    """DB-API cursor that accepts Snowflake-style SQL."""
+
+    def __init__(self, raw_cursor):
+        self._cursor = raw_cursor
+
+    def execute(self, sql, params=None, timeout=None):
+        """`timeout` is accepted for snowflake.connector compatibility and ignored."""
+        if sql.strip().upper() == "BEGIN" and self._cursor.connection.in_transaction:
+            return self     # like Snowflake, a BEGIN inside an open transaction is ignored
+        self._cursor.execute(translate_sql(sql), tuple(params) if params is not None else ())
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class LocalConnection:
+    """Connection wrapper with the snowflake.connector methods the backend relies on."""
+
+    def __init__(self, raw_connection):
+        self._conn = raw_connection
+        self._closed = False
+
+    def cursor(self):
+        return LocalCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._conn.close()
+
+    def is_closed(self):
+        return self._closed
+
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+def initialize_local_schema(connection):
+    """Create all tables in the local database (idempotent)."""
+    cursor = connection.cursor()
+    for statement in LOCAL_SCHEMA:
+        if "CREATE INDEX" in statement:
+            continue
+        cursor.execute(statement)
+
+    for table, column, column_type in LOCAL_MIGRATIONS:
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    # Indexes last, since they may reference migrated columns
+    for statement in LOCAL_SCHEMA:
+        if "CREATE INDEX" in statement:
+            cursor.execute(statement)
+    connection.commit()
+    cursor.close()
+
+
+def connect(path):
+    """Open a connection to the local database at `path`, creating the schema on first use."""
+    raw = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,  # connections are handed between threads by the pool
+        timeout=5.0,
+    )
+    raw.execute("PRAGMA journal_mode=WAL")
+    raw.execute("PRAGMA synchronous=NORMAL")
+    raw.create_function("CORTEX_COMPLETE", 2, local_complete)
+    connection = LocalConnection(raw)
+
+    if path not in _initialized_paths:
+        with _init_lock:
+            if path not in _initialized_paths:
+                initialize_local_schema(connection)
+                _initialized_paths.add(path)
+
+    return connection
@@ -0,0 +1,261 @@
+"""
+Per-course cache of answers to repeated student questions.
+
+In a large course the same logistics questions ("when is the midterm",
+"When's the midterm exam?") are asked many times a day, and each one used to
+cost a full Cortex call. Answers are cached per course and model, together
+with the citations they were given.
+
+A question is normalised first: lowercased, split into words, filler words
+dropped and stemmed. Question words and negations are kept, because "when"
+vs "where" or "is" vs "is not" changes the answer. A repeat that normalises
+to the same words is an exact hit. Otherwise its set of words is MinHashed,
+and LSH banding finds earlier questions with a similar signature. Such a
+question is a hit if it has the same question words and negations, and its
+similarity() (the Dice coefficient of the word sets) is at least
+NEAR_DUPLICATE_THRESHOLD. Logistics questions are a few words long, so one
+extra word ("exam") must still leave them the same question.
+
+Follow-ups that lean on the conversation ("can you explain that again?") are
+never cached. An answer to those depends on the student's own history.
+
+Entries expire after ANSWER_CACHE_TTL seconds and are evicted least recently
+used beyond EDWIN_ANSWER_CACHE_MB. Every material change in this process
+(Modules/MaterialEvents.py) drops the course's entries and bumps its
+materials version. An answer generated from the old materials is then never
+stored under the new version. Other worker processes see the change after
+at most the TTL.
+"""
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from Modules.MaterialEvents import on_materials_changed
+from Modules.Tokenizer import stem, words
+
+ANSWER_CACHE_BYTES = int(os.environ.get("EDWIN_ANSWER_CACHE_MB", "16")) * 1024 * 1024
+ANSWER_CACHE_TTL = int(os.environ.get("EDWIN_ANSWER_CACHE_TTL", str(6 * 3600)))   # seconds
+NEAR_DUPLICATE_THRESHOLD = 0.8   # similarity() that counts as the same question
+MIN_QUESTION_TERMS = 2           # shorter questions are too ambiguous to share
+MINHASH_BANDS = 16               # LSH bands x rows = MinHash signature length; short rows, since
+MINHASH_ROWS = 2                 # a two-word question and its three-word paraphrase share 2 of 3 words
+ENTRY_OVERHEAD = 600             # entry object, dict slots and bucket references (approximate)
+
+# Words that carry no meaning in a question; unlike Tokenizer.STOP_WORDS this keeps
+# question words (what/when/where/...) and negations
+FILLER_WORDS = frozenset("""
+a an the is are was were be been am do does did i me my we our you your its please
+isn aren wasn weren don doesn didn
+can could would will should shall may might tell know about of for to on in at by with
+hey hi hello thanks thank edwin
+""".split())
+
+# A question containing one of these probably refers back to the conversation
+FOLLOW_UP_WORDS = frozenset("""
+it this that these those they them he she him her his again more else further above
+previous earlier example elaborate
+""".split())
+
+# Words that change which answer is right: two questions must have the same ones to share an answer
+KEY_WORDS = frozenset("""
+what when where who whom whose which why how not no never nor cannot without
+""".split())
+
+_KEY_TERMS = frozenset(stem(w) for w in KEY_WORDS)
+_PRIME = (1 << 61) - 1
+_SEEDS = [(zlib.crc32(f"a{i}".encode()) | 1, zlib.crc32(f"b{i}".encode()))
+          for i in range(MINHASH_BANDS * MINHASH_ROWS)]
+
+
+def normalize_question(question):
+    """Question terms in order: lowercased, filler words dropped, stemmed ("isn't" becomes "not")."""
+    terms = ("not" if w == "t" else w for w in words(question))
+    return [stem(w) for w in terms if w not in FILLER_WORDS and (len(w) > 1 or w.isdigit())]
+
+
+def is_follow_up(question):
+    return any(w in FOLLOW_UP_WORDS for w in words(question))
+
+
+def shingles(terms):
+    """Single terms and adjacent pairs."""
+    return frozenset(terms) | frozenset(f"{a} {b}" for a, b in zip(terms, terms[1:]))
+
+
+def similarity(terms, other):
+    """Dice coefficient of two term sets; 0.0 unless they have the same question words and negations."""
+    if not terms or not other or terms & _KEY_TERMS != other & _KEY_TERMS:
+        return 0.0
+    return 2 * len(terms & other) / (len(terms) + len(other))
+
+
+def minhash(term_set):
+    """MinHash signature: the minimum of each seeded hash over the terms."""
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in term_set]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _SEEDS)
+
+
+def _bands(signature):
+    return [(i, signature[i * MINHASH_ROWS:(i + 1) * MINHASH_ROWS]) for i in range(MINHASH_BANDS)]
+
+
+class CachedAnswer:
+    __slots__ = ("key", "terms", "signature", "answer", "citations", "question", "created", "size")
+
+    def __init__(self, key, term_set, signature, answer, citations, question):
+        self.key = key
+        self.terms = term_set
+        self.signature = signature
+        self.answer = answer
+        self.citations = citations
+        self.question = question
+        self.created = time.monotonic()
+        self.size = (ENTRY_OVERHEAD + sys.getsizeof(answer) + sys.getsizeof(question)
+                     + sum(sys.getsizeof(s) for s in term_set)
+                     + sum(sys.getsizeof(str(c)) for c in citations))
+
+
+class AnswerCache:
+    """LRU of CachedAnswer entries with TTL, bounded by their approximate size in bytes."""
+
+    def __init__(self, max_bytes=ANSWER_CACHE_BYTES, ttl=ANSWER_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (course key, model, version, normalized question) -> CachedAnswer
+        self._buckets = {}              # (course key, model, version, band, band values) -> set of keys
+        self._versions = {}             # course key -> materials version
+        self.bytes = 0
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0, "skipped": 0, "stores": 0,
+                       "evictions": 0, "expired": 0, "invalidated": 0}
+
+    def lookup(self, courseID, model, question):
+        """
+        (CachedAnswer or None, cache key for storing the answer or None if the question
+        mustn't be cached). The key carries the current materials version.
+        """
+        terms = normalize_question(question)
+        with self._lock:
+            if not self.max_bytes or len(terms) < MIN_QUESTION_TERMS or is_follow_up(question):
+                self._stats["skipped"] += 1
+                return None, None
+            course = str(courseID)
+            scope = (course, model, self._versions.get(course, 0))
+            key = scope + (" ".join(terms),)
+
+            entry = self._live(key)
+            if entry is not None:
+                self._stats["hits"] += 1
+                return entry, key
+
+            term_set = frozenset(terms)
+            best, best_similarity = None, NEAR_DUPLICATE_THRESHOLD
+            for band in _bands(minhash(term_set)):
+                for candidate_key in list(self._buckets.get(scope + band, ())):
+                    candidate = self._live(candidate_key, touch=False)
+                    if candidate is None:
+                        continue
+                    score = similarity(term_set, candidate.terms)
+                    if score >= best_similarity:
+                        best, best_similarity = candidate, score
+            if best is not None:
+                self._entries.move_to_end(best.key)
+                self._stats["near_hits"] += 1
+                return best, key
+            self._stats["misses"] += 1
+            return None, key
+
+    def _live(self, key, touch=True):
+        """The entry under `key` if it hasn't expired (expired ones are dropped)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created > self.ttl:
+            self._discard(key)
+            self._stats["expired"] += 1
+            return None
+        if touch:
+            self._entries.move_to_end(key)
+        return entry
+
+    def store(self, key, question, answer, citations):
+        """Cache an answer under a key from lookup(); ignored if the course's materials changed since."""
+        if key is None or not answer:
+            return
+        course, model, version, normalized = key
+        term_set = frozenset(normalized.split(" "))
+        entry = CachedAnswer(key, term_set, minhash(term_set), answer, list(citations or []), question)
+        with self._lock:
+            if self._versions.get(course, 0) != version or entry.size > self.max_bytes:
+                return
+            self._discard(key)
+            self._entries[key] = entry
+            for band in _bands(entry.signature):
+                self._buckets.setdefault(key[:3] + band, set()).add(key)
+            self.bytes += entry.size
+            self._stats["stores"] += 1
+            while self.bytes > self.max_bytes and self._entries:
+                self._discard(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, courseID):
+        """Drop a course's answers and move it to a new materials version."""
+        course = str(courseID)
+        with self._lock:
+            self._versions[course] = self._versions.get(course, 0) + 1
+            for key in [key for key in self._entries if key[0] == course]:
+                self._discard(key)
+                self._stats["invalidated"] += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry.size
+        for band in _bands(entry.signature):
+            bucket_key = key[:3] + band
+            bucket = self._buckets.get(bucket_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[bucket_key]
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            })
+        lookups = stats["hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["near_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+# -------------------------------
+# Shared cache
+# -------------------------------
+_cache = AnswerCache()
+
+
+@on_materials_changed
+def _invalidate(course_id, **_):
+    _cache.invalidate(course_id)
+
+
+def cached_answer(courseID, model, question):
+    """(CachedAnswer or None, key to pass to cache_answer() or None if the question isn't cacheable)"""
+    return _cache.lookup(courseID, model, question)
+
+
+def cache_answer(key, question, answer, citations):
+    _cache.store(key, question, answer, citations)
+
+
+def answer_cache_metrics():
+    return _cache.metrics()
@@ -1,7 +1,6 @@
 import requests
 import os
 import tempfile
-from pathlib import Path
 
 CANVAS_BASE_URL = "https://canvas.asu.edu"
 
@@ -148,19 +147,10 @@ def sync_course_materials(course_id, canvas_token, connection, material_ingestio
         try:
             ingest_func = material_ingestion_funcs.get(file_type)
             if ingest_func:
-                success, message, error = ingest_func(temp_path, course_id, connection)
+                # file_url is written with the rows, so re-syncs can skip this file
+                success, message, error = ingest_func(temp_path, course_id, connection, file_url=file_url)
 
                 if success:
-                    # Update database with file_url
-                    cursor = connection.cursor()
-                    cursor.execute("""
-                        UPDATE course_materials
-                        SET file_url = %s
-                        WHERE course_id = %s AND title LIKE %s
-                    """, (file_url, course_id, f"%{Path(filename).stem}%"))
-                    connection.commit()
-                    cursor.close()
-
                     stats["ingested"] += 1
                 else:
                     stats["errors"].append(f"{filename}: {error or message}")
@@ -0,0 +1,112 @@
+"""
+Chat context loader for ask_question.
+
+Everything the chat path needs before calling Cortex (the user's active
+conversation, its last N messages, the baseline context message and the
+material chunks chosen by the search index) is fetched in ONE statement: a
+UNION ALL of tagged rows whose dependent parts key off a CTE for the
+conversation id. This replaces five sequential round trips on separate
+cursors.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+
+# One statement, one round trip. Every branch returns the same 10 columns:
+#   kind, conv_id, num, title, body, url, created_at, page, material_id, char_start
+CHAT_CONTEXT_SQL = """
+    WITH conv AS (
+        SELECT conv_id FROM conversations
+        WHERE course_id = %s AND user_id = %s AND is_assigned = TRUE
+        ORDER BY created_at DESC
+        LIMIT 1
+    )
+    SELECT 'conv' AS kind, conv_id, NULL AS num, NULL AS title, NULL AS body, NULL AS url, NULL AS created_at,
+           NULL AS page, NULL AS material_id, NULL AS char_start
+    FROM conv
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'history', m.conv_id, CASE WHEN m.userorAI THEN 1 ELSE 0 END, NULL, m.message, NULL, m.created_at,
+               NULL, NULL, NULL
+        FROM edwin_messages m
+        WHERE m.conv_id = (SELECT conv_id FROM conv)
+        ORDER BY m.created_at DESC
+        LIMIT %s
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'baseline', m.conv_id, NULL, NULL, m.message, NULL, m.created_at, NULL, NULL, NULL
+        FROM edwin_messages m
+        WHERE m.conv_id = (SELECT conv_id FROM conv) AND m.userorAI = TRUE
+        ORDER BY m.created_at ASC
+        LIMIT 1
+    )
+"""
+
+# Appended for the chunks the search index picked that aren't in the retrieval cache
+MATERIALS_BRANCH_SQL = """
+    UNION ALL
+    SELECT 'material', NULL, c.chunk_id, m.title, c.content, m.source_url, NULL, c.page_number,
+           c.material_id, c.char_start
+    FROM course_material_chunks c
+    JOIN course_materials m ON m.material_id = c.material_id
+    WHERE c.course_id = %s AND c.chunk_id IN ({placeholders})
+"""
+
+
+@dataclass
+class ChatContext:
+    """Everything ask_question needs before the LLM call."""
+    conv_id: str = None
+    # (userorAI, message, created_at), oldest first
+    history: list = field(default_factory=list)
+    baseline: str = ""
+    # (chunk_id, material_id, title, content, source_url, page_number, char_start) like
+    # SearchIndex.fetch_chunks(), in the order of the requested ids
+    materials: list = field(default_factory=list)
+
+
+def _as_datetime(value):
+    # Column types can be lost through UNION ALL on some backends
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def load_chat_context(user_id, courseID, connection, history_limit=3, chunk_ids=()):
+    """
+    Fetch conversation id, last `history_limit` messages, baseline context and the
+    given material chunks in a single round trip.
+    Returns a ChatContext (conv_id is None if the user has no active conversation).
+    """
+    sql = CHAT_CONTEXT_SQL
+    params = [courseID, user_id, history_limit]
+    chunk_ids = list(chunk_ids)
+    if chunk_ids:
+        sql += MATERIALS_BRANCH_SQL.format(placeholders=", ".join(["%s"] * len(chunk_ids)))
+        params += [courseID] + chunk_ids
+
+    cursor = connection.cursor()
+    cursor.execute(sql, tuple(params))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    context = ChatContext()
+    history = []
+    materials = {}
+    for kind, conv_id, num, title, body, url, created_at, page, material_id, char_start in rows:
+        if kind == "conv":
+            context.conv_id = conv_id
+        elif kind == "history":
+            history.append((bool(num), body, _as_datetime(created_at)))
+        elif kind == "baseline":
+            context.baseline = body or ""
+        elif kind == "material":
+            materials[num] = (num, material_id, title, body, url, page, char_start)
+
+    # History comes back newest first
+    context.history = list(reversed(history))
+    context.materials = [materials[c] for c in chunk_ids if c in materials]
+    return context
@@ -1,89 +1,84 @@
 from flask import json
-import fitz  # PyMuPDF (for PDF text/images)
-from pptx import Presentation
 import io
+import os
 import base64
 import uuid
-
-# Snowflake Cortex Configuration
-CORTEX_MODEL = "llama3-70b"  # Options: llama3-70b, llama3-8b, mistral-large, mixtral-8x7b
+from datetime import datetime
+
+from Modules.ChatContext import load_chat_context
+from Modules.Ingestion import ingest_document
+from Modules.SearchIndex import search_chunks, leading_chunks, passage
+from Modules.RetrievalCache import cached_chunks, cache_chunks, get_chunks
+from Modules.AnswerCache import cached_answer, cache_answer
+from Modules.MessageLogger import log_message, pending_messages
+from Modules.Cortex import complete, complete_async, model_for
+from Modules.QuizParser import parse_quiz
+from Modules.PromptBudget import PromptBudget, fit_prompt, estimate_tokens, chars_for_tokens, truncate_to_tokens
+from ConnectionPool import run_with_pooled_connection
+
+# Snowflake Cortex Configuration (models per endpoint: Modules/Cortex.py)
+CORTEX_MODEL = model_for("chat")
+QUIZ_MODEL = model_for("quiz")
+QUIZ_MATERIAL_CHUNKS = 4     # chunks of a material considered for a quiz prompt
+BASELINE_TOKENS = 1000       # course materials stored in a conversation's baseline message
+CHAT_OUTPUT_TOKENS = 1024    # answer tokens kept free in the chat prompt
+QUIZ_QUESTION_TOKENS = 200   # answer tokens kept free per quiz question
+QUIZ_REGENERATE_ROUNDS = 1   # follow-up completions for the questions that failed to parse
+HELPER_OUTPUT_TOKENS = 1024  # answer tokens kept free for page explanations and assignment help
+SOURCE_MIN_TOKENS = 40       # smallest useful cut of a material passage
+HISTORY_MIN_TOKENS = 24      # smallest useful cut of a history message
 
 # -----------------------------
 # Helper: Build baseline context
 # -----------------------------
-def get_baseline_context(courseID, connection, limit_chars=800):
+def get_baseline_context(courseID, connection, limit_tokens=BASELINE_TOKENS):
     """
-    Fetch course materials from DB and build system baseline context.
-    OPTIMIZED: Reduced to 800 chars to avoid Snowflake 8192 token limit.
+    Fetch course materials from DB and build system baseline context,
+    at most `limit_tokens` tokens (newest materials first).
     """
     cursor = connection.cursor()
-    # OPTIMIZATION: Only fetch 3 most recent materials
-    cursor.execute(
-        "SELECT title, content FROM course_materials WHERE course_id = %s ORDER BY created_at DESC LIMIT 3",
-        (courseID,)
-    )
+    # OPTIMIZATION: Only fetch 3 most recent materials, and only their first chunk
+    # (materials that have no chunks yet are cut down in the query)
+    cursor.execute("""
+        SELECT m.title, COALESCE(c.content, SUBSTR(m.content, 1, %s))
+        FROM course_materials m
+        LEFT JOIN course_material_chunks c ON c.material_id = m.material_id AND c.chunk_index = 0
+        WHERE m.course_id = %s
+        ORDER BY m.created_at DESC
+        LIMIT 3
+    """, (chars_for_tokens(limit_tokens), courseID))
     materials = cursor.fetchall()
     cursor.close()
 
-    baseline = f"""You are Edwin, TA AI for course {courseID}. Give helpful answers. Reference course materials when relevant.
+    budget = PromptBudget(None, limit=limit_tokens)
+    budget.add("persona", f"""You are Edwin, TA AI for course {courseID}. Give helpful answers. Reference course materials when relevant.
 
 COURSE MATERIALS:
-"""
-
-    for m in materials:
-        title, content = m
+""", priority=0)
+    for i, (title, content) in enumerate(materials, 1):
         if content:
-            baseline += f"\n{title}: {content[:limit_chars]}\n"
+            budget.add(title, f"\n{title}: {content}\n", priority=i, min_tokens=SOURCE_MIN_TOKENS)
 
+    baseline, _ = budget.build()
     return baseline
 
 
-def ingest_pdf_to_snowflake(file_path, courseID, connection):
+def ingest_pdf_to_snowflake(file_path, courseID, connection, file_url=None):
     """Extract text from PDF and insert as ONE material entry."""
-    import os
-
-    doc = fitz.open(file_path)
-    full_text = ""
-    cursor = connection.cursor()
-
-    # Extract text from all pages
-    for page_num, page in enumerate(doc):
-        text = page.get_text()
-        full_text += f"--- Page {page_num + 1} ---\n{text}\n\n"
+    success, message, material_ids = ingest_document(file_path, courseID, connection, "pdf", file_url)
+    if not success:
+        return False, message, message
 
-    # Get the PDF filename (without path)
     pdf_filename = os.path.basename(file_path)
-
-    # Store as ONE material entry with the actual filename
-    cursor.execute(
-        "INSERT INTO course_materials (course_id, title, content) VALUES (%s, %s, %s)",
-        (courseID, pdf_filename, full_text)
-    )
-
-    connection.commit()
-    cursor.close()
     return True, f"PDF '{pdf_filename}' ingested successfully as one material", None
 
 
-def ingest_pptx_to_snowflake(file_path, courseID, connection):
-    """Extract text from PPTX and insert into course_materials."""
-    prs = Presentation(file_path)
-    cursor = connection.cursor()
-
-    for i, slide in enumerate(prs.slides):
-        texts = []
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                texts.append(shape.text)
-        slide_text = "\n".join(texts)
-        print("Ready#")
-        cursor.execute(
-            "INSERT INTO course_materials (course_id, title, content) VALUES (%s, %s, %s)",
-            (courseID, f"Slide {i+1}", slide_text)
-        )
+def ingest_pptx_to_snowflake(file_path, courseID, connection, file_url=None):
+    """Extract text from PPTX and insert into course_materials (one row per slide, one round trip)."""
+    success, message, material_ids = ingest_document(file_path, courseID, connection, "pptx", file_url)
+    if not success:
+        return False, message, message
 
-    connection.commit()
-    cursor.close()
     return True, "PPTX ingested successfully", None
 
 
@@ -188,6 +183,33 @@ def log_to_snowflake(conv_id, user_id, userorai, message, connection):
     cursor.close()
 
 
+def _timestamp_key(created_at):
+    """Sort key for created_at values that may be naive (local) or timezone-aware."""
+    if isinstance(created_at, datetime):
+        return created_at.timestamp()
+    return 0.0
+
+
+def merge_pending_messages(conv_id, messages, limit):
+    """
+    Combine DB rows (userorAI, message, created_at) with messages still queued in the
+    write-behind logger, and return the last `limit` in chronological order.
+    """
+    # Snapshot the queue before the caller's rows can go stale in the other direction;
+    # a row written in between may show up twice, so de-duplicate on (message, time).
+    pending = [(row[2], row[3], row[4]) for row in pending_messages(conv_id)]
+    seen = set()
+    merged = []
+    for is_ai, message, created_at in list(messages) + pending:
+        key = (message, round(_timestamp_key(created_at), 3))
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append((is_ai, message, created_at))
+    merged.sort(key=lambda row: _timestamp_key(row[2]))
+    return merged[-limit:] if limit else merged
+
+
 # -------------------------------
 # Get conversation history
 # -------------------------------
@@ -195,7 +217,7 @@ def get_conversation_history(conv_id, connection, limit=3):
     """
     Retrieve the last N messages from a conversation.
     Returns formatted string for context.
-    OPTIMIZED: Reduced to 3 messages to avoid Snowflake 8192 token limit.
+    Includes messages still waiting in the write-behind logger.
     """
     cursor = connection.cursor()
     cursor.execute("""
@@ -209,23 +231,28 @@ def get_conversation_history(conv_id, connection, limit=3):
     messages = cursor.fetchall()
     cursor.close()
 
-    # Reverse to get chronological order
-    messages = list(reversed(messages))
+    # Chronological order, including messages not yet written
+    messages = merge_pending_messages(conv_id, messages, limit)
+    return format_history(messages)
 
-    # Format conversation history (OPTIMIZATION: Heavily limit message length)
-    history = ""
+
+def history_lines(messages):
+    """(is_ai, 'Student: ...' / 'Edwin: ...' line) for (userorAI, message, created_at) rows, oldest first."""
+    lines = []
     for is_ai, message, timestamp in messages:
         if is_ai:
             # Skip the first system message (baseline context) from history
             if "You are Edwin" in message or "TA AI" in message:
                 continue
-            # OPTIMIZATION: Truncate to 200 chars
-            history += f"Edwin: {message[:200]}\n"
+            lines.append((True, f"Edwin: {message}\n"))
         else:
-            # OPTIMIZATION: Truncate to 150 chars
-            history += f"Student: {message[:150]}\n"
+            lines.append((False, f"Student: {message}\n"))
+    return lines
+
 
-    return history
+def format_history(messages):
+    """Format (userorAI, message, created_at) rows, oldest first, as prompt text."""
+    return "".join(line for _, line in history_lines(messages))
 
 
 # --------------------------
@@ -233,164 +260,355 @@ def get_conversation_history(conv_id, connection, limit=3):
 # --------------------------
 def retrieve_relevant_materials(courseID, question, connection, limit=2):
     """
-    Retrieve most relevant course materials for the question.
-    Returns list of (title, content_snippet, source_url, full_content)
-    OPTIMIZED: Reduced to 2 materials max, 500 chars each to avoid token limit.
+    Retrieve most relevant course material chunks for the question (BM25 over every chunk in the course).
+    Returns list of dicts with score, title, page, snippet, source_url, full_content, chunk
     """
-    cursor = connection.cursor()
+    hits = search_chunks(courseID, question, connection, limit)
+    chunks = get_chunks(courseID, [chunk_id for chunk_id, _ in hits], connection)
+    return build_citations(courseID, question, chunks, hits)
 
-    # OPTIMIZATION: Only fetch 10 most recent materials
-    cursor.execute("""
-        SELECT material_id, title, content, source_url
-        FROM course_materials
-        WHERE course_id = %s AND content IS NOT NULL
-        ORDER BY created_at DESC
-        LIMIT 10
-    """, (courseID,))
 
-    materials = cursor.fetchall()
-    cursor.close()
-
-    if not materials:
-        return []
-
-    # Simple keyword matching for relevance scoring
-    question_lower = question.lower()
-    # OPTIMIZATION: Filter out common words for better matching
-    stop_words = {'the', 'is', 'at', 'which', 'on', 'a', 'an', 'as', 'are', 'was', 'were', 'be', 'been', 'what', 'when', 'where', 'who', 'how'}
-    question_words = set(w for w in question_lower.split() if w not in stop_words and len(w) > 2)
-
-    scored_materials = []
-    for material_id, title, content, source_url in materials:
+def build_citations(courseID, question, chunks, hits):
+    """
+    Turn CachedChunks ranked by the search index into dicts with score, title, page, snippet,
+    highlights, source_url, full_content and chunk, where snippet is the passage of the chunk
+    that best matches the question and highlights are the question's terms in it as
+    [start, end] offsets into the snippet.
+    """
+    scores = dict(hits)
+    results = []
+    for chunk in chunks:
+        content = chunk.content
         if not content:
             continue
 
-        content_lower = content.lower()
-        title_lower = title.lower()
-
-        # OPTIMIZATION: Score based on keyword overlap
-        score = 0
-
-        # Boost score if question words appear in title (highest priority)
-        title_boost = sum(10 for word in question_words if word in title_lower)
-        score += title_boost
-
-        # Quick content check - count matches in first 500 chars only
-        content_sample = content_lower[:500]
-        overlap = sum(1 for word in question_words if word in content_sample)
-        score += overlap
-
-        # OPTIMIZATION: Only process materials with minimum score
-        if score > 0:
-            # Extract relevant snippet (smaller for speed)
-            snippet = content[:150]
-            for word in question_words:
-                if word in content_lower:
-                    idx = content_lower.find(word)
-                    start = max(0, idx - 75)
-                    end = min(len(content), idx + 75)
-                    snippet = "..." + content[start:end] + "..."
-                    break
-
-            scored_materials.append({
-                'score': score,
-                'title': title,
-                'snippet': snippet,
-                'source_url': source_url or '',
-                'full_content': content[:500]  # OPTIMIZATION: Reduced from 1500 to 500 chars
-            })
-
-    # Sort by score and return top N
-    scored_materials.sort(key=lambda x: x['score'], reverse=True)
-    return scored_materials[:limit]
+        snippet_start, snippet_end, highlights = passage(courseID, chunk, question, 150)
+        results.append({
+            'score': scores.get(chunk.chunk_id, 0.0),
+            'title': chunk.title,
+            'page': chunk.page_number,
+            'snippet': "..." + content[snippet_start:snippet_end] + "...",
+            'highlights': [[start + 3, end + 3] for start, end in highlights],   # after the leading "..."
+            'source_url': chunk.source_url or '',
+            'full_content': content,
+            'chunk': chunk
+        })
+    return results
+
+
+def passage_shrink(courseID, question, chunk):
+    """PromptBudget shrink for a material chunk: keep the passage that best matches the question."""
+    def shrink(text, max_tokens):
+        header = text[:text.index(":\n") + 2]
+        max_tokens -= estimate_tokens(header)
+        start, end, _ = passage(courseID, chunk, question, chars_for_tokens(max_tokens))
+        return header + truncate_to_tokens(chunk.content[start:end], max_tokens) + "\n"
+    return shrink
 
 
 # --------------------------
 # Ask a question in a thread using Snowflake Cortex
 # --------------------------
-def ask_question(user_id, courseID, question, connection, model=None):
+# The question path is split in three so the async server (asgi.py) can await
+# the Cortex call without holding a thread or a connection:
+#   prepare_question (DB) -> Cortex completion -> finish_question (no DB)
+def build_chat_prompt(courseID, model, baseline, sources, history, question):
     """
-    Ask a question using Snowflake Cortex AI with RAG citations.
-    Returns: (success, message, answer_or_dict)
-    answer_or_dict format: {"answer": "...", "citations": [...]}
+    Pack the chat prompt into the model's budget. The question always goes in; then,
+    in order: the best source, the latest message, the baseline, the other sources,
+    older messages. Returns (prompt, report); report["kept"] names the sources used.
     """
-    conv_id = get_user_conversation(user_id, courseID, connection)
-    if not conv_id:
-        return False, "No active thread found. Start a new one first.", None
+    budget = PromptBudget(model, output_tokens=CHAT_OUTPUT_TOKENS)
+    budget.add("baseline", baseline + "\n\n", priority=3, min_tokens=SOURCE_MIN_TOKENS)
 
-    # Log user question
-    log_to_snowflake(conv_id, user_id, False, question, connection)
+    budget.header("sources", "\nRELEVANT COURSE MATERIALS:\n")
+    for i, mat in enumerate(sources, 1):
+        where = f" (page {mat['page']})" if mat['page'] else ""
+        budget.add(f"source {i}", f"\n[Source {i}] {mat['title']}{where}:\n{mat['full_content']}\n",
+                   priority=1 if i == 1 else 3 + i, min_tokens=SOURCE_MIN_TOKENS,
+                   shrink=passage_shrink(courseID, question, mat['chunk']), group="sources")
 
-    # Get conversation history
-    history = get_conversation_history(conv_id, connection)
+    budget.header("history", "\n\nCONVERSATION HISTORY:\n")
+    for i, (is_ai, line) in enumerate(history):
+        # Newest message right after the best source, older ones last
+        age = len(history) - i
+        budget.add(f"history -{age}", line, priority=2 if age == 1 else 10 + age,
+                   min_tokens=HISTORY_MIN_TOKENS, group="history")
 
-    # Retrieve relevant course materials (RAG)
-    relevant_materials = retrieve_relevant_materials(courseID, question, connection, limit=3)
+    budget.add("question", f"""
 
-    # Build context from relevant materials
-    materials_context = ""
-    citations = []
+Student: {question}
 
-    if relevant_materials:
-        materials_context = "\n\nRELEVANT COURSE MATERIALS:\n"
-        for i, mat in enumerate(relevant_materials, 1):
-            materials_context += f"\n[Source {i}] {mat['title']}:\n{mat['full_content']}\n"
-            citations.append({
-                'title': mat['title'],
-                'url': mat['source_url'],
-                'snippet': mat['snippet']
-            })
-
-    # Get baseline context (first message in conversation)
-    cursor = connection.cursor()
-    cursor.execute("""
-        SELECT message FROM edwin_messages
-        WHERE conv_id = %s AND userorAI = TRUE
-        ORDER BY created_at ASC
-        LIMIT 1
-    """, (conv_id,))
-    baseline_row = cursor.fetchone()
-    baseline_context = baseline_row[0] if baseline_row else ""
+Edwin (cite sources when using information from course materials):""", priority=0, min_tokens=SOURCE_MIN_TOKENS)
+    return budget.build()
+
+
+def prepare_question(user_id, courseID, question, connection, model=None):
+    """
+    Load context, log the question and build the Cortex prompt.
+    Returns: (success, message, state) where state is passed to finish_question.
+    If the course has already answered the same question, state["cached_answer"] holds
+    that answer and there is no prompt.
+    """
+    model = model or CORTEX_MODEL
+    hit, answer_key = cached_answer(courseID, model, question)
+    if hit is not None:
+        conv_id = get_user_conversation(user_id, courseID, connection)
+        if not conv_id:
+            return False, "No active thread found. Start a new one first.", None
+        log_message(conv_id, user_id, False, question)
+        print(f"DEBUG: Answer cache hit for '{question}' (cached from '{hit.question}')")
+        return True, "Answer cached", {
+            "conv_id": conv_id,
+            "user_id": user_id,
+            "model": model,
+            "prompt": None,
+            "citations": hit.citations,
+            "cached_answer": hit.answer
+        }
 
-    # Build full prompt for Cortex with RAG context
-    full_prompt = f"""{baseline_context}
+    # Rank every chunk in the course in-process, take what the retrieval cache already
+    # holds, then one round trip for conversation id, recent history, baseline and
+    # the content of any chunks not cached yet
+    hits = search_chunks(courseID, question, connection, limit=3)
+    chunk_ids = [chunk_id for chunk_id, _ in hits]
+    found, missing = cached_chunks(chunk_ids)
+    context = load_chat_context(user_id, courseID, connection, history_limit=3, chunk_ids=missing)
+    found.update(cache_chunks(courseID, context.materials))
+    conv_id = context.conv_id
+    if not conv_id:
+        return False, "No active thread found. Start a new one first.", None
 
-{materials_context}
+    # Log user question (write-behind: batched off the request path)
+    log_message(conv_id, user_id, False, question)
 
-CONVERSATION HISTORY:
-{history}
+    # Conversation history before the question just queued (it ends the prompt)
+    history = history_lines(merge_pending_messages(conv_id, context.history, 3))
+    if history and history[-1] == (False, f"Student: {question}\n"):
+        history.pop()
 
-Student: {question}
+    # Relevant course materials (RAG)
+    relevant_materials = build_citations(courseID, question, [found[c] for c in chunk_ids if c in found], hits)
 
-Edwin (cite sources when using information from course materials):"""
+    full_prompt, report = build_chat_prompt(courseID, model, context.baseline, relevant_materials, history, question)
 
-    # Use Snowflake Cortex to generate response
-    cortex_model = model or CORTEX_MODEL
-    cursor.execute("""
-        SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, %s)
-    """, (cortex_model, full_prompt))
+    # Cite the sources that made it into the prompt; neighbouring chunks of the same page are one citation
+    citations = []
+    for i, mat in enumerate(relevant_materials, 1):
+        if f"source {i}" not in report["kept"]:
+            continue
+        if any(c['title'] == mat['title'] and c['page'] == mat['page'] for c in citations):
+            continue
+        citations.append({
+            'title': mat['title'],
+            'page': mat['page'],
+            'url': mat['source_url'],
+            'snippet': mat['snippet'],
+            'highlights': mat['highlights']
+        })
+
+    state = {
+        "conv_id": conv_id,
+        "user_id": user_id,
+        "model": model,
+        "prompt": full_prompt,
+        "citations": citations,
+        "prompt_report": report,
+        "question": question,
+        "answer_key": answer_key
+    }
+    return True, "Prompt ready", state
 
-    result = cursor.fetchone()
-    answer = result[0] if result else "I'm sorry, I couldn't generate a response."
 
-    cursor.close()
+def finish_question(state, answer):
+    """Log the AI answer and build the response. Returns: (success, message, answer_dict)"""
+    if answer and state.get("answer_key") is not None:
+        cache_answer(state["answer_key"], state["question"], answer, state["citations"])
+    answer = answer or "I'm sorry, I couldn't generate a response."
 
-    # Log AI answer
-    log_to_snowflake(conv_id, user_id, True, answer, connection)
+    # Log AI answer (write-behind)
+    log_message(state["conv_id"], state["user_id"], True, answer)
 
     # Return answer with citations
     response_data = {
         "answer": answer,
-        "citations": citations
+        "citations": state["citations"]
     }
 
     return True, "Successful message!", response_data
 
 
+def ask_question(user_id, courseID, question, connection, model=None):
+    """
+    Ask a question using Snowflake Cortex AI with RAG citations.
+    Returns: (success, message, answer_or_dict)
+    answer_or_dict format: {"answer": "...", "citations": [...]}
+    """
+    status, message, state = prepare_question(user_id, courseID, question, connection, model)
+    if not status:
+        return status, message, state
+    if "cached_answer" in state:
+        return finish_question(state, state["cached_answer"])
+
+    # Use Snowflake Cortex to generate response
+    answer = complete(state["model"], state["prompt"], connection, endpoint="chat")
+    return finish_question(state, answer)
+
+
+async def ask_question_async(user_id, courseID, question, model=None):
+    """ask_question for the async server: the connection is only held while preparing."""
+    status, message, state = await run_with_pooled_connection(
+        prepare_question, user_id, courseID, question, model=model
+    )
+    if not status:
+        return status, message, state
+    if "cached_answer" in state:
+        return finish_question(state, state["cached_answer"])
+
+    answer = await complete_async(state["model"], state["prompt"], endpoint="chat")
+    return finish_question(state, answer)
+
+
 # --------------------------
 # Generate Quiz Questions using Snowflake Cortex
 # --------------------------
-def generate_quiz(courseID, topic, difficulty, num_questions, connection, model=None, material_id=None):
+def material_excerpt(courseID, material_id, topic, connection, max_tokens):
+    """
+    Up to `max_tokens` of one material: the chunks that best match the topic, topped up
+    with its first chunks, joined in document order with overlaps removed.
+    """
+    hits = search_chunks(courseID, topic, connection, QUIZ_MATERIAL_CHUNKS, material_id=material_id)
+    leading = leading_chunks(courseID, material_id, connection, QUIZ_MATERIAL_CHUNKS)
+    ranked = list(dict.fromkeys([chunk_id for chunk_id, _ in hits] + leading))
+    chunks = get_chunks(courseID, ranked, connection)
+
+    # Best chunks first until the budget is spent, then back into reading order
+    selected, used = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk.content)
+        if selected and used + tokens > max_tokens:
+            break
+        selected.append(chunk)
+        used += tokens
+    selected.sort(key=lambda chunk: chunk.char_start)
+
+    excerpt, end = "", None
+    for chunk in selected:
+        content, start = chunk.content, chunk.char_start
+        if end is not None and start < end:
+            content = content[end - start:]     # skip the overlap with the previous chunk
+        elif end is not None:
+            excerpt += "\n...\n"
+        excerpt += content
+        end = start + len(chunk.content)
+    return truncate_to_tokens(excerpt, max_tokens)
+
+
+def build_quiz_prompt(courseID, topic, difficulty, num_questions, connection, material_id=None, model=None,
+                      context=None):
+    """
+    Build the quiz generation prompt from one material, prepared material text (`context`)
+    or the course baseline, sized to the quiz model's budget.
+    Returns: (success, message, prompt)
+    """
+    # Build quiz generation prompt (simplified for speed)
+    task = f"""
+
+TASK: Generate {num_questions} {difficulty}-level multiple choice questions about: {topic}
+
+REQUIREMENTS:
+1. Each question must have exactly 4 options
+2. Questions should test understanding, not just memorization
+3. Include detailed explanations for correct answers
+4. Base questions on the course materials provided above
+5. Make questions progressively harder within the difficulty level
+
+OUTPUT FORMAT (strict JSON only, no other text):
+{{
+    "title": "{topic}",
+    "description": "Brief description of what this quiz covers",
+    "questions": [
+        {{
+            "question": "Question text here?",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correct": 0,
+            "explanation": "Detailed explanation of why this answer is correct"
+        }}
+    ]
+}}
+
+Generate the quiz now:"""
+    budget = PromptBudget(model or QUIZ_MODEL, output_tokens=QUIZ_QUESTION_TOKENS * int(num_questions))
+    room = budget.limit - estimate_tokens(task)
+
+    if context is not None:
+        baseline_context = context
+    # If material_id is provided, use ONLY that material: its chunks that best match the topic
+    elif material_id:
+        cursor = connection.cursor()
+        print(f"DEBUG: Fetching material_id={material_id} for courseID={courseID}")
+        cursor.execute("""
+            SELECT title FROM course_materials
+            WHERE material_id = %s AND course_id = %s
+        """, (material_id, courseID))
+        material = cursor.fetchone()
+        cursor.close()
+
+        if not material:
+            print(f"DEBUG: Material {material_id} not found in database")
+            return False, f"Material {material_id} not found", None
+
+        title = material[0]
+        # ids from request JSON may arrive as strings
+        material_id = int(material_id) if str(material_id).isdigit() else material_id
+        header = f"""You are Edwin, TA AI. Generate quiz questions based on this material:
+
+MATERIAL: {title}
+CONTENT: """
+        content = material_excerpt(courseID, material_id, topic, connection, room - estimate_tokens(header))
+        print(f"DEBUG: Found material: {title}, excerpt length: {len(content)}")
+
+        baseline_context = f"""{header}{content}
+"""
+    else:
+        # Use general course materials if no specific material
+        baseline_context = get_baseline_context(courseID, connection, limit_tokens=min(room, BASELINE_TOKENS))
+
+    budget.add("material", baseline_context, priority=1, min_tokens=SOURCE_MIN_TOKENS)
+    budget.add("task", task, priority=0)
+    prompt, _ = budget.build()
+    return True, "Prompt ready", prompt
+
+
+def parse_quiz_response(response):
+    """Parse the model's quiz JSON, keeping the questions that parse. Returns: (success, message, quiz_data)"""
+    status, message, quiz_data, _ = parse_quiz_questions(response)
+    return status, message, quiz_data
+
+
+def parse_quiz_questions(response):
+    """parse_quiz_response, plus the questions that failed ([{index, error}]). Returns: (success, message, quiz_data, failed)"""
+    if not response:
+        return False, "Failed to generate quiz", None, []
+
+    quiz_data, failed = parse_quiz(response)
+    if quiz_data is None:
+        return False, "AI response was not valid JSON", None, []
+    if failed:
+        print(f"WARNING: {len(failed)} generated quiz question(s) failed to parse: {failed}")
+    if not quiz_data["questions"]:
+        return False, "No usable questions in the AI response", None, failed
+
+    return True, "Quiz generated successfully", quiz_data, failed
+
+
+def _missing_questions(quiz_data, failed, num_questions):
+    """Questions to generate again: the failed ones, as far as the quiz is still short."""
+    return min(len(failed), int(num_questions) - len(quiz_data["questions"])) if quiz_data else 0
+
+
+def generate_quiz(courseID, topic, difficulty, num_questions, connection, model=None, material_id=None,
+                  endpoint="quiz"):
     """
     Generate quiz questions using Snowflake Cortex AI based on course materials.
 
@@ -402,6 +620,7 @@ def generate_quiz(courseID, topic, difficulty, num_questions, connection, model=
         connection: Database connection
         model: Optional Cortex model override
         material_id: Optional specific material ID to generate quiz from
+        endpoint: Completion cache policy name ("quiz", "exam")
 
     Returns:
         (success, message, quiz_data)
@@ -419,99 +638,193 @@ def generate_quiz(courseID, topic, difficulty, num_questions, connection, model=
             ]
         }
     """
-    cursor = connection.cursor()
+    status, message, prompt = build_quiz_prompt(courseID, topic, difficulty, num_questions, connection, material_id,
+                                                model or QUIZ_MODEL)
+    if not status:
+        return status, message, None
 
-    # If material_id is provided, fetch ONLY that specific material
-    if material_id:
-        print(f"DEBUG: Fetching material_id={material_id} for courseID={courseID}")
-        cursor.execute("""
-            SELECT title, content FROM course_materials
-            WHERE material_id = %s AND course_id = %s
-        """, (material_id, courseID))
-        material = cursor.fetchone()
+    # Use Snowflake Cortex to generate quiz (use faster model)
+    try:
+        response = complete(model or QUIZ_MODEL, prompt, connection, endpoint=endpoint)
+    except Exception as e:
+        return False, f"Error generating quiz: {str(e)}", None
 
-        if not material:
-            cursor.close()
-            print(f"DEBUG: Material {material_id} not found in database")
-            return False, f"Material {material_id} not found", None
+    status, message, quiz_data, failed = parse_quiz_questions(response)
+    # Only the questions that failed are asked for again
+    for _ in range(QUIZ_REGENERATE_ROUNDS):
+        missing = _missing_questions(quiz_data, failed, num_questions)
+        if missing <= 0:
+            break
+        retry_status, _, prompt = build_quiz_prompt(courseID, topic, difficulty, missing, connection, material_id,
+                                                    model or QUIZ_MODEL)
+        try:
+            response = complete(model or QUIZ_MODEL, prompt, connection, endpoint=endpoint) if retry_status else None
+        except Exception as e:
+            print(f"WARNING: Regenerating {missing} quiz question(s) failed: {e}")
+            break
+        retry_status, _, retry_data, failed = parse_quiz_questions(response)
+        if retry_status:
+            quiz_data["questions"] += retry_data["questions"][:missing]
+    return status, message, quiz_data
+
+
+async def generate_quiz_async(courseID, topic, difficulty, num_questions, model=None, material_id=None,
+                              endpoint="quiz"):
+    """generate_quiz for the async server: the connection is only held while building the prompt."""
+    status, message, prompt = await run_with_pooled_connection(
+        build_quiz_prompt, courseID, topic, difficulty, num_questions, material_id=material_id,
+        model=model or QUIZ_MODEL
+    )
+    if not status:
+        return status, message, None
 
-        print(f"DEBUG: Found material: {material[0]}, content length: {len(material[1]) if material[1] else 0}")
+    try:
+        response = await complete_async(model or QUIZ_MODEL, prompt, endpoint=endpoint)
+    except Exception as e:
+        return False, f"Error generating quiz: {str(e)}", None
+
+    status, message, quiz_data, failed = parse_quiz_questions(response)
+    for _ in range(QUIZ_REGENERATE_ROUNDS):
+        missing = _missing_questions(quiz_data, failed, num_questions)
+        if missing <= 0:
+            break
+        retry_status, _, prompt = await run_with_pooled_connection(
+            build_quiz_prompt, courseID, topic, difficulty, missing, material_id=material_id,
+            model=model or QUIZ_MODEL
+        )
+        try:
+            response = await complete_async(model or QUIZ_MODEL, prompt, endpoint=endpoint) if retry_status else None
+        except Exception as e:
+            print(f"WARNING: Regenerating {missing} quiz question(s) failed: {e}")
+            break
+        retry_status, _, retry_data, failed = parse_quiz_questions(response)
+        if retry_status:
+            quiz_data["questions"] += retry_data["questions"][:missing]
+    return status, message, quiz_data
 
-        title, content = material
-        baseline_context = f"""You are Edwin, TA AI. Generate quiz questions based on this material:
 
-MATERIAL: {title}
-CONTENT: {content[:3000]}
+# --------------------------
+# Page explanations and assignment help
+# --------------------------
+def build_explain_prompt(pageTitle, content, model=CORTEX_MODEL):
+    """Prompt for /api/explainPage in 'explain' mode (page content cut to the model's budget)."""
+    prompt, _ = fit_prompt(model, f"""You are an educational AI assistant. Analyze the following course page and provide:
+
+1. A brief summary (2-3 sentences)
+2. Key points (3-5 bullet points)
+3. Common mistakes students make with this topic (2-3 points)
+
+Page Title: {pageTitle}
+Content:
+""", content, """
+
+Respond in JSON format:
+{
+  "summary": "...",
+  "keyPoints": ["...", "..."],
+  "commonMistakes": ["...", "..."]
+}""", HELPER_OUTPUT_TOKENS, name="page content")
+    return prompt
+
+
+def parse_explanation(result):
+    """Explanation JSON from the model, or the raw text as the summary."""
+    try:
+        return json.loads(result)
+    except Exception:
+        return {
+            "summary": result,
+            "keyPoints": [],
+            "commonMistakes": []
+        }
+
+
+def build_assignment_prompt(mode, assignmentText, dueDate=None, model=CORTEX_MODEL):
+    """Prompt for /api/assignmentHelper ('summary', 'checklist' or 'plan'), assignment text cut to the model's budget."""
+    if mode == 'summary':
+        before = """You are an educational AI assistant helping a student understand their assignment.
+
+Assignment:
 """
-    else:
-        # Use general course materials if no specific material
-        baseline_context = get_baseline_context(courseID, connection, limit_chars=600)
+        after = """
 
-    cursor.close()
+Provide a clear, concise summary of what the student needs to do. Include:
+1. Main objective (1-2 sentences)
+2. Key requirements (3-5 bullet points)
+3. Important notes or warnings
 
-    # Build quiz generation prompt (simplified for speed)
-    prompt = f"""{baseline_context}
+Respond in JSON format:
+{
+  "summary": "Main objective...",
+  "requirements": ["req1", "req2", "req3"],
+  "notes": ["note1", "note2"]
+}"""
 
-TASK: Generate {num_questions} {difficulty}-level multiple choice questions about: {topic}
+    elif mode == 'checklist':
+        before = """You are an educational AI assistant creating an actionable checklist for a student.
 
-REQUIREMENTS:
-1. Each question must have exactly 4 options
-2. Questions should test understanding, not just memorization
-3. Include detailed explanations for correct answers
-4. Base questions on the course materials provided above
-5. Make questions progressively harder within the difficulty level
+Assignment:
+"""
+        after = f"""
+{f"Due Date: {dueDate}" if dueDate else ""}
 
-OUTPUT FORMAT (strict JSON only, no other text):
+Create a step-by-step checklist of tasks the student should complete. Be specific and actionable.
+Include time estimates if the due date is provided.
+
+Respond in JSON format:
 {{
-    "title": "{topic}",
-    "description": "Brief description of what this quiz covers",
-    "questions": [
-        {{
-            "question": "Question text here?",
-            "options": ["Option A", "Option B", "Option C", "Option D"],
-            "correct": 0,
-            "explanation": "Detailed explanation of why this answer is correct"
-        }}
-    ]
-}}
+  "checklist": [
+    {{"task": "Step 1 description", "estimated_hours": 2}},
+    {{"task": "Step 2 description", "estimated_hours": 1}}
+  ],
+  "totalHours": 8,
+  "tips": ["tip1", "tip2"]
+}}"""
 
-Generate the quiz now:"""
+    else:
+        due_date_info = f"Due Date: {dueDate}\n\n" if dueDate else ""
+        before = """You are an educational AI assistant creating a study plan for a student.
 
-    # Use Snowflake Cortex to generate quiz (use faster model)
-    cortex_model = model or "mixtral-8x7b"  # Faster model for quiz generation
-    cursor = connection.cursor()
+Assignment:
+"""
+        after = f"""
 
-    try:
-        cursor.execute("""
-            SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, %s)
-        """, (cortex_model, prompt))
+{due_date_info}Create a day-by-day study plan. Break down the work into manageable daily tasks.
+If no due date is provided, create a 7-day plan.
 
-        result = cursor.fetchone()
-        response = result[0] if result else None
+Respond in JSON format:
+{{
+  "studyPlan": [
+    {{"day": 1, "dayLabel": "Today", "tasks": ["task1", "task2"], "hours": 2}},
+    {{"day": 2, "dayLabel": "Tomorrow", "tasks": ["task3"], "hours": 1}}
+  ],
+  "totalDays": 7,
+  "advice": ["advice1", "advice2"]
+}}"""
 
-        if not response:
-            cursor.close()
-            return False, "Failed to generate quiz", None
+    prompt, _ = fit_prompt(model, before, assignmentText, after, HELPER_OUTPUT_TOKENS, name="assignment")
+    return prompt
 
-        # Parse JSON response
-        import json
 
-        # Try to extract JSON from response (in case AI added extra text)
-        if '{' in response:
-            json_start = response.index('{')
-            json_end = response.rindex('}') + 1
-            json_str = response[json_start:json_end]
-            quiz_data = json.loads(json_str)
-        else:
-            cursor.close()
-            return False, "AI response was not valid JSON", None
+def parse_assignment_response(result, mode):
+    """Assignment helper JSON from the model, or a mode-shaped fallback."""
+    try:
+        return json.loads(result)
+    except Exception:
+        return {
+            "summary": result if mode == 'summary' else "",
+            "checklist": [] if mode == 'checklist' else None,
+            "studyPlan": [] if mode == 'plan' else None
+        }
 
-        cursor.close()
-        return True, "Quiz generated successfully", quiz_data
 
-    except Exception as e:
-        cursor.close()
-        return False, f"Error generating quiz: {str(e)}", None
+def count_course_materials(courseID, connection):
+    """Number of materials stored for a course (used to flag grounded answers)."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM course_materials WHERE course_id = %s", (courseID,))
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
 
 
 if __name__ == "__main__":
@@ -0,0 +1,263 @@
+"""
+Content-addressed cache of Cortex completions.
+
+Every COMPLETE call used to be generated from scratch, even when its prompt
+was identical to an earlier one. For example, every student who clicks
+"Explain" on the same Canvas page sent the same prompt. Completions are now
+stored under sha256(model, prompt, params) in two tiers:
+  - memory: an LRU per process, bounded by EDWIN_COMPLETION_CACHE_MB
+  - disk: a SQLite file shared by every worker process on the host
+    (EDWIN_COMPLETION_CACHE_PATH, empty to disable), pruned to
+    EDWIN_COMPLETION_CACHE_DISK_MB by least recent use
+Entries older than EDWIN_COMPLETION_CACHE_TTL seconds are ignored.
+
+Call sites name their endpoint. Endpoints whose answers should differ on every
+call (quiz and exam generation, where a second click should bring new
+questions) opt out in COMPLETION_CACHE_POLICY, or with
+EDWIN_COMPLETION_CACHE_OPTOUT=name,name.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+COMPLETION_CACHE_BYTES = int(os.environ.get("EDWIN_COMPLETION_CACHE_MB", "32")) * 1024 * 1024
+COMPLETION_CACHE_PATH = os.environ.get(
+    "EDWIN_COMPLETION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "completion_cache.db")
+)
+COMPLETION_CACHE_DISK_BYTES = int(os.environ.get("EDWIN_COMPLETION_CACHE_DISK_MB", "256")) * 1024 * 1024
+COMPLETION_CACHE_TTL = int(os.environ.get("EDWIN_COMPLETION_CACHE_TTL", str(7 * 24 * 3600)))   # seconds
+PRUNE_EVERY = 200              # disk writes between size checks
+ENTRY_OVERHEAD = 200           # key, dict slot and tuple per memory entry (approximate)
+
+# Endpoint -> whether its completions are cached (unlisted endpoints are)
+COMPLETION_CACHE_POLICY = {
+    "chat": True,
+    "explain": True,
+    "assignment": True,
+    "quiz": False,      # a new quiz each time
+    "exam": False,
+}
+for _name in filter(None, os.environ.get("EDWIN_COMPLETION_CACHE_OPTOUT", "").split(",")):
+    COMPLETION_CACHE_POLICY[_name.strip()] = False
+
+DISK_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS completions (
+        key TEXT PRIMARY KEY,
+        model TEXT,
+        completion TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        used_at REAL NOT NULL
+    )
+"""
+
+
+def completion_key(model, prompt, params=None):
+    """sha256 hex of the model, the prompt and any generation parameters."""
+    payload = json.dumps([model, prompt, params or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_enabled(endpoint):
+    return bool(endpoint) and COMPLETION_CACHE_POLICY.get(endpoint, True)
+
+
+class CompletionCache:
+    """Memory LRU in front of a SQLite file, both keyed by completion_key()."""
+
+    def __init__(self, max_bytes=COMPLETION_CACHE_BYTES, path=COMPLETION_CACHE_PATH,
+                 disk_bytes=COMPLETION_CACHE_DISK_BYTES, ttl=COMPLETION_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (completion, created_at, size)
+        self.bytes = 0
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+                       "disk_errors": 0, "disk_pruned": 0, "bypassed": 0}
+        self._by_endpoint = {}          # endpoint -> {"hits", "misses"}
+
+    # -------------------------------
+    # Lookups
+    # -------------------------------
+    def get(self, key, endpoint=None):
+        """The cached completion for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                self._discard(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._count(endpoint, "hits", "memory_hits")
+                return entry[0]
+
+        row = self._disk_get(key, now)
+        with self._lock:
+            if row is None:
+                self._count(endpoint, "misses", "misses")
+                return None
+            self._count(endpoint, "hits", "disk_hits")
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key, completion, model=None):
+        if not completion:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, completion, now)
+            self._stats["stores"] += 1
+        self._disk_put(key, model, completion, now)
+
+    def bypass(self, endpoint):
+        with self._lock:
+            self._count(endpoint, "bypassed", "bypassed")
+
+    def _count(self, endpoint, kind, stat):
+        self._stats[stat] += 1
+        if endpoint:
+            counts = self._by_endpoint.setdefault(endpoint, {"hits": 0, "misses": 0, "bypassed": 0})
+            counts[kind] += 1
+
+    def _remember(self, key, completion, created_at):
+        size = ENTRY_OVERHEAD + sys.getsizeof(completion)
+        if size > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (completion, created_at, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._entries:
+            self._discard(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    # -------------------------------
+    # Disk tier
+    # -------------------------------
+    def _connection(self):
+        """The SQLite connection (opened on first use), or None if the disk tier is off or broken."""
+        if not self.path:
+            return None
+        if self._disk is None:
+            self._disk = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("PRAGMA synchronous=NORMAL")
+            self._disk.execute(DISK_SCHEMA)
+            self._disk.execute("CREATE INDEX IF NOT EXISTS idx_completions_used ON completions (used_at)")
+        return self._disk
+
+    def _disk_get(self, key, now):
+        try:
+            with self._disk_lock:
+                disk = self._connection()
+                if disk is None:
+                    return None
+                row = disk.execute("SELECT completion, created_at FROM completions WHERE key = ?",
+                                   (key,)).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.ttl:
+                    disk.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    return None
+                disk.execute("UPDATE completions SET used_at = ? WHERE key = ?", (now, key))
+                return row
+        except sqlite3.Error as e:
+            self._disk_failed(e)
+            return None
+
+    def _disk_put(self, key, model, completion, now):
+        try:
+            with self._disk_lock:
+                disk = self._connection()
+                if disk is None:
+                    return
+                disk.execute(
+                    "INSERT OR REPLACE INTO completions (key, model, completion, size, created_at, used_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, completion, len(completion.encode("utf-8")), now, now)
+                )
+                self._writes += 1
+                if self._writes % PRUNE_EVERY == 0:
+                    self._prune(disk, now)
+        except sqlite3.Error as e:
+            self._disk_failed(e)
+
+    def _prune(self, disk, now):
+        """Drop expired rows, then the least recently used ones beyond disk_bytes."""
+        pruned = disk.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl,)).rowcount
+        total = disk.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total > self.disk_bytes:
+            # Oldest use first until the running total of what's left fits
+            cutoff = disk.execute("""
+                SELECT used_at FROM (
+                    SELECT used_at, SUM(size) OVER (ORDER BY used_at DESC) AS kept FROM completions
+                ) WHERE kept > ? ORDER BY used_at DESC LIMIT 1
+            """, (self.disk_bytes,)).fetchone()
+            if cutoff is not None:
+                pruned += disk.execute("DELETE FROM completions WHERE used_at <= ?", (cutoff[0],)).rowcount
+        with self._lock:
+            self._stats["disk_pruned"] += pruned
+
+    def _disk_failed(self, error):
+        print(f"WARNING: Completion cache disk tier error: {error}")
+        if self._disk is None:
+            self.path = None    # couldn't open the file: memory tier only from now on
+        with self._lock:
+            self._stats["disk_errors"] += 1
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "disk_path": self.path or None,
+                "endpoints": {name: dict(counts) for name, counts in self._by_endpoint.items()},
+            })
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+# -------------------------------
+# Shared cache
+# -------------------------------
+_cache = CompletionCache()
+
+
+def cached_completion(endpoint, model, prompt, params=None):
+    """
+    (completion or None, key to pass to store_completion() or None if this endpoint doesn't cache)
+    """
+    if not cache_enabled(endpoint):
+        if endpoint:
+            _cache.bypass(endpoint)
+        return None, None
+    key = completion_key(model, prompt, params)
+    return _cache.get(key, endpoint), key
+
+
+def store_completion(key, model, completion):
+    if key is not None:
+        _cache.put(key, completion, model)
+
+
+def completion_cache_metrics():
+    return _cache.metrics()
@@ -0,0 +1,324 @@
+"""
+Pool of ready-to-claim blank conversations.
+
+/api/newConversation used to create a blank conversation on every call (a
+baseline-context query, two INSERTs and two commits) and then claim it. A
+background manager now keeps CONVERSATION_POOL_SIZE unassigned conversations
+ready for every recently active course and refills them off the request path.
+Starting a thread is a single atomic claim:
+
+    UPDATE conversations SET user_id = ..., is_assigned = TRUE
+    WHERE id = ... AND is_assigned = FALSE      -- rowcount 0 => someone else won, retry
+
+Each course's baseline context is cached and rebuilt when its materials change
+(see Modules/MaterialEvents.py). When that happens, the baseline message of
+every still-unclaimed conversation is refreshed too. Those events only reach
+the process that made the change, so each claim and refill also compares the
+course's material count and newest material_id with the ones the cached
+baseline was built from, and a baseline older than BASELINE_TTL is rebuilt
+regardless. A claim that finds the cache out of date creates its
+conversation inline from a fresh baseline instead of taking a ready one.
+"""
+import random
+import threading
+import time
+import uuid
+
+from ConnectionPool import pooled_connection
+from Modules.ChatGPT import get_baseline_context
+from Modules.MaterialEvents import on_materials_changed
+
+CONVERSATION_POOL_SIZE = 3          # ready conversations kept per active course
+POOL_REFILL_INTERVAL = 30           # seconds between background sweeps of active courses
+ACTIVE_COURSE_SECONDS = 6 * 3600    # a course stays warm this long after its last claim
+CLAIM_ATTEMPTS = 5                  # conditional-update retries before creating a conversation inline
+BASELINE_TTL = 3600                 # seconds a cached baseline context is trusted at most
+
+
+class ConversationPoolManager:
+    """Keeps blank conversations and baseline contexts ready per course; refills in a background thread."""
+
+    def __init__(self, size=CONVERSATION_POOL_SIZE, refill_interval=POOL_REFILL_INTERVAL,
+                 active_seconds=ACTIVE_COURSE_SECONDS, baseline_ttl=BASELINE_TTL):
+        self.size = size
+        self.refill_interval = refill_interval
+        self.active_seconds = active_seconds
+        self.baseline_ttl = baseline_ttl
+
+        self._cond = threading.Condition()
+        self._active = {}       # course key -> (courseID, last activity monotonic)
+        self._pending = {}      # course key -> courseID, waiting for a refill
+        self._generations = {}  # course key -> bumped on every material change
+        self._baselines = {}    # course key -> (generation, material signature, built monotonic, baseline text)
+        self._refresh = set()   # course keys whose unclaimed conversations hold an old baseline
+        self._thread = None
+
+        self._stats = {
+            "claims": 0,
+            "claim_conflicts": 0,     # lost a race for a row and retried
+            "inline_creates": 0,      # pool was empty, conversation created on the request path
+            "created": 0,
+            "baseline_builds": 0,
+            "stale_baselines": 0,     # out of date without an event from this process
+            "refill_errors": 0,
+        }
+
+    # -------------------------------
+    # Request path
+    # -------------------------------
+    def claim(self, user_id, courseID, connection):
+        """
+        Assign a ready conversation to the user.
+        Returns (success, message, conv_id)
+        """
+        self._touch(courseID)
+        cursor = connection.cursor()
+        try:
+            # Ready conversations were preloaded with the cached baseline; if that's out of date, skip them
+            for _ in range(0 if self._check_current(courseID, cursor) else CLAIM_ATTEMPTS):
+                # Pick among the first few rows so concurrent claimers rarely collide
+                cursor.execute("""
+                    SELECT id, conv_id FROM conversations
+                    WHERE course_id = %s AND is_assigned = FALSE
+                    ORDER BY id
+                    LIMIT %s
+                """, (courseID, self.size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                row_id, conv_id = random.choice(rows)
+                # created_at becomes the claim time, so "latest conversation" lookups stay correct
+                cursor.execute("""
+                    UPDATE conversations
+                    SET user_id = %s, is_assigned = TRUE, created_at = CURRENT_TIMESTAMP()
+                    WHERE id = %s AND is_assigned = FALSE
+                """, (user_id, row_id))
+                if cursor.rowcount == 1:
+                    connection.commit()
+                    self._count("claims")
+                    self.request_refill(courseID)
+                    return True, "New thread started", conv_id
+                self._count("claim_conflicts")
+
+            # Nothing ready (first use of a course, or a burst drained it): create one right here
+            conv_id = self._create_blanks(courseID, 1, connection, user_id=user_id)[0]
+            self._count("claims")
+            self._count("inline_creates")
+            self.request_refill(courseID)
+            return True, "New thread started", conv_id
+        finally:
+            cursor.close()
+
+    def baseline(self, courseID, connection):
+        """Cached baseline context for a course (built on first use or after materials change)."""
+        key = str(courseID)
+        with self._cond:
+            generation = self._generations.get(key, 0)
+            cached = self._baselines.get(key)
+        if cached is not None and cached[0] == generation and time.monotonic() - cached[2] <= self.baseline_ttl:
+            return cached[3]
+
+        cursor = connection.cursor()
+        try:
+            signature = self._signature(courseID, cursor)
+        finally:
+            cursor.close()
+        baseline = get_baseline_context(courseID, connection)
+        with self._cond:
+            # Tagged with the generation it was built from; a change during the build invalidates it
+            self._baselines[key] = (generation, signature, time.monotonic(), baseline)
+            self._stats["baseline_builds"] += 1
+        return baseline
+
+    def _signature(self, courseID, cursor):
+        """(count, newest material_id) of the course's materials; any add or delete changes it."""
+        cursor.execute("SELECT COUNT(*), MAX(material_id) FROM course_materials WHERE course_id = %s", (courseID,))
+        return tuple(cursor.fetchone())
+
+    def _check_current(self, courseID, cursor):
+        """
+        Invalidate the course's cached baseline if it is older than baseline_ttl or was built
+        from other materials than the course has now (changed by another process).
+        Returns True if it was out of date.
+        """
+        key = str(courseID)
+        with self._cond:
+            cached = self._baselines.get(key)
+            generation = self._generations.get(key, 0)
+        if cached is None or cached[0] != generation:
+            return False    # nothing cached, or already being rebuilt
+        if time.monotonic() - cached[2] <= self.baseline_ttl and cached[1] == self._signature(courseID, cursor):
+            return False
+        self._invalidate(key)
+        self._count("stale_baselines")
+        return True
+
+    def _invalidate(self, key):
+        with self._cond:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._refresh.add(key)
+
+    # -------------------------------
+    # Background refill
+    # -------------------------------
+    def request_refill(self, courseID):
+        """Ask the background thread to top up a course's ready conversations."""
+        self._ensure_thread()
+        with self._cond:
+            self._pending[str(courseID)] = courseID
+            self._cond.notify()
+
+    def materials_changed(self, courseID, **_):
+        """Rebuild the course's baseline (and refresh unclaimed conversations) in the background."""
+        self._invalidate(str(courseID))
+        self.request_refill(courseID)
+
+    def refill(self, courseID, connection):
+        """Bring one course up to `size` ready conversations. Returns how many were created."""
+        key = str(courseID)
+        cursor = connection.cursor()
+        try:
+            self._check_current(courseID, cursor)
+        except Exception:
+            cursor.close()
+            raise
+        with self._cond:
+            rebuild = key in self._refresh
+            self._refresh.discard(key)
+
+        try:
+            baseline = self.baseline(courseID, connection)
+            if rebuild:
+                # Unclaimed conversations were preloaded with the old materials
+                cursor.execute("""
+                    UPDATE edwin_messages SET message = %s
+                    WHERE userorAI = TRUE AND conv_id IN (
+                        SELECT conv_id FROM conversations WHERE course_id = %s AND is_assigned = FALSE
+                    )
+                """, (baseline, courseID))
+                connection.commit()
+        except Exception:
+            if rebuild:
+                with self._cond:
+                    self._refresh.add(key)
+            cursor.close()
+            raise
+
+        cursor.execute(
+            "SELECT COUNT(*) FROM conversations WHERE course_id = %s AND is_assigned = FALSE",
+            (courseID,)
+        )
+        ready = cursor.fetchone()[0]
+        cursor.close()
+
+        missing = self.size - ready
+        if missing <= 0:
+            return 0
+        self._create_blanks(courseID, missing, connection)
+        return missing
+
+    def _create_blanks(self, courseID, count, connection, user_id=None):
+        """
+        Insert `count` conversations with the cached baseline as their first message
+        (one multi-row INSERT per table). Assigned to user_id if given.
+        """
+        baseline = self.baseline(courseID, connection)
+        conv_ids = [f"conv_{uuid.uuid4().hex}" for _ in range(count)]
+        assigned = user_id is not None
+
+        cursor = connection.cursor()
+        try:
+            cursor.executemany(
+                "INSERT INTO conversations (course_id, user_id, conv_id, is_assigned) VALUES (%s, %s, %s, %s)",
+                [(courseID, user_id, conv_id, assigned) for conv_id in conv_ids]
+            )
+            cursor.executemany(
+                "INSERT INTO edwin_messages (conv_id, user_id, userorAI, message) VALUES (%s, NULL, TRUE, %s)",
+                [(conv_id, baseline) for conv_id in conv_ids]
+            )
+            connection.commit()
+        finally:
+            cursor.close()
+
+        with self._cond:
+            self._stats["created"] += count
+        return conv_ids
+
+    def _run(self):
+        last_sweep = time.monotonic()
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(self.refill_interval)
+                now = time.monotonic()
+                courses = dict(self._pending)
+                self._pending.clear()
+
+                # Periodic sweep: re-check every recently active course, forget idle ones
+                if now - last_sweep >= self.refill_interval:
+                    last_sweep = now
+                    for key, (courseID, seen) in list(self._active.items()):
+                        if now - seen > self.active_seconds:
+                            del self._active[key]
+                        else:
+                            courses.setdefault(key, courseID)
+
+            for courseID in courses.values():
+                try:
+                    with pooled_connection() as connection:
+                        if connection is None:
+                            raise RuntimeError("no database connection")
+                        created = self.refill(courseID, connection)
+                    if created:
+                        print(f"Conversation pool: prepared {created} conversation(s) for course {courseID}")
+                except Exception as e:
+                    self._count("refill_errors")
+                    print(f"ERROR: Conversation pool refill for course {courseID} failed: {e}")
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="edwin-conversation-pool", daemon=True)
+                self._thread.start()
+
+    def _touch(self, courseID):
+        with self._cond:
+            self._active[str(courseID)] = (courseID, time.monotonic())
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "size": self.size,
+                "active_courses": len(self._active),
+                "pending_refills": len(self._pending),
+                "cached_baselines": len(self._baselines),
+            })
+        return stats
+
+
+# -------------------------------
+# Shared manager
+# -------------------------------
+_manager = ConversationPoolManager()
+
+
+@on_materials_changed
+def _rebuild_baseline(course_id, **_):
+    _manager.materials_changed(course_id)
+
+
+def claim_conversation(user_id, courseID, connection):
+    """Start a new thread for the user from the course's pool. Returns (success, message, conv_id)"""
+    return _manager.claim(user_id, courseID, connection)
+
+
+def conversation_pool_metrics():
+    return _manager.metrics()
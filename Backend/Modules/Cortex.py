@@ -0,0 +1,729 @@
+"""
+LLM client: every Cortex completion the backend makes goes through here.
+
+complete() runs SNOWFLAKE.CORTEX.COMPLETE on a connection the caller already
+holds; complete_pooled() borrows one for the call, for worker threads that
+hold none. complete_async() is used by the async server (asgi.py): it submits the
+query with Snowflake's async query API, gives the connection back to the pool
+while the model runs, and polls the query status with asyncio.sleep(), so a
+5-30 s completion holds neither a worker thread nor a pooled connection.
+Backends without async query submission (local storage) run the blocking
+call in the default executor instead.
+
+complete_stream() yields the completion in pieces as the model produces them,
+via the Cortex REST endpoint (authenticated with the pooled session's token).
+If streaming isn't available it falls back to one blocking completion.
+complete_stream_async() is the same stream for the async server: the REST
+response is read on asyncio streams, so an answer being streamed holds no
+thread while the model generates it.
+
+All of them take the calling endpoint's name and go through the shared
+completion cache (Modules/CompletionCache.py) first, unless that endpoint
+opts out. Identical blocking and async calls that miss the cache while one is
+already running wait for it and share its completion (Modules/SingleFlight.py),
+so a burst of students on the same page costs one completion; streams don't
+coalesce. A call that reaches the model then:
+  - waits for one of the model's MODEL_CONCURRENCY slots (per process), so
+    a burst queues here instead of piling onto the warehouse
+  - binds the model and prompt as query parameters, never into the SQL text
+  - runs with a statement timeout, and is retried with backoff after
+    connection-level or throttling errors (later attempts on a fresh
+    pooled connection)
+  - is recorded per model and per endpoint: latency, slot wait, errors,
+    retries, and prompt / completion size (llm_metrics())
+
+model_for() gives each endpoint's model (EDWIN_MODEL_<ENDPOINT> overrides).
+Unless the endpoint is pinned that way, each call's model is then chosen by
+the router in Modules/ModelRouter.py, from the prompt size, the task, and the
+models' recent p95 latency on that endpoint against its latency budget.
+With EDWIN_LLM_BACKEND=local (the default under local storage) completions
+come from the deterministic stand-in in Modules/LocalCortex.py, through the
+same slots and accounting, so every endpoint can be load-tested offline.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from snowflake.connector import errors as sf_errors
+
+from ConnectionPool import pooled_connection, DatabaseUnavailable
+from credentials import STORAGE_BACKEND
+from Modules.CompletionCache import cached_completion, store_completion
+from Modules.LocalCortex import local_complete, simulated_latency, stream_pieces
+from Modules.ModelRouter import ModelRouter
+from Modules.PromptBudget import estimate_tokens
+from Modules.SingleFlight import flight_key, single_flight, single_flight_async
+
+COMPLETE_SQL = "SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, %s)"
+
+# "cortex" or "local" (the deterministic stand-in, no warehouse)
+LLM_BACKEND = os.environ.get("EDWIN_LLM_BACKEND", "local" if STORAGE_BACKEND == "local" else "cortex").lower()
+
+# Model per endpoint, which the router may swap per call; EDWIN_MODEL_<ENDPOINT> (e.g. EDWIN_MODEL_QUIZ=llama3-8b) pins it
+ENDPOINT_MODELS = {
+    "chat": "llama3-70b",     # Options: llama3-70b, llama3-8b, mistral-large, mixtral-8x7b
+    "explain": "llama3-70b",
+    "assignment": "llama3-70b",
+    "quiz": "mixtral-8x7b",   # Faster model for quiz generation
+    "exam": "mixtral-8x7b",
+}
+DEFAULT_MODEL = "llama3-70b"
+
+MODEL_CONCURRENCY = int(os.environ.get("EDWIN_CORTEX_CONCURRENCY", "8"))  # in-flight completions per model
+SLOT_WAIT_TIMEOUT = 30        # seconds a call waits for a free slot before failing
+COMPLETE_TIMEOUT = 120        # statement timeout of a blocking completion (seconds)
+COMPLETE_RETRIES = 2          # extra attempts after a transient error
+RETRY_BACKOFF = 0.5           # seconds before the first retry, doubling each time
+LATENCY_WINDOW = 500          # recent calls per model / endpoint kept for percentiles
+
+ASYNC_POLL_INITIAL = 0.2     # seconds between status checks, growing...
+ASYNC_POLL_MAX = 2.0         # ...up to this
+ASYNC_COMPLETE_TIMEOUT = 180  # give up (and cancel the query) after this many seconds
+
+CORTEX_REST_PATH = "/api/v2/cortex/inference:complete"
+STREAM_CONNECT_TIMEOUT = 10   # seconds
+STREAM_READ_TIMEOUT = 120     # max seconds between streamed chunks
+
+# Errors worth another attempt: the connection or the service, not the request
+TRANSIENT_ERRORS = (
+    DatabaseUnavailable,
+    requests.ConnectionError,
+    sf_errors.OperationalError,
+    sf_errors.InterfaceError,
+    sf_errors.ServiceUnavailableError,
+    sf_errors.BadGatewayError,
+    sf_errors.GatewayTimeoutError,
+    sf_errors.TooManyRequests,
+)
+
+
+class CortexBusy(Exception):
+    """Raised when no completion slot for the model frees up within SLOT_WAIT_TIMEOUT."""
+
+
+def model_for(endpoint):
+    """The model configured for an endpoint."""
+    return os.environ.get(f"EDWIN_MODEL_{str(endpoint).upper()}") or ENDPOINT_MODELS.get(endpoint, DEFAULT_MODEL)
+
+
+# -------------------------------
+# Concurrency slots
+# -------------------------------
+class ModelSlots:
+    """A semaphore of in-flight completions per model, shared by threads and the event loop."""
+
+    def __init__(self, limit=MODEL_CONCURRENCY, wait_timeout=SLOT_WAIT_TIMEOUT):
+        self.limit = limit
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._semaphores = {}    # model -> BoundedSemaphore
+        self._in_flight = {}     # model -> count
+
+    def _semaphore(self, model):
+        with self._lock:
+            if model not in self._semaphores:
+                self._semaphores[model] = threading.BoundedSemaphore(self.limit)
+                self._in_flight[model] = 0
+            return self._semaphores[model]
+
+    def acquire(self, model):
+        """Block for a slot. Returns the seconds waited."""
+        started = time.monotonic()
+        if not self._semaphore(model).acquire(timeout=self.wait_timeout):
+            raise CortexBusy(f"No free {model} completion slot after {self.wait_timeout}s")
+        return self._taken(model, started)
+
+    async def acquire_async(self, model):
+        """acquire() without blocking the event loop: polls with asyncio.sleep()."""
+        semaphore, started, interval = self._semaphore(model), time.monotonic(), 0.01
+        while not semaphore.acquire(blocking=False):
+            if time.monotonic() - started > self.wait_timeout:
+                raise CortexBusy(f"No free {model} completion slot after {self.wait_timeout}s")
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 0.25)
+        return self._taken(model, started)
+
+    def _taken(self, model, started):
+        with self._lock:
+            self._in_flight[model] += 1
+        return time.monotonic() - started
+
+    def release(self, model):
+        with self._lock:
+            self._in_flight[model] -= 1
+        self._semaphores[model].release()
+
+    def in_flight(self):
+        with self._lock:
+            return dict(self._in_flight)
+
+
+# -------------------------------
+# Accounting
+# -------------------------------
+class CallStats:
+    """Counters and recent latencies of the completions of one model or endpoint."""
+    __slots__ = ("calls", "errors", "retries", "timeouts", "prompt_tokens", "completion_tokens",
+                 "prompt_chars", "completion_chars", "slot_wait", "latencies")
+
+    def __init__(self):
+        self.calls = self.errors = self.retries = self.timeouts = 0
+        self.prompt_tokens = self.completion_tokens = self.prompt_chars = self.completion_chars = 0
+        self.slot_wait = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)   # seconds, most recent last
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "avg_slot_wait_ms": round(self.slot_wait * 1000 / self.calls, 1) if self.calls else 0.0,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.calls, 1) if self.calls else 0.0,
+            "avg_completion_tokens": round(self.completion_tokens / self.calls, 1) if self.calls else 0.0,
+            "prompt_chars": self.prompt_chars,
+            "completion_chars": self.completion_chars,
+        }
+
+
+_stats_lock = threading.Lock()
+_by_model = {}       # model -> CallStats
+_by_endpoint = {}    # endpoint -> CallStats
+
+
+def _series(endpoint, model):
+    return [_by_model.setdefault(model, CallStats()), _by_endpoint.setdefault(endpoint or "other", CallStats())]
+
+
+def _record(endpoint, model, prompt, result, seconds, waited, error=None):
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = estimate_tokens(result) if result else 0
+    with _stats_lock:
+        for stats in _series(endpoint, model):
+            stats.calls += 1
+            stats.slot_wait += waited
+            stats.latencies.append(seconds)
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.prompt_chars += len(prompt or "")
+            stats.completion_chars += len(result or "")
+            if error is not None:
+                stats.errors += 1
+                stats.timeouts += _is_timeout(error)
+    _router.observe(endpoint, model, seconds)
+
+
+def _count_retry(endpoint, model):
+    with _stats_lock:
+        for stats in _series(endpoint, model):
+            stats.retries += 1
+
+
+def _is_timeout(error):
+    # Snowflake reports a statement timeout as errno 604 (query cancelled)
+    return isinstance(error, (TimeoutError, requests.Timeout)) or getattr(error, "errno", None) == 604
+
+
+def model_latency(model, fraction=0.95):
+    """Recent latency percentile of a model's completions in seconds, or None before its first call."""
+    with _stats_lock:
+        stats = _by_model.get(model)
+        return stats.percentile(fraction) if stats is not None else None
+
+
+def router_metrics():
+    return _router.metrics()
+
+
+def llm_metrics():
+    in_flight = _slots.in_flight()
+    with _stats_lock:
+        models = {model: dict(stats.summary(), in_flight=in_flight.get(model, 0))
+                  for model, stats in _by_model.items()}
+        endpoints = {endpoint: stats.summary() for endpoint, stats in _by_endpoint.items()}
+    return {
+        "backend": LLM_BACKEND,
+        "concurrency_per_model": _slots.limit,
+        "models": models,
+        "endpoints": endpoints,
+    }
+
+
+_slots = ModelSlots()
+_router = ModelRouter()
+
+
+# -------------------------------
+# Calls: slot, retries, accounting
+# -------------------------------
+def _call(endpoint, model, prompt, attempt):
+    """Run attempt(n) in one of the model's slots, retrying transient errors. Returns its result."""
+    waited = _slots.acquire(model)
+    started = time.monotonic()
+    try:
+        for n in range(COMPLETE_RETRIES + 1):
+            try:
+                result = attempt(n)
+                break
+            except TRANSIENT_ERRORS as e:
+                if n == COMPLETE_RETRIES:
+                    raise
+                _count_retry(endpoint, model)
+                print(f"WARNING: {model} completion failed (attempt {n + 1}), retrying: {e}")
+                time.sleep(RETRY_BACKOFF * 2 ** n)
+    except Exception as e:
+        _record(endpoint, model, prompt, None, time.monotonic() - started, waited, e)
+        raise
+    finally:
+        _slots.release(model)
+    _record(endpoint, model, prompt, result, time.monotonic() - started, waited)
+    return result
+
+
+async def _call_async(endpoint, model, prompt, attempt):
+    """_call() for coroutines: attempt(n) is awaited, and waits don't block the event loop."""
+    waited = await _slots.acquire_async(model)
+    started = time.monotonic()
+    try:
+        for n in range(COMPLETE_RETRIES + 1):
+            try:
+                result = await attempt(n)
+                break
+            except TRANSIENT_ERRORS as e:
+                if n == COMPLETE_RETRIES:
+                    raise
+                _count_retry(endpoint, model)
+                print(f"WARNING: {model} completion failed (attempt {n + 1}), retrying: {e}")
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** n)
+    except Exception as e:
+        _record(endpoint, model, prompt, None, time.monotonic() - started, waited, e)
+        raise
+    finally:
+        _slots.release(model)
+    _record(endpoint, model, prompt, result, time.monotonic() - started, waited)
+    return result
+
+
+def _local(model, prompt):
+    result = local_complete(model, prompt)
+    time.sleep(simulated_latency(result))
+    return result
+
+
+async def _local_async(model, prompt):
+    result = local_complete(model, prompt)
+    await asyncio.sleep(simulated_latency(result))
+    return result
+
+
+# -------------------------------
+# Blocking completions
+# -------------------------------
+def complete(model, prompt, connection, endpoint=None):
+    """Run one Cortex completion (or reuse a cached one). Returns the completion text, or None if nothing came back."""
+    model = _router.route(endpoint, model, prompt)
+    cached, key = cached_completion(endpoint, model, prompt)
+    if cached is not None:
+        return cached
+    return _coalesced(endpoint, model, prompt, key,
+                      lambda: _call(endpoint, model, prompt,
+                                    lambda n: _blocking_attempt(model, prompt, connection if n == 0 else None)))
+
+
+def complete_pooled(model, prompt, endpoint=None):
+    """complete() on a connection borrowed from the pool for just this call (for worker threads)."""
+    model = _router.route(endpoint, model, prompt)
+    cached, key = cached_completion(endpoint, model, prompt)
+    if cached is not None:
+        return cached
+    return _coalesced(endpoint, model, prompt, key,
+                      lambda: _call(endpoint, model, prompt, lambda n: _blocking_attempt(model, prompt)))
+
+
+def _coalesced(endpoint, model, prompt, key, compute):
+    """
+    compute() once for identical concurrent calls, storing its result in the cache.
+    Endpoints that don't share completions (no cache key) always compute their own.
+    """
+    if key is None:
+        return compute()
+
+    def lead():
+        result = compute()
+        store_completion(key, model, result)
+        return result
+    return single_flight(flight_key(endpoint, model, prompt), lead,
+                         recheck=lambda: cached_completion(endpoint, model, prompt)[0])
+
+
+def _blocking_attempt(model, prompt, connection=None):
+    """One completion: on `connection`, or on a pooled one if None."""
+    if LLM_BACKEND == "local":
+        return _local(model, prompt)
+    if connection is not None:
+        return _complete(model, prompt, connection)
+    return _complete_with_pool(model, prompt)
+
+
+def _complete(model, prompt, connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(COMPLETE_SQL, (model, prompt), timeout=COMPLETE_TIMEOUT)
+        result = cursor.fetchone()
+    finally:
+        cursor.close()
+    return result[0] if result else None
+
+
+def _complete_with_pool(model, prompt):
+    with pooled_connection() as connection:
+        if connection is None:
+            raise DatabaseUnavailable("Database connection error")
+        return _complete(model, prompt, connection)
+
+
+# -------------------------------
+# Async completions
+# -------------------------------
+def _submit(model, prompt):
+    """Submit the completion as an async query. Returns the query id, or None if unsupported."""
+    with pooled_connection() as connection:
+        if connection is None:
+            raise DatabaseUnavailable("Database connection error")
+        cursor = connection.cursor()
+        if not hasattr(cursor, "execute_async"):
+            cursor.close()
+            return None
+        cursor.execute_async(COMPLETE_SQL, (model, prompt))
+        query_id = cursor.sfqid
+        cursor.close()
+        return query_id
+
+
+def _is_running(query_id):
+    with pooled_connection() as connection:
+        if connection is None:
+            raise DatabaseUnavailable("Database connection error")
+        status = connection.get_query_status_throw_if_error(query_id)
+        return connection.is_still_running(status)
+
+
+def _fetch_result(query_id):
+    with pooled_connection() as connection:
+        if connection is None:
+            raise DatabaseUnavailable("Database connection error")
+        cursor = connection.cursor()
+        cursor.get_results_from_sfqid(query_id)
+        result = cursor.fetchone()
+        cursor.close()
+        return result[0] if result else None
+
+
+def _cancel(query_id):
+    with pooled_connection() as connection:
+        if connection is not None:
+            cursor = connection.cursor()
+            cursor.execute("SELECT SYSTEM$CANCEL_QUERY(%s)", (query_id,))
+            cursor.close()
+
+
+async def complete_async(model, prompt, timeout=ASYNC_COMPLETE_TIMEOUT, endpoint=None):
+    """Awaitable Cortex completion (or a cached one). Returns the completion text, or None if nothing came back."""
+    loop = asyncio.get_running_loop()
+    model = _router.route(endpoint, model, prompt)
+    # The cache's disk tier is a file read, so keep it off the event loop too
+    cached, key = await loop.run_in_executor(None, cached_completion, endpoint, model, prompt)
+    if cached is not None:
+        return cached
+
+    async def compute():
+        if LLM_BACKEND == "local":
+            return await _call_async(endpoint, model, prompt, lambda n: _local_async(model, prompt))
+        return await _call_async(endpoint, model, prompt, lambda n: _complete_async(loop, model, prompt, timeout))
+    if key is None:
+        return await compute()
+
+    async def lead():
+        result = await compute()
+        await loop.run_in_executor(None, store_completion, key, model, result)
+        return result
+    return await single_flight_async(flight_key(endpoint, model, prompt), lead,
+                                     recheck=lambda: cached_completion(endpoint, model, prompt)[0])
+
+
+async def _complete_async(loop, model, prompt, timeout):
+    query_id = await loop.run_in_executor(None, _submit, model, prompt)
+    if query_id is None:
+        # No async query support on this backend: run the blocking call off the event loop
+        return await loop.run_in_executor(None, _complete_with_pool, model, prompt)
+
+    deadline = time.monotonic() + timeout
+    interval = ASYNC_POLL_INITIAL
+    while await loop.run_in_executor(None, _is_running, query_id):
+        if time.monotonic() > deadline:
+            await loop.run_in_executor(None, _cancel, query_id)
+            raise TimeoutError(f"Cortex completion timed out after {timeout}s")
+        await asyncio.sleep(interval)
+        interval = min(interval * 1.5, ASYNC_POLL_MAX)
+
+    return await loop.run_in_executor(None, _fetch_result, query_id)
+
+
+# -------------------------------
+# Streaming
+# -------------------------------
+def _rest_stream_target():
+    """(url, session token) for the Cortex REST endpoint, or None if this backend has no REST session."""
+    with pooled_connection() as connection:
+        if connection is None:
+            raise DatabaseUnavailable("Database connection error")
+        rest = getattr(connection, "rest", None)
+        token = getattr(rest, "token", None)
+        host = getattr(connection, "host", None)
+    if not token or not host:
+        return None
+    return f"https://{host}{CORTEX_REST_PATH}", token
+
+
+def _rest_request(token, model, prompt):
+    """(headers, JSON body) of a streaming Cortex REST completion."""
+    headers = {
+        "Authorization": f'Snowflake Token="{token}"',
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+    }
+    return headers, {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True}
+
+
+def _rest_deltas(line):
+    """The text deltas in one line of the Cortex REST event stream, or None at [DONE]."""
+    if not line or not line.startswith("data:"):
+        return []
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    texts = []
+    for choice in json.loads(data).get("choices", []):
+        delta = choice.get("delta") or {}
+        text = delta.get("content") or delta.get("text")
+        if text:
+            texts.append(text)
+    return texts
+
+
+def _stream_rest(url, token, model, prompt):
+    """Yield text deltas from the Cortex REST server-sent events."""
+    headers, body = _rest_request(token, model, prompt)
+    with requests.post(url, headers=headers, json=body, stream=True,
+                       timeout=(STREAM_CONNECT_TIMEOUT, STREAM_READ_TIMEOUT)) as response:
+        response.raise_for_status()
+        # chunk_size=None: hand over bytes as they arrive instead of filling 512-byte blocks
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            texts = _rest_deltas(line)
+            if texts is None:
+                return
+            yield from texts
+
+
+def _stream_pieces(model, prompt):
+    """The completion's pieces from whichever source is available (no slot or accounting)."""
+    if LLM_BACKEND == "local":
+        result = local_complete(model, prompt)
+        pieces = stream_pieces(result)
+        delay = simulated_latency(result) / max(len(pieces), 1)
+        for piece in pieces:
+            time.sleep(delay)
+            yield piece
+        return
+
+    target = _rest_stream_target()
+    if target is not None:
+        started = False
+        try:
+            for text in _stream_rest(target[0], target[1], model, prompt):
+                started = True
+                yield text
+            if started:
+                return
+        except Exception as e:
+            if started:
+                raise
+            print(f"WARNING: Cortex streaming unavailable, falling back to a single completion: {e}")
+
+    answer = _complete_with_pool(model, prompt)
+    if answer:
+        yield answer
+
+
+def complete_stream(model, prompt, endpoint=None):
+    """
+    Yield the completion text in chunks as it is generated (a cached completion comes as one chunk).
+    No pooled connection is held while streaming, but one of the model's slots is.
+    Falls back to a single blocking completion if streaming fails before the first chunk arrives.
+    """
+    model = _router.route(endpoint, model, prompt)
+    cached, key = cached_completion(endpoint, model, prompt)
+    if cached is not None:
+        yield cached
+        return
+
+    waited = _slots.acquire(model)
+    started = time.monotonic()
+    parts = []
+    try:
+        for text in _stream_pieces(model, prompt):
+            parts.append(text)
+            yield text
+    except Exception as e:
+        _record(endpoint, model, prompt, "".join(parts), time.monotonic() - started, waited, e)
+        raise
+    finally:
+        _slots.release(model)
+    # Only a stream that ran to the end is recorded and stored
+    answer = "".join(parts)
+    _record(endpoint, model, prompt, answer, time.monotonic() - started, waited)
+    store_completion(key, model, answer)
+
+
+# -------------------------------
+# Streaming on the event loop
+# -------------------------------
+async def _within(awaitable, timeout):
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"No data from Cortex for {timeout}s") from None
+
+
+async def _response_head(reader):
+    """(status, headers) of an HTTP/1.1 response."""
+    status_line = await _within(reader.readline(), STREAM_READ_TIMEOUT)
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = (await _within(reader.readline(), STREAM_READ_TIMEOUT)).decode("latin-1").strip()
+        if not line:
+            return status, headers
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _body_lines(reader, chunked):
+    """Yield the lines of an HTTP/1.1 response body as they arrive."""
+    buffer = b""
+    while True:
+        if chunked:
+            size = int((await _within(reader.readline(), STREAM_READ_TIMEOUT)).split(b";")[0].strip() or b"0", 16)
+            data = (await _within(reader.readexactly(size + 2), STREAM_READ_TIMEOUT))[:size] if size else b""
+        else:
+            data = await _within(reader.read(65536), STREAM_READ_TIMEOUT)
+        if not data:
+            break
+        *lines, buffer = (buffer + data).split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8")
+    if buffer:
+        yield buffer.rstrip(b"\r").decode("utf-8")
+
+
+async def _stream_rest_async(url, token, model, prompt):
+    """
+    _stream_rest() on asyncio streams. requests has no async API (and no async HTTP
+    client is a dependency), so this speaks the one HTTP/1.1 request itself.
+    """
+    parts = urlsplit(url)
+    headers, body = _rest_request(token, model, prompt)
+    body = json.dumps(body).encode("utf-8")
+    secure = parts.scheme == "https"
+    reader, writer = await _within(
+        asyncio.open_connection(parts.hostname, parts.port or (443 if secure else 80), ssl=secure),
+        STREAM_CONNECT_TIMEOUT
+    )
+    try:
+        head = [f"POST {parts.path} HTTP/1.1", f"Host: {parts.netloc}",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write("\r\n".join(head).encode("latin-1") + b"\r\n\r\n" + body)
+        await writer.drain()
+        status, response_headers = await _response_head(reader)
+        if status >= 400:
+            raise requests.HTTPError(f"{status} error from {url}")
+        chunked = "chunked" in response_headers.get("transfer-encoding", "").lower()
+        async for line in _body_lines(reader, chunked):
+            texts = _rest_deltas(line)
+            if texts is None:
+                return
+            for text in texts:
+                yield text
+    finally:
+        writer.close()
+
+
+async def _stream_pieces_async(loop, model, prompt):
+    """_stream_pieces() for the event loop: waits between pieces don't hold a thread."""
+    if LLM_BACKEND == "local":
+        result = local_complete(model, prompt)
+        pieces = stream_pieces(result)
+        delay = simulated_latency(result) / max(len(pieces), 1)
+        for piece in pieces:
+            await asyncio.sleep(delay)
+            yield piece
+        return
+
+    target = await loop.run_in_executor(None, _rest_stream_target)
+    if target is not None:
+        started = False
+        try:
+            async for text in _stream_rest_async(target[0], target[1], model, prompt):
+                started = True
+                yield text
+            if started:
+                return
+        except Exception as e:
+            if started:
+                raise
+            print(f"WARNING: Cortex streaming unavailable, falling back to a single completion: {e}")
+
+    answer = await _complete_async(loop, model, prompt, ASYNC_COMPLETE_TIMEOUT)
+    if answer:
+        yield answer
+
+
+async def complete_stream_async(model, prompt, endpoint=None):
+    """complete_stream() as an async generator: no thread is held while the completion is generated."""
+    loop = asyncio.get_running_loop()
+    model = _router.route(endpoint, model, prompt)
+    cached, key = await loop.run_in_executor(None, cached_completion, endpoint, model, prompt)
+    if cached is not None:
+        yield cached
+        return
+
+    waited = await _slots.acquire_async(model)
+    started = time.monotonic()
+    parts = []
+    try:
+        async for text in _stream_pieces_async(loop, model, prompt):
+            parts.append(text)
+            yield text
+    except Exception as e:
+        _record(endpoint, model, prompt, "".join(parts), time.monotonic() - started, waited, e)
+        raise
+    finally:
+        _slots.release(model)
+    answer = "".join(parts)
+    _record(endpoint, model, prompt, answer, time.monotonic() - started, waited)
+    await loop.run_in_executor(None, store_completion, key, model, answer)
@@ -1,3 +1,6 @@
+from Modules.Ingestion import bulk_insert_materials, material_row
+
+
 
 
 def uploadCourseMaterial(course_id, title, content, file_url, connection):
@@ -10,14 +13,11 @@ def uploadCourseMaterial(course_id, title, content, file_url, connection):
     """
     if not connection:
         return False, "Database connection error", 500  
-    cursor = connection.cursor()
     
     try:
-        cursor.execute("INSERT INTO course_materials (course_id, title, content, file_url) VALUES (%s, %s, %s, %s)",(course_id, title, content, file_url))
-        connection.commit()
+        bulk_insert_materials(course_id, [material_row(title, content, file_url)], connection)
         return True, "Course material uploaded successfully", 201
     except Exception as e:
-        connection.rollback()
         return False, f"ERROR Uploading Course Material. {e}", 500
 
 
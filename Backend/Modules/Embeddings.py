@@ -0,0 +1,97 @@
+"""
+Text embedders for dense retrieval.
+
+An embedder turns a list of strings into an (n, dim) float32 matrix of
+L2-normalised rows, so the dot product of two rows is their cosine
+similarity. The default, HashedNgramEmbedder, needs no network or model
+files: word stems and character n-grams are hashed into a fixed number of
+signed buckets. Character n-grams give partial credit to related word forms
+and misspellings ('subnetting' / 'subnets', 'algoritm'), which exact
+keyword matching misses.
+
+Other embedders can be plugged in with register_embedder() and selected with
+the EDWIN_EMBEDDER environment variable.
+"""
+import math
+import os
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from Modules.Tokenizer import STOP_WORDS, stem, words
+
+EMBEDDING_DIM = 512        # buckets per vector (2 KB per chunk as float32)
+NGRAM_SIZES = (3, 4)       # character n-gram lengths, taken from each word with boundary marks
+WORD_WEIGHT = 2.0          # a whole-word match counts this many n-gram matches
+
+
+@lru_cache(maxsize=100_000)
+def _word_features(word, dim):
+    """
+    (buckets, signs) of one word's features: its stem (weighted WORD_WEIGHT) and its
+    character n-grams. crc32 is stable across processes, unlike hash().
+    """
+    features = [("w:" + stem(word), WORD_WEIGHT)]
+    marked = f"<{word}>"
+    for n in NGRAM_SIZES:
+        features.extend((marked[i:i + n], 1.0) for i in range(len(marked) - n + 1))
+
+    buckets = np.empty(len(features), dtype=np.int64)
+    signs = np.empty(len(features), dtype=np.float32)
+    for i, (feature, weight) in enumerate(features):
+        h = zlib.crc32(feature.encode("utf-8"))
+        buckets[i] = h % dim
+        signs[i] = weight if (h >> 31) & 1 else -weight
+    return buckets, signs
+
+
+class HashedNgramEmbedder:
+    """Deterministic offline embedder: hashed word stems plus character n-grams."""
+    name = "hashed-ngram"
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = Counter(w for w in words(text) if len(w) >= 3 and w not in STOP_WORDS)
+            if not counts:
+                continue
+            buckets, values = [], []
+            for word, count in counts.items():
+                word_buckets, signs = _word_features(word, self.dim)
+                buckets.append(word_buckets)
+                # Sublinear term frequency so one repeated word can't dominate
+                values.append(signs * (1.0 + math.log(count)))
+            np.add.at(vectors[row], np.concatenate(buckets), np.concatenate(values))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+# -------------------------------
+# Registry
+# -------------------------------
+_embedders = {HashedNgramEmbedder.name: HashedNgramEmbedder}
+_active = None
+
+
+def register_embedder(name, factory):
+    """Make an embedder available as EDWIN_EMBEDDER=<name>. factory() returns an object with .dim and .embed(texts)."""
+    _embedders[name] = factory
+
+
+def get_embedder():
+    """The embedder selected by EDWIN_EMBEDDER (default: hashed-ngram), created once per process."""
+    global _active
+    if _active is None:
+        name = os.environ.get("EDWIN_EMBEDDER", HashedNgramEmbedder.name)
+        factory = _embedders.get(name)
+        if factory is None:
+            print(f"WARNING: Unknown embedder '{name}', using {HashedNgramEmbedder.name}")
+            factory = HashedNgramEmbedder
+        _active = factory()
+    return _active
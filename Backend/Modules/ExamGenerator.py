@@ -0,0 +1,281 @@
+"""
+Fan-out exam generation.
+
+/api/generateExam used to ask one completion for all 20-30 questions. That
+was the slowest request served, it often ran past the model's output limit,
+and then the JSON didn't parse and the whole exam was lost. An exam is now
+planned as several small slices of at most EXAM_SLICE_QUESTIONS questions:
+  - the course's chunks (or the ones that best match the topic) are split
+    into contiguous ranges, so each slice covers a different part of the
+    materials
+  - for a "mixed" exam, the questions are split evenly across the three
+    difficulty levels first, so every slice asks for one level
+Slices are generated concurrently, so the wall-clock time is that of the
+slowest slice. Slices that fail (an error, or no usable questions) are
+retried, and only those. The results are merged with near-duplicate
+questions dropped, keeping the planned number of questions per difficulty
+where the slices delivered them.
+"""
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Modules.AnswerCache import normalize_question, shingles
+from Modules.ChatGPT import build_quiz_prompt, parse_quiz_response
+from Modules.Cortex import complete_async, complete_pooled, model_for
+from Modules.RetrievalCache import get_chunks
+from Modules.SearchIndex import course_chunks, search_chunks
+
+EXAM_SLICE_QUESTIONS = 5     # most questions asked of one completion
+EXAM_SLICE_SPARE = 1         # extra questions per slice, to cover duplicates and malformed ones
+EXAM_SLICE_CHUNKS = 6        # material chunks in one slice's prompt
+EXAM_SLICE_RETRIES = 1       # extra rounds for the slices that failed
+DUPLICATE_SIMILARITY = 0.8   # Jaccard similarity of shingle sets that counts as the same question
+EXAM_WORKERS = 12            # threads shared by all blocking exam requests
+DIFFICULTY_LEVELS = ("Beginner", "Intermediate", "Advanced")
+COMPREHENSIVE_TOPICS = {"comprehensive exam", "all", ""}   # topics that cover the whole course
+
+_executor = ThreadPoolExecutor(max_workers=EXAM_WORKERS, thread_name_prefix="edwin-exam")
+
+
+class ExamSlice:
+    __slots__ = ("index", "difficulty", "count", "prompt", "questions", "error", "attempts", "seconds")
+
+    def __init__(self, index, difficulty, count, prompt):
+        self.index = index
+        self.difficulty = difficulty
+        self.count = count          # questions this slice must contribute
+        self.prompt = prompt
+        self.questions = []
+        self.error = None
+        self.attempts = 0
+        self.seconds = 0.0
+
+
+# -------------------------------
+# Planning
+# -------------------------------
+def difficulty_targets(difficulty, num_questions):
+    """[(difficulty, questions)]: "mixed" (or anything unknown) is split evenly over the levels."""
+    for level in DIFFICULTY_LEVELS:
+        if str(difficulty or "").strip().lower() == level.lower():
+            return [(level, num_questions)]
+    share, extra = divmod(num_questions, len(DIFFICULTY_LEVELS))
+    # The remainder goes to the middle level first, then the easiest
+    order = (1, 0, 2)
+    counts = [share + (1 if order.index(i) < extra else 0) for i in range(len(DIFFICULTY_LEVELS))]
+    return [(level, count) for level, count in zip(DIFFICULTY_LEVELS, counts) if count]
+
+
+def slice_counts(difficulty, num_questions):
+    """[(difficulty, questions)] per slice, each at most EXAM_SLICE_QUESTIONS, sizes as even as possible."""
+    slices = []
+    for level, count in difficulty_targets(difficulty, num_questions):
+        parts = math.ceil(count / EXAM_SLICE_QUESTIONS)
+        share, extra = divmod(count, parts)
+        slices += [(level, share + (1 if i < extra else 0)) for i in range(parts)]
+    return slices
+
+
+def _ranges(items, parts):
+    """`items` split into `parts` contiguous runs (fewer if there are fewer items)."""
+    parts = max(1, min(parts, len(items)))
+    bounds = [round(i * len(items) / parts) for i in range(parts + 1)]
+    return [items[bounds[i]:bounds[i + 1]] for i in range(parts)]
+
+
+def _spread(items, count):
+    """Up to `count` items evenly spaced through `items`."""
+    if len(items) <= count:
+        return items
+    return [items[i * len(items) // count] for i in range(count)]
+
+
+def slice_chunks(courseID, topic, parts, connection):
+    """Chunk ids for each of `parts` slices: contiguous ranges of the course (or of the topic's best chunks)."""
+    ordered = course_chunks(courseID, connection)
+    if str(topic or "").strip().lower() not in COMPREHENSIVE_TOPICS:
+        position = {chunk_id: i for i, chunk_id in enumerate(ordered)}
+        hits = search_chunks(courseID, topic, connection, parts * EXAM_SLICE_CHUNKS)
+        ordered = sorted((chunk_id for chunk_id, _ in hits), key=lambda chunk_id: position.get(chunk_id, 0))
+    if not ordered:
+        return []
+    ranges = _ranges(ordered, parts)
+    # Fewer chunks than slices: slices share ranges, and their difficulty keeps their questions apart
+    return [_spread(ranges[i % len(ranges)], EXAM_SLICE_CHUNKS) for i in range(parts)]
+
+
+def slice_context(courseID, chunk_ids, connection):
+    """Material text for one slice's prompt: its chunks in reading order under their material titles."""
+    text, title = "You are Edwin, TA AI. Generate exam questions based on these course materials:\n", None
+    for chunk in get_chunks(courseID, chunk_ids, connection):
+        if chunk.title != title:
+            title = chunk.title
+            text += f"\nMATERIAL: {title}\n"
+        text += chunk.content.strip() + "\n...\n"
+    return text
+
+
+def plan_exam(courseID, topic, difficulty, num_questions, connection):
+    """
+    Slices for an exam, each with its prompt ready.
+    Returns: (success, message, [ExamSlice])
+    """
+    counts = slice_counts(difficulty, int(num_questions))
+    chunk_sets = slice_chunks(courseID, topic, len(counts), connection)
+    slices = []
+    for i, (level, count) in enumerate(counts):
+        # No chunks (nothing ingested yet): every slice falls back to the course baseline
+        context = slice_context(courseID, chunk_sets[i], connection) if chunk_sets else None
+        status, message, prompt = build_quiz_prompt(courseID, topic, level, count + EXAM_SLICE_SPARE, connection,
+                                                    model=model_for("exam"), context=context)
+        if not status:
+            return False, message, None
+        slices.append(ExamSlice(i, level, count, prompt))
+    return True, f"Exam planned as {len(slices)} slice(s)", slices
+
+
+# -------------------------------
+# Generation
+# -------------------------------
+def _accept(exam_slice, response, started):
+    """Record one slice attempt's outcome; returns True if it produced usable questions."""
+    exam_slice.attempts += 1
+    exam_slice.seconds += time.monotonic() - started
+    status, message, quiz_data = parse_quiz_response(response)
+    if not status:
+        exam_slice.error = message
+        return False
+    questions = quiz_data["questions"]
+    exam_slice.questions = [dict(q, difficulty=exam_slice.difficulty) for q in questions]
+    exam_slice.error = None
+    return True
+
+
+def _generate_slice(exam_slice):
+    started = time.monotonic()
+    try:
+        response = complete_pooled(model_for("exam"), exam_slice.prompt, endpoint="exam")
+    except Exception as e:
+        exam_slice.attempts += 1
+        exam_slice.seconds += time.monotonic() - started
+        exam_slice.error = str(e)
+        return False
+    return _accept(exam_slice, response, started)
+
+
+async def _generate_slice_async(exam_slice):
+    started = time.monotonic()
+    try:
+        response = await complete_async(model_for("exam"), exam_slice.prompt, endpoint="exam")
+    except Exception as e:
+        exam_slice.attempts += 1
+        exam_slice.seconds += time.monotonic() - started
+        exam_slice.error = str(e)
+        return False
+    return _accept(exam_slice, response, started)
+
+
+def run_exam(slices, topic, num_questions):
+    """Generate the slices concurrently (retrying failed ones), then merge. Returns (success, message, quiz_data)"""
+    started = time.monotonic()
+    pending = list(slices)
+    for _ in range(1 + EXAM_SLICE_RETRIES):
+        results = list(_executor.map(_generate_slice, pending))
+        pending = [s for s, ok in zip(pending, results) if not ok]
+        if not pending:
+            break
+    return merge_exam(slices, topic, num_questions, time.monotonic() - started)
+
+
+async def run_exam_async(slices, topic, num_questions):
+    """run_exam for the async server: the slices' completions are awaited together."""
+    started = time.monotonic()
+    pending = list(slices)
+    for _ in range(1 + EXAM_SLICE_RETRIES):
+        results = await asyncio.gather(*(_generate_slice_async(s) for s in pending))
+        pending = [s for s, ok in zip(pending, results) if not ok]
+        if not pending:
+            break
+    return merge_exam(slices, topic, num_questions, time.monotonic() - started)
+
+
+# -------------------------------
+# Merging
+# -------------------------------
+def merge_exam(slices, topic, num_questions, seconds):
+    """
+    One exam from the slices' questions: near-duplicates dropped, each difficulty given its
+    planned share, shortfalls filled from the other levels, easiest first.
+    Returns: (success, message, quiz_data)
+    """
+    kept, seen, duplicates = {}, [], 0
+    for exam_slice in slices:
+        for question in exam_slice.questions:
+            terms = shingles(normalize_question(question["question"]))
+            if terms and any(len(terms & other) / len(terms | other) >= DUPLICATE_SIMILARITY for other in seen):
+                duplicates += 1
+                continue
+            seen.append(terms)
+            kept.setdefault(question["difficulty"], []).append(question)
+
+    targets = {}
+    for exam_slice in slices:
+        targets[exam_slice.difficulty] = targets.get(exam_slice.difficulty, 0) + exam_slice.count
+    chosen = {level: kept.get(level, [])[:target] for level, target in targets.items()}
+    short = num_questions - sum(len(questions) for questions in chosen.values())
+    for level in targets:
+        extra = kept.get(level, [])[len(chosen[level]):][:max(short, 0)]
+        chosen[level] += extra
+        short -= len(extra)
+    questions = [q for level in DIFFICULTY_LEVELS for q in chosen.get(level, [])]
+
+    failed = [s for s in slices if s.error]
+    _record(slices, failed, duplicates, len(questions) < num_questions, seconds)
+    if failed:
+        print(f"WARNING: Exam: {len(failed)} of {len(slices)} slice(s) failed: {[s.error for s in failed]}")
+    if not questions:
+        return False, "Failed to generate exam", None
+
+    return True, f"Generated {len(questions)} of {num_questions} question(s) from {len(slices)} slice(s)", {
+        "title": topic,
+        "description": f"{len(questions)}-question exam on {topic}",
+        "questions": questions,
+        "slices": {
+            "total": len(slices),
+            "failed": len(failed),
+            "retried": sum(1 for s in slices if s.attempts > 1),
+            "slowestSeconds": round(max((s.seconds for s in slices), default=0.0), 2),
+        },
+    }
+
+
+# -------------------------------
+# Metrics
+# -------------------------------
+_lock = threading.Lock()
+_stats = {"exams": 0, "slices": 0, "slice_attempts": 0, "slice_failures": 0, "retried_slices": 0,
+          "duplicates_dropped": 0, "short_exams": 0, "seconds": 0.0, "slowest_slice_seconds": 0.0}
+
+
+def _record(slices, failed, duplicates, short, seconds):
+    with _lock:
+        _stats["exams"] += 1
+        _stats["slices"] += len(slices)
+        _stats["slice_attempts"] += sum(s.attempts for s in slices)
+        _stats["slice_failures"] += len(failed)
+        _stats["retried_slices"] += sum(1 for s in slices if s.attempts > 1)
+        _stats["duplicates_dropped"] += duplicates
+        _stats["short_exams"] += short
+        _stats["seconds"] += seconds
+        _stats["slowest_slice_seconds"] = max([_stats["slowest_slice_seconds"]] + [s.seconds for s in slices])
+
+
+def exam_metrics():
+    with _lock:
+        stats = dict(_stats)
+    stats["avg_seconds"] = round(stats.pop("seconds") / stats["exams"], 2) if stats["exams"] else 0.0
+    stats["slowest_slice_seconds"] = round(stats["slowest_slice_seconds"], 2)
+    return stats
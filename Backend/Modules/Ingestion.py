@@ -0,0 +1,310 @@
+"""
+Bulk ingestion of course materials.
+
+A document (PDF, PPTX, scraped page) is turned into a list of rows first and
+then written with a single executemany() per batch, so ingest time scales with
+document size instead of with the number of slides times the warehouse
+round-trip latency. snowflake.connector rewrites executemany() of an
+INSERT ... VALUES into one multi-row VALUES statement.
+
+Every row written in one call is tagged with the same ingest_batch id and
+its position in the call (ingest_ordinal), which is how the generated
+material_ids are read back and matched to their rows: Snowflake has no
+lastrowid for multi-row inserts, and AUTOINCREMENT ids (NOORDER sequences)
+aren't handed out in insertion order.
+
+Each material is also split into bounded, overlapping chunks
+(course_material_chunks) in the same transaction. A chunk never crosses a PDF
+page and records its page/slide number and character offsets into the
+material's content, so retrieval, citations and quiz generation read a few
+small chunks instead of whole documents.
+"""
+import os
+import re
+import sys
+import uuid
+
+import fitz  # PyMuPDF (for PDF text/images)
+from pptx import Presentation
+
+from ConnectionPool import transaction
+from Modules.MaterialEvents import materials_changed
+
+# Upper bound on the text sent in one INSERT statement; larger documents are
+# split into several statements inside the same transaction.
+MAX_BATCH_CHARS = 500_000
+
+INSERT_MATERIAL_SQL = (
+    "INSERT INTO course_materials (course_id, title, content, file_url, source_url, ingest_batch, ingest_ordinal) "
+    "VALUES (%s, %s, %s, %s, %s, %s, %s)"
+)
+
+INSERT_CHUNK_SQL = (
+    "INSERT INTO course_material_chunks "
+    "(material_id, course_id, chunk_index, page_number, char_start, char_end, content) "
+    "VALUES (%s, %s, %s, %s, %s, %s, %s)"
+)
+
+CHUNK_CHARS = 1200      # upper bound on one chunk's length
+CHUNK_OVERLAP = 200     # characters shared by consecutive chunks of the same page
+BACKFILL_BATCH = 50     # materials read per round trip when backfilling chunks
+
+# build_pdf_rows() separates pages with these markers
+_PAGE_MARKER_RE = re.compile(r"--- Page (\d+) ---\n")
+_SENTENCE_END_RE = re.compile(r"[.!?]\s|\n")
+_SLIDE_TITLE_RE = re.compile(r"^Slide (\d+)$")
+
+
+# --------------------------
+# Row builders
+# --------------------------
+def material_row(title, content, file_url=None, source_url=None, page_number=None):
+    """
+    One course_materials row: (title, content, file_url, source_url, page_number).
+    page_number is the slide number for one-slide materials; PDFs carry page markers instead.
+    """
+    return (title, content, file_url, source_url, page_number)
+
+
+def build_pdf_rows(file_path, file_url=None):
+    """Extract text from a PDF as ONE material (pages separated by '--- Page N ---' markers)."""
+    doc = fitz.open(file_path)
+    full_text = ""
+    for page_num, page in enumerate(doc):
+        text = page.get_text()
+        full_text += f"--- Page {page_num + 1} ---\n{text}\n\n"
+    doc.close()
+
+    pdf_filename = os.path.basename(file_path)
+    return [material_row(pdf_filename, full_text, file_url)]
+
+
+def build_pptx_rows(file_path, file_url=None):
+    """Extract text from a PPTX as one material per slide."""
+    prs = Presentation(file_path)
+    rows = []
+    for i, slide in enumerate(prs.slides):
+        texts = []
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                texts.append(shape.text)
+        rows.append(material_row(f"Slide {i+1}", "\n".join(texts), file_url, page_number=i + 1))
+    return rows
+
+
+def _batches(rows, content_index=1):
+    """Split rows into groups whose combined content stays under MAX_BATCH_CHARS."""
+    batch, size = [], 0
+    for row in rows:
+        row_size = len(row[content_index] or "")
+        if batch and size + row_size > MAX_BATCH_CHARS:
+            yield batch
+            batch, size = [], 0
+        batch.append(row)
+        size += row_size
+    if batch:
+        yield batch
+
+
+# --------------------------
+# Chunking
+# --------------------------
+def _page_spans(content, page_number=None):
+    """(page_number, start, end) for each page body of a material's content."""
+    markers = list(_PAGE_MARKER_RE.finditer(content))
+    if not markers:
+        return [(page_number, 0, len(content))]
+
+    spans = []
+    if content[:markers[0].start()].strip():
+        spans.append((page_number, 0, markers[0].start()))
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(content)
+        spans.append((int(marker.group(1)), marker.end(), end))
+    return spans
+
+
+def _strip_span(content, start, end):
+    """Shrink [start, end) so it neither starts nor ends with whitespace."""
+    while start < end and content[start].isspace():
+        start += 1
+    while end > start and content[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _cut_point(content, start, end):
+    """
+    Where to end a full-size window: after the last sentence end in its final 20%,
+    else after the last whitespace there, else at the hard limit.
+    """
+    floor = start + CHUNK_CHARS * 4 // 5
+    sentence = None
+    for sentence in _SENTENCE_END_RE.finditer(content, floor, end):
+        pass
+    if sentence:
+        return sentence.end()
+    space = content.rfind(" ", floor, end)
+    return space + 1 if space != -1 else end
+
+
+def build_chunks(content, page_number=None):
+    """
+    Split a material's content into chunks of at most CHUNK_CHARS characters that overlap
+    by about CHUNK_OVERLAP and never cross a '--- Page N ---' marker.
+    Returns [(page_number, char_start, char_end)] with offsets into `content`.
+    """
+    if not content:
+        return []
+
+    chunks = []
+    for page, page_start, page_end in _page_spans(content, page_number):
+        start, page_end = _strip_span(content, page_start, page_end)
+        while start < page_end:
+            end = page_end
+            if end - start > CHUNK_CHARS:
+                end = _cut_point(content, start, start + CHUNK_CHARS)
+            chunk_start, chunk_end = _strip_span(content, start, end)
+            if chunk_end > chunk_start:
+                chunks.append((page, chunk_start, chunk_end))
+            if end >= page_end:
+                break
+            # Step back for the overlap, starting on a word boundary
+            start = end - CHUNK_OVERLAP
+            space = content.find(" ", start, end)
+            if space != -1:
+                start = space + 1
+    return chunks
+
+
+def _slide_number(title):
+    match = _SLIDE_TITLE_RE.match(title or "")
+    return int(match.group(1)) if match else None
+
+
+def chunk_rows(material_id, courseID, content, page_number=None):
+    """course_material_chunks rows for one material."""
+    return [
+        (material_id, courseID, i, page, start, end, content[start:end])
+        for i, (page, start, end) in enumerate(build_chunks(content, page_number))
+    ]
+
+
+def _insert_chunks(cursor, rows):
+    for batch in _batches(rows, content_index=6):
+        cursor.executemany(INSERT_CHUNK_SQL, batch)
+
+
+# --------------------------
+# Bulk insert
+# --------------------------
+def bulk_insert_materials(courseID, rows, connection):
+    """
+    Insert all rows for a document, and their chunks, in one transaction.
+    Returns the created material_ids in the same order as `rows`.
+    Raises on database errors (after rolling back).
+    """
+    if not rows:
+        return []
+
+    batch_id = uuid.uuid4().hex
+    with transaction(connection) as cursor:
+        ordinal = 0
+        for batch in _batches(rows):
+            cursor.executemany(
+                INSERT_MATERIAL_SQL,
+                [(courseID, title, content, file_url, source_url, batch_id, ordinal + i)
+                 for i, (title, content, file_url, source_url, _) in enumerate(batch)]
+            )
+            ordinal += len(batch)
+
+        # Matched by ordinal: the ids' order needn't follow the insertion order
+        cursor.execute(
+            "SELECT ingest_ordinal, material_id FROM course_materials WHERE ingest_batch = %s",
+            (batch_id,)
+        )
+        ids_by_ordinal = dict(cursor.fetchall())
+        material_ids = [ids_by_ordinal[i] for i in range(len(rows))]
+
+        chunks = []
+        for material_id, (title, content, _, _, page_number) in zip(material_ids, rows):
+            chunks.extend(chunk_rows(material_id, courseID, content, page_number))
+        _insert_chunks(cursor, chunks)
+
+    materials_changed(courseID, added=material_ids)
+    return material_ids
+
+
+def backfill_chunks(connection, courseID=None):
+    """
+    Chunk materials stored before chunking existed (those with content but no chunks).
+    Each batch of materials is chunked in its own transaction, so a failure leaves the
+    earlier batches done and no material half-chunked. Returns the number of materials chunked.
+    """
+    cursor = connection.cursor()
+    course_filter = "AND m.course_id = %s" if courseID is not None else ""
+    cursor.execute(f"""
+        SELECT m.material_id FROM course_materials m
+        WHERE m.content IS NOT NULL {course_filter}
+          AND NOT EXISTS (SELECT 1 FROM course_material_chunks c WHERE c.material_id = m.material_id)
+        ORDER BY m.material_id
+    """, (courseID,) if courseID is not None else ())
+    material_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+
+    for i in range(0, len(material_ids), BACKFILL_BATCH):
+        batch = material_ids[i:i + BACKFILL_BATCH]
+        placeholders = ", ".join(["%s"] * len(batch))
+        with transaction(connection) as cursor:
+            cursor.execute(
+                f"SELECT material_id, course_id, title, content FROM course_materials WHERE material_id IN ({placeholders})",
+                tuple(batch)
+            )
+            chunks = []
+            for material_id, course_id, title, content in cursor.fetchall():
+                # One-slide materials are titled "Slide N" by build_pptx_rows()
+                chunks.extend(chunk_rows(material_id, course_id, content or "", _slide_number(title)))
+            _insert_chunks(cursor, chunks)
+
+    if material_ids:
+        print(f"Chunked {len(material_ids)} existing material(s)")
+    return len(material_ids)
+
+
+def ingest_document(file_path, courseID, connection, file_type=None, file_url=None):
+    """
+    Build and bulk-insert all rows for a PDF or PPTX.
+    Returns (success, message, material_ids)
+    """
+    if file_type is None:
+        file_type = "pptx" if file_path.lower().endswith((".ppt", ".pptx")) else "pdf"
+
+    try:
+        if file_type == "pptx":
+            rows = build_pptx_rows(file_path, file_url)
+        else:
+            rows = build_pdf_rows(file_path, file_url)
+    except Exception as e:
+        return False, f"Could not read {os.path.basename(file_path)}: {e}", []
+
+    try:
+        material_ids = bulk_insert_materials(courseID, rows, connection)
+    except Exception as e:
+        return False, f"Database error while ingesting {os.path.basename(file_path)}: {e}", []
+
+    return True, f"Ingested {len(material_ids)} material(s) from '{os.path.basename(file_path)}'", material_ids
+
+
+if __name__ == "__main__":
+    # python -m Modules.Ingestion --backfill-chunks [--course COURSE_ID]
+    from ConnectionPool import pooled_connection
+
+    if "--backfill-chunks" not in sys.argv:
+        print("Usage: python -m Modules.Ingestion --backfill-chunks [--course COURSE_ID]")
+        sys.exit(1)
+    course = sys.argv[sys.argv.index("--course") + 1] if "--course" in sys.argv else None
+    with pooled_connection() as connection:
+        if connection is None:
+            print("ERROR: Could not get a database connection.")
+            sys.exit(1)
+        backfill_chunks(connection, int(course) if course else None)
@@ -0,0 +1,148 @@
+"""
+Course insights engine for the instructor dashboard (/api/insights).
+
+All five sections are computed by ONE statement (a UNION ALL of tagged,
+course-scoped aggregates) and the result is cached per course for
+INSIGHTS_CACHE_TTL. Concurrent refreshes of the same course share a single
+computation, so a lecture hall of instructors refreshing the dashboard
+doesn't keep waking the warehouse.
+
+The cache is per process, and the TTL is the only freshness guarantee: the
+dashboard may be up to INSIGHTS_CACHE_TTL seconds behind the attempts
+table. A quiz attempt drops its course's entry (invalidate_insights()), but
+only in the process that recorded it. Other worker processes keep serving
+their copy until it expires.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+INSIGHTS_CACHE_TTL = 60    # seconds; the most the dashboard lags behind new attempts
+ACTIVE_USERS_DAYS = 7
+TOP_TOPICS_LIMIT = 5
+MISSED_QUESTIONS_LIMIT = 5
+MISSED_MIN_ATTEMPTS = 3
+RECENT_QUESTIONS_LIMIT = 10
+
+# Every branch returns: section, label, n1, n2, n3, ts
+INSIGHTS_SQL = f"""
+    SELECT 'active' AS section, NULL AS label, COUNT(DISTINCT user_id) AS n1, NULL AS n2, NULL AS n3, NULL AS ts
+    FROM user_quiz_attempts
+    WHERE course_id = %s AND created_at >= %s
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'topic', title, COUNT(*) AS freq, NULL, NULL, NULL
+        FROM course_materials
+        WHERE course_id = %s
+        GROUP BY title
+        ORDER BY freq DESC
+        LIMIT {TOP_TOPICS_LIMIT}
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'missed', question_text, COUNT(*),
+               SUM(CASE WHEN is_correct THEN 1 ELSE 0 END),
+               ROUND(100.0 * SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) / COUNT(*), 1) AS accuracy,
+               NULL
+        FROM user_quiz_attempts
+        WHERE course_id = %s AND question_text IS NOT NULL
+        GROUP BY question_text
+        HAVING COUNT(*) >= {MISSED_MIN_ATTEMPTS}
+        ORDER BY accuracy ASC
+        LIMIT {MISSED_QUESTIONS_LIMIT}
+    )
+    UNION ALL
+    SELECT 'quiz', quiz_title, COUNT(*),
+           SUM(CASE WHEN is_correct THEN 1 ELSE 0 END),
+           ROUND(100.0 * SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) / COUNT(*), 1),
+           NULL
+    FROM user_quiz_attempts
+    WHERE course_id = %s AND quiz_title IS NOT NULL
+    GROUP BY quiz_title
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'recent', m.message, NULL, NULL, NULL, m.created_at
+        FROM edwin_messages m
+        JOIN conversations c ON c.conv_id = m.conv_id
+        WHERE c.course_id = %s AND m.userorAI = FALSE
+        ORDER BY m.created_at DESC
+        LIMIT {RECENT_QUESTIONS_LIMIT}
+    )
+"""
+
+_cache = {}                # course_id -> (computed_at, insights)
+_course_locks = {}         # course_id -> Lock, so one refresh computes and the rest wait
+_locks_guard = threading.Lock()
+
+
+def compute_insights(course_id, connection):
+    """Run the single-pass insights query for one course. Returns the endpoint's JSON shape."""
+    since = datetime.now(timezone.utc) - timedelta(days=ACTIVE_USERS_DAYS)
+    cursor = connection.cursor()
+    cursor.execute(INSIGHTS_SQL, (course_id, since, course_id, course_id, course_id, course_id))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    insights = {
+        "activeUsers7d": 0,
+        "topTopics": [],
+        "mostMissedQuestions": [],
+        "quizAccuracy": [],
+        "recentQuestions": []
+    }
+    for section, label, n1, n2, n3, ts in rows:
+        if section == "active":
+            insights["activeUsers7d"] = n1 or 0
+        elif section == "topic":
+            insights["topTopics"].append({"topic": label, "frequency": n1})
+        elif section == "missed":
+            insights["mostMissedQuestions"].append({
+                "question": label,
+                "totalAttempts": n1,
+                "correctAttempts": n2,
+                "accuracy": n3
+            })
+        elif section == "quiz":
+            insights["quizAccuracy"].append({
+                "quizTitle": label,
+                "totalAttempts": n1,
+                "correctAttempts": n2,
+                "accuracy": n3
+            })
+        elif section == "recent":
+            insights["recentQuestions"].append({"question": label, "timestamp": str(ts)})
+
+    # UNION ALL doesn't preserve the per-branch ordering
+    insights["topTopics"].sort(key=lambda t: t["frequency"], reverse=True)
+    insights["mostMissedQuestions"].sort(key=lambda q: q["accuracy"])
+    insights["quizAccuracy"].sort(key=lambda q: q["quizTitle"])
+    insights["recentQuestions"].sort(key=lambda q: q["timestamp"], reverse=True)
+    return insights
+
+
+def _course_lock(course_id):
+    with _locks_guard:
+        return _course_locks.setdefault(course_id, threading.Lock())
+
+
+def get_insights(course_id, connection):
+    """Cached insights for a course; computes at most once per TTL per course."""
+    key = str(course_id)
+    cached = _cache.get(key)
+    if cached and time.monotonic() - cached[0] < INSIGHTS_CACHE_TTL:
+        return cached[1]
+
+    with _course_lock(key):
+        # Another request may have refreshed it while we waited
+        cached = _cache.get(key)
+        if cached and time.monotonic() - cached[0] < INSIGHTS_CACHE_TTL:
+            return cached[1]
+        insights = compute_insights(course_id, connection)
+        _cache[key] = (time.monotonic(), insights)
+        return insights
+
+
+def invalidate_insights(course_id):
+    """Drop this process's cached insights for a course (other processes wait out the TTL)."""
+    if course_id is not None:
+        _cache.pop(str(course_id), None)
@@ -0,0 +1,649 @@
+"""
+Request handling for the LLM-backed endpoints.
+
+Each endpoint has a blocking handler, used by the Flask views in
+!database.py, and an async one, used by the ASGI server (asgi.py). Both take
+the request JSON and return (payload, status_code). Validation and response
+shaping are shared, so the two servers keep the same JSON contract. The async
+handlers only hold a pooled connection for the DB steps. They await the
+Cortex call itself, so a slow completion ties up neither a worker thread nor
+a connection.
+"""
+import json
+import uuid
+
+from ConnectionPool import get_pooled_connection, run_with_pooled_connection, DatabaseUnavailable
+from Modules.Cortex import complete, complete_async, complete_stream, complete_stream_async, model_for
+from Modules.ChatGPT import (
+    ask_question, ask_question_async, prepare_question, finish_question,
+    generate_quiz, generate_quiz_async,
+    build_explain_prompt, parse_explanation, build_assignment_prompt, parse_assignment_response,
+    count_course_materials
+)
+from Modules.QuizBank import sample_quiz
+from Modules.QuizSessions import (
+    POLL_WAIT_MAX, start_quiz_session, quiz_session_snapshot, quiz_session_snapshot_async
+)
+from Modules.ExamGenerator import plan_exam, run_exam, run_exam_async
+
+DB_ERROR = ({"success": False, "message": "Database connection error"}, 500)
+
+
+def _error(e):
+    return {"success": False, "message": f"Error: {str(e)}"}, 500
+
+
+# -------------------------------
+# /api/sendMessage
+# -------------------------------
+def _parse_send_message(data):
+    # Extract values from frontend request
+    userID = data.get("userID")
+    courseID = data.get("courseID")
+    question = data.get("question")
+
+    if not userID or not question or not courseID:
+        return None, ({"success": False, "message": "Missing userID, question, or courseID"}, 400)
+    return (userID, courseID, question), None
+
+
+def _send_message_response(question, status, message, response_data):
+    print(message)
+    print(question)
+
+    # Check if grounded (has citations)
+    if status and isinstance(response_data, dict):
+        citations = response_data.get("citations", [])
+        grounded = len(citations) > 0
+
+        print("Answer:", response_data.get("answer"))
+        print("Citations:", citations)
+        print("Grounded:", grounded)
+
+        return {
+            "success": status,
+            "message": message,
+            "answer": response_data.get("answer"),
+            "citations": citations,
+            "grounded": grounded
+        }, 200
+
+    # Fallback for error cases
+    return {
+        "success": status,
+        "message": message,
+        "answer": response_data if isinstance(response_data, str) else "",
+        "grounded": False
+    }, 200
+
+
+def handle_send_message(data):
+    args, error = _parse_send_message(data)
+    if error:
+        return error
+
+    connection = get_pooled_connection()
+    if not connection:
+        return DB_ERROR
+
+    try:
+        status, message, response_data = ask_question(*args, connection)
+    finally:
+        connection.close()
+    return _send_message_response(args[2], status, message, response_data)
+
+
+async def handle_send_message_async(data):
+    args, error = _parse_send_message(data)
+    if error:
+        return error
+
+    try:
+        status, message, response_data = await ask_question_async(*args)
+    except DatabaseUnavailable:
+        return DB_ERROR
+    return _send_message_response(args[2], status, message, response_data)
+
+
+# -------------------------------
+# /api/sendMessage/stream (server-sent events)
+# -------------------------------
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _stream_answer(question, state):
+    """
+    Events: 'token' ({"text"}) as the answer is generated, then 'citations' (list),
+    then 'done' with the same JSON /api/sendMessage returns; 'error' if generation fails.
+    The answer is logged exactly once, when the stream ends (or the client goes away).
+    """
+    parts = []
+    logged = False
+    try:
+        if "cached_answer" in state:
+            pieces = [state["cached_answer"]]   # repeated question: the whole answer at once
+        else:
+            pieces = complete_stream(state["model"], state["prompt"], endpoint="chat")
+        for text in pieces:
+            parts.append(text)
+            yield _sse("token", {"text": text})
+
+        logged = True
+        status, message, response_data = finish_question(state, "".join(parts))
+        yield _sse("citations", response_data["citations"])
+        payload, _ = _send_message_response(question, status, message, response_data)
+        yield _sse("done", payload)
+    except Exception as e:
+        print(f"ERROR: Streaming answer failed: {e}")
+        yield _sse("error", {"success": False, "message": f"Error: {str(e)}"})
+    finally:
+        if not logged:
+            state["answer_key"] = None    # a cut-off answer isn't worth caching
+            finish_question(state, "".join(parts))
+
+
+def handle_send_message_stream(data):
+    """
+    Returns (events, None) where events is a generator of SSE strings,
+    or (None, (payload, status_code)) if the request is rejected up front.
+    """
+    args, error = _parse_send_message(data)
+    if error:
+        return None, error
+
+    connection = get_pooled_connection()
+    if not connection:
+        return None, DB_ERROR
+
+    # The connection is only needed to prepare; it's back in the pool before streaming starts
+    try:
+        status, message, state = prepare_question(*args, connection)
+    finally:
+        connection.close()
+
+    if not status:
+        payload, _ = _send_message_response(args[2], status, message, state)
+        return iter([_sse("done", payload)]), None
+    return _stream_answer(args[2], state), None
+
+
+async def _stream_answer_async(question, state):
+    """_stream_answer() as an async generator over complete_stream_async(); same events."""
+    parts = []
+    logged = False
+    try:
+        if "cached_answer" in state:
+            parts.append(state["cached_answer"])
+            yield _sse("token", {"text": state["cached_answer"]})
+        else:
+            async for text in complete_stream_async(state["model"], state["prompt"], endpoint="chat"):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+
+        logged = True
+        status, message, response_data = finish_question(state, "".join(parts))
+        yield _sse("citations", response_data["citations"])
+        payload, _ = _send_message_response(question, status, message, response_data)
+        yield _sse("done", payload)
+    except Exception as e:
+        print(f"ERROR: Streaming answer failed: {e}")
+        yield _sse("error", {"success": False, "message": f"Error: {str(e)}"})
+    finally:
+        if not logged:
+            state["answer_key"] = None
+            finish_question(state, "".join(parts))
+
+
+async def _events(*events):
+    for event in events:
+        yield event
+
+
+async def handle_send_message_stream_async(data):
+    """handle_send_message_stream() for the async server: events is an async generator."""
+    args, error = _parse_send_message(data)
+    if error:
+        return None, error
+
+    try:
+        status, message, state = await run_with_pooled_connection(prepare_question, *args)
+    except DatabaseUnavailable:
+        return None, DB_ERROR
+
+    if not status:
+        payload, _ = _send_message_response(args[2], status, message, state)
+        return _events(_sse("done", payload)), None
+    return _stream_answer_async(args[2], state), None
+
+
+# -------------------------------
+# /api/generateQuiz
+# -------------------------------
+MAX_QUIZ_QUESTIONS = 20   # most questions one quiz may ask for
+
+
+def _parse_generate_quiz(data):
+    # Extract values from frontend request
+    courseID = data.get("courseID")
+    topic = data.get("topic", "General Course Review")
+    difficulty = data.get("difficulty", "Intermediate")
+    num_questions = data.get("numQuestions", 5)  # Default to 5 for faster generation
+    material_id = data.get("materialId")  # Specific material to generate from
+    user_id = data.get("userID")  # Optional: leaves out bank questions the user already attempted
+
+    print(f"DEBUG API: courseID={courseID}, topic={topic}, material_id={material_id}, num_questions={num_questions}")
+
+    if not courseID:
+        return None, ({"success": False, "message": "Missing courseID"}, 400)
+
+    try:
+        num_questions = int(num_questions)
+    except (TypeError, ValueError):
+        num_questions = 0
+    if not 1 <= num_questions <= MAX_QUIZ_QUESTIONS:
+        return None, ({"success": False,
+                       "message": f"Number of questions must be between 1 and {MAX_QUIZ_QUESTIONS}"}, 400)
+    return (courseID, topic, difficulty, num_questions, material_id, user_id), None
+
+
+def _generate_quiz_response(status, message, quiz_data):
+    print(message)
+    if status:
+        print(f"Generated quiz: {quiz_data['title']}")
+
+    return {
+        "success": status,
+        "message": message,
+        "quiz": quiz_data
+    }, 200 if status else 500
+
+
+def handle_generate_quiz(data):
+    args, error = _parse_generate_quiz(data)
+    if error:
+        return error
+    courseID, topic, difficulty, num_questions, material_id, user_id = args
+
+    connection = get_pooled_connection()
+    if not connection:
+        return DB_ERROR
+
+    try:
+        # Served from the pre-generated bank; generated live only on a miss
+        status, message, quiz_data = sample_quiz(
+            courseID, user_id, topic, difficulty, num_questions, connection, material_id
+        )
+        if not status:
+            print(f"DEBUG quiz bank miss: {message}")
+            status, message, quiz_data = generate_quiz(
+                courseID, topic, difficulty, num_questions, connection, None, material_id
+            )
+    finally:
+        connection.close()
+    return _generate_quiz_response(status, message, quiz_data)
+
+
+async def handle_generate_quiz_async(data):
+    args, error = _parse_generate_quiz(data)
+    if error:
+        return error
+    courseID, topic, difficulty, num_questions, material_id, user_id = args
+
+    try:
+        status, message, quiz_data = await run_with_pooled_connection(
+            sample_quiz, courseID, user_id, topic, difficulty, num_questions, material_id=material_id
+        )
+        if not status:
+            print(f"DEBUG quiz bank miss: {message}")
+            status, message, quiz_data = await generate_quiz_async(
+                courseID, topic, difficulty, num_questions, material_id=material_id
+            )
+    except DatabaseUnavailable:
+        return DB_ERROR
+    return _generate_quiz_response(status, message, quiz_data)
+
+
+# -------------------------------
+# /api/quizSession (progressive quizzes)
+# -------------------------------
+QUIZ_SESSION_NOT_FOUND = ({"success": False, "message": "Quiz session not found or expired"}, 404)
+QUIZ_SESSIONS_BUSY = ({"success": False, "message": "Too many quizzes are being generated, try again shortly"}, 503)
+
+
+def _parse_session_poll(args):
+    """(after, wait) from the query string; bad values fall back to 0."""
+    try:
+        after = max(0, int(args.get("after", 0)))
+        wait = min(max(0.0, float(args.get("wait", 0))), POLL_WAIT_MAX)
+    except (TypeError, ValueError):
+        after, wait = 0, 0.0
+    return after, wait
+
+
+def handle_start_quiz_session(data):
+    """Start generating a quiz; the session id comes back at once (202), or 503 while too many are generating."""
+    args, error = _parse_generate_quiz(data)
+    if error:
+        return error
+    courseID, topic, difficulty, num_questions, material_id, user_id = args
+
+    session_id = start_quiz_session(courseID, user_id, topic, difficulty, num_questions, material_id)
+    if session_id is None:
+        return QUIZ_SESSIONS_BUSY
+    return {
+        "success": True,
+        "message": "Quiz generation started",
+        "sessionId": session_id,
+        "status": "generating"
+    }, 202
+
+
+def handle_quiz_session(session_id, args):
+    """Long-poll: the questions after `after`, once there are any (or the quiz is finished, or `wait` runs out)."""
+    after, wait = _parse_session_poll(args)
+    snapshot = quiz_session_snapshot(session_id, after, wait)
+    if snapshot is None:
+        return QUIZ_SESSION_NOT_FOUND
+    return dict(snapshot, success=snapshot["status"] != "failed"), 200
+
+
+async def handle_quiz_session_async(session_id, args):
+    after, wait = _parse_session_poll(args)
+    snapshot = await quiz_session_snapshot_async(session_id, after, wait)
+    if snapshot is None:
+        return QUIZ_SESSION_NOT_FOUND
+    return dict(snapshot, success=snapshot["status"] != "failed"), 200
+
+
+def _stream_quiz_session(session_id, after):
+    """
+    Events: 'question' ({"index", "question"}) as each question is ready, then 'done'
+    with the session's state (without questions). A comment line is sent while waiting.
+    """
+    while True:
+        snapshot = quiz_session_snapshot(session_id, after, POLL_WAIT_MAX)
+        if snapshot is None:
+            yield _sse("error", QUIZ_SESSION_NOT_FOUND[0])
+            return
+        for i, question in enumerate(snapshot.pop("questions")):
+            yield _sse("question", {"index": after + i, "question": question})
+        if snapshot["next"] == after and snapshot["status"] == "generating":
+            yield ": waiting\n\n"
+        after = snapshot["next"]
+        if snapshot["status"] != "generating":
+            yield _sse("done", dict(snapshot, success=snapshot["status"] != "failed"))
+            return
+
+
+def handle_quiz_session_stream(session_id, args):
+    """Returns (events, None), or (None, (payload, status_code)) for an unknown session."""
+    after, _ = _parse_session_poll(args)
+    if quiz_session_snapshot(session_id) is None:
+        return None, QUIZ_SESSION_NOT_FOUND
+    return _stream_quiz_session(session_id, after), None
+
+
+async def _stream_quiz_session_async(session_id, after):
+    """_stream_quiz_session() as an async generator; same events."""
+    while True:
+        snapshot = await quiz_session_snapshot_async(session_id, after, POLL_WAIT_MAX)
+        if snapshot is None:
+            yield _sse("error", QUIZ_SESSION_NOT_FOUND[0])
+            return
+        for i, question in enumerate(snapshot.pop("questions")):
+            yield _sse("question", {"index": after + i, "question": question})
+        if snapshot["next"] == after and snapshot["status"] == "generating":
+            yield ": waiting\n\n"
+        after = snapshot["next"]
+        if snapshot["status"] != "generating":
+            yield _sse("done", dict(snapshot, success=snapshot["status"] != "failed"))
+            return
+
+
+async def handle_quiz_session_stream_async(session_id, args):
+    after, _ = _parse_session_poll(args)
+    if quiz_session_snapshot(session_id) is None:
+        return None, QUIZ_SESSION_NOT_FOUND
+    return _stream_quiz_session_async(session_id, after), None
+
+
+# -------------------------------
+# /api/explainPage
+# -------------------------------
+def _parse_explain_page(data):
+    userID = data.get("userID")
+    courseID = data.get("courseID")
+    pageTitle = data.get("pageTitle")
+    content = data.get("content")
+    mode = data.get("mode", "explain")  # 'explain' or 'practice'
+
+    if not all([userID, courseID, pageTitle, content]):
+        return None, ({"success": False, "message": "Missing required fields"}, 400)
+
+    if mode not in ['explain', 'practice']:
+        return None, ({"success": False, "message": "Mode must be 'explain' or 'practice'"}, 400)
+    return (courseID, pageTitle, content, mode), None
+
+
+def _explanation_response(result):
+    return {
+        "success": True,
+        "data": parse_explanation(result)
+    }, 200
+
+
+def _practice_response(status, quiz_data):
+    if status:
+        return {
+            "success": True,
+            "data": {
+                "quiz": quiz_data,
+                "message": f"Generated {len(quiz_data.get('questions', []))} practice questions"
+            }
+        }, 200
+    return {
+        "success": False,
+        "message": "Failed to generate practice questions"
+    }, 500
+
+
+def handle_explain_page(data):
+    args, error = _parse_explain_page(data)
+    if error:
+        return error
+    courseID, pageTitle, content, mode = args
+
+    connection = get_pooled_connection()
+    if not connection:
+        return DB_ERROR
+
+    try:
+        if mode == 'explain':
+            model = model_for("explain")
+            result = complete(model, build_explain_prompt(pageTitle, content, model), connection, endpoint="explain")
+            return _explanation_response(result)
+
+        # Generate practice questions using quiz generation logic (all course materials)
+        status, message, quiz_data = generate_quiz(
+            courseID, f"{pageTitle} Practice", "Intermediate", 5, connection
+        )
+        return _practice_response(status, quiz_data)
+    except Exception as e:
+        return _error(e)
+    finally:
+        connection.close()
+
+
+async def handle_explain_page_async(data):
+    args, error = _parse_explain_page(data)
+    if error:
+        return error
+    courseID, pageTitle, content, mode = args
+
+    try:
+        if mode == 'explain':
+            model = model_for("explain")
+            result = await complete_async(model, build_explain_prompt(pageTitle, content, model), endpoint="explain")
+            return _explanation_response(result)
+
+        status, message, quiz_data = await generate_quiz_async(
+            courseID, f"{pageTitle} Practice", "Intermediate", 5
+        )
+        return _practice_response(status, quiz_data)
+    except DatabaseUnavailable:
+        return DB_ERROR
+    except Exception as e:
+        return _error(e)
+
+
+# -------------------------------
+# /api/assignmentHelper
+# -------------------------------
+def _parse_assignment_helper(data):
+    userID = data.get("userID")
+    courseID = data.get("courseID")
+    assignmentText = data.get("assignmentText")
+    dueDate = data.get("dueDate")  # Optional
+    mode = data.get("mode", "summary")  # 'summary', 'checklist', 'plan'
+
+    if not all([userID, courseID, assignmentText, mode]):
+        return None, ({"success": False, "message": "Missing required fields"}, 400)
+
+    if mode not in ['summary', 'checklist', 'plan']:
+        return None, ({"success": False, "message": "Mode must be 'summary', 'checklist', or 'plan'"}, 400)
+    return (courseID, assignmentText, dueDate, mode), None
+
+
+def _assignment_response(mode, result, materials_count):
+    return {
+        "success": True,
+        "mode": mode,
+        "data": parse_assignment_response(result, mode),
+        # Grounded if the course has materials
+        "grounded": materials_count > 0,
+        "message": f"Generated {mode} for assignment"
+    }, 200
+
+
+def handle_assignment_helper(data):
+    args, error = _parse_assignment_helper(data)
+    if error:
+        return error
+    courseID, assignmentText, dueDate, mode = args
+
+    connection = get_pooled_connection()
+    if not connection:
+        return DB_ERROR
+
+    try:
+        model = model_for("assignment")
+        result = complete(model, build_assignment_prompt(mode, assignmentText, dueDate, model), connection,
+                          endpoint="assignment")
+        materials_count = count_course_materials(courseID, connection)
+        return _assignment_response(mode, result, materials_count)
+    except Exception as e:
+        return _error(e)
+    finally:
+        connection.close()
+
+
+async def handle_assignment_helper_async(data):
+    args, error = _parse_assignment_helper(data)
+    if error:
+        return error
+    courseID, assignmentText, dueDate, mode = args
+
+    try:
+        model = model_for("assignment")
+        result = await complete_async(model, build_assignment_prompt(mode, assignmentText, dueDate, model),
+                                      endpoint="assignment")
+        materials_count = await run_with_pooled_connection(count_course_materials, courseID)
+        return _assignment_response(mode, result, materials_count)
+    except DatabaseUnavailable:
+        return DB_ERROR
+    except Exception as e:
+        return _error(e)
+
+
+# -------------------------------
+# /api/generateExam
+# -------------------------------
+def _parse_generate_exam(data):
+    userID = data.get("userID")
+    courseID = data.get("courseID")
+    topic = data.get("topic", "all")  # Optional topic filter
+    numQuestions = data.get("numQuestions", 25)
+    difficulty = data.get("difficulty", "mixed")  # 'beginner', 'intermediate', 'advanced', 'mixed'
+
+    if not all([userID, courseID]):
+        return None, ({"success": False, "message": "Missing required fields"}, 400)
+
+    if numQuestions < 20 or numQuestions > 30:
+        return None, ({"success": False, "message": "Number of questions must be between 20 and 30"}, 400)
+
+    topic_str = topic if topic != "all" else "Comprehensive Exam"
+    return (courseID, topic_str, difficulty, numQuestions), None
+
+
+def _exam_response(topic_str, status, quiz_data):
+    if not status:
+        return {
+            "success": False,
+            "message": "Failed to generate exam"
+        }, 500
+
+    questions = quiz_data.get('questions', [])
+    return {
+        "success": True,
+        "examID": str(uuid.uuid4()),  # exam ID for tracking
+        "topic": topic_str,
+        "numQuestions": len(questions),
+        "questions": questions,
+        "slices": quiz_data.get("slices"),
+        "message": f"Generated exam with {len(questions)} questions"
+    }, 200
+
+
+def handle_generate_exam(data):
+    args, error = _parse_generate_exam(data)
+    if error:
+        return error
+    courseID, topic_str, difficulty, numQuestions = args
+
+    connection = get_pooled_connection()
+    if not connection:
+        return DB_ERROR
+
+    try:
+        # Planned on this connection; the slices then run concurrently on their own
+        try:
+            status, message, slices = plan_exam(courseID, topic_str, difficulty, numQuestions, connection)
+        finally:
+            connection.close()
+        if not status:
+            return _exam_response(topic_str, status, None)
+        status, message, quiz_data = run_exam(slices, topic_str, numQuestions)
+        return _exam_response(topic_str, status, quiz_data)
+    except Exception as e:
+        return _error(e)
+
+
+async def handle_generate_exam_async(data):
+    args, error = _parse_generate_exam(data)
+    if error:
+        return error
+    courseID, topic_str, difficulty, numQuestions = args
+
+    try:
+        status, message, slices = await run_with_pooled_connection(
+            plan_exam, courseID, topic_str, difficulty, numQuestions
+        )
+        if not status:
+            return _exam_response(topic_str, status, None)
+        status, message, quiz_data = await run_exam_async(slices, topic_str, numQuestions)
+        return _exam_response(topic_str, status, quiz_data)
+    except DatabaseUnavailable:
+        return DB_ERROR
+    except Exception as e:
+        return _error(e)
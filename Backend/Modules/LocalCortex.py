@@ -0,0 +1,83 @@
+"""
+Deterministic local stand-in for Cortex completions.
+
+Answers every prompt the backend sends without a warehouse, so each endpoint
+can be run and load-tested offline. It is selected with
+EDWIN_LLM_BACKEND=local, which is the default under EDWIN_STORAGE_BACKEND=local
+(see Modules/Cortex.py). It also answers CORTEX_COMPLETE in the local
+SQLite database. The same prompt always gets the same answer:
+  - quiz prompts get quiz JSON whose questions are worded from the prompt's
+    material, so different materials get different questions
+  - prompts that ask for JSON get their template back as JSON
+  - anything else gets a short answer naming the student's question
+EDWIN_LOCAL_LLM_LATENCY_MS and EDWIN_LOCAL_LLM_MS_PER_TOKEN add a simulated
+model latency, for load tests that need realistic completion times.
+"""
+import json
+import os
+import random
+import re
+import zlib
+
+from Modules.PromptBudget import estimate_tokens
+
+LOCAL_LATENCY_MS = float(os.environ.get("EDWIN_LOCAL_LLM_LATENCY_MS", "0"))      # per completion
+LOCAL_MS_PER_TOKEN = float(os.environ.get("EDWIN_LOCAL_LLM_MS_PER_TOKEN", "0"))  # per completion token
+STREAM_PIECE_WORDS = 8          # words per streamed piece
+
+_QUIZ_RE = re.compile(r"Generate (\d+) (\S+?)-level multiple choice questions about: (.+)")
+_JSON_RE = re.compile(r"Respond in JSON format:\s*(\{.*\})", re.DOTALL)
+
+
+def local_complete(model, prompt):
+    """
+    Deterministic offline completion so every endpoint works without a warehouse.
+    Returns valid JSON for prompts that ask for JSON, otherwise a short grounded answer.
+    """
+    prompt = prompt or ""
+
+    quiz_match = _QUIZ_RE.search(prompt)
+    if quiz_match:
+        count = int(quiz_match.group(1))
+        level = quiz_match.group(2)
+        topic = quiz_match.group(3).strip()
+        # Each question names a few words of the prompt's material, picked by a seed from the
+        # prompt, so different materials (and slices) get different questions
+        vocabulary = sorted(set(re.findall(r"[A-Za-z]{4,}", prompt[:quiz_match.start()])))
+        seed = zlib.crc32(prompt.encode("utf-8"))
+        questions = [
+            {
+                "question": f"[{model}] {level} question {i + 1} about {topic}: how do "
+                            f"{', '.join(random.Random(seed + i).sample(vocabulary, min(4, len(vocabulary))))} relate?",
+                "options": ["Option A", "Option B", "Option C", "Option D"],
+                "correct": i % 4,
+                "explanation": f"Local stand-in answer for question {i + 1}.",
+            }
+            for i in range(count)
+        ]
+        return json.dumps({"title": topic, "description": f"Local practice quiz on {topic}", "questions": questions})
+
+    json_match = _JSON_RE.search(prompt)
+    if json_match:
+        template = json_match.group(1).replace("{{", "{").replace("}}", "}")
+        try:
+            return json.dumps(json.loads(template))
+        except ValueError:
+            return template
+
+    question_match = re.findall(r"Student: (.+)", prompt)
+    question = question_match[-1].strip() if question_match else "your question"
+    return f"[{model} local] Here is what I found in the course materials about: {question}"
+
+
+def simulated_latency(completion):
+    """Seconds the stand-in takes to produce `completion` (0 unless configured)."""
+    if not LOCAL_LATENCY_MS and not LOCAL_MS_PER_TOKEN:
+        return 0.0
+    return (LOCAL_LATENCY_MS + LOCAL_MS_PER_TOKEN * estimate_tokens(completion)) / 1000
+
+
+def stream_pieces(completion):
+    """The completion split into pieces of STREAM_PIECE_WORDS words, for streamed responses."""
+    words = re.findall(r"\S+\s*", completion or "")
+    return ["".join(words[i:i + STREAM_PIECE_WORDS]) for i in range(0, len(words), STREAM_PIECE_WORDS)]
@@ -0,0 +1,30 @@
+"""
+Course-material change notifications.
+
+Code that writes course_materials calls materials_changed() after it commits.
+Subsystems that keep derived per-course state register a listener with
+on_materials_changed(). The conversation pool's baseline contexts are one
+such listener.
+"""
+
+_listeners = []
+
+
+def on_materials_changed(listener):
+    """
+    Register listener(course_id, added=[material_ids], removed=[material_ids], cleared=bool).
+    Can be used as a decorator.
+    """
+    _listeners.append(listener)
+    return listener
+
+
+def materials_changed(course_id, added=(), removed=(), cleared=False):
+    """Notify listeners that a course's materials changed. Listener errors are logged, not raised."""
+    if course_id is None:
+        return
+    for listener in list(_listeners):
+        try:
+            listener(course_id, added=list(added), removed=list(removed), cleared=cleared)
+        except Exception as e:
+            print(f"ERROR: Material change listener {getattr(listener, '__name__', listener)} failed: {e}")
@@ -0,0 +1,225 @@
+"""
+Write-behind logger for edwin_messages.
+
+Chat turns used to INSERT + commit each message on the request's critical path.
+Messages are now appended to a bounded in-memory queue and a background thread
+writes them in batches (one multi-row INSERT per batch) when either the batch
+size or the flush interval is reached. The queue is flushed on shutdown.
+
+Rows carry their own created_at (taken when the message was logged) so the
+conversation order is preserved even though several rows share one INSERT.
+Messages that are queued but not yet written are still visible to readers via
+pending_messages(), so conversation history never misses the previous turn.
+"""
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+
+from ConnectionPool import get_pooled_connection
+
+FLUSH_BATCH_SIZE = 50       # flush as soon as this many rows are waiting
+FLUSH_INTERVAL = 0.5        # ...or when the oldest row has waited this long (seconds)
+QUEUE_MAX_SIZE = 1000       # producers block when this many rows are waiting
+ENQUEUE_TIMEOUT = 2.0       # how long a producer blocks before writing synchronously
+MAX_FLUSH_ATTEMPTS = 3      # a batch is dropped (and reported) after this many failed writes
+
+INSERT_MESSAGES_SQL = (
+    "INSERT INTO edwin_messages (conv_id, user_id, userorAI, message, created_at) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+
+
+def _write_rows(connection, rows):
+    """
+    Write rows in a single statement. snowflake.connector rewrites executemany()
+    of an INSERT ... VALUES into one multi-row VALUES insert.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(INSERT_MESSAGES_SQL, rows)
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+class WriteBehindLogger:
+    """Bounded queue + background flusher for edwin_messages inserts."""
+
+    def __init__(self, connection_factory, batch_size=FLUSH_BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_queue=QUEUE_MAX_SIZE, enqueue_timeout=ENQUEUE_TIMEOUT):
+        self._connection_factory = connection_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+
+        self._cond = threading.Condition()
+        self._pending = []        # rows waiting to be written, oldest first
+        self._inflight = []       # rows currently being written by the flusher
+        self._oldest_at = None    # monotonic time the oldest pending row was queued
+        self._thread = None
+        self._stopping = False
+
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "dropped": 0,
+            "sync_fallbacks": 0,
+            "backpressure_waits": 0,
+        }
+
+    # -------------------------------
+    # Producer side
+    # -------------------------------
+    def log(self, conv_id, user_id, userorai, message, created_at=None):
+        """Queue a message for writing. Blocks briefly if the queue is full."""
+        row = (conv_id, user_id, userorai, message, created_at or datetime.now(timezone.utc))
+        self._ensure_thread()
+
+        with self._cond:
+            if len(self._pending) >= self.max_queue:
+                self._stats["backpressure_waits"] += 1
+                deadline = time.monotonic() + self.enqueue_timeout
+                while len(self._pending) >= self.max_queue and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            if len(self._pending) < self.max_queue and not self._stopping:
+                self._pending.append(row)
+                self._stats["enqueued"] += 1
+                if self._oldest_at is None:
+                    self._oldest_at = time.monotonic()
+                self._cond.notify_all()
+                return
+
+            self._stats["sync_fallbacks"] += 1
+
+        # Queue still full (or shutting down): write on the caller's thread so nothing is lost
+        self._write_batch([row])
+
+    def pending_for(self, conv_id):
+        """Rows for a conversation that are queued or being written but not yet committed."""
+        with self._cond:
+            return [row for row in self._inflight + self._pending if row[0] == conv_id]
+
+    # -------------------------------
+    # Flusher side
+    # -------------------------------
+    def flush(self, timeout=10.0):
+        """Block until everything queued so far has been written (or the timeout expires)."""
+        self._ensure_thread()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._oldest_at = 0 if self._pending else None  # make the flusher run now
+            self._cond.notify_all()
+            while self._pending or self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=10.0):
+        """Flush remaining rows and stop the background thread."""
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._pending)
+            stats["inflight"] = len(self._inflight)
+        return stats
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="edwin-message-logger", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if self._pending:
+                        waited = time.monotonic() - self._oldest_at
+                        if len(self._pending) >= self.batch_size or waited >= self.flush_interval:
+                            break
+                        self._cond.wait(self.flush_interval - waited)
+                    else:
+                        self._cond.wait()
+                if self._stopping and not self._pending:
+                    return
+
+                batch = self._pending[:self.batch_size]
+                self._pending = self._pending[self.batch_size:]
+                self._inflight = batch
+                self._oldest_at = time.monotonic() if self._pending else None
+                self._cond.notify_all()  # wake producers blocked on a full queue
+
+            self._write_batch(batch, attempts=MAX_FLUSH_ATTEMPTS)
+
+            with self._cond:
+                self._inflight = []
+                self._cond.notify_all()
+
+    def _write_batch(self, rows, attempts=1):
+        for attempt in range(1, attempts + 1):
+            connection = self._connection_factory()
+            if connection:
+                try:
+                    _write_rows(connection, rows)
+                    with self._cond:
+                        self._stats["written"] += len(rows)
+                        self._stats["batches"] += 1
+                    return True
+                except Exception as e:
+                    print(f"ERROR: Failed to write {len(rows)} message(s) (attempt {attempt}): {e}")
+                finally:
+                    connection.close()
+            with self._cond:
+                self._stats["failed_batches"] += 1
+            if attempt < attempts:
+                time.sleep(0.2 * attempt)
+
+        with self._cond:
+            self._stats["dropped"] += len(rows)
+        print(f"ERROR: Dropped {len(rows)} message(s) after {attempts} failed write attempt(s)")
+        return False
+
+
+# -------------------------------
+# Shared logger
+# -------------------------------
+_logger = WriteBehindLogger(get_pooled_connection)
+atexit.register(_logger.shutdown)
+
+
+def log_message(conv_id, user_id, userorai, message):
+    """Queue a chat message for edwin_messages (userorai: False = student, True = Edwin)."""
+    _logger.log(conv_id, user_id, userorai, message)
+
+
+def pending_messages(conv_id):
+    """Queued-but-unwritten rows for a conversation: (conv_id, user_id, userorAI, message, created_at)."""
+    return _logger.pending_for(conv_id)
+
+
+def flush_messages(timeout=10.0):
+    return _logger.flush(timeout)
+
+
+def message_logger_metrics():
+    return _logger.metrics()
@@ -0,0 +1,181 @@
+"""
+Per-request model choice for Cortex completions.
+
+Each endpoint used to run every completion on one model, so a chat question
+like "what time are office hours" paid llama3-70b latency. The LLM client
+(Modules/Cortex.py) now asks route() for the model of each completion,
+passing the endpoint's configured model (model_for()) and the prompt. It
+picks:
+  - only models whose context window fits the prompt, and none weaker than
+    the task needs (quiz and exam JSON needs at least mixtral-8x7b)
+  - for a small prompt on a light task (chat, explain), the fastest such model
+  - otherwise the endpoint's model, unless its recent p95 latency is over the
+    endpoint's latency budget: then the strongest faster model that is within
+    budget (or hasn't been measured yet)
+Latency is observed per (endpoint, model) over the last LATENCY_WINDOW
+seconds, so long quiz generations don't count against the chat budget, and
+old slow calls age out. A model over budget still gets every PROBE_EVERY-th
+request that would have used it. Once RECOVERY_PROBES of those in a row are
+within budget, its older samples are dropped and it is used again. An
+endpoint pinned with EDWIN_MODEL_<ENDPOINT> is never rerouted, and
+EDWIN_MODEL_ROUTING=0 turns routing off.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from Modules.PromptBudget import context_budget, estimate_tokens
+
+ROUTING_ENABLED = os.environ.get("EDWIN_MODEL_ROUTING", "1") == "1"
+# Models the router chooses among, fastest first
+ROUTED_MODELS = tuple(filter(None, os.environ.get("EDWIN_ROUTED_MODELS", "llama3-8b,mixtral-8x7b,llama3-70b").split(",")))
+# p95 seconds each endpoint's completions should stay within; EDWIN_LATENCY_BUDGET_<ENDPOINT> overrides
+LATENCY_BUDGETS = {
+    "chat": 8.0,
+    "explain": 12.0,
+    "assignment": 15.0,
+    "quiz": 20.0,
+    "exam": 25.0,
+}
+DEFAULT_LATENCY_BUDGET = 15.0
+LIGHT_TASKS = {"chat", "explain"}            # endpoints whose small prompts go to the fastest model
+SMALL_PROMPT_TOKENS = int(os.environ.get("EDWIN_ROUTER_SMALL_PROMPT_TOKENS", "1200"))
+TASK_MIN_MODEL = {"quiz": "mixtral-8x7b", "exam": "mixtral-8x7b"}   # weakest model that produces usable quiz JSON
+LATENCY_WINDOW = 300         # seconds of calls a p95 is taken over
+LATENCY_SAMPLES_MAX = 1000   # most samples kept per (endpoint, model)
+MIN_LATENCY_SAMPLES = 10     # calls in the window before a p95 is trusted
+PROBE_EVERY = 20             # one in this many requests still goes to a model over budget
+RECOVERY_PROBES = 2          # calls in a row within budget that bring a model back
+
+
+def latency_budget(endpoint):
+    """The endpoint's p95 latency budget in seconds."""
+    override = os.environ.get(f"EDWIN_LATENCY_BUDGET_{str(endpoint).upper()}")
+    return float(override) if override else LATENCY_BUDGETS.get(endpoint, DEFAULT_LATENCY_BUDGET)
+
+
+class ModelRouter:
+    """Chooses each completion's model from the latencies observe() has seen per (endpoint, model)."""
+
+    def __init__(self, models=ROUTED_MODELS, enabled=ROUTING_ENABLED, window=LATENCY_WINDOW):
+        self.models = list(models)
+        self.enabled = enabled
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}       # (endpoint, model) -> deque of (monotonic time, seconds)
+        self._good_calls = {}    # (endpoint, model) -> calls in a row within budget while over it
+        self._over_budget = {}   # (endpoint, model) -> requests it would have had while over budget
+        self._recoveries = 0
+        self._decisions = {}     # endpoint -> {model: count}
+        self._reasons = {}       # endpoint -> {reason: count}
+
+    def _rank(self, model):
+        """Position from fastest; models outside the routed list rank as the slowest."""
+        return self.models.index(model) if model in self.models else len(self.models)
+
+    # -------------------------------
+    # Latency
+    # -------------------------------
+    def observe(self, endpoint, model, seconds):
+        """Record one completion's latency (called by the LLM client for every call)."""
+        if endpoint is None:
+            return
+        key, budget = (endpoint, model), latency_budget(endpoint)
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=LATENCY_SAMPLES_MAX))
+            p95 = self._p95_locked(samples)
+            if p95 is not None and p95 > budget and seconds <= budget:
+                self._good_calls[key] = self._good_calls.get(key, 0) + 1
+                if self._good_calls[key] >= RECOVERY_PROBES:
+                    # Recovered: the slow calls no longer describe it
+                    samples.clear()
+                    self._good_calls.pop(key)
+                    self._over_budget.pop(key, None)
+                    self._recoveries += 1
+            else:
+                self._good_calls.pop(key, None)
+            samples.append((time.monotonic(), seconds))
+
+    def _p95_locked(self, samples):
+        cutoff = time.monotonic() - self.window
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(seconds for _, seconds in samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def p95(self, endpoint, model):
+        """Recent p95 latency of `model` on `endpoint` in seconds, or None with too few recent calls."""
+        with self._lock:
+            samples = self._samples.get((endpoint, model))
+            return self._p95_locked(samples) if samples is not None else None
+
+    def _over(self, endpoint, model, budget):
+        p95 = self.p95(endpoint, model)
+        return p95 is not None and p95 > budget
+
+    def _probe(self, endpoint, model):
+        """True for every PROBE_EVERY-th request a model over budget would have had."""
+        key = (endpoint, model)
+        with self._lock:
+            self._over_budget[key] = self._over_budget.get(key, 0) + 1
+            return self._over_budget[key] % PROBE_EVERY == 0
+
+    def route(self, endpoint, model, prompt):
+        """The model to run `prompt` on for `endpoint`; `model` is the one the endpoint is configured with."""
+        if not self.enabled or endpoint is None:
+            return model
+        if os.environ.get(f"EDWIN_MODEL_{str(endpoint).upper()}"):
+            return self._decide(endpoint, model, "pinned")
+
+        tokens = estimate_tokens(prompt)
+        floor = self._rank(TASK_MIN_MODEL.get(endpoint)) if endpoint in TASK_MIN_MODEL else 0
+        candidates = [m for m in self.models if self._rank(m) >= floor and tokens <= context_budget(m)]
+        budget = latency_budget(endpoint)
+
+        if endpoint in LIGHT_TASKS and tokens <= SMALL_PROMPT_TOKENS and candidates:
+            within = [m for m in candidates if not self._over(endpoint, m, budget)]
+            return self._decide(endpoint, (within or candidates)[0], "small_prompt")
+
+        if not self._over(endpoint, model, budget):
+            return self._decide(endpoint, model, "configured")
+        if self._probe(endpoint, model):
+            return self._decide(endpoint, model, "probe")
+        faster = [m for m in candidates if self._rank(m) < self._rank(model) and not self._over(endpoint, m, budget)]
+        if faster:
+            return self._decide(endpoint, faster[-1], "latency_fallback")
+        return self._decide(endpoint, model, "over_budget")
+
+    def _decide(self, endpoint, model, reason):
+        with self._lock:
+            models = self._decisions.setdefault(endpoint, {})
+            models[model] = models.get(model, 0) + 1
+            reasons = self._reasons.setdefault(endpoint, {})
+            reasons[reason] = reasons.get(reason, 0) + 1
+        return model
+
+    def metrics(self):
+        with self._lock:
+            p95 = {}
+            for (endpoint, model), samples in self._samples.items():
+                seconds = self._p95_locked(samples)
+                p95.setdefault(endpoint, {})[model] = round(seconds * 1000, 1) if seconds is not None else None
+            endpoints = {
+                endpoint: {
+                    "budget_s": latency_budget(endpoint),
+                    "models": dict(models),
+                    "reasons": dict(self._reasons.get(endpoint, {})),
+                    "p95_ms": p95.get(endpoint, {}),
+                }
+                for endpoint, models in self._decisions.items()
+            }
+            recoveries = self._recoveries
+        return {
+            "enabled": self.enabled,
+            "models": self.models,
+            "window_s": self.window,
+            "recoveries": recoveries,
+            "endpoints": endpoints,
+        }
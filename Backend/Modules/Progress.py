@@ -0,0 +1,296 @@
+"""
+Incrementally maintained per-user quiz progress.
+
+/api/quizAttempt updates two small aggregate tables (user_progress and
+user_quiz_progress) and /api/progress reads them with one keyed lookup,
+instead of scanning user_quiz_attempts four times on every panel open.
+Reads are also cached in-process for a short TTL.
+
+An attempt is applied as an atomic increment. A user or quiz that has no
+aggregate row yet may still have older attempts, so that row is instead
+computed from user_quiz_attempts (which includes the new attempt) and
+written with a MERGE. Snowflake doesn't enforce primary keys, and a MERGE
+is what keeps two workers from both inserting the row.
+
+Backfill / repair from the raw attempts:
+    cd Backend
+    python -m Modules.Progress --rebuild [--user USER_ID]
+"""
+import time
+from datetime import date, datetime, timedelta
+
+PROGRESS_CACHE_TTL = 30   # seconds; other workers' writes become visible after this
+MAX_STREAK = 30           # the original query only looked at the last 30 active days
+STREAK_GAP_DAYS = 2       # consecutive active days may be at most this far apart
+
+_cache = {}               # user_id -> (fetched_at, progress dict)
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+
+def _streak_as_of(last_active_date, current_streak, today=None):
+    """A stored streak only counts if the user was active today or yesterday."""
+    today = today or datetime.now().date()
+    if not last_active_date or (today - last_active_date).days > 1:
+        return 0
+    return min(current_streak, MAX_STREAK)
+
+
+def _streak_from_dates(dates):
+    """Streak ending at the most recent of `dates` (any order)."""
+    dates = sorted(set(dates), reverse=True)
+    if not dates:
+        return 0
+    streak = 1
+    for previous, current in zip(dates, dates[1:]):
+        if (previous - current).days > STREAK_GAP_DAYS:
+            break
+        streak += 1
+    return streak
+
+
+# -------------------------------
+# Write path
+# -------------------------------
+def _merge(cursor, table, keys, row):
+    """Insert `row` (column -> value) into `table`, or overwrite the row with the same `keys`, in one MERGE."""
+    columns = list(row)
+    cursor.execute(f"""
+        MERGE INTO {table} t
+        USING (SELECT {', '.join(f'%s AS {column}' for column in columns)}) s
+        ON {' AND '.join(f't.{key} = s.{key}' for key in keys)}
+        WHEN MATCHED THEN UPDATE SET {', '.join(f'{column} = s.{column}' for column in columns if column not in keys)}
+        WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) VALUES ({', '.join(f's.{column}' for column in columns)})
+    """, [row[column] for column in columns])
+
+
+def _rebuild_quiz(cursor, user_id, quiz_title):
+    """Write one quiz's aggregate row from the user's attempts at it."""
+    cursor.execute("""
+        SELECT COUNT(*), SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
+        FROM user_quiz_attempts
+        WHERE user_id = %s AND quiz_title = %s
+    """, (user_id, quiz_title))
+    answered, correct = cursor.fetchone()
+    _merge(cursor, "user_quiz_progress", ("user_id", "quiz_title"), {
+        "user_id": user_id, "quiz_title": quiz_title,
+        "questions_answered": answered or 0, "correct_count": correct or 0,
+    })
+
+
+def record_attempt(user_id, quiz_title, is_correct, connection, attempted_on=None):
+    """
+    Apply one quiz attempt to the aggregates (call after inserting into user_quiz_attempts
+    on the same connection). Commits, so the attempt row and the aggregates land together.
+    """
+    attempted_on = attempted_on or datetime.now().date()
+    correct = 1 if is_correct else 0
+    streak_window_start = attempted_on - timedelta(days=STREAK_GAP_DAYS)
+    cursor = connection.cursor()
+
+    # Increment in SQL so concurrent attempts never lose an update
+    cursor.execute(
+        """
+        UPDATE user_progress SET
+            total_attempts = total_attempts + 1,
+            correct_answers = correct_answers + %s,
+            current_streak = CASE
+                WHEN last_active_date >= %s THEN current_streak
+                WHEN last_active_date >= %s THEN current_streak + 1
+                ELSE 1 END,
+            last_active_date = CASE
+                WHEN last_active_date >= %s THEN last_active_date
+                ELSE %s END
+        WHERE user_id = %s
+        """,
+        (correct, attempted_on, streak_window_start, attempted_on, attempted_on, user_id)
+    )
+    if cursor.rowcount == 0:
+        # No aggregates yet, but there may be attempts from before they existed
+        rebuild_progress(connection, user_id)
+    else:
+        cursor.execute(
+            """
+            UPDATE user_quiz_progress SET
+                questions_answered = questions_answered + 1,
+                correct_count = correct_count + %s
+            WHERE user_id = %s AND quiz_title = %s
+            """,
+            (correct, user_id, quiz_title)
+        )
+        if cursor.rowcount == 0:
+            _rebuild_quiz(cursor, user_id, quiz_title)
+
+    connection.commit()
+    cursor.close()
+    _cache.pop(str(user_id), None)
+
+
+# -------------------------------
+# Read path
+# -------------------------------
+def _fetch_progress(user_id, connection):
+    """One keyed lookup. Returns None if the user has no aggregate row yet."""
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT p.total_attempts, p.correct_answers, p.last_active_date, p.current_streak,
+               q.quiz_title, q.questions_answered, q.correct_count
+        FROM user_progress p
+        LEFT JOIN user_quiz_progress q ON q.user_id = p.user_id
+        WHERE p.user_id = %s
+    """, (user_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    if not rows:
+        return None
+
+    total_attempts, correct_answers, last_active_date, current_streak = rows[0][:4]
+    return {
+        "total_attempts": total_attempts or 0,
+        "correct_answers": correct_answers or 0,
+        "last_active_date": _as_date(last_active_date),
+        "current_streak": current_streak or 0,
+        "quiz_stats": [(title, answered, correct) for _, _, _, _, title, answered, correct in rows if title is not None],
+    }
+
+
+def get_progress(user_id, connection):
+    """
+    Progress for /api/progress, in the endpoint's JSON shape.
+    Users without aggregates yet (attempts from before this table existed) are backfilled once.
+    """
+    key = str(user_id)
+    cached = _cache.get(key)
+    if cached and time.monotonic() - cached[0] < PROGRESS_CACHE_TTL:
+        stats = cached[1]
+    else:
+        stats = _fetch_progress(user_id, connection)
+        if stats is None:
+            rebuild_progress(connection, user_id)
+            connection.commit()
+            stats = _fetch_progress(user_id, connection)
+        _cache[key] = (time.monotonic(), stats)
+
+    total_attempts = stats["total_attempts"]
+    correct_answers = stats["correct_answers"]
+    accuracy = (correct_answers / total_attempts * 100) if total_attempts > 0 else 0
+
+    return {
+        "totalAttempts": total_attempts,
+        "correctAnswers": correct_answers,
+        "accuracy": round(accuracy, 1),
+        "streak": _streak_as_of(stats["last_active_date"], stats["current_streak"]),
+        "quizzesCompleted": len(stats["quiz_stats"]),
+        "quizStats": [
+            {
+                "title": title,
+                "questionsAnswered": questions,
+                "correctCount": correct
+            }
+            for title, questions, correct in stats["quiz_stats"]
+        ]
+    }
+
+
+# -------------------------------
+# Rebuild / backfill
+# -------------------------------
+def rebuild_progress(connection, user_id=None):
+    """
+    Recompute aggregates from user_quiz_attempts for one user (or everyone).
+    Always writes a user_progress row for a single user, even with zero attempts,
+    so the backfill runs at most once per user. A single user's rows are written
+    with MERGE, so a concurrent rebuild can't duplicate them; a full rebuild
+    replaces both tables. Does not commit.
+    """
+    where = "WHERE user_id = %s" if user_id is not None else ""
+    params = (user_id,) if user_id is not None else ()
+    cursor = connection.cursor()
+
+    cursor.execute(f"""
+        SELECT user_id, quiz_title, COUNT(*), SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
+        FROM user_quiz_attempts
+        {where}
+        GROUP BY user_id, quiz_title
+    """, params)
+    per_quiz = cursor.fetchall()
+
+    cursor.execute(f"""
+        SELECT DISTINCT user_id, DATE(created_at)
+        FROM user_quiz_attempts
+        {where}
+    """, params)
+    active_dates = {}
+    for uid, day in cursor.fetchall():
+        if day is not None:
+            active_dates.setdefault(uid, []).append(_as_date(day))
+
+    totals = {}
+    for uid, title, answered, correct in per_quiz:
+        total = totals.setdefault(uid, [0, 0])
+        total[0] += answered or 0
+        total[1] += correct or 0
+    if user_id is not None and not totals:
+        totals[user_id] = [0, 0]
+
+    progress_rows = []
+    for uid, (total, correct) in totals.items():
+        dates = active_dates.get(uid, [])
+        progress_rows.append((uid, total, correct, max(dates) if dates else None, _streak_from_dates(dates)))
+
+    quiz_rows = [(uid, title, answered or 0, correct or 0) for uid, title, answered, correct in per_quiz if title is not None]
+    if user_id is not None:
+        for uid, total, correct, last_active_date, streak in progress_rows:
+            _merge(cursor, "user_progress", ("user_id",), {
+                "user_id": uid, "total_attempts": total, "correct_answers": correct,
+                "last_active_date": last_active_date, "current_streak": streak,
+            })
+        for uid, title, answered, correct in quiz_rows:
+            _merge(cursor, "user_quiz_progress", ("user_id", "quiz_title"), {
+                "user_id": uid, "quiz_title": title, "questions_answered": answered, "correct_count": correct,
+            })
+        _cache.pop(str(user_id), None)
+    else:
+        cursor.execute("DELETE FROM user_progress")
+        cursor.execute("DELETE FROM user_quiz_progress")
+        if progress_rows:
+            cursor.executemany("""
+                INSERT INTO user_progress (user_id, total_attempts, correct_answers, last_active_date, current_streak)
+                VALUES (%s, %s, %s, %s, %s)
+            """, progress_rows)
+        if quiz_rows:
+            cursor.executemany("""
+                INSERT INTO user_quiz_progress (user_id, quiz_title, questions_answered, correct_count)
+                VALUES (%s, %s, %s, %s)
+            """, quiz_rows)
+        _cache.clear()
+
+    cursor.close()
+    return len(progress_rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    from credentials import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Maintain Edwin progress aggregates")
+    parser.add_argument("--rebuild", action="store_true", help="recompute aggregates from user_quiz_attempts")
+    parser.add_argument("--user", help="only rebuild this user_id")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        conn = get_db_connection()
+        if conn:
+            count = rebuild_progress(conn, args.user)
+            conn.commit()
+            conn.close()
+            print(f"SUCCESS: Rebuilt progress for {count} user(s).")
+    else:
+        parser.print_help()
@@ -0,0 +1,208 @@
+"""
+Token-budgeted prompt assembly.
+
+Prompts used to be cut with fixed character limits (baseline 800, material
+passages 500, history messages 200/150, page text 3000, assignment 4000).
+Those limits were tuned for an 8192-token model: they cut short inputs that
+would have fit and still overflow on dense text. Prompts are now built from
+parts, and each part is measured with a local token estimate. The parts are
+packed into the model's context window (minus the tokens kept free for the
+answer) in priority order. A part that doesn't fit is cut at a word
+boundary, or dropped when even its smallest useful cut doesn't fit. Each
+build reports what was cut or dropped.
+
+    budget = PromptBudget(CORTEX_MODEL, output_tokens=CHAT_OUTPUT_TOKENS)
+    budget.add("question", f"Student: {question}\\n", priority=0)
+    budget.header("sources", "RELEVANT COURSE MATERIALS:\\n")
+    budget.add("source 1", text, priority=1, min_tokens=40, group="sources")
+    prompt, report = budget.build()
+"""
+import re
+import threading
+
+# Context windows of the Cortex models (tokens)
+MODEL_CONTEXT_TOKENS = {
+    "llama3-8b": 8192,
+    "llama3-70b": 8192,
+    "llama3.1-8b": 128000,
+    "llama3.1-70b": 128000,
+    "mistral-7b": 32000,
+    "mixtral-8x7b": 32000,
+    "mistral-large": 32000,
+    "snowflake-arctic": 4096,
+}
+DEFAULT_CONTEXT_TOKENS = 8192   # unknown models
+DEFAULT_OUTPUT_TOKENS = 1024    # kept free for the answer
+ESTIMATE_MARGIN = 0.9           # the estimate is approximate, so only fill 90% of the window
+CHARS_PER_TOKEN = 4             # for sizing reads before the text is known
+
+# Words, numbers and single symbols; roughly how BPE tokenizers split English text
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_")
+
+
+def _piece_tokens(piece):
+    if piece.isascii():
+        if piece[0].isdigit():
+            return 1 + (len(piece) - 1) // 3    # numbers split every 3 digits
+        return 1 + (len(piece) - 1) // 6        # long words split into sub-words
+    return len(piece)                          # non-Latin text is about a token per character
+
+
+def estimate_tokens(text):
+    """Approximate token count of `text` (within ~10% of the Cortex tokenizers on English prose)."""
+    if not text:
+        return 0
+    return sum(_piece_tokens(piece) for piece in _PIECE_RE.findall(text))
+
+
+def chars_for_tokens(tokens):
+    """Characters to read to fill about `tokens` tokens."""
+    return max(0, int(tokens)) * CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    """The longest head of `text` estimated at no more than `max_tokens`, cut at a word boundary."""
+    if max_tokens <= 0:
+        return ""
+    used = 0
+    for match in _PIECE_RE.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def context_budget(model, output_tokens=DEFAULT_OUTPUT_TOKENS):
+    """Prompt tokens available for `model` once `output_tokens` are kept for the answer."""
+    window = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    return max(0, int(window * ESTIMATE_MARGIN) - output_tokens)
+
+
+class _Part:
+    __slots__ = ("name", "text", "priority", "min_tokens", "shrink", "group", "tokens")
+
+    def __init__(self, name, text, priority, min_tokens, shrink, group):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        self.min_tokens = min_tokens
+        self.shrink = shrink
+        self.group = group
+        self.tokens = estimate_tokens(self.text)
+
+
+class PromptBudget:
+    """Packs prompt parts into a model's context window by priority."""
+
+    def __init__(self, model=None, output_tokens=DEFAULT_OUTPUT_TOKENS, limit=None):
+        """Budget for `model`, or a fixed `limit` of tokens."""
+        self.model = model
+        self.limit = context_budget(model, output_tokens) if limit is None else limit
+        self._parts = []      # parts and headers, in prompt order
+        self._headers = {}    # group -> header part
+
+    def add(self, name, text, priority=0, min_tokens=None, shrink=None, group=None):
+        """
+        Add a part. Parts render in the order they are added and are packed by `priority`
+        (lower first; ties in the order added). Priority 0 parts are always kept, cut to
+        fit if they allow it. Other parts are cut to fit when at least `min_tokens` are
+        left (None: never cut), otherwise dropped.
+        `shrink(text, max_tokens)` makes the cut (default: keep the head).
+        """
+        self._parts.append(_Part(name, text, priority, min_tokens, shrink, group))
+
+    def header(self, group, text):
+        """Text rendered before the parts of `group`, only when at least one of them is kept."""
+        part = _Part(f"{group} header", text, None, None, None, group)
+        self._headers[group] = part
+        self._parts.append(part)
+
+    def build(self):
+        """(prompt, report) where report has model, limit, tokens, kept, truncated and dropped part names."""
+        parts = [p for p in self._parts if p.priority is not None]
+        order = sorted(range(len(parts)), key=lambda i: (parts[i].priority != 0, parts[i].priority, i))
+
+        used = 0
+        kept = {}             # id(part) -> text
+        open_groups = set()
+        truncated, dropped = [], []
+        for i in order:
+            part = parts[i]
+            header = self._headers.get(part.group)
+            overhead = header.tokens if header is not None and part.group not in open_groups else 0
+            room = self.limit - used - overhead
+            text, tokens = part.text, part.tokens
+
+            if tokens > room:
+                required = part.priority == 0
+                if part.min_tokens is not None and room >= part.min_tokens and room > 0:
+                    text = (part.shrink or truncate_to_tokens)(part.text, room)
+                    # A custom shrink can overshoot the estimate; finish with a plain cut
+                    text = truncate_to_tokens(text, room)
+                    tokens = estimate_tokens(text)
+                    text += part.text[len(part.text.rstrip()):]   # keep the separator after the part
+                    truncated.append(part.name)
+                elif not required:
+                    dropped.append(part.name)
+                    continue
+
+            kept[id(part)] = text
+            used += tokens + overhead
+            if header is not None:
+                open_groups.add(part.group)
+
+        prompt = "".join(
+            kept[id(p)] if p.priority is not None else p.text
+            for p in self._parts
+            if id(p) in kept or (p.priority is None and p.group in open_groups)
+        )
+        report = {
+            "model": self.model,
+            "limit": self.limit,
+            "tokens": used,
+            "kept": [p.name for p in parts if id(p) in kept],
+            "truncated": truncated,
+            "dropped": dropped,
+        }
+        _record(report)
+        if truncated or dropped:
+            print(f"DEBUG prompt budget ({self.model or 'custom'}, {used}/{self.limit} tokens): "
+                  f"truncated {truncated}, dropped {dropped}")
+        return prompt, report
+
+
+def fit_prompt(model, before, body, after="", output_tokens=DEFAULT_OUTPUT_TOKENS, name="body"):
+    """
+    `before` + `body` + `after`, with only `body` cut to fit the model's budget.
+    Returns (prompt, report).
+    """
+    budget = PromptBudget(model, output_tokens)
+    budget.add("instructions", before, priority=0)
+    budget.add(name, body, priority=1, min_tokens=1)
+    budget.add("format", after, priority=0)
+    return budget.build()
+
+
+# -------------------------------
+# Metrics
+# -------------------------------
+_lock = threading.Lock()
+_stats = {"prompts": 0, "tokens": 0, "over_budget": 0, "truncated_parts": 0, "dropped_parts": 0,
+          "prompts_trimmed": 0}
+
+
+def _record(report):
+    with _lock:
+        _stats["prompts"] += 1
+        _stats["tokens"] += report["tokens"]
+        _stats["over_budget"] += report["tokens"] > report["limit"]
+        _stats["truncated_parts"] += len(report["truncated"])
+        _stats["dropped_parts"] += len(report["dropped"])
+        _stats["prompts_trimmed"] += bool(report["truncated"] or report["dropped"])
+
+
+def prompt_budget_metrics():
+    with _lock:
+        stats = dict(_stats)
+    stats["avg_tokens"] = round(stats["tokens"] / stats["prompts"], 1) if stats["prompts"] else 0.0
+    return stats
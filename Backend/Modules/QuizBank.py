@@ -0,0 +1,380 @@
+"""
+Pre-generated quiz bank.
+
+/api/generateQuiz used to block on a fresh Cortex call (10-40 s on mixtral)
+for every quiz. Questions are now generated ahead of time. When materials
+are ingested (Modules/MaterialEvents.py), a background builder generates
+QUIZ_BANK_QUESTIONS questions per new material at each of
+QUIZ_BANK_DIFFICULTIES. They are stored in the quizzes / quiz_questions
+tables, one quizzes row per material and difficulty. To bound the work an
+upload causes (a 40-slide deck is 40 materials), materials shorter than
+QUIZ_BANK_MIN_CHARS (title slides and the like) aren't banked, and an upload
+or backfill pass banks at most QUIZ_BANK_MAX_BUILDS materials, longest
+first.
+
+A quiz request samples the bank: questions at the requested difficulty from
+the requested material, or from the materials that best match the topic,
+leaving out the ones the user has already attempted
+(user_quiz_attempts.question_id). Only when the bank can't fill the quiz is
+it generated live. The miss also queues the course's unbanked materials, so
+materials ingested before the bank existed (or by another worker process)
+are picked up too.
+
+The sample joins course_materials, so questions of a deleted material are
+never served; the builder deletes their rows afterwards.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from ConnectionPool import pooled_connection
+from Modules.ChatGPT import QUIZ_MODEL, build_quiz_prompt, parse_quiz_response
+from Modules.Cortex import complete
+from Modules.MaterialEvents import on_materials_changed
+from Modules.Quizzes import OPTION_LETTERS, insertQuizWithQuestions, quiz_question_row
+from Modules.SearchIndex import search_materials
+
+QUIZ_BANK_ENABLED = os.environ.get("EDWIN_QUIZ_BANK", "1") != "0"
+QUIZ_BANK_DIFFICULTIES = ("Beginner", "Intermediate", "Advanced")
+QUIZ_BANK_QUESTIONS = int(os.environ.get("EDWIN_QUIZ_BANK_QUESTIONS", "10"))  # per material and difficulty
+QUIZ_BANK_MIN_CHARS = 500        # shorter materials (title slides) aren't banked
+QUIZ_BANK_MAX_BUILDS = 10        # materials banked per upload or backfill pass, longest first
+TOPIC_MATERIALS = 3              # best-matching materials a topic quiz is sampled from
+BACKFILL_INTERVAL = 600          # seconds between checks of one course for unbanked materials
+GENERAL_TOPICS = {"", "general course review"}   # topics that sample the whole course
+
+
+def bank_difficulty(difficulty):
+    """The bank's spelling of a difficulty, or None if the bank doesn't keep it."""
+    for name in QUIZ_BANK_DIFFICULTIES:
+        if str(difficulty or "").strip().lower() == name.lower():
+            return name
+    return None
+
+
+class QuizBank:
+    """Samples banked questions for quiz requests; builds the bank in a background thread."""
+
+    def __init__(self, questions=QUIZ_BANK_QUESTIONS, backfill_interval=BACKFILL_INTERVAL):
+        self.questions = questions
+        self.backfill_interval = backfill_interval
+
+        self._cond = threading.Condition()
+        self._builds = OrderedDict()   # (course key, material_id) -> courseID, oldest first
+        self._backfills = {}           # course key -> courseID, waiting for an unbanked-material check
+        self._uploads = {}             # course key -> (courseID, material_ids) added, waiting to be picked from
+        self._prunes = {}              # course key -> courseID, waiting for deleted materials' rows to go
+        self._checked = {}             # course key -> monotonic time of its last backfill request
+        self._thread = None
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "questions_served": 0,
+            "quizzes_built": 0,
+            "questions_stored": 0,
+            "build_failures": 0,
+            "skipped_short": 0,
+            "quizzes_pruned": 0,
+        }
+
+    # -------------------------------
+    # Request path
+    # -------------------------------
+    def sample(self, courseID, user_id, topic, difficulty, count, connection, material_id=None):
+        """
+        A quiz of `count` banked questions the user hasn't attempted.
+        Returns (success, message, quiz_data); success is False on a miss.
+        """
+        difficulty = bank_difficulty(difficulty)
+        try:
+            count = int(count)
+        except (TypeError, ValueError):
+            count = 0
+        if difficulty is None or count <= 0:
+            return False, "Quiz bank doesn't cover this request", None
+
+        if material_id:
+            material_ids = [int(material_id) if str(material_id).isdigit() else material_id]
+        elif str(topic or "").strip().lower() in GENERAL_TOPICS:
+            material_ids = None
+        else:
+            material_ids = search_materials(courseID, topic, connection, TOPIC_MATERIALS)
+            if not material_ids:
+                self._miss(courseID)
+                return False, "No banked material matches the topic", None
+
+        where, params = "", [courseID, difficulty]
+        if material_ids is not None:
+            where += f" AND z.material_id IN ({', '.join(['%s'] * len(material_ids))})"
+            params += material_ids
+        if user_id:
+            where += """ AND q.question_id NOT IN (
+                SELECT question_id FROM user_quiz_attempts WHERE user_id = %s AND question_id IS NOT NULL
+            )"""
+            params.append(user_id)
+
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT q.question_id, q.question_text, q.option_a, q.option_b, q.option_c, q.option_d,
+                       q.correct_option, q.explanation
+                FROM quiz_questions q
+                JOIN quizzes z ON z.quiz_id = q.quiz_id
+                JOIN course_materials m ON m.material_id = z.material_id AND m.course_id = z.course_id
+                WHERE z.course_id = %s AND z.difficulty = %s{where}
+                ORDER BY RANDOM()
+                LIMIT %s
+            """, params + [count])
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        if len(rows) < count:
+            self._miss(courseID, material_ids if material_id else ())
+            return False, f"Quiz bank has {len(rows)} of {count} unattempted question(s)", None
+
+        with self._cond:
+            self._stats["hits"] += 1
+            self._stats["questions_served"] += count
+        title = topic or "General Course Review"
+        quiz_data = {
+            "title": title,
+            "description": f"{difficulty} practice questions on {title}",
+            "source": "bank",
+            "questions": [
+                {
+                    "questionId": row[0],
+                    "question": row[1],
+                    "options": list(row[2:6]),
+                    "correct": OPTION_LETTERS.index(row[6]),
+                    "explanation": row[7] or "",
+                }
+                for row in rows
+            ],
+        }
+        return True, "Quiz served from the question bank", quiz_data
+
+    def _miss(self, courseID, material_ids=()):
+        """Count a miss and queue what would have filled it."""
+        with self._cond:
+            self._stats["misses"] += 1
+        for material_id in material_ids:
+            self.request_build(courseID, material_id)
+        self.request_backfill(courseID)
+
+    # -------------------------------
+    # Background builder
+    # -------------------------------
+    def request_build(self, courseID, material_id):
+        """Ask the background thread to bank questions for one material."""
+        if not QUIZ_BANK_ENABLED:
+            return
+        self._ensure_thread()
+        with self._cond:
+            self._builds.setdefault((str(courseID), material_id), courseID)
+            self._cond.notify()
+
+    def request_backfill(self, courseID):
+        """Ask the background thread to queue the course's unbanked materials (at most once per interval)."""
+        if not QUIZ_BANK_ENABLED:
+            return
+        key, now = str(courseID), time.monotonic()
+        with self._cond:
+            checked = self._checked.get(key)
+            if checked is not None and now - checked < self.backfill_interval:
+                return
+            self._checked[key] = now
+        self._ensure_thread()
+        with self._cond:
+            self._backfills[key] = courseID
+            self._cond.notify()
+
+    def materials_changed(self, courseID, added=(), removed=(), cleared=False):
+        if not QUIZ_BANK_ENABLED or not (added or removed or cleared):
+            return
+        self._ensure_thread()
+        with self._cond:
+            if added:
+                # Picked from in the background, where their lengths can be read
+                _, pending = self._uploads.get(str(courseID), (courseID, ()))
+                self._uploads[str(courseID)] = (courseID, tuple(pending) + tuple(added))
+            if removed or cleared:
+                self._prunes[str(courseID)] = courseID
+            self._cond.notify()
+
+    def build(self, courseID, material_id, connection):
+        """Bank questions for every difficulty the material doesn't have yet. Returns how many were stored."""
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                "SELECT title, LENGTH(content) FROM course_materials WHERE material_id = %s AND course_id = %s",
+                (material_id, courseID)
+            )
+            material = cursor.fetchone()
+            if not material:
+                return 0    # deleted since it was queued
+            if (material[1] or 0) < QUIZ_BANK_MIN_CHARS:
+                self._count("skipped_short")
+                return 0
+            cursor.execute("""
+                SELECT DISTINCT difficulty FROM quizzes
+                WHERE course_id = %s AND material_id = %s AND difficulty IS NOT NULL
+            """, (courseID, material_id))
+            banked = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+        title, stored = material[0] or f"Material {material_id}", 0
+        for difficulty in QUIZ_BANK_DIFFICULTIES:
+            if difficulty in banked:
+                continue
+            status, message, prompt = build_quiz_prompt(courseID, title, difficulty, self.questions, connection,
+                                                        material_id, QUIZ_MODEL)
+            if status:
+                status, message, quiz_data = parse_quiz_response(
+                    complete(QUIZ_MODEL, prompt, connection, endpoint="quiz")
+                )
+            rows = [quiz_question_row(q) for q in (quiz_data.get("questions") or [])] if status else []
+            rows = [row for row in rows if row is not None]
+            if not rows:
+                self._count("build_failures")
+                print(f"WARNING: Quiz bank: no {difficulty} questions for material {material_id}: {message}")
+                continue
+
+            # One transaction, so a failed questions insert doesn't leave the difficulty looking banked
+            status, message, _, _ = insertQuizWithQuestions(courseID, title[:255], material_id, rows, connection,
+                                                            difficulty)
+            if not status:
+                raise RuntimeError(message)
+            with self._cond:
+                self._stats["quizzes_built"] += 1
+                self._stats["questions_stored"] += len(rows)
+            stored += len(rows)
+        return stored
+
+    def backfill(self, courseID, connection, material_ids=None):
+        """
+        Queue up to QUIZ_BANK_MAX_BUILDS of the course's materials (or of `material_ids`)
+        that are long enough and are missing any of QUIZ_BANK_DIFFICULTIES, longest first.
+        """
+        levels = ", ".join(["%s"] * len(QUIZ_BANK_DIFFICULTIES))
+        where = ""
+        params = [courseID, QUIZ_BANK_MIN_CHARS, courseID, *QUIZ_BANK_DIFFICULTIES, len(QUIZ_BANK_DIFFICULTIES)]
+        if material_ids:
+            where = f" AND material_id IN ({', '.join(['%s'] * len(material_ids))})"
+            params += list(material_ids)
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT material_id FROM course_materials
+                WHERE course_id = %s AND LENGTH(content) >= %s AND material_id NOT IN (
+                    SELECT material_id FROM quizzes
+                    WHERE course_id = %s AND difficulty IN ({levels}) AND material_id IS NOT NULL
+                    GROUP BY material_id
+                    HAVING COUNT(DISTINCT difficulty) >= %s
+                ){where}
+                ORDER BY LENGTH(content) DESC
+                LIMIT %s
+            """, params + [QUIZ_BANK_MAX_BUILDS])
+            material_ids = [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        for material_id in material_ids:
+            self.request_build(courseID, material_id)
+
+    def upload(self, courseID, material_ids, connection):
+        """Queue the longest of the materials an upload added (see backfill())."""
+        self.backfill(courseID, connection, material_ids)
+
+    def prune(self, courseID, connection):
+        """Delete the banked quizzes of materials that no longer exist (Snowflake doesn't enforce the FKs)."""
+        orphaned = """
+            SELECT quiz_id FROM quizzes
+            WHERE course_id = %s AND difficulty IS NOT NULL
+              AND material_id NOT IN (SELECT material_id FROM course_materials WHERE course_id = %s)
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"DELETE FROM quiz_questions WHERE quiz_id IN ({orphaned})", (courseID, courseID))
+            cursor.execute(f"DELETE FROM quizzes WHERE quiz_id IN ({orphaned})", (courseID, courseID))
+            pruned = cursor.rowcount
+            connection.commit()
+        finally:
+            cursor.close()
+        with self._cond:
+            self._stats["quizzes_pruned"] += max(pruned or 0, 0)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="edwin-quiz-bank", daemon=True)
+                self._thread.start()
+
+    def _next_job(self):
+        """Prunes, uploads and backfills first (they're quick), then one material build at a time."""
+        with self._cond:
+            while not (self._prunes or self._uploads or self._backfills or self._builds):
+                self._cond.wait()
+            if self._prunes:
+                return self.prune, self._prunes.pop(next(iter(self._prunes))), ()
+            if self._uploads:
+                courseID, material_ids = self._uploads.pop(next(iter(self._uploads)))
+                return self.upload, courseID, (material_ids,)
+            if self._backfills:
+                return self.backfill, self._backfills.pop(next(iter(self._backfills))), ()
+            (_, material_id), courseID = self._builds.popitem(last=False)
+            return self.build, courseID, (material_id,)
+
+    def _run(self):
+        while True:
+            job, courseID, args = self._next_job()
+            try:
+                with pooled_connection() as connection:
+                    if connection is None:
+                        raise RuntimeError("no database connection")
+                    stored = job(courseID, *args, connection)
+                if stored:
+                    print(f"Quiz bank: stored {stored} question(s) for material {args[0]} of course {courseID}")
+            except Exception as e:
+                self._count("build_failures")
+                print(f"ERROR: Quiz bank {job.__name__} for course {courseID} failed: {e}")
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "enabled": QUIZ_BANK_ENABLED,
+                "pending_builds": len(self._builds),
+                "pending_backfills": len(self._backfills) + len(self._uploads),
+            })
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+# -------------------------------
+# Shared bank
+# -------------------------------
+_bank = QuizBank()
+
+
+@on_materials_changed
+def _update_bank(course_id, added=(), removed=(), cleared=False):
+    _bank.materials_changed(course_id, added, removed, cleared)
+
+
+def sample_quiz(courseID, user_id, topic, difficulty, count, connection, material_id=None):
+    """(success, message, quiz_data) from the question bank; success is False on a miss."""
+    return _bank.sample(courseID, user_id, topic, difficulty, count, connection, material_id)
+
+
+def quiz_bank_metrics():
+    return _bank.metrics()
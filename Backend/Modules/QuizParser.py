@@ -0,0 +1,190 @@
+"""
+Incremental, tolerant parsing of generated quiz JSON.
+
+Quiz completions used to be parsed by cutting the text from the first "{"
+to the last "}" and calling json.loads on it, so one malformed question
+(or a completion cut off at the output limit) lost the whole quiz, and
+nothing could be shown before the completion had finished. QuizParser
+reads the completion as it arrives (feed()) and returns each question as
+soon as its closing brace does. Each question is parsed on its own, so a
+malformed one is reported by its position (failed) and the rest are kept.
+Questions are the objects of the array in the top-level object (or of a
+top-level array). On the way it repairs what models commonly get wrong:
+  - text before and after the JSON
+  - trailing commas before "}" or "]"
+  - smart quotes used as string delimiters (a string closes on the kind of
+    quote that opened it, so smart quotes inside a "..." string stay text),
+    raw newlines inside strings
+  - "correct" given as "B" or "1" instead of 1
+  - a tail cut off mid-question: finish() closes it and keeps it if it's
+    still a complete question
+"""
+import json
+import re
+
+from Modules.Quizzes import OPTION_LETTERS, quiz_question_row
+
+_QUOTE_CLOSERS = {'"': '"', "“": "”", "”": "”"}   # opening quote -> the quote that closes its string
+_CLOSERS = {"{": "}", "[": "]"}
+_DANGLING_KEY_RE = re.compile(r',?\s*"(?:[^"\\]|\\.)*"\s*:?\s*$')   # a key whose value never arrived
+_LAST_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"$')
+_FIELD_RES = {field: re.compile(rf'"{field}"\s*:\s*"((?:[^"\\]|\\.)*)"') for field in ("title", "description")}
+
+
+def normalize_question(question):
+    """`question` with "correct" as an option index when it came as a letter or a numeric string."""
+    if not isinstance(question, dict):
+        return question
+    correct = question.get("correct")
+    if isinstance(correct, str):
+        text = correct.strip().rstrip(").").upper()
+        if text.isdigit():
+            question["correct"] = int(text)
+        elif len(text) == 1 and text in OPTION_LETTERS:
+            question["correct"] = OPTION_LETTERS.index(text)
+    return question
+
+
+class QuizParser:
+    """Feed a quiz completion in pieces; each feed() returns the questions completed by that piece."""
+
+    def __init__(self):
+        self.questions = []     # valid questions, in order
+        self.failed = []        # [{"index", "error"}] for questions that didn't parse or validate
+        self._buf = []          # the JSON seen so far, normalized
+        self._stack = []        # open "{" / "["
+        self._started = self._done = False
+        self._in_string = self._escape = False
+        self._quote = None             # the quote that closes the open string
+        self._question_start = None    # index in _buf of the open question's "{"
+        self._question_depth = None    # stack depth the open question closes back to
+        self._seen = 0                 # question objects opened so far
+
+    def feed(self, text):
+        """Consume more of the completion. Returns the questions it completed."""
+        completed = []
+        for ch in text or "":
+            if self._done:
+                break
+            if not self._started:
+                if ch not in _CLOSERS:
+                    continue    # text before the JSON
+                self._started = True
+            if self._in_string:
+                self._string_char(ch)
+                continue
+            if ch in _QUOTE_CLOSERS:
+                self._in_string, self._quote = True, _QUOTE_CLOSERS[ch]
+                self._buf.append('"')
+            elif ch in _CLOSERS:
+                if ch == "{" and self._opens_question():
+                    self._question_start, self._question_depth = len(self._buf), len(self._stack)
+                    self._seen += 1
+                self._stack.append(ch)
+                self._buf.append(ch)
+            elif ch in "}]":
+                self._drop_trailing_comma()
+                self._buf.append(ch)
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._question_start is not None and len(self._stack) == self._question_depth:
+                    question = self._close_question("".join(self._buf[self._question_start:]))
+                    if question is not None:
+                        completed.append(question)
+                self._done = not self._stack
+            else:
+                self._buf.append(ch)
+        return completed
+
+    def finish(self):
+        """
+        End of the completion: a question cut off mid-way is closed and kept if it's complete enough.
+        Returns quiz_data ({title, description, questions}), or None if no JSON was found.
+        """
+        if not self._started:
+            return None
+        if self._question_start is not None and not self._done:
+            self._close_question(self._repaired_tail(), truncated=True)
+        text = "".join(self._buf)
+        quiz_data = {}
+        for field, pattern in _FIELD_RES.items():
+            match = pattern.search(text)
+            if match:
+                try:
+                    quiz_data[field] = json.loads(f'"{match.group(1)}"', strict=False)
+                except ValueError:
+                    quiz_data[field] = match.group(1)
+        quiz_data["questions"] = list(self.questions)
+        return quiz_data
+
+    # -------------------------------
+    # Scanning
+    # -------------------------------
+    def _string_char(self, ch):
+        if self._escape:
+            self._escape = False
+            self._buf.append(ch)
+        elif ch == "\\":
+            self._escape = True
+            self._buf.append(ch)
+        elif ch == self._quote:
+            self._in_string = False
+            self._buf.append('"')
+        elif ch == '"':
+            self._buf.append('\\"')    # a plain quote inside a smart-quoted string is text
+        elif ch == "\n":
+            self._buf.append("\\n")
+        else:
+            self._buf.append(ch)
+
+    def _opens_question(self):
+        """An object opened here is a question: it sits in the top-level array, or the top-level object's array."""
+        if self._question_start is not None or not self._stack or self._stack[-1] != "[":
+            return False
+        return len(self._stack) == 1 or (len(self._stack) == 2 and self._stack[0] == "{")
+
+    def _drop_trailing_comma(self):
+        i = len(self._buf) - 1
+        while i >= 0 and self._buf[i].isspace():
+            i -= 1
+        if i >= 0 and self._buf[i] == ",":
+            del self._buf[i]
+
+    def _repaired_tail(self):
+        """The open question's text, closed: open string ended, unfinished member dropped, containers closed."""
+        text = "".join(self._buf[self._question_start:])
+        if self._in_string:
+            text += '"'
+        text = text.rstrip().rstrip(",").rstrip()
+        if self._stack[-1] == "{":
+            if text.endswith(":"):
+                text = _DANGLING_KEY_RE.sub("", text)
+            else:
+                last = _LAST_STRING_RE.search(text)
+                # A string after "{" or "," is a key whose value never arrived
+                if last and text[:last.start()].rstrip().endswith(("{", ",")):
+                    text = _DANGLING_KEY_RE.sub("", text)
+        text = text.rstrip().rstrip(",")
+        return text + "".join(_CLOSERS[opener] for opener in reversed(self._stack[self._question_depth:]))
+
+    def _close_question(self, text, truncated=False):
+        """Parse and validate one question's text; returns it, or records the failure and returns None."""
+        index = self._seen - 1
+        self._question_start = self._question_depth = None
+        try:
+            question = normalize_question(json.loads(text, strict=False))
+        except ValueError as e:
+            self.failed.append({"index": index, "error": "truncated" if truncated else f"invalid JSON: {e}"})
+            return None
+        if quiz_question_row(question) is None:
+            self.failed.append({"index": index, "error": "truncated" if truncated else "malformed question"})
+            return None
+        self.questions.append(question)
+        return question
+
+
+def parse_quiz(response):
+    """Parse a whole quiz completion. Returns: (quiz_data or None, failed)"""
+    parser = QuizParser()
+    parser.feed(response)
+    return parser.finish(), parser.failed
@@ -0,0 +1,294 @@
+"""
+Progressive quiz delivery.
+
+/api/generateQuiz answers once the whole quiz exists, so a live-generated
+quiz kept the student on a spinner for the full completion. A quiz session
+is started with POST /api/quizSession, which returns its id at once while a
+worker thread fills the quiz in:
+  - from the question bank (Modules/QuizBank.py), all at once, when it has
+    enough questions
+  - otherwise from a streamed completion, each question added as soon as
+    QuizParser sees it close. Questions that failed to parse are asked for
+    again once the stream ends.
+The client fetches the questions it doesn't have yet: by long-poll
+(GET /api/quizSession/<id>?after=N&wait=S), or as server-sent events
+(GET /api/quizSession/<id>/stream), so it can show question 1 while the
+rest are still being generated. Flask threads wait on a condition; the
+async server's pollers wait on futures that the generating thread resolves
+through their event loop (wait_async()), so a long-poll holds no thread.
+
+Sessions live in the memory of the process that started them, so a server
+with several worker processes needs sticky routing for the polls. Finished
+sessions are dropped after QUIZ_SESSION_TTL, and the oldest ones go first
+once QUIZ_SESSION_MAX are held. Sessions still generating can't be dropped,
+so while QUIZ_SESSION_ACTIVE_MAX of them are held (running or queued for a
+worker) a new one is refused and the client is told to retry.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from ConnectionPool import pooled_connection, DatabaseUnavailable
+from Modules.ChatGPT import QUIZ_MODEL, build_quiz_prompt, parse_quiz_questions
+from Modules.Cortex import complete_pooled, complete_stream
+from Modules.QuizBank import sample_quiz
+from Modules.QuizParser import QuizParser
+
+QUIZ_SESSION_WORKERS = 8      # sessions generated at once; later ones queue
+QUIZ_SESSION_TTL = 1800       # seconds a finished session stays fetchable
+QUIZ_SESSION_MAX = 1000       # sessions held at once
+QUIZ_SESSION_ACTIVE_MAX = 64  # sessions generating or queued at once; more are refused
+POLL_WAIT_MAX = 20            # longest long-poll wait (seconds)
+FINISHED = ("complete", "failed")
+
+
+class QuizSession:
+    __slots__ = ("id", "course_id", "user_id", "topic", "difficulty", "num_questions", "material_id",
+                 "title", "description", "source", "questions", "status", "message", "failed",
+                 "started", "first_at", "finished_at", "waiters")
+
+    def __init__(self, course_id, user_id, topic, difficulty, num_questions, material_id):
+        self.id = uuid.uuid4().hex
+        self.course_id = course_id
+        self.user_id = user_id
+        self.topic = topic
+        self.difficulty = difficulty
+        self.num_questions = int(num_questions)
+        self.material_id = material_id
+        self.title = topic
+        self.description = ""
+        self.source = None          # "bank" or "generated"
+        self.questions = []
+        self.status = "generating"
+        self.message = "Generating quiz"
+        self.failed = 0             # questions that failed to parse
+        self.started = time.monotonic()
+        self.first_at = None        # monotonic time of the first question
+        self.finished_at = None
+        self.waiters = []           # (loop, future) of async pollers
+
+    def snapshot(self, after=0):
+        """The session's state, with the questions from index `after` on."""
+        return {
+            "sessionId": self.id,
+            "status": self.status,
+            "message": self.message,
+            "title": self.title,
+            "description": self.description,
+            "source": self.source,
+            "questions": self.questions[after:],
+            "next": len(self.questions),
+            "total": self.num_questions,
+            "failed": self.failed,
+        }
+
+
+class QuizSessions:
+    """Quiz sessions of this process, and the threads that generate them."""
+
+    def __init__(self, workers=QUIZ_SESSION_WORKERS, ttl=QUIZ_SESSION_TTL, max_sessions=QUIZ_SESSION_MAX,
+                 max_active=QUIZ_SESSION_ACTIVE_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_active = max_active
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="edwin-quiz-session")
+        self._cond = threading.Condition()
+        self._sessions = {}     # id -> QuizSession, oldest first
+        self._stats = {"started": 0, "completed": 0, "failed": 0, "from_bank": 0, "questions": 0,
+                       "first_question_seconds": 0.0, "first_questions": 0, "complete_seconds": 0.0,
+                       "refused": 0}
+
+    def start(self, course_id, user_id, topic, difficulty, num_questions, material_id=None):
+        """Start generating a quiz. Returns the session id, or None if max_active sessions are generating."""
+        session = QuizSession(course_id, user_id, topic, difficulty, num_questions, material_id)
+        with self._cond:
+            self._prune()
+            if sum(1 for s in self._sessions.values() if s.status not in FINISHED) >= self.max_active:
+                self._stats["refused"] += 1
+                return None
+            self._sessions[session.id] = session
+            self._stats["started"] += 1
+        self._executor.submit(self._generate, session)
+        return session.id
+
+    def wait(self, session_id, after=0, timeout=0):
+        """
+        The session's snapshot once it has questions past `after` or is finished,
+        or after `timeout` seconds. None if there is no such session.
+        """
+        deadline = time.monotonic() + min(max(timeout, 0), POLL_WAIT_MAX)
+        with self._cond:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            while len(session.questions) <= after and session.status not in FINISHED:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return session.snapshot(after)
+
+    async def wait_async(self, session_id, after=0, timeout=0):
+        """wait() for the event loop: waits on a future that _add() / _finish() resolve."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(max(timeout, 0), POLL_WAIT_MAX)
+        while True:
+            with self._cond:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return None
+                remaining = deadline - loop.time()
+                if len(session.questions) > after or session.status in FINISHED or remaining <= 0:
+                    return session.snapshot(after)
+                waiter = loop.create_future()
+                session.waiters.append((loop, waiter))
+            try:
+                await asyncio.wait({waiter}, timeout=remaining)
+            finally:
+                with self._cond:
+                    if (loop, waiter) in session.waiters:
+                        session.waiters.remove((loop, waiter))
+
+    # -------------------------------
+    # Generation
+    # -------------------------------
+    def _generate(self, session):
+        try:
+            with pooled_connection() as connection:
+                if connection is None:
+                    raise DatabaseUnavailable("Database connection error")
+                status, message, quiz_data = sample_quiz(session.course_id, session.user_id, session.topic,
+                                                         session.difficulty, session.num_questions, connection,
+                                                         session.material_id)
+                if status:
+                    self._add(session, quiz_data["questions"], quiz_data, "bank")
+                    self._finish(session, "complete", message)
+                    return
+                status, message, prompt = build_quiz_prompt(session.course_id, session.topic, session.difficulty,
+                                                            session.num_questions, connection, session.material_id,
+                                                            QUIZ_MODEL)
+            if not status:
+                self._finish(session, "failed", message)
+                return
+
+            # The connection is back in the pool while the model runs
+            parser = QuizParser()
+            for piece in complete_stream(QUIZ_MODEL, prompt, endpoint="quiz"):
+                self._add(session, parser.feed(piece))
+            # finish() may still recover a question cut off at the end
+            streamed = len(parser.questions)
+            quiz_data = parser.finish()
+            self._add(session, parser.questions[streamed:], quiz_data)
+            with self._cond:
+                session.failed = len(parser.failed)
+            self._regenerate(session, len(parser.failed))
+        except Exception as e:
+            print(f"ERROR: Quiz session {session.id} failed: {e}")
+            self._finish(session, "failed", f"Error generating quiz: {str(e)}")
+            return
+
+        if session.questions:
+            self._finish(session, "complete", f"Generated {len(session.questions)} question(s)")
+        else:
+            self._finish(session, "failed", "Failed to generate quiz")
+
+    def _regenerate(self, session, failed):
+        """Ask again for the questions that failed to parse, as far as the quiz is still short."""
+        missing = min(failed, session.num_questions - len(session.questions))
+        if missing <= 0:
+            return
+        with pooled_connection() as connection:
+            if connection is None:
+                return
+            status, _, prompt = build_quiz_prompt(session.course_id, session.topic, session.difficulty, missing,
+                                                  connection, session.material_id, QUIZ_MODEL)
+        if status:
+            status, _, quiz_data, _ = parse_quiz_questions(complete_pooled(QUIZ_MODEL, prompt, endpoint="quiz"))
+        if status:
+            self._add(session, quiz_data["questions"][:missing])
+
+    def _add(self, session, questions, quiz_data=None, source="generated"):
+        """Append questions (up to the number asked for) and wake the session's pollers."""
+        with self._cond:
+            questions = list(questions or [])[:session.num_questions - len(session.questions)]
+            if quiz_data:
+                session.title = quiz_data.get("title") or session.title
+                session.description = quiz_data.get("description") or session.description
+            session.source = session.source or source
+            if not questions:
+                return
+            if session.first_at is None:
+                session.first_at = time.monotonic()
+                self._stats["first_question_seconds"] += session.first_at - session.started
+                self._stats["first_questions"] += 1
+            session.questions += questions
+            self._stats["questions"] += len(questions)
+            self._wake(session)
+
+    def _finish(self, session, status, message):
+        with self._cond:
+            session.status, session.message = status, message
+            session.finished_at = time.monotonic()
+            self._stats["completed" if status == "complete" else "failed"] += 1
+            self._stats["from_bank"] += session.source == "bank"
+            self._stats["complete_seconds"] += session.finished_at - session.started
+            self._wake(session)
+
+    def _wake(self, session):
+        """Wake the session's pollers, threads and coroutines (call with the condition held)."""
+        self._cond.notify_all()
+        for loop, waiter in session.waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                pass    # that event loop is closed
+        session.waiters.clear()
+
+    def _prune(self):
+        """Drop expired finished sessions, then the oldest finished ones while over the limit."""
+        now = time.monotonic()
+        finished = [s for s in self._sessions.values() if s.status in FINISHED]
+        for session in finished:
+            if now - session.finished_at > self.ttl or len(self._sessions) >= self.max_sessions:
+                del self._sessions[session.id]
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["active"] = sum(1 for s in self._sessions.values() if s.status not in FINISHED)
+            stats["held"] = len(self._sessions)
+        finished = stats["completed"] + stats["failed"]
+        first = stats.pop("first_questions")
+        stats["avg_first_question_seconds"] = round(stats.pop("first_question_seconds") / first, 2) if first else 0.0
+        stats["avg_complete_seconds"] = round(stats.pop("complete_seconds") / finished, 2) if finished else 0.0
+        return stats
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# -------------------------------
+# Shared instance
+# -------------------------------
+_sessions = QuizSessions()
+
+
+def start_quiz_session(course_id, user_id, topic, difficulty, num_questions, material_id=None):
+    return _sessions.start(course_id, user_id, topic, difficulty, num_questions, material_id)
+
+
+def quiz_session_snapshot(session_id, after=0, wait=0):
+    """The session's state and its questions from `after` on, waiting up to `wait` seconds for new ones."""
+    return _sessions.wait(session_id, after, wait)
+
+
+async def quiz_session_snapshot_async(session_id, after=0, wait=0):
+    return await _sessions.wait_async(session_id, after, wait)
+
+
+def quiz_session_metrics():
+    return _sessions.metrics()
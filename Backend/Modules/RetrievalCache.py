@@ -0,0 +1,168 @@
+"""
+In-process cache of retrieved material chunks.
+
+The search index (Modules/SearchIndex.py) ranks chunks in memory, but their
+text still had to come from the database on every question. This cache keeps
+the chunks that questions actually hit in an LRU bounded by memory
+(EDWIN_RETRIEVAL_CACHE_MB, default 64). A warm question needs no database
+read for retrieval.
+
+Chunk rows never change once written, so entries only have to go when their
+material is removed. Every code path that writes course materials
+(syncPageContent, uploadPDF, Canvas sync, deleteMaterial, deleteAllMaterials)
+reports it through Modules/MaterialEvents.py, and the listener below drops
+exactly the affected entries.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from Modules.MaterialEvents import on_materials_changed
+from Modules.SearchIndex import fetch_chunks
+
+RETRIEVAL_CACHE_BYTES = int(os.environ.get("EDWIN_RETRIEVAL_CACHE_MB", "64")) * 1024 * 1024
+ENTRY_OVERHEAD = 400    # object, tuple and dict slots per entry (approximate)
+
+
+class CachedChunk:
+    """One chunk with its material's title and source."""
+    __slots__ = ("chunk_id", "material_id", "title", "content", "source_url", "page_number", "char_start", "size")
+
+    def __init__(self, chunk_id, material_id, title, content, source_url, page_number, char_start):
+        self.chunk_id = chunk_id
+        self.material_id = material_id
+        self.title = title
+        self.content = content or ""
+        self.source_url = source_url
+        self.page_number = page_number
+        self.char_start = char_start or 0
+        self.size = (ENTRY_OVERHEAD + sys.getsizeof(self.content)
+                     + sys.getsizeof(title or "") + sys.getsizeof(source_url or ""))
+
+
+class RetrievalCache:
+    """LRU of CachedChunk entries bounded by their approximate size in bytes."""
+
+    def __init__(self, max_bytes=RETRIEVAL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # chunk_id -> CachedChunk, least recently used first
+        self._courses = {}              # course key -> {material_id: set of chunk_ids}
+        self._course_of = {}            # chunk_id -> course key
+        self.bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidated": 0}
+
+    def lookup(self, chunk_ids):
+        """({chunk_id: CachedChunk} for cached ids, [ids that must be fetched])"""
+        found, missing = {}, []
+        with self._lock:
+            for chunk_id in chunk_ids:
+                entry = self._entries.get(chunk_id)
+                if entry is None:
+                    missing.append(chunk_id)
+                else:
+                    self._entries.move_to_end(chunk_id)
+                    found[chunk_id] = entry
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(missing)
+        return found, missing
+
+    def store(self, courseID, rows):
+        """
+        Cache fetch_chunks()-style rows for a course.
+        Returns {chunk_id: CachedChunk} for the rows.
+        """
+        key = str(courseID)
+        entries = {row[0]: CachedChunk(*row) for row in rows}
+        with self._lock:
+            materials = self._courses.setdefault(key, {})
+            for chunk_id, entry in entries.items():
+                self._discard(chunk_id)
+                if entry.size > self.max_bytes:
+                    continue
+                self._entries[chunk_id] = entry
+                self._course_of[chunk_id] = key
+                materials.setdefault(entry.material_id, set()).add(chunk_id)
+                self.bytes += entry.size
+            while self.bytes > self.max_bytes and self._entries:
+                self._discard(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+        return entries
+
+    def invalidate(self, courseID, removed=(), cleared=False):
+        """Drop the entries of removed materials (or of the whole course)."""
+        key = str(courseID)
+        with self._lock:
+            materials = self._courses.get(key)
+            if not materials:
+                return
+            targets = list(materials) if cleared else [
+                int(m) if str(m).isdigit() else m for m in removed   # ids from request JSON may be strings
+            ]
+            for material_id in targets:
+                for chunk_id in list(materials.get(material_id, ())):
+                    self._discard(chunk_id)
+                    self._stats["invalidated"] += 1
+            if cleared:
+                self._courses.pop(key, None)
+
+    def _discard(self, chunk_id):
+        entry = self._entries.pop(chunk_id, None)
+        if entry is None:
+            return
+        self.bytes -= entry.size
+        materials = self._courses.get(self._course_of.pop(chunk_id, None))
+        if materials is not None:
+            siblings = materials.get(entry.material_id)
+            if siblings is not None:
+                siblings.discard(chunk_id)
+                if not siblings:
+                    del materials[entry.material_id]
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "courses": sum(1 for materials in self._courses.values() if materials),
+            })
+        return stats
+
+
+# -------------------------------
+# Shared cache
+# -------------------------------
+_cache = RetrievalCache()
+
+
+@on_materials_changed
+def _invalidate(course_id, removed=(), cleared=False, **_):
+    # Added materials only bring new chunk ids, which can't be cached yet
+    if removed or cleared:
+        _cache.invalidate(course_id, removed, cleared)
+
+
+def cached_chunks(chunk_ids):
+    """({chunk_id: CachedChunk} already cached, [chunk_ids not cached])"""
+    return _cache.lookup(chunk_ids)
+
+
+def cache_chunks(courseID, rows):
+    """Cache fetch_chunks()-style rows. Returns {chunk_id: CachedChunk}."""
+    return _cache.store(courseID, rows)
+
+
+def get_chunks(courseID, chunk_ids, connection):
+    """CachedChunk for each id (that still exists), in the given order; misses are fetched in one query."""
+    chunk_ids = list(chunk_ids)
+    found, missing = _cache.lookup(chunk_ids)
+    if missing:
+        found.update(_cache.store(courseID, fetch_chunks(connection, missing)))
+    return [found[chunk_id] for chunk_id in chunk_ids if chunk_id in found]
+
+
+def retrieval_cache_metrics():
+    return _cache.metrics()
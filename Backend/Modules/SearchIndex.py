@@ -0,0 +1,412 @@
+"""
+Per-course BM25 index over course material chunks.
+
+Retrieval used to score only the 10 newest materials, and only by substring
+checks against their first 500 characters. This index covers every material
+of a course: title and full content are tokenized (lowercased, stopwords
+removed, light suffix stemming) into an in-memory inverted index. A query only
+touches the postings of its own terms, so ranking takes milliseconds no
+matter how many materials a course has. Documents are the bounded chunks
+written at ingest time (course_material_chunks), so a hit points at a page
+or slide rather than at a whole PDF.
+
+The index for a course is built on first use and then kept current:
+  - ingest / delete notify it through Modules/MaterialEvents.py
+  - every INDEX_RECHECK_SECONDS it re-syncs its chunk ids with the table in a
+    background thread, which picks up writes made by other worker processes
+    without putting a database read on any question's path
+Only postings, lengths, term offsets (for snippets, Modules/Snippets.py) and
+one embedding vector per chunk are kept in memory. Content is fetched from
+the DB for the handful of chunks a query returns.
+
+Ranking is hybrid: BM25 catches exact course vocabulary, while cosine
+similarity of the chunk embeddings (Modules/Embeddings.py, Modules/VectorIndex.py)
+still finds chunks when the student words the question differently. The two
+scores are blended after scaling each to [0, 1] by the query's best score.
+"""
+import math
+import threading
+import time
+from collections import Counter
+
+from ConnectionPool import pooled_connection
+from Modules.Ingestion import backfill_chunks
+from Modules.MaterialEvents import on_materials_changed
+from Modules.Tokenizer import tokenize, term_spans
+from Modules.Snippets import TermPositions, scan_matches, snippet_window
+from Modules.Embeddings import get_embedder
+from Modules.VectorIndex import VectorIndex
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 3              # a title term counts as this many body occurrences
+INDEX_RECHECK_SECONDS = 60    # how often a loaded index re-syncs with course_material_chunks
+FETCH_BATCH = 200             # ids per IN (...) when loading rows
+KEYWORD_WEIGHT = 0.5          # share of the hybrid score from (scaled) BM25; the rest is cosine
+DENSE_CANDIDATES = 20         # nearest chunks by embedding considered per query
+DENSE_MIN_SCORE = 0.1         # cosine below this doesn't make a chunk relevant on its own
+CHUNKS_PER_MATERIAL = 4       # chunks ranked per material wanted by search_materials()
+
+
+class CourseIndex:
+    """Inverted index with BM25 scoring plus embedding vectors for one course's material chunks."""
+
+    def __init__(self, embedder=None):
+        self._lock = threading.RLock()
+        self.embedder = embedder or get_embedder()
+        self.vectors = VectorIndex(self.embedder.dim)
+        self.sync_lock = threading.Lock()   # one re-sync with the table at a time
+        self.postings = {}      # term -> {chunk_id: term frequency}
+        self.doc_terms = {}     # chunk_id -> Counter (needed to remove a document)
+        self.doc_len = {}       # chunk_id -> weighted length
+        self.materials = {}     # chunk_id -> material_id
+        self.chunks = {}        # material_id -> set of chunk_ids
+        self.positions = {}     # chunk_id -> char_start within its material
+        self.offsets = {}       # chunk_id -> TermPositions of its content
+        self.vocabulary = {}    # term -> id used by TermPositions
+        self.total_len = 0
+        self.checked_at = 0.0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, chunk_id, material_id, title, content, char_start=0):
+        self.add_many([(chunk_id, material_id, title, content, char_start)])
+
+    def add_many(self, rows):
+        """Index (chunk_id, material_id, title, content, char_start) rows; embeddings are computed in one batch."""
+        if not rows:
+            return
+        vectors = self.embedder.embed([f"{title}\n{content}" for _, _, title, content, _ in rows])
+        with self._lock:
+            for chunk_id, material_id, title, content, char_start in rows:
+                self._add_terms(chunk_id, material_id, title, content)
+                self.positions[chunk_id] = char_start or 0
+            self.vectors.add([row[0] for row in rows], vectors)
+
+    def _add_terms(self, chunk_id, material_id, title, content):
+        spans = term_spans(content)
+        terms = Counter(term for term, _, _ in spans)
+        for term in tokenize(title):
+            terms[term] += TITLE_WEIGHT
+        length = sum(terms.values())
+
+        if chunk_id in self.doc_len:
+            self.remove(chunk_id)
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        self.doc_terms[chunk_id] = terms
+        self.offsets[chunk_id] = TermPositions(spans, self.vocabulary)
+        self.doc_len[chunk_id] = length
+        self.materials[chunk_id] = material_id
+        self.chunks.setdefault(material_id, set()).add(chunk_id)
+        self.total_len += length
+
+    def remove(self, chunk_id):
+        with self._lock:
+            terms = self.doc_terms.pop(chunk_id, None)
+            if terms is None:
+                return
+            self.vectors.remove(chunk_id)
+            for term in terms:
+                docs = self.postings.get(term)
+                if docs is not None:
+                    docs.pop(chunk_id, None)
+                    if not docs:
+                        del self.postings[term]
+            self.total_len -= self.doc_len.pop(chunk_id, 0)
+            self.positions.pop(chunk_id, None)
+            self.offsets.pop(chunk_id, None)
+            material_id = self.materials.pop(chunk_id, None)
+            siblings = self.chunks.get(material_id)
+            if siblings is not None:
+                siblings.discard(chunk_id)
+                if not siblings:
+                    del self.chunks[material_id]
+
+    def remove_material(self, material_id):
+        """Drop every chunk of a material. Returns how many were removed."""
+        with self._lock:
+            chunk_ids = list(self.chunks.get(material_id, ()))
+            for chunk_id in chunk_ids:
+                self.remove(chunk_id)
+        return len(chunk_ids)
+
+    def leading_chunks(self, material_id, count):
+        """The first `count` chunk ids of a material, in document order."""
+        with self._lock:
+            chunk_ids = list(self.chunks.get(material_id, ()))
+            chunk_ids.sort(key=lambda chunk_id: self.positions.get(chunk_id, 0))
+        return chunk_ids[:count]
+
+    def document_order(self):
+        """Every chunk id, by material and in reading order within each."""
+        with self._lock:
+            return sorted(self.positions, key=lambda chunk_id: (self.materials.get(chunk_id) or 0,
+                                                                 self.positions[chunk_id]))
+
+    def matches(self, chunk_id, query):
+        """(start, end, term_id) of the query's terms in a chunk, in offset order (None if not indexed)."""
+        with self._lock:
+            positions = self.offsets.get(chunk_id)
+            if positions is None:
+                return None
+            term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        return positions.matches(term_ids)
+
+    def keyword_scores(self, query, allowed=None):
+        """{chunk_id: BM25 score} for every chunk sharing a term with the query."""
+        query_terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.doc_len)
+            if not n_docs or not query_terms:
+                return {}
+            avg_len = self.total_len / n_docs
+            scores = {}
+            for term in query_terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for chunk_id, tf in docs.items():
+                    if allowed is not None and chunk_id not in allowed:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[chunk_id] / avg_len)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, limit=3, material_id=None, mode="hybrid"):
+        """
+        Top `limit` (chunk_id, score) for a query string, best first; optionally within one material.
+        mode: "hybrid" (default), "keyword" (BM25 only) or "dense" (embeddings only).
+        """
+        with self._lock:
+            allowed = set(self.chunks.get(material_id, ())) if material_id is not None else None
+        if mode != "dense":
+            keyword = self.keyword_scores(query, allowed)
+            if mode == "keyword":
+                return sorted(keyword.items(), key=lambda item: item[1], reverse=True)[:limit]
+        else:
+            keyword = {}
+
+        query_vector = self.embedder.embed([query])[0]
+        dense = self.vectors.search(query_vector, max(limit, DENSE_CANDIDATES), candidates=allowed)[0]
+        dense = [(chunk_id, score) for chunk_id, score in dense if score >= DENSE_MIN_SCORE]
+        if mode == "dense":
+            return dense[:limit]
+
+        # Blend: each score scaled by this query's best score of its kind
+        strongest = sorted(keyword, key=keyword.get, reverse=True)[:max(limit, DENSE_CANDIDATES)]
+        candidates = set(strongest) | {chunk_id for chunk_id, _ in dense}
+        cosine = self.vectors.similarity(query_vector, candidates)
+        top_keyword = max(keyword.values(), default=0.0) or 1.0
+        top_cosine = max(max(cosine.values(), default=0.0), DENSE_MIN_SCORE)
+        scores = {
+            chunk_id: KEYWORD_WEIGHT * keyword.get(chunk_id, 0.0) / top_keyword
+                      + (1 - KEYWORD_WEIGHT) * max(cosine.get(chunk_id, 0.0), 0.0) / top_cosine
+            for chunk_id in candidates
+        }
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    def search_materials(self, query, limit=3):
+        """Top `limit` material ids for a query, ranked by their best chunk."""
+        ranked = self.search(query, limit * CHUNKS_PER_MATERIAL)
+        with self._lock:
+            material_ids = [self.materials.get(chunk_id) for chunk_id, _ in ranked]
+        return list(dict.fromkeys(m for m in material_ids if m is not None))[:limit]
+
+
+# -------------------------------
+# Per-course indexes
+# -------------------------------
+_indexes = {}                  # course key -> CourseIndex
+_guard = threading.Lock()
+_stats = {"builds": 0, "resyncs": 0, "documents_added": 0, "documents_removed": 0, "queries": 0}
+
+
+# Chunk rows with the fields of their material that citations need
+FETCH_CHUNKS_SQL = """
+    SELECT c.chunk_id, c.material_id, m.title, c.content, m.source_url, c.page_number, c.char_start
+    FROM course_material_chunks c
+    JOIN course_materials m ON m.material_id = c.material_id
+    WHERE c.{column} IN ({placeholders})
+"""
+
+
+def fetch_chunks(connection, ids, by_material=False):
+    """
+    (chunk_id, material_id, title, content, source_url, page_number, char_start) rows
+    for the given chunk ids (or for every chunk of the given material ids).
+    """
+    rows = []
+    ids = list(ids)
+    column = "material_id" if by_material else "chunk_id"
+    cursor = connection.cursor()
+    for i in range(0, len(ids), FETCH_BATCH):
+        batch = ids[i:i + FETCH_BATCH]
+        placeholders = ", ".join(["%s"] * len(batch))
+        cursor.execute(FETCH_CHUNKS_SQL.format(column=column, placeholders=placeholders), tuple(batch))
+        rows.extend(cursor.fetchall())
+    cursor.close()
+    return rows
+
+
+def _sync(index, courseID, connection):
+    """Bring an index in line with course_material_chunks (adds new ids, drops deleted ones)."""
+    if not index.checked_at:
+        # Materials stored before chunking existed are chunked on the course's first build
+        backfill_chunks(connection, courseID)
+
+    cursor = connection.cursor()
+    cursor.execute("SELECT chunk_id FROM course_material_chunks WHERE course_id = %s", (courseID,))
+    current = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+
+    with index._lock:
+        known = set(index.doc_len)
+    removed = known - current
+    added = current - known
+
+    for chunk_id in removed:
+        index.remove(chunk_id)
+    index.add_many([
+        (chunk_id, material_id, title or "", content or "", char_start)
+        for chunk_id, material_id, title, content, _, _, char_start in fetch_chunks(connection, added)
+    ])
+
+    index.checked_at = time.monotonic()
+    with _guard:
+        _stats["documents_added"] += len(added)
+        _stats["documents_removed"] += len(removed)
+
+
+def get_course_index(courseID, connection):
+    """The course's index, built on first use and re-synced every INDEX_RECHECK_SECONDS."""
+    key = str(courseID)
+    with _guard:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = CourseIndex()
+            _stats["builds"] += 1
+
+    if time.monotonic() - index.checked_at < INDEX_RECHECK_SECONDS:
+        return index
+
+    if not index.checked_at:
+        # Everyone waits for the first build
+        with index.sync_lock:
+            if not index.checked_at:
+                _sync(index, courseID, connection)
+    elif index.sync_lock.acquire(blocking=False):
+        # A periodic re-sync runs in the background while questions keep using the current index
+        threading.Thread(target=_background_sync, args=(index, courseID),
+                         name="edwin-index-sync", daemon=True).start()
+    return index
+
+
+def _background_sync(index, courseID):
+    """Re-sync an index on its own pooled connection. The caller holds index.sync_lock."""
+    try:
+        with pooled_connection() as connection:
+            if connection is None:
+                raise RuntimeError("no database connection")
+            _sync(index, courseID, connection)
+        with _guard:
+            _stats["resyncs"] += 1
+    except Exception as e:
+        print(f"ERROR: Search index re-sync for course {courseID} failed: {e}")
+    finally:
+        index.sync_lock.release()
+
+
+def leading_chunks(courseID, material_id, connection, count):
+    """The first `count` chunk ids of a material, in document order."""
+    return get_course_index(courseID, connection).leading_chunks(material_id, count)
+
+
+def course_chunks(courseID, connection):
+    """Every chunk id of a course, by material and in reading order within each."""
+    return get_course_index(courseID, connection).document_order()
+
+
+def search_chunks(courseID, question, connection, limit=3, material_id=None):
+    """
+    Top `limit` (chunk_id, score) for the question across all of a course's materials
+    (or within one material).
+    """
+    index = get_course_index(courseID, connection)
+    with _guard:
+        _stats["queries"] += 1
+    return index.search(question, limit, material_id)
+
+
+def search_materials(courseID, query, connection, limit=3):
+    """The ids of the `limit` materials of a course that best match the query, best first."""
+    index = get_course_index(courseID, connection)
+    with _guard:
+        _stats["queries"] += 1
+    return index.search_materials(query, limit)
+
+
+def passage(courseID, chunk, query, size=500):
+    """
+    (start, end, highlights) of the `size`-character window of a chunk (anything with
+    chunk_id and content) with the most distinct query terms, from the course's positional
+    index; highlights are the query-term spans relative to start.
+    """
+    with _guard:
+        index = _indexes.get(str(courseID))
+    matches = index.matches(chunk.chunk_id, query) if index is not None else None
+    if matches is None:
+        matches = scan_matches(chunk.content, query)
+    return snippet_window(chunk.content, matches, size)
+
+
+@on_materials_changed
+def _update_index(course_id, added=(), removed=(), cleared=False):
+    with _guard:
+        index = _indexes.get(str(course_id))
+    if index is None:
+        return  # not loaded in this process; built from the table on first query
+
+    if cleared:
+        with _guard:
+            _indexes.pop(str(course_id), None)
+        return
+    removed_chunks = 0
+    for material_id in removed:
+        # ids from request JSON may arrive as strings
+        removed_chunks += index.remove_material(int(material_id) if str(material_id).isdigit() else material_id)
+    added_chunks = 0
+    if added:
+        with pooled_connection() as connection:
+            if connection is None:
+                index.checked_at = 0.0  # couldn't fetch; re-sync on the next query
+                return
+            rows = [
+                (chunk_id, material_id, title or "", content or "", char_start)
+                for chunk_id, material_id, title, content, _, _, char_start
+                in fetch_chunks(connection, added, by_material=True)
+            ]
+            index.add_many(rows)
+            added_chunks = len(rows)
+    with _guard:
+        _stats["documents_added"] += added_chunks
+        _stats["documents_removed"] += removed_chunks
+
+
+def search_index_metrics():
+    with _guard:
+        stats = dict(_stats)
+        stats["courses"] = len(_indexes)
+        stats["documents"] = sum(len(index) for index in _indexes.values())
+        stats["materials"] = sum(len(index.chunks) for index in _indexes.values())
+        stats["terms"] = sum(len(index.postings) for index in _indexes.values())
+        stats["position_bytes"] = sum(
+            positions.nbytes for index in _indexes.values() for positions in list(index.offsets.values())
+        )
+        stats["vector_bytes"] = sum(index.vectors.nbytes for index in _indexes.values())
+        stats["ivf_courses"] = sum(index.vectors.centroids is not None for index in _indexes.values())
+        stats["embedder"] = get_embedder().name
+    return stats
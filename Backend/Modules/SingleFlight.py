@@ -0,0 +1,275 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+When an instructor posts an announcement, dozens of students open the same
+page within seconds, and each /api/explainPage started its own identical
+Cortex completion: the completion cache only helps once the first one has
+finished. Now the first caller for a key runs the work (the leader), and
+callers that arrive while it runs wait for its outcome instead. Threads wait
+on an event. A coroutine leader runs the work as a task, which callers on
+its loop await shielded, so cancelling the leader's request doesn't cancel
+the work the others wait for; coroutines on other loops await a future
+resolved on their own loop. Either way, every caller gets the work's result
+or its error.
+
+Keys are built by flight_key() from the endpoint and a hash of the
+whitespace-normalized input, so inputs that differ only in spacing share
+one flight.
+
+Worker processes don't share memory. With EDWIN_SINGLE_FLIGHT_DIR set (and
+fcntl available), a leader also takes an exclusive lock on a file named by
+the key in that directory. A leader in another process that finds the file
+locked waits for it, then checks the shared store before computing, so the
+answer it finds there is the other process's. For completions that store is
+the completion cache's disk tier (Modules/CompletionCache.py).
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:     # not on Windows: coalescing stays within each process
+    fcntl = None
+
+FLIGHT_WAIT_TIMEOUT = 300       # seconds a caller waits for another's result
+SINGLE_FLIGHT_DIR = os.environ.get("EDWIN_SINGLE_FLIGHT_DIR", "")   # lock files for cross-process coalescing
+LOCK_POLL_INTERVAL = 0.05       # seconds between tries of a lock held by another process
+
+
+def flight_key(endpoint, *parts):
+    """(endpoint, sha256 hex of the parts with runs of whitespace collapsed)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(" ".join(str(part or "").split()).encode("utf-8"))
+        digest.update(b"\0")
+    return endpoint, digest.hexdigest()
+
+
+class Flight:
+    __slots__ = ("event", "result", "error", "followers", "callbacks", "task")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self.callbacks = []     # (loop, future) of coroutines waiting for the outcome
+        self.task = None        # the work, when a coroutine leads
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _resolve(future, flight):
+    if future.done():
+        return
+    if flight.error is not None:
+        future.set_exception(flight.error)
+    else:
+        future.set_result(flight.result)
+
+
+class ProcessLock:
+    """Exclusive lock file for one key, shared by the worker processes on this host."""
+
+    def __init__(self, directory, key):
+        self.path = os.path.join(directory, f"{key[0]}-{key[1]}.lock")
+        self._file = None
+        self.held = False
+
+    def acquire(self, timeout=FLIGHT_WAIT_TIMEOUT):
+        """
+        Take the lock. Returns True if another process held it first (its result may be stored by now).
+        On timeout it returns without the lock (held stays False) and the caller computes anyway.
+        """
+        self._file = open(self.path, "a+")
+        waited = False
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.held = True
+                return waited
+            except OSError:
+                waited = True
+                if time.monotonic() > deadline:
+                    return waited
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def release(self):
+        if self._file is None:
+            return
+        if self.held:
+            try:
+                # Removed while held, so the directory doesn't keep a file per key. A process that
+                # opened the old file just finds the result stored, or computes it again.
+                os.remove(self.path)
+            except OSError:
+                pass
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self.held = False
+        self._file.close()
+        self._file = None
+
+
+class SingleFlight:
+    """In-flight calls by key: the first caller runs the work, later ones share its outcome."""
+
+    def __init__(self, wait_timeout=FLIGHT_WAIT_TIMEOUT, lock_dir=SINGLE_FLIGHT_DIR):
+        self.wait_timeout = wait_timeout
+        self.lock_dir = lock_dir if fcntl is not None else ""
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._flights = {}      # key -> Flight
+        self._stats = {"leaders": 0, "coalesced": 0, "shared_errors": 0, "process_waits": 0,
+                       "process_hits": 0}
+
+    def do(self, key, fn, recheck=None):
+        """
+        fn() once for all concurrent callers with this key. With cross-process locks on,
+        recheck() is tried first after waiting for another process; a non-None result is used.
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            if not flight.event.wait(self.wait_timeout):
+                raise TimeoutError(f"Timed out waiting for the in-flight {key[0]} call")
+            return flight.outcome()
+
+        try:
+            result = self._lead(key, fn, recheck)
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, result=result)
+        return result
+
+    async def do_async(self, key, coro_fn, recheck=None):
+        """do() for coroutines: `coro_fn()` is awaited, and no wait blocks the event loop."""
+        flight, leader = self._join(key)
+        loop = asyncio.get_running_loop()
+        if leader:
+            # A task, so a cancelled leader only stops waiting; the work goes on for the followers
+            task = loop.create_task(self._lead_async(key, coro_fn, recheck))
+            task.add_done_callback(lambda done: self._land_task(key, flight, done))
+            with self._lock:
+                flight.task = task
+            return await asyncio.shield(task)
+
+        with self._lock:
+            task = flight.task
+            if task is None or task.get_loop() is not loop:
+                task = None
+                future = loop.create_future()
+                if not flight.event.is_set():
+                    flight.callbacks.append((loop, future))
+        if flight.event.is_set():
+            return flight.outcome()
+        try:
+            return await asyncio.wait_for(asyncio.shield(task) if task is not None else future, self.wait_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Timed out waiting for the in-flight {key[0]} call")
+
+    # -------------------------------
+    # Leader side
+    # -------------------------------
+    def _lead(self, key, fn, recheck):
+        if not self.lock_dir:
+            return fn()
+        lock = ProcessLock(self.lock_dir, key)
+        try:
+            found = self._after_wait(lock.acquire(self.wait_timeout), recheck)
+            return found if found is not None else fn()
+        finally:
+            lock.release()
+
+    async def _lead_async(self, key, coro_fn, recheck):
+        if not self.lock_dir:
+            return await coro_fn()
+        loop = asyncio.get_running_loop()
+        lock = ProcessLock(self.lock_dir, key)
+        try:
+            waited = await loop.run_in_executor(None, lock.acquire, self.wait_timeout)
+            found = await loop.run_in_executor(None, self._after_wait, waited, recheck)
+            return found if found is not None else await coro_fn()
+        finally:
+            lock.release()
+
+    def _after_wait(self, waited, recheck):
+        """The other process's stored result, if this process had to wait for its lock."""
+        if not waited:
+            return None
+        with self._lock:
+            self._stats["process_waits"] += 1
+        found = recheck() if recheck is not None else None
+        if found is not None:
+            with self._lock:
+                self._stats["process_hits"] += 1
+        return found
+
+    # -------------------------------
+    # Bookkeeping
+    # -------------------------------
+    def _join(self, key):
+        """(flight, True if this caller leads it)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                self._stats["leaders"] += 1
+                return flight, True
+            flight.followers += 1
+            self._stats["coalesced"] += 1
+            return flight, False
+
+    def _land_task(self, key, flight, task):
+        if task.cancelled():
+            self._land(key, flight, error=RuntimeError(f"The in-flight {key[0]} call was cancelled"))
+        elif task.exception() is not None:
+            self._land(key, flight, error=task.exception())
+        else:
+            self._land(key, flight, result=task.result())
+
+    def _land(self, key, flight, result=None, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+            flight.result, flight.error = result, error
+            flight.event.set()
+            callbacks, flight.callbacks = flight.callbacks, []
+            if error is not None and flight.followers:
+                self._stats["shared_errors"] += 1
+        for loop, future in callbacks:
+            loop.call_soon_threadsafe(_resolve, future, flight)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+        stats["cross_process"] = bool(self.lock_dir)
+        calls = stats["leaders"] + stats["coalesced"]
+        stats["coalesced_rate"] = round(stats["coalesced"] / calls, 3) if calls else 0.0
+        return stats
+
+
+# -------------------------------
+# Shared instance
+# -------------------------------
+_flights = SingleFlight()
+
+
+def single_flight(key, fn, recheck=None):
+    """fn() once for concurrent callers with the same flight_key(); everyone gets its outcome."""
+    return _flights.do(key, fn, recheck)
+
+
+async def single_flight_async(key, coro_fn, recheck=None):
+    return await _flights.do_async(key, coro_fn, recheck)
+
+
+def single_flight_metrics():
+    return _flights.metrics()
@@ -0,0 +1,108 @@
+"""
+Positional term index and citation snippets.
+
+Snippets used to be found by running a regex over the whole chunk for every
+citation and comparing every match with every later one. Instead, when a
+chunk is indexed (Modules/SearchIndex.py, at ingest or on the course's first
+load), the offsets of its terms are kept as a TermPositions: compact arrays
+grouped by term. A snippet then only looks at the occurrences of the
+question's own terms: they are merged in offset order, and one sliding pass
+finds the window with the most distinct terms. That is O(matches), whatever
+the chunk's length. The matches inside the window are returned as highlight
+spans for the frontend.
+"""
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+
+from Modules.Tokenizer import term_spans, tokenize
+
+MAX_WORD_LENGTH = 65535     # occurrence lengths are stored as 16-bit
+
+
+class TermPositions:
+    """Offsets of one chunk's terms: term ids sorted, with the start and length of each occurrence."""
+    __slots__ = ("terms", "starts", "lengths")
+
+    def __init__(self, spans, vocabulary):
+        """`spans` from Tokenizer.term_spans(); `vocabulary` maps term -> id and is extended as needed."""
+        entries = sorted(
+            (vocabulary.setdefault(term, len(vocabulary)), start, min(end - start, MAX_WORD_LENGTH))
+            for term, start, end in spans
+        )
+        self.terms = array("I", [entry[0] for entry in entries])
+        self.starts = array("I", [entry[1] for entry in entries])
+        self.lengths = array("H", [entry[2] for entry in entries])
+
+    @property
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.terms, self.starts, self.lengths))
+
+    def matches(self, term_ids):
+        """(start, end, term_id) of every occurrence of the given terms, in offset order."""
+        runs = []
+        for term_id in term_ids:
+            lo = bisect_left(self.terms, term_id)
+            hi = bisect_right(self.terms, term_id, lo)
+            if lo < hi:
+                runs.append([(start, start + length, term_id)
+                             for start, length in zip(self.starts[lo:hi], self.lengths[lo:hi])])
+        if len(runs) == 1:
+            return runs[0]
+        return list(heapq.merge(*runs))
+
+
+def scan_matches(content, query):
+    """matches() without a positional index: one pass over the content."""
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    return [(start, end, term) for term, start, end in term_spans(content) if term in terms]
+
+
+def densest_window(matches, size):
+    """
+    (first, last) indexes into `matches` of the run that fits in `size` characters with the
+    most distinct terms (then the most occurrences). Two pointers, so O(len(matches)).
+    """
+    counts = {}
+    best, best_score = (0, 0), (0, 0)
+    left = 0
+    for right, (_, end, term) in enumerate(matches):
+        counts[term] = counts.get(term, 0) + 1
+        while end - matches[left][0] > size:
+            dropped = matches[left][2]
+            counts[dropped] -= 1
+            if not counts[dropped]:
+                del counts[dropped]
+            left += 1
+        score = (len(counts), right - left + 1)
+        if score > best_score:
+            best, best_score = (left, right), score
+    return best
+
+
+def snippet_window(content, matches, size):
+    """
+    (start, end, highlights) of the `size`-character window of `content` around its densest
+    run of query-term matches, where highlights are (start, end) spans relative to `start`.
+    Without matches the window is the start of the text.
+    """
+    if not content:
+        return 0, 0, []
+    if len(content) <= size:
+        start = 0
+    elif not matches:
+        return 0, size, []
+    else:
+        first, _ = densest_window(matches, size)
+        # Give the first match a little leading context, starting on a word boundary
+        anchor = matches[first][0]
+        start = max(0, min(anchor - size // 5, len(content) - size))
+        if start > 0:
+            space = content.find(" ", start, anchor)
+            if space != -1:
+                start = space + 1
+    end = min(len(content), start + size)
+    highlights = [(s - start, e - start) for s, e, _ in matches if s >= start and e <= end]
+    return start, end, highlights
@@ -0,0 +1,57 @@
+"""
+Tokenizer shared by the keyword (BM25) and dense retrieval indexes.
+"""
+import re
+
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had
+has have having he her here hers herself him himself his how i if in into is it its itself just
+me more most my myself no nor not now of off on once only or other our ours ourselves out over
+own same she should so some such than that the their theirs them themselves then there these they
+this those through to too under until up very was we were what when where which while who whom
+why will with would you your yours yourself yourselves
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SPAN_RE = re.compile(r"[A-Za-z0-9]+")   # same words, matched on the original text so offsets line up
+
+# Suffix stripping only, so every stem is a prefix of the words it came from
+_SUFFIXES = ("izations", "ization", "ations", "ation", "nesses", "ness", "ments", "ment",
+             "ings", "ing", "edly", "ies", "ied", "ers", "er", "ed", "ly", "es", "s", "e", "y")
+_MIN_STEM = 3
+
+
+def stem(word):
+    """Light suffix-stripping stemmer: 'routing', 'routers', 'routes' -> 'rout'."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            # 'class' -> 'class', not 'clas'
+            if suffix == "s" and word.endswith("ss"):
+                continue
+            return word[:-len(suffix)]
+    return word
+
+
+def words(text):
+    """Lowercased alphanumeric words of a text, in order."""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def _indexed(word):
+    return word not in STOP_WORDS and (len(word) > 1 or word.isdigit())
+
+
+def tokenize(text):
+    """Lowercase, split on non-alphanumerics, drop stopwords, stem. Returns a list of terms."""
+    return [stem(t) for t in words(text) if _indexed(t)]
+
+
+def term_spans(text):
+    """tokenize() with offsets: (term, start, end) for each indexed word of the text, in order."""
+    spans = []
+    for match in _SPAN_RE.finditer(text or ""):
+        word = match.group().lower()
+        if _indexed(word):
+            spans.append((stem(word), match.start(), match.end()))
+    return spans
@@ -0,0 +1,201 @@
+"""
+Dense-vector index for one course.
+
+Vectors live in one contiguous float32 matrix (rows are L2-normalised, so a
+dot product is a cosine similarity). Top-k search scores every row with one
+matrix multiply, for a whole batch of queries at once.
+
+Once a course has IVF_MIN_ROWS vectors, the index also trains an IVF
+partitioning: k-means splits the rows into about sqrt(n) lists, and a query
+only scores the rows of its IVF_NPROBE nearest lists. Removed rows are
+tombstoned and compacted away in bulk, so a delete never re-trains on the
+query path.
+"""
+import threading
+
+import numpy as np
+
+INITIAL_CAPACITY = 256
+IVF_MIN_ROWS = 20_000      # partition courses with at least this many vectors
+IVF_NPROBE = 8             # lists scored per query
+IVF_TRAIN_ITERS = 8
+IVF_TRAIN_SAMPLE = 64      # training rows per list
+COMPACT_RATIO = 0.25       # compact once this share of rows are tombstones
+SEARCH_BATCH = 4096        # rows scored per matrix multiply while assigning lists
+
+
+class VectorIndex:
+    """float32 matrix of chunk vectors with brute-force or IVF top-k search."""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self.matrix = np.zeros((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self.alive = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self.ids = []          # row -> chunk_id (None once removed)
+        self.rows = {}         # chunk_id -> row
+        self.centroids = None  # (nlist, dim) when partitioned
+        self.lists = None      # list id -> array of rows
+        self.trained_rows = 0
+        self.stats = {"ivf_trainings": 0, "compactions": 0}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    # -------------------------------
+    # Updates
+    # -------------------------------
+    def add(self, ids, vectors):
+        """Add (or replace) vectors for the given chunk ids."""
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for chunk_id in ids:
+                self._tombstone(chunk_id)
+
+            start = len(self.ids)
+            end = start + len(ids)
+            if end > len(self.matrix):
+                self._grow(end)
+            self.matrix[start:end] = vectors
+            self.alive[start:end] = True
+            for offset, chunk_id in enumerate(ids):
+                self.ids.append(chunk_id)
+                self.rows[chunk_id] = start + offset
+
+            if self.centroids is not None:
+                self._assign(np.arange(start, end))
+            self._maintain()
+
+    def remove(self, chunk_id):
+        with self._lock:
+            self._tombstone(chunk_id)
+            self._maintain()
+
+    def _tombstone(self, chunk_id):
+        row = self.rows.pop(chunk_id, None)
+        if row is not None:
+            self.alive[row] = False
+            self.ids[row] = None
+
+    def _grow(self, needed):
+        capacity = len(self.matrix)
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:len(self.ids)] = self.matrix[:len(self.ids)]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self.ids)] = self.alive[:len(self.ids)]
+        self.matrix, self.alive = matrix, alive
+
+    def _maintain(self):
+        """Compact when tombstones pile up; (re)train IVF when the index is large or has doubled."""
+        dead = len(self.ids) - len(self.rows)
+        if dead and dead >= COMPACT_RATIO * len(self.ids):
+            keep = np.flatnonzero(self.alive[:len(self.ids)])
+            self.matrix[:len(keep)] = self.matrix[keep]
+            self.alive[:] = False
+            self.alive[:len(keep)] = True
+            self.ids = [self.ids[row] for row in keep]
+            self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+            self.centroids = self.lists = None
+            self.stats["compactions"] += 1
+
+        if len(self.rows) < IVF_MIN_ROWS:
+            self.centroids = self.lists = None
+        elif self.centroids is None or len(self.ids) >= 2 * self.trained_rows:
+            self._train()
+
+    # -------------------------------
+    # IVF
+    # -------------------------------
+    def _train(self):
+        """Spherical k-means over a sample of the rows, then assign every row to a list."""
+        n = len(self.ids)
+        nlist = max(1, int(np.sqrt(len(self.rows))))
+        live = np.flatnonzero(self.alive[:n])
+        rng = np.random.default_rng(0)
+        sample = self.matrix[rng.choice(live, size=min(len(live), nlist * IVF_TRAIN_SAMPLE), replace=False)]
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(IVF_TRAIN_ITERS):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(nlist):
+                members = sample[nearest == list_id]
+                if len(members):
+                    centroids[list_id] = members.sum(axis=0)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids /= norms
+
+        self.centroids = centroids
+        self.lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._assign(live)
+        self.trained_rows = n
+        self.stats["ivf_trainings"] += 1
+
+    def _assign(self, rows):
+        """Append rows to their nearest list."""
+        for i in range(0, len(rows), SEARCH_BATCH):
+            batch = rows[i:i + SEARCH_BATCH]
+            nearest = np.argmax(self.matrix[batch] @ self.centroids.T, axis=1)
+            for list_id in np.unique(nearest):
+                self.lists[list_id] = np.concatenate([self.lists[list_id], batch[nearest == list_id]])
+
+    # -------------------------------
+    # Search
+    # -------------------------------
+    def search(self, queries, k=10, candidates=None):
+        """
+        Top `k` (chunk_id, score) per query vector, best first.
+        `candidates` restricts the search to those chunk ids (exact scoring).
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._lock:
+            if not self.rows:
+                return [[] for _ in queries]
+            if candidates is not None:
+                rows = np.array([self.rows[c] for c in candidates if c in self.rows], dtype=np.int64)
+                return [self._top(query, rows, k) for query in queries]
+            if self.centroids is None:
+                n = len(self.ids)
+                scores = queries @ self.matrix[:n].T        # one multiply for the whole batch
+                scores[:, ~self.alive[:n]] = -np.inf
+                k = min(k, len(self.rows))
+                rows = np.arange(n)
+                return [self._rank(rows, row_scores, k) for row_scores in scores]
+
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :IVF_NPROBE]
+            results = []
+            for query, lists in zip(queries, probes):
+                rows = np.concatenate([self.lists[list_id] for list_id in lists])
+                results.append(self._top(query, rows[self.alive[rows]], k))
+            return results
+
+    def similarity(self, query, chunk_ids):
+        """{chunk_id: cosine} for specific chunks."""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            known = [c for c in chunk_ids if c in self.rows]
+            if not known:
+                return {}
+            scores = self.matrix[[self.rows[c] for c in known]] @ query
+        return dict(zip(known, scores.tolist()))
+
+    def _top(self, query, rows, k):
+        if not len(rows):
+            return []
+        return self._rank(rows, self.matrix[rows] @ query, k)
+
+    def _rank(self, rows, scores, k):
+        if len(scores) > k:
+            best = np.argpartition(-scores, k)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        return [(self.ids[rows[i]], float(scores[i])) for i in best]
@@ -0,0 +1,261 @@
+"""
+ASGI entry point for the Edwin backend.
+
+    cd Backend
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The LLM-bound routes (chat, quiz, explain, assignment helper, exam) are served
+by async handlers from Modules/LLMEndpoints.py, and the chat and quiz
+session streams by async generators sent as they are produced. The quiz
+session long-poll waits on the event loop too. While Cortex is generating,
+those requests wait on the event loop, not in a worker thread. Every other
+route runs the existing Flask app in a thread pool. Routes and JSON contracts
+are the same as `python !database.py`.
+"""
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from ConnectionPool import get_pool
+from Modules.MessageLogger import flush_messages
+from Modules.LLMEndpoints import (
+    handle_send_message_async, handle_generate_quiz_async, handle_explain_page_async,
+    handle_assignment_helper_async, handle_generate_exam_async, handle_send_message_stream_async,
+    handle_quiz_session_async, handle_quiz_session_stream_async
+)
+
+# Threads for Flask routes and short DB steps; LLM waits don't occupy these
+EXECUTOR_THREADS = int(os.environ.get("EDWIN_ASGI_THREADS", "32"))
+
+# "!database.py" isn't an importable module name, so load it by path
+_spec = importlib.util.spec_from_file_location("edwin_flask_app", os.path.join(BACKEND_DIR, "!database.py"))
+flask_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(flask_module)
+flask_app = flask_module.app
+
+ASYNC_ROUTES = {
+    "/api/sendMessage": handle_send_message_async,
+    "/sendMessage": handle_send_message_async,          # deprecated alias
+    "/api/generateQuiz": handle_generate_quiz_async,
+    "/generateQuiz": handle_generate_quiz_async,        # deprecated alias
+    "/api/explainPage": handle_explain_page_async,
+    "/api/assignmentHelper": handle_assignment_helper_async,
+    "/api/generateExam": handle_generate_exam_async,
+}
+
+# Server-sent event routes: the handler returns (async events, None) or (None, (payload, status))
+STREAM_ROUTES = {
+    "/api/sendMessage/stream": handle_send_message_stream_async,
+}
+
+# GET /api/quizSession/<id> (long-poll) and /api/quizSession/<id>/stream
+QUIZ_SESSION_PATH = "/api/quizSession/"
+
+
+# -------------------------------
+# ASGI plumbing
+# -------------------------------
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, payload, status):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_events(receive, send, events):
+    """Send each event as it comes; stop (and close the generator) if the client disconnects."""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),     # don't let a reverse proxy buffer the stream
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        while True:
+            next_event = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait({next_event, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                await asyncio.wait({next_event})    # let the generator unwind before closing it
+                return
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                break
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        watcher.cancel()
+        await events.aclose()
+
+
+def _wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _call_flask(scope, body, send):
+    """Run the Flask app for one request in the thread pool, streaming its body back."""
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    result = await loop.run_in_executor(None, flask_app, _wsgi_environ(scope, body), start_response)
+    iterator = iter(result)
+    done = object()
+    try:
+        chunk = await loop.run_in_executor(None, next, iterator, done)
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        while chunk is not done:
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await loop.run_in_executor(None, next, iterator, done)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        close = getattr(result, "close", None)
+        if close:
+            await loop.run_in_executor(None, close)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            loop = asyncio.get_running_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=EXECUTOR_THREADS, thread_name_prefix="edwin-asgi"))
+            # Open min_size connections up front so the first requests don't pay the login
+            await loop.run_in_executor(None, get_pool().prefill)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.get_running_loop().run_in_executor(None, flush_messages)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _respond(scope, receive, send, call, streams=False):
+    """Await a handler and send its JSON, or its events if it streams and accepted the request."""
+    try:
+        result = await call
+    except Exception as e:
+        print(f"ERROR: {scope['path']} failed: {e}")
+        await _send_json(send, {"success": False, "message": f"Error: {str(e)}"}, 500)
+        return
+    if not streams:
+        await _send_json(send, *result)
+    elif result[1] is not None:
+        await _send_json(send, *result[1])
+    else:
+        await _send_events(receive, send, result[0])
+
+
+def _quiz_session_route(path):
+    """(handler, session_id, streams) for /api/quizSession/<id>[/stream], or None."""
+    if not path.startswith(QUIZ_SESSION_PATH):
+        return None
+    session_id, _, rest = path[len(QUIZ_SESSION_PATH):].partition("/")
+    if not session_id or rest not in ("", "stream"):
+        return None
+    if rest == "stream":
+        return handle_quiz_session_stream_async, session_id, True
+    return handle_quiz_session_async, session_id, False
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    body = await _read_body(receive)
+    route = _quiz_session_route(scope["path"]) if scope["method"] == "GET" else None
+    if route is not None:
+        handler, session_id, streams = route
+        args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        await _respond(scope, receive, send, handler(session_id, args), streams)
+        return
+
+    handler, streams = None, False
+    if scope["method"] == "POST":
+        handler, streams = ASYNC_ROUTES.get(scope["path"]), False
+        if handler is None:
+            handler, streams = STREAM_ROUTES.get(scope["path"]), True
+    if handler is None:
+        # Everything else (including CORS preflight for the async routes) goes to Flask
+        await _call_flask(scope, body, send)
+        return
+
+    try:
+        data = json.loads(body or b"null")
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        await _send_json(send, {"success": False, "message": "Request body must be a JSON object"}, 400)
+        return
+    await _respond(scope, receive, send, handler(data), streams)
@@ -0,0 +1,150 @@
+"""
+Retrieval benchmark: recall and latency of keyword (BM25), dense and hybrid ranking.
+
+Runs entirely in memory (no database, no network):
+
+    cd Backend
+    python benchmark_retrieval.py                 # default corpus
+    python benchmark_retrieval.py --chunks 40000  # large course, exercises the IVF partitioning
+
+A synthetic course is built from filler chunks plus one chunk per known fact.
+Each fact is asked four ways: with the document's own words, with different
+word forms, with typos, and as a single misspelled key term. Recall@k is the
+share of questions whose fact chunk is in the top k.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from Modules.SearchIndex import CourseIndex
+from Modules.VectorIndex import VectorIndex, IVF_MIN_ROWS
+
+FILLER_WORDS = """
+network packet router switch layer frame latency buffer queue protocol socket stream header
+checksum address port segment window congestion throughput bandwidth link host server client
+request response cache memory process thread schedule kernel disk file block page table index
+""".split()
+
+# (fact sentence, [same words, other word forms, typos, misspelled key term only])
+FACTS = [
+    ("Dijkstra's algorithm computes least-cost paths in link-state routing.",
+     ["which algorithm computes least-cost paths", "how are the cheapest routes computed by link state routers",
+      "dijkstras algoritm least cost path", "djikstra"]),
+    ("Subnetting divides an IP network into smaller subnets using a subnet mask.",
+     ["what does subnetting divide", "how do you subnet a network with masks", "subneting ip netwrok mask", "subneting"]),
+    ("TCP uses a three-way handshake of SYN, SYN-ACK and ACK to open a connection.",
+     ["tcp three-way handshake", "how does tcp establish connections with syn acks", "three way handshak tcp", "handshak"]),
+    ("Public-key encryption uses a key pair: the public key encrypts and the private key decrypts.",
+     ["public key encryption private key decrypts", "what is encrypting with public keys", "pubic key encription", "encription"]),
+    ("Deadlock requires mutual exclusion, hold and wait, no preemption and circular wait.",
+     ["conditions for deadlock circular wait", "what causes deadlocked processes", "deadlok conditions circuler wait", "deadlok"]),
+    ("Virtual memory maps virtual addresses to physical frames through page tables.",
+     ["virtual memory physical frames", "how are virtual addressing and physical memory mapped", "virtal memmory mapping", "virtal memmory"]),
+    ("A binary search tree keeps smaller keys in the left subtree and larger keys in the right.",
+     ["binary search tree left subtree smaller keys", "where do smaller keys go in binary trees", "binary serch tree left subtre", "subtre"]),
+    ("Quicksort picks a pivot and partitions the array around it, averaging O(n log n).",
+     ["quicksort pivot partitions", "how does quick sort partitioning work", "quiksort pivot partitoning", "quiksort"]),
+    ("Normalization to third normal form removes transitive dependencies between columns.",
+     ["third normal form transitive dependencies", "what does normalizing to 3nf remove", "normalisation third normal form", "normalisation"]),
+    ("Photosynthesis converts light energy into chemical energy stored in glucose.",
+     ["photosynthesis light energy glucose", "how do plants convert light into chemical energy", "photosynthisis glucose", "photosynthisis"]),
+    ("Inflation is a sustained increase in the general price level of goods and services.",
+     ["what is inflation price level", "why do general prices increase over time", "inflaton price levle", "inflaton"]),
+    ("Mitochondria produce most of the cell's ATP through oxidative phosphorylation.",
+     ["mitochondria atp oxidative phosphorylation", "which organelle produces energy for cells", "mitocondria atp", "mitocondria"]),
+]
+STYLES = ["same words", "other forms", "typos", "key typo"]
+
+
+def build_course(n_filler, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_filler):
+        rows.append((i, i // 20, f"Lecture {i // 20}", " ".join(rng.choice(FILLER_WORDS) for _ in range(150)), 0))
+    fact_ids = []
+    for j, (fact, _) in enumerate(FACTS):
+        chunk_id = n_filler + j
+        filler = " ".join(rng.choice(FILLER_WORDS) for _ in range(60))
+        rows.append((chunk_id, chunk_id, f"Notes {j}", f"{filler} {fact} {filler}", 0))
+        fact_ids.append(chunk_id)
+    index = CourseIndex()
+    started = time.perf_counter()
+    index.add_many(rows)
+    return index, fact_ids, time.perf_counter() - started
+
+
+def evaluate(index, fact_ids, k_values=(1, 3, 5)):
+    print(f"\n{'mode':<8} {'style':<12} " + " ".join(f"R@{k:<4}" for k in k_values) + "  p50 ms  p95 ms")
+    for mode in ("keyword", "dense", "hybrid"):
+        for s, style in enumerate(STYLES):
+            hits = {k: 0 for k in k_values}
+            latencies = []
+            for chunk_id, (_, questions) in zip(fact_ids, FACTS):
+                started = time.perf_counter()
+                ranked = [c for c, _ in index.search(questions[s], max(k_values), mode=mode)]
+                latencies.append((time.perf_counter() - started) * 1000)
+                for k in k_values:
+                    hits[k] += chunk_id in ranked[:k]
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            print(f"{mode:<8} {style:<12} " + " ".join(f"{hits[k] / len(FACTS):<6.2f}" for k in k_values)
+                  + f"  {statistics.median(latencies):6.2f}  {p95:6.2f}")
+
+
+def benchmark_vectors(rows, dim, queries=200, k=10, seed=3):
+    """Brute force vs IVF on random clustered vectors: recall@k of IVF against exact, and latency."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(64, dim)).astype(np.float32)
+    data = centers[rng.integers(0, 64, rows)] + 0.5 * rng.normal(size=(rows, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    q = data[rng.integers(0, rows, queries)] + 0.1 * rng.normal(size=(queries, dim)).astype(np.float32)
+
+    index = VectorIndex(dim)
+    started = time.perf_counter()
+    index.add(list(range(rows)), data)
+    build = time.perf_counter() - started
+
+    exact_index = VectorIndex(dim)
+    exact_index.add(list(range(rows)), data)
+    exact_index.centroids = exact_index.lists = None    # force brute force
+
+    started = time.perf_counter()
+    exact = exact_index.search(q, k)
+    batched = (time.perf_counter() - started) * 1000 / queries
+
+    started = time.perf_counter()
+    for query in q:
+        exact_index.search(query, k)
+    brute = (time.perf_counter() - started) * 1000 / queries
+
+    started = time.perf_counter()
+    approx = [index.search(query, k)[0] for query in q]
+    ivf = (time.perf_counter() - started) * 1000 / queries
+
+    recall = np.mean([len({c for c, _ in a} & {c for c, _ in e}) / k for a, e in zip(approx, exact)])
+    partitioned = index.centroids is not None
+    print(f"\nVectors: {rows} x {dim} float32 ({index.nbytes / 1e6:.1f} MB), built in {build:.2f}s, "
+          f"IVF {'on (' + str(len(index.lists)) + ' lists)' if partitioned else 'off (below ' + str(IVF_MIN_ROWS) + ' rows)'}")
+    print(f"  brute force: {brute:.3f} ms/query, batched: {batched:.3f} ms/query")
+    if partitioned:
+        print(f"  IVF:         {ivf:.3f} ms/query, recall@{k} vs exact: {recall:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000, help="filler chunks in the synthetic course")
+    parser.add_argument("--vectors", type=int, default=IVF_MIN_ROWS * 2, help="rows for the IVF benchmark")
+    args = parser.parse_args()
+
+    index, fact_ids, build = build_course(args.chunks)
+    print(f"Course: {len(index)} chunks indexed in {build:.2f}s "
+          f"({build * 1000 / len(index):.2f} ms/chunk including embedding)")
+    evaluate(index, fact_ids)
+    benchmark_vectors(args.vectors, index.embedder.dim)
+
+
+if __name__ == "__main__":
+    main()
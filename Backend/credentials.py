@@ -1,14 +1,29 @@
 # Python 3.14 compatibility fixes
 import python314_compat
 
+import os
+
 import snowflake.connector
 from snowflake.connector import errors as sf_errors
 
+# Storage backend: "snowflake" (default) or "local" (embedded SQLite, no warehouse needed)
+STORAGE_BACKEND = os.environ.get("EDWIN_STORAGE_BACKEND", "snowflake").lower()
+LOCAL_DB_PATH = os.environ.get(
+    "EDWIN_LOCAL_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "edwin_local.db")
+)
+
+
 def get_db_connection():
     """
-    Creates and returns a Snowflake connection for the Edwin backend.
+    Creates and returns a connection for the Edwin backend.
+    Uses Snowflake unless EDWIN_STORAGE_BACKEND=local is set.
     Update the password on your local machine.
     """
+    if STORAGE_BACKEND == "local":
+        import LocalStorage
+        return LocalStorage.connect(LOCAL_DB_PATH)
+
     try:
         connection = snowflake.connector.connect(
             user="jahangir",              # Your Snowflake username
@@ -29,4 +44,4 @@ def get_db_connection():
 if __name__ == "__main__":
     conn = get_db_connection()
     if conn:
-        print("✅ Connected to Snowflake successfully!")
+        print(f"✅ Connected to {STORAGE_BACKEND} storage successfully!")
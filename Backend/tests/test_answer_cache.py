@@ -0,0 +1,40 @@
+import pytest
+
+from Modules.AnswerCache import AnswerCache
+
+ANSWER = "The midterm is on October 29."
+
+
+def cache_with(question):
+    cache = AnswerCache(max_bytes=1024 * 1024, ttl=3600)
+    _, key = cache.lookup(1, "llama3-8b", question)
+    cache.store(key, question, ANSWER, [])
+    return cache
+
+
+@pytest.mark.parametrize("paraphrase", [
+    "When's the midterm exam?",
+    "When is the midterm exam",
+    "when is the midterm?",
+])
+def test_short_paraphrases_hit(paraphrase):
+    entry, _ = cache_with("when is the midterm").lookup(1, "llama3-8b", paraphrase)
+    assert entry is not None and entry.answer == ANSWER
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("when is the midterm", "where is the midterm"),
+    ("When is the midterm exam", "Where is the midterm exam"),
+    ("Is the midterm cancelled?", "Is the midterm not cancelled?"),
+    ("Is the midterm cancelled?", "Isn't the midterm cancelled?"),
+    ("Is there class on Monday?", "Is there no class on Monday?"),
+    ("When is the midterm exam", "When is the final exam"),
+])
+def test_different_questions_miss(stored, asked):
+    entry, _ = cache_with(stored).lookup(1, "llama3-8b", asked)
+    assert entry is None
+
+
+def test_other_course_misses():
+    entry, _ = cache_with("when is the midterm").lookup(2, "llama3-8b", "when is the midterm")
+    assert entry is None
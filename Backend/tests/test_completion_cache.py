@@ -0,0 +1,86 @@
+import pytest
+
+import Modules.CompletionCache as completion_cache
+from Modules.CompletionCache import CompletionCache, cache_enabled, completion_key
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(completion_cache.time, "time", clock)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs):
+    return CompletionCache(path=str(tmp_path / "completions.db"), **kwargs)
+
+
+def test_keys_depend_on_model_prompt_and_params():
+    key = completion_key("llama3-70b", "Explain TCP")
+    assert key == completion_key("llama3-70b", "Explain TCP", {})
+    assert key != completion_key("llama3-8b", "Explain TCP")
+    assert key != completion_key("llama3-70b", "Explain TCP", {"temperature": 0.2})
+    assert cache_enabled("chat") and not cache_enabled("quiz") and not cache_enabled(None)
+
+
+def test_memory_lru_is_bounded_by_bytes(tmp_path, clock):
+    probe = make_cache(tmp_path, max_bytes=10 ** 6)
+    probe._remember("probe", "x" * 1000, clock.now)
+    cache = CompletionCache(max_bytes=2 * probe.bytes, path="")
+    cache.put("a", "x" * 1000)
+    cache.put("b", "y" * 1000)
+    assert cache.get("a") == "x" * 1000     # b is now the least recently used
+    cache.put("c", "z" * 1000)
+    assert cache.get("b") is None and cache.get("a") and cache.get("c")
+    assert cache.metrics()["evictions"] == 1 and cache.bytes <= cache.max_bytes
+
+
+def test_disk_tier_is_shared_between_processes(tmp_path, clock):
+    make_cache(tmp_path).put("k", "cached answer", model="llama3-70b")
+    other = make_cache(tmp_path)
+    assert other.get("k", "chat") == "cached answer"
+    assert other.get("k", "chat") == "cached answer"
+    metrics = other.metrics()
+    assert metrics["disk_hits"] == 1 and metrics["memory_hits"] == 1
+
+
+def test_expired_entries_are_ignored_in_both_tiers(tmp_path, clock):
+    cache = make_cache(tmp_path, ttl=60)
+    cache.put("k", "old answer")
+    clock.now += 61
+    assert cache.get("k") is None
+    assert make_cache(tmp_path, ttl=60).get("k") is None
+    rows = cache._connection().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+    assert rows == 0
+
+
+def test_prune_drops_expired_then_least_recently_used(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(completion_cache, "PRUNE_EVERY", 1)
+    cache = make_cache(tmp_path, ttl=1000, disk_bytes=2500)
+    cache.put("expired", "e" * 100)
+    clock.now += 990
+    cache.put("a", "a" * 1000)
+    clock.now += 1
+    cache.put("b", "b" * 1000)
+    clock.now += 1
+    cache._disk_get("a", clock.now)     # a was used more recently than b
+    clock.now += 10                     # "expired" is now past the TTL
+    cache.put("c", "c" * 1000)
+    keys = {row[0] for row in cache._connection().execute("SELECT key FROM completions")}
+    assert keys == {"a", "c"}
+    assert cache.metrics()["disk_pruned"] == 2
+
+
+def test_unopenable_disk_falls_back_to_memory(tmp_path, clock):
+    cache = CompletionCache(path=str(tmp_path / "missing" / "completions.db"))
+    cache.put("k", "answer")
+    assert cache.get("k") == "answer"
+    assert cache.path is None and cache.metrics()["disk_errors"] == 1
@@ -0,0 +1,80 @@
+import gc
+
+import pytest
+
+from ConnectionPool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def is_closed(self):
+        return self.closed
+
+
+def make_pool(max_size=2):
+    return ConnectionPool(FakeConnection, min_size=0, max_size=max_size, checkout_timeout=0.05,
+                          reap_interval=0)
+
+
+def test_released_connection_is_reused():
+    pool = make_pool()
+    first = pool.acquire()
+    raw = first._raw
+    first.close()
+    first.close()   # a second close is a no-op
+    second = pool.acquire()
+    assert second._raw is raw
+    metrics = pool.metrics()
+    assert metrics["created"] == 1 and metrics["in_use"] == 1 and metrics["open"] == 1
+
+
+def test_exhausted_pool_times_out():
+    pool = make_pool(max_size=1)
+    held = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.metrics()["timeouts"] == 1
+    held.close()
+    assert pool.acquire() is not None
+
+
+def test_context_manager_releases_on_error():
+    pool = make_pool(max_size=1)
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError("handler failed")
+    assert pool.metrics()["in_use"] == 0
+
+
+def test_dropped_connection_is_reclaimed():
+    pool = make_pool(max_size=2)
+
+    def leaky_handler():
+        connection = pool.acquire()
+        raise RuntimeError(f"failed before closing {connection}")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            leaky_handler()
+    gc.collect()
+    metrics = pool.metrics()
+    assert metrics["reclaimed"] == 2 and metrics["in_use"] == 0 and metrics["open"] == 0
+    assert pool.acquire() is not None
+
+
+def test_discard_closes_the_connection():
+    pool = make_pool()
+    connection = pool.acquire()
+    raw = connection._raw
+    connection.discard()
+    connection.close()
+    assert raw.closed
+    assert pool.metrics()["open"] == 0
@@ -0,0 +1,87 @@
+import pytest
+
+from LocalStorage import connect
+from Modules.ConversationPool import ConversationPoolManager
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = connect(str(tmp_path / "pool.db"))
+    yield connection
+    connection.close()
+
+
+def make_manager(**kwargs):
+    manager = ConversationPoolManager(size=2, **kwargs)
+    manager._ensure_thread = lambda: None   # refills are run by the test
+    return manager
+
+
+def add_material(connection, title):
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO course_materials (course_id, title, content) VALUES (1, %s, %s)",
+                   (title, f"{title} covers TCP congestion control."))
+    connection.commit()
+
+
+def first_message(connection, conv_id):
+    cursor = connection.cursor()
+    cursor.execute("SELECT message FROM edwin_messages WHERE conv_id = %s AND userorAI = TRUE", (conv_id,))
+    return cursor.fetchone()[0]
+
+
+def unclaimed_messages(connection):
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT message FROM edwin_messages WHERE conv_id IN (
+            SELECT conv_id FROM conversations WHERE course_id = 1 AND is_assigned = FALSE
+        )
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def test_claim_takes_a_ready_conversation(connection):
+    add_material(connection, "Lecture 1")
+    manager = make_manager()
+    assert manager.refill(1, connection) == 2
+    status, _, conv_id = manager.claim("u1", 1, connection)
+    assert status and "Lecture 1" in first_message(connection, conv_id)
+    metrics = manager.metrics()
+    assert metrics["inline_creates"] == 0 and metrics["baseline_builds"] == 1
+
+
+def test_materials_added_elsewhere_are_noticed_on_claim(connection):
+    add_material(connection, "Lecture 1")
+    manager = make_manager()
+    manager.refill(1, connection)
+    add_material(connection, "Lecture 2")     # by another process: no event here
+
+    status, _, conv_id = manager.claim("u1", 1, connection)
+    assert status and "Lecture 2" in first_message(connection, conv_id)
+    assert manager.metrics()["stale_baselines"] == 1 and manager.metrics()["inline_creates"] == 1
+
+    manager.refill(1, connection)
+    messages = unclaimed_messages(connection)
+    assert len(messages) == 2 and all("Lecture 2" in message for message in messages)
+
+
+def test_materials_deleted_elsewhere_are_noticed_on_refill(connection):
+    add_material(connection, "Lecture 1")
+    add_material(connection, "Lecture 2")
+    manager = make_manager()
+    manager.refill(1, connection)
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM course_materials WHERE title = 'Lecture 1'")
+    connection.commit()
+
+    manager.refill(1, connection)
+    assert manager.metrics()["stale_baselines"] == 1
+    assert all("Lecture 1" not in message for message in unclaimed_messages(connection))
+
+
+def test_baseline_is_rebuilt_after_its_ttl(connection):
+    add_material(connection, "Lecture 1")
+    manager = make_manager(baseline_ttl=0)
+    manager.baseline(1, connection)
+    manager.baseline(1, connection)
+    assert manager.metrics()["baseline_builds"] == 2
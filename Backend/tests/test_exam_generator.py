@@ -0,0 +1,66 @@
+import pytest
+
+from Modules.ExamGenerator import (
+    DIFFICULTY_LEVELS, EXAM_SLICE_QUESTIONS, ExamSlice, difficulty_targets, merge_exam, slice_counts
+)
+
+TOPICS = ["TCP congestion", "DNS caching", "IP fragmentation", "ARP spoofing", "BGP routes", "UDP checksums",
+          "HTTP cookies", "TLS handshakes", "Wi-Fi hidden stations", "Ethernet collisions"]
+
+
+def question(level, i):
+    return {"question": f"Which statement about {TOPICS[i % len(TOPICS)]} holds in case {i}?",
+            "difficulty": level, "options": ["A", "B", "C", "D"], "correctAnswer": 0}
+
+
+def exam_slice(index, level, count, questions, error=None):
+    exam_slice = ExamSlice(index, level, count, "prompt")
+    exam_slice.questions = questions
+    exam_slice.error = error
+    return exam_slice
+
+
+@pytest.mark.parametrize("num_questions", [1, 2, 4, 5, 11, 20, 37])
+@pytest.mark.parametrize("difficulty", ["Mixed", "Beginner", "advanced", None])
+def test_slices_add_up_and_stay_small(difficulty, num_questions):
+    slices = slice_counts(difficulty, num_questions)
+    assert sum(count for _, count in slices) == num_questions
+    assert all(0 < count <= EXAM_SLICE_QUESTIONS for _, count in slices)
+    for level, target in difficulty_targets(difficulty, num_questions):
+        sizes = [count for slice_level, count in slices if slice_level == level]
+        assert sum(sizes) == target and max(sizes) - min(sizes) <= 1
+
+
+def test_mixed_exams_split_evenly_over_the_levels():
+    assert difficulty_targets("Mixed", 20) == [("Beginner", 7), ("Intermediate", 7), ("Advanced", 6)]
+    assert difficulty_targets("mixed", 4) == [("Beginner", 1), ("Intermediate", 2), ("Advanced", 1)]
+    assert difficulty_targets("Intermediate", 6) == [("Intermediate", 6)]
+
+
+def test_merge_keeps_each_levels_share_easiest_first():
+    slices = [exam_slice(0, "Advanced", 2, [question("Advanced", i) for i in range(3)]),
+              exam_slice(1, "Beginner", 2, [question("Beginner", i) for i in range(3, 6)]),
+              exam_slice(2, "Intermediate", 2, [question("Intermediate", i) for i in range(6, 9)])]
+    status, _, quiz_data = merge_exam(slices, "Networks", 6, 1.0)
+    levels = [q["difficulty"] for q in quiz_data["questions"]]
+    assert status and levels == ["Beginner"] * 2 + ["Intermediate"] * 2 + ["Advanced"] * 2
+    assert levels == sorted(levels, key=DIFFICULTY_LEVELS.index)
+
+
+def test_merge_drops_near_duplicates_and_fills_from_other_levels():
+    duplicate = dict(question("Beginner", 0), question=question("Beginner", 0)["question"].upper() + " ")
+    slices = [exam_slice(0, "Beginner", 3, [question("Beginner", 0), duplicate]),
+              exam_slice(1, "Advanced", 3, [question("Advanced", i) for i in range(1, 6)])]
+    status, message, quiz_data = merge_exam(slices, "Networks", 6, 1.0)
+    levels = [q["difficulty"] for q in quiz_data["questions"]]
+    assert status and levels == ["Beginner"] + ["Advanced"] * 5
+    assert message.startswith("Generated 6 of 6")
+
+
+def test_failed_slices_are_reported_and_an_empty_exam_fails():
+    slices = [exam_slice(0, "Beginner", 2, [question("Beginner", 0)]),
+              exam_slice(1, "Advanced", 2, [], error="timed out")]
+    status, message, quiz_data = merge_exam(slices, "Networks", 4, 1.0)
+    assert status and message.startswith("Generated 1 of 4")
+    assert quiz_data["slices"]["failed"] == 1 and quiz_data["slices"]["total"] == 2
+    assert merge_exam([exam_slice(0, "Beginner", 2, [], error="timed out")], "Networks", 2, 1.0)[0] is False
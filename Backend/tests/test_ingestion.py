@@ -0,0 +1,81 @@
+import pytest
+
+from LocalStorage import connect
+from Modules.Ingestion import (
+    CHUNK_CHARS, CHUNK_OVERLAP, backfill_chunks, build_chunks, bulk_insert_materials, material_row
+)
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = connect(str(tmp_path / "ingest.db"))
+    connection._conn.isolation_level = None     # autocommit each statement, as Snowflake connections do
+    yield connection
+    connection.close()
+
+
+def count(connection, table):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def test_failed_chunk_insert_leaves_no_materials(connection):
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE course_material_chunks")
+    connection.commit()
+    rows = [material_row(f"Slide {i}", f"Slide {i} covers TCP congestion control. " * 5) for i in range(3)]
+    with pytest.raises(Exception):
+        bulk_insert_materials(1, rows, connection)
+    assert count(connection, "course_materials") == 0
+
+
+# -------------------------------
+# Chunking
+# -------------------------------
+def sentences(count, page=1):
+    return " ".join(f"Page {page} sentence {i} explains how TCP congestion windows grow." for i in range(count))
+
+
+def test_chunks_are_bounded_and_overlap():
+    content = sentences(120)
+    chunks = build_chunks(content)
+    assert len(chunks) > 2
+    for (_, start, end), (_, next_start, next_end) in zip(chunks, chunks[1:]):
+        assert end - start <= CHUNK_CHARS
+        assert start < next_start < end     # the next chunk starts inside this one
+        assert end - next_start <= CHUNK_OVERLAP
+    assert chunks[0][1] == 0 and chunks[-1][2] == len(content)
+
+
+def test_chunks_never_cross_page_markers():
+    content = "".join(f"--- Page {page} ---\n{sentences(40, page)}\n\n" for page in (1, 2, 3))
+    chunks = build_chunks(content)
+    assert {page for page, _, _ in chunks} == {1, 2, 3}
+    for page, start, end in chunks:
+        text = content[start:end]
+        assert "--- Page" not in text
+        assert f"Page {page} sentence" in text
+        assert f"Page {page + 1} sentence" not in text
+
+
+def test_empty_pages_have_no_chunks():
+    content = f"--- Page 1 ---\n{sentences(3)}\n\n--- Page 2 ---\n   \n\n--- Page 3 ---\n{sentences(3, 3)}\n\n"
+    assert [page for page, _, _ in build_chunks(content)] == [1, 3]
+    assert build_chunks("") == [] and build_chunks("  \n ") == []
+
+
+def test_slide_chunks_carry_the_slide_number():
+    assert build_chunks("Congestion control", page_number=7) == [(7, 0, len("Congestion control"))]
+
+
+def test_backfill_chunks_materials_without_chunks(connection):
+    cursor = connection.cursor()
+    cursor.executemany(
+        "INSERT INTO course_materials (course_id, title, content) VALUES (%s, %s, %s)",
+        [(1, "Slide 4", sentences(5)), (1, "notes.pdf", f"--- Page 1 ---\n{sentences(40)}\n\n")]
+    )
+    assert backfill_chunks(connection) == 2
+    cursor.execute("SELECT COUNT(DISTINCT material_id), MIN(page_number), MAX(page_number) FROM course_material_chunks")
+    assert cursor.fetchone() == (2, 1, 4)
+    assert backfill_chunks(connection) == 0
@@ -0,0 +1,106 @@
+import pytest
+
+import Modules.ModelRouter as model_router
+from Modules.ModelRouter import MIN_LATENCY_SAMPLES, PROBE_EVERY, RECOVERY_PROBES, ModelRouter, latency_budget
+
+SMALL = "When are office hours?"
+LARGE = "word " * 1500          # over SMALL_PROMPT_TOKENS, within every model's context
+HUGE = "word " * 10000         # only fits mixtral-8x7b
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_router.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def router(clock):
+    return ModelRouter(models=("llama3-8b", "mixtral-8x7b", "llama3-70b"), enabled=True, window=300)
+
+
+def slow(router, endpoint, model, calls=MIN_LATENCY_SAMPLES):
+    for _ in range(calls):
+        router.observe(endpoint, model, latency_budget(endpoint) * 2)
+
+
+def reasons(router, endpoint):
+    return router.metrics()["endpoints"][endpoint]["reasons"]
+
+
+def test_small_light_prompts_go_to_the_fastest_model(router):
+    assert router.route("chat", "llama3-70b", SMALL) == "llama3-8b"
+    assert router.route("chat", "llama3-70b", LARGE) == "llama3-70b"
+    assert reasons(router, "chat") == {"small_prompt": 1, "configured": 1}
+
+
+def test_task_floor_and_context_window(router):
+    assert router.route("quiz", "mixtral-8x7b", SMALL) == "mixtral-8x7b"
+    slow(router, "quiz", "mixtral-8x7b")
+    # llama3-8b is faster but below the floor for quiz JSON
+    assert router.route("quiz", "mixtral-8x7b", SMALL) == "mixtral-8x7b"
+    assert reasons(router, "quiz")["over_budget"] == 1
+    slow(router, "chat", "llama3-70b")
+    # llama3-8b is faster than mixtral but its context can't hold the prompt
+    assert router.route("chat", "llama3-70b", HUGE) == "mixtral-8x7b"
+
+
+def test_over_budget_model_falls_back_to_the_strongest_faster_one(router):
+    slow(router, "explain", "llama3-70b")
+    assert router.route("explain", "llama3-70b", LARGE) == "mixtral-8x7b"
+    slow(router, "explain", "mixtral-8x7b")
+    assert router.route("explain", "llama3-70b", LARGE) == "llama3-8b"
+    assert reasons(router, "explain") == {"latency_fallback": 2}
+
+
+def test_latency_is_kept_per_endpoint(router):
+    slow(router, "quiz", "llama3-70b")
+    assert router.p95("quiz", "llama3-70b") is not None
+    assert router.p95("chat", "llama3-70b") is None
+    assert router.route("chat", "llama3-70b", LARGE) == "llama3-70b"
+
+
+def test_slow_samples_age_out_of_the_window(router, clock):
+    slow(router, "chat", "llama3-70b")
+    assert router.route("chat", "llama3-70b", LARGE) == "mixtral-8x7b"
+    clock.now += 301
+    assert router.p95("chat", "llama3-70b") is None
+    assert router.route("chat", "llama3-70b", LARGE) == "llama3-70b"
+
+
+def test_probes_bring_a_recovered_model_back(router):
+    slow(router, "chat", "llama3-70b")
+    routed = [router.route("chat", "llama3-70b", LARGE) for _ in range(PROBE_EVERY)]
+    assert routed.count("llama3-70b") == 1 and routed[-1] == "llama3-70b"
+    assert reasons(router, "chat")["probe"] == 1
+
+    for _ in range(RECOVERY_PROBES):
+        router.observe("chat", "llama3-70b", 1.0)
+    assert router.metrics()["recoveries"] == 1
+    assert router.p95("chat", "llama3-70b") is None     # the slow samples were dropped
+    assert router.route("chat", "llama3-70b", LARGE) == "llama3-70b"
+
+
+def test_one_slow_probe_resets_the_recovery_count(router):
+    slow(router, "chat", "llama3-70b")
+    for seconds in [1.0] * (RECOVERY_PROBES - 1) + [30.0] + [1.0] * (RECOVERY_PROBES - 1):
+        router.observe("chat", "llama3-70b", seconds)
+    assert router.metrics()["recoveries"] == 0
+
+
+def test_pinned_endpoints_and_disabled_routing(router, monkeypatch):
+    monkeypatch.setenv("EDWIN_MODEL_CHAT", "llama3-70b")
+    assert router.route("chat", "llama3-70b", SMALL) == "llama3-70b"
+    assert reasons(router, "chat") == {"pinned": 1}
+    disabled = ModelRouter(enabled=False)
+    assert disabled.route("explain", "llama3-70b", SMALL) == "llama3-70b"
+    assert router.route(None, "llama3-70b", SMALL) == "llama3-70b"
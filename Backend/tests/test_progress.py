@@ -0,0 +1,94 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from LocalStorage import connect
+from Modules.Progress import STREAK_GAP_DAYS, _fetch_progress, get_progress, rebuild_progress, record_attempt
+
+DAY = date(2026, 3, 2)
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = connect(str(tmp_path / "progress.db"))
+    yield connection
+    connection.close()
+
+
+def insert_attempt(connection, user_id, quiz_title, is_correct, day):
+    cursor = connection.cursor()
+    cursor.execute("""
+        INSERT INTO user_quiz_attempts (user_id, course_id, question_text, quiz_title, selected_option,
+                                        correct_option, is_correct, created_at)
+        VALUES (%s, 1, 'Q?', %s, 0, 0, %s, %s)
+    """, (user_id, quiz_title, is_correct, datetime.combine(day, datetime.min.time())))
+    cursor.close()
+
+
+def attempt(connection, user_id, quiz_title, is_correct, day):
+    insert_attempt(connection, user_id, quiz_title, is_correct, day)
+    record_attempt(user_id, quiz_title, is_correct, connection, attempted_on=day)
+
+
+def aggregates(connection, user_id):
+    stats = _fetch_progress(user_id, connection)
+    stats["quiz_stats"] = sorted(stats["quiz_stats"])
+    return stats
+
+
+def test_streak_continues_within_gap_and_resets_after_it(connection):
+    attempt(connection, "u1", "TCP", True, DAY)
+    attempt(connection, "u1", "TCP", True, DAY)     # same day: no change
+    attempt(connection, "u1", "TCP", False, DAY + timedelta(days=STREAK_GAP_DAYS))
+    assert aggregates(connection, "u1")["current_streak"] == 2
+    attempt(connection, "u1", "UDP", True, DAY + timedelta(days=2 * STREAK_GAP_DAYS + 1))
+    stats = aggregates(connection, "u1")
+    assert stats["current_streak"] == 1
+    assert stats["total_attempts"] == 4 and stats["correct_answers"] == 3
+
+
+def test_first_recorded_attempt_keeps_earlier_history(connection):
+    # Attempts from before the aggregates existed
+    for offset in range(3):
+        insert_attempt(connection, "u2", "TCP", True, DAY + timedelta(days=offset))
+    attempt(connection, "u2", "UDP", False, DAY + timedelta(days=3))
+    stats = aggregates(connection, "u2")
+    assert stats["total_attempts"] == 4 and stats["correct_answers"] == 3
+    assert stats["current_streak"] == 4
+    assert stats["quiz_stats"] == [("TCP", 3, 3), ("UDP", 1, 0)]
+
+
+def test_new_quiz_title_counts_its_earlier_attempts(connection):
+    attempt(connection, "u3", "TCP", True, DAY)
+    insert_attempt(connection, "u3", "UDP", True, DAY)    # logged without updating the aggregates
+    attempt(connection, "u3", "UDP", False, DAY)
+    assert ("UDP", 2, 1) in aggregates(connection, "u3")["quiz_stats"]
+
+
+def test_rebuild_matches_incremental_aggregates(connection):
+    for offset, title, correct in [(0, "TCP", True), (1, "TCP", False), (1, "UDP", True),
+                                   (4, "IP", True), (5, "IP", True), (7, "TCP", False)]:
+        attempt(connection, "u4", title, correct, DAY + timedelta(days=offset))
+    incremental = aggregates(connection, "u4")
+    rebuild_progress(connection, "u4")
+    connection.commit()
+    assert aggregates(connection, "u4") == incremental
+    rebuild_progress(connection)
+    connection.commit()
+    assert aggregates(connection, "u4") == incremental
+
+
+def test_rebuild_does_not_duplicate_rows(connection):
+    attempt(connection, "u5", "TCP", True, DAY)
+    rebuild_progress(connection, "u5")
+    rebuild_progress(connection, "u5")
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_progress WHERE user_id = %s", ("u5",))
+    assert cursor.fetchone()[0] == 1
+
+
+def test_get_progress_backfills_a_user_without_aggregates(connection):
+    insert_attempt(connection, "u6", "TCP", True, DAY)
+    insert_attempt(connection, "u6", "TCP", False, DAY)
+    progress = get_progress("u6", connection)
+    assert progress["totalAttempts"] == 2 and progress["accuracy"] == 50.0
@@ -0,0 +1,64 @@
+import pytest
+
+from LocalStorage import connect
+from Modules.QuizBank import QUIZ_BANK_DIFFICULTIES, QUIZ_BANK_MIN_CHARS, QuizBank
+from Modules.Quizzes import insertQuizWithQuestions
+
+ROW = ("What does TCP slow start double?", "The window", "The RTT", "The MSS", "The port", "A", "Each RTT.")
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = connect(str(tmp_path / "bank.db"))
+    connection._conn.isolation_level = None     # autocommit each statement, as Snowflake connections do
+    yield connection
+    connection.close()
+
+
+def count(connection, table):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def add_material(connection, title, length=QUIZ_BANK_MIN_CHARS):
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO course_materials (course_id, title, content) VALUES (1, %s, %s)",
+                   (title, "x" * length))
+    cursor.execute("SELECT MAX(material_id) FROM course_materials")
+    return cursor.fetchone()[0]
+
+
+def test_quiz_and_questions_are_stored_together(connection):
+    material_id = add_material(connection, "Lecture 1")
+    status, _, quiz_id, _ = insertQuizWithQuestions(1, "Lecture 1", material_id, [ROW, ROW], connection, "Beginner")
+    assert status and quiz_id is not None
+    assert count(connection, "quizzes") == 1 and count(connection, "quiz_questions") == 2
+
+
+def test_failed_questions_insert_leaves_no_quiz(connection):
+    material_id = add_material(connection, "Lecture 1")
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE quiz_questions")
+    status, message, quiz_id, _ = insertQuizWithQuestions(1, "Lecture 1", material_id, [ROW], connection, "Beginner")
+    assert not status and quiz_id is None and message.startswith("ERROR")
+    assert count(connection, "quizzes") == 0
+
+
+def test_backfill_queues_materials_missing_any_difficulty(connection):
+    complete = add_material(connection, "Complete", QUIZ_BANK_MIN_CHARS + 300)
+    partial = add_material(connection, "Partial", QUIZ_BANK_MIN_CHARS + 200)
+    unbanked = add_material(connection, "Unbanked", QUIZ_BANK_MIN_CHARS + 100)
+    add_material(connection, "Title slide", QUIZ_BANK_MIN_CHARS - 1)
+    for difficulty in QUIZ_BANK_DIFFICULTIES:
+        insertQuizWithQuestions(1, "Complete", complete, [ROW], connection, difficulty)
+    insertQuizWithQuestions(1, "Partial", partial, [ROW], connection, QUIZ_BANK_DIFFICULTIES[0])
+
+    bank = QuizBank()
+    queued = []
+    bank.request_build = lambda courseID, material_id: queued.append(material_id)
+    bank.backfill(1, connection)
+    assert queued == [partial, unbanked]
+    queued.clear()
+    bank.backfill(1, connection, [complete, unbanked])
+    assert queued == [unbanked]
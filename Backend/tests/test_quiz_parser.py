@@ -0,0 +1,72 @@
+import json
+
+from Modules.QuizParser import QuizParser, parse_quiz
+
+
+def question(text, correct=0, explanation="Because."):
+    return {"question": text, "options": ["A", "B", "C", "D"], "correct": correct, "explanation": explanation}
+
+
+def quiz_json(*questions):
+    return json.dumps({"title": "T", "description": "D", "questions": list(questions)})
+
+
+def test_smart_quotes_inside_ascii_string_are_text():
+    text = quiz_json(question("Q1?")).replace('"Q1?"', '"What does “static” mean?"')
+    quiz_data, failed = parse_quiz(text)
+    assert failed == []
+    assert quiz_data["questions"][0]["question"] == "What does “static” mean?"
+
+
+def test_smart_quotes_as_delimiters():
+    text = '{“title”: “T”, "questions": [{“question”: “Say "hi"?”, "options": ["A","B","C","D"], "correct": 1}]}'
+    quiz_data, failed = parse_quiz(text)
+    assert failed == []
+    assert quiz_data["title"] == "T"
+    assert quiz_data["questions"][0]["question"] == 'Say "hi"?'
+
+
+def test_trailing_commas_and_surrounding_prose():
+    text = ('Here is your quiz:\n{"title": "T", "questions": ['
+            '{"question": "Q1?", "options": ["A","B","C","D",], "correct": 0,},'
+            ']}\nGood luck!')
+    quiz_data, failed = parse_quiz(text)
+    assert failed == []
+    assert quiz_data["questions"][0]["options"] == ["A", "B", "C", "D"]
+
+
+def test_letter_and_string_correct():
+    text = quiz_json(question("Q1?", correct="B"), question("Q2?", correct="3"))
+    quiz_data, _ = parse_quiz(text)
+    assert [q["correct"] for q in quiz_data["questions"]] == [1, 3]
+
+
+def test_malformed_question_is_reported_and_others_kept():
+    text = quiz_json(question("Q1?"), {"question": "Q2?", "options": ["A"], "correct": 0}, question("Q3?"))
+    quiz_data, failed = parse_quiz(text)
+    assert [q["question"] for q in quiz_data["questions"]] == ["Q1?", "Q3?"]
+    assert failed == [{"index": 1, "error": "malformed question"}]
+
+
+def test_cut_off_tail():
+    full = quiz_json(question("Q1?"), question("Q2?", explanation="A long explanation"))
+    # Cut inside the last explanation: the question is still complete enough to keep
+    quiz_data, failed = parse_quiz(full[:full.rindex("explanation\"")])
+    assert [q["question"] for q in quiz_data["questions"]] == ["Q1?", "Q2?"]
+    # Cut inside the options: reported as truncated
+    quiz_data, failed = parse_quiz(full[:full.rindex('"C"')])
+    assert [q["question"] for q in quiz_data["questions"]] == ["Q1?"]
+    assert failed == [{"index": 1, "error": "truncated"}]
+
+
+def test_questions_arrive_as_they_close():
+    text = quiz_json(question("Q1?"), question("Q2?"))
+    parser = QuizParser()
+    first_end = text.index("}") + 1
+    assert [q["question"] for q in parser.feed(text[:first_end])] == ["Q1?"]
+    assert [q["question"] for q in parser.feed(text[first_end:])] == ["Q2?"]
+    assert parser.finish()["title"] == "T"
+
+
+def test_no_json():
+    assert parse_quiz("Sorry, I can't help with that.") == (None, [])
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+
+from Modules.LLMEndpoints import MAX_QUIZ_QUESTIONS, _parse_generate_quiz
+from Modules.QuizSessions import QuizSessions
+
+
+@pytest.mark.parametrize("num_questions", [0, -3, MAX_QUIZ_QUESTIONS + 1, "lots", None, [5]])
+def test_bad_question_counts_are_rejected(num_questions):
+    args, error = _parse_generate_quiz({"courseID": 1, "numQuestions": num_questions})
+    assert args is None and error[1] == 400
+
+
+def test_question_count_is_an_int():
+    args, error = _parse_generate_quiz({"courseID": 1, "numQuestions": "7"})
+    assert error is None and args[3] == 7
+
+
+def test_new_sessions_are_refused_while_max_active_are_generating():
+    release = threading.Event()
+    sessions = QuizSessions(workers=1, max_active=2)
+    sessions._generate = lambda session: release.wait(5)
+    try:
+        assert sessions.start(1, None, "TCP", "Beginner", 5) is not None
+        assert sessions.start(1, None, "TCP", "Beginner", 5) is not None
+        assert sessions.start(1, None, "TCP", "Beginner", 5) is None
+        assert sessions.metrics()["refused"] == 1
+    finally:
+        release.set()
+
+
+def test_async_poll_wakes_when_a_question_arrives():
+    release = threading.Event()
+    sessions = QuizSessions(workers=1)
+    sessions._generate = lambda session: release.wait(5)
+    session_id = sessions.start(1, None, "TCP", "Beginner", 2)
+    session = sessions._sessions[session_id]
+
+    async def poll():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        loop.call_later(0.1, lambda: threading.Thread(target=sessions._add, args=(session, [{"q": 1}])).start())
+        snapshot = await sessions.wait_async(session_id, after=0, timeout=5)
+        return snapshot, loop.time() - started
+
+    try:
+        snapshot, waited = asyncio.run(poll())
+        assert snapshot["questions"] == [{"q": 1}] and snapshot["next"] == 1
+        assert waited < 1
+        assert session.waiters == []
+    finally:
+        release.set()
+
+
+def test_async_poll_times_out_and_unknown_sessions_are_none():
+    release = threading.Event()
+    sessions = QuizSessions(workers=1)
+    sessions._generate = lambda session: release.wait(5)
+    session_id = sessions.start(1, None, "TCP", "Beginner", 2)
+    try:
+        snapshot = asyncio.run(sessions.wait_async(session_id, after=0, timeout=0.05))
+        assert snapshot["status"] == "generating" and snapshot["questions"] == []
+        assert sessions._sessions[session_id].waiters == []
+        assert asyncio.run(sessions.wait_async("nope")) is None
+    finally:
+        release.set()
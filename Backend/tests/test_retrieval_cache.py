@@ -0,0 +1,53 @@
+from Modules.RetrievalCache import RetrievalCache
+
+
+def row(chunk_id, material_id=1, content="x" * 1000):
+    return (chunk_id, material_id, "Lecture", content, None, 1, 0)
+
+
+def test_lookup_splits_hits_and_misses():
+    cache = RetrievalCache()
+    cache.store(1, [row(1), row(2)])
+    found, missing = cache.lookup([1, 3, 2])
+    assert sorted(found) == [1, 2] and missing == [3]
+    assert found[1].content == "x" * 1000
+    metrics = cache.metrics()
+    assert metrics["hits"] == 2 and metrics["misses"] == 1
+
+
+def test_evicts_least_recently_used_within_the_byte_bound():
+    entry_size = RetrievalCache().store(1, [row(0)])[0].size
+    cache = RetrievalCache(max_bytes=3 * entry_size)
+    cache.store(1, [row(1), row(2), row(3)])
+    cache.lookup([1])                   # 2 is now the least recently used
+    cache.store(1, [row(4)])
+    found, missing = cache.lookup([1, 2, 3, 4])
+    assert missing == [2] and sorted(found) == [1, 3, 4]
+    metrics = cache.metrics()
+    assert metrics["evictions"] == 1 and metrics["bytes"] == 3 * entry_size <= cache.max_bytes
+
+
+def test_oversized_entries_are_not_cached():
+    cache = RetrievalCache(max_bytes=2000)
+    cache.store(1, [row(1, content="y" * 5000)])
+    assert cache.lookup([1]) == ({}, [1])
+    assert cache.bytes == 0
+
+
+def test_restoring_a_chunk_does_not_double_count():
+    cache = RetrievalCache()
+    cache.store(1, [row(1)])
+    size = cache.bytes
+    cache.store(1, [row(1)])
+    assert cache.bytes == size and cache.metrics()["entries"] == 1
+
+
+def test_invalidation_drops_only_the_removed_materials():
+    cache = RetrievalCache()
+    cache.store(1, [row(1, material_id=10), row(2, material_id=11)])
+    cache.store(2, [row(3, material_id=20)])
+    cache.invalidate(1, removed=["10"])     # ids from request JSON may be strings
+    assert cache.lookup([1, 2, 3])[1] == [1]
+    cache.invalidate(1, cleared=True)
+    assert cache.lookup([2, 3])[1] == [2]
+    assert cache.bytes == cache.lookup([3])[0][3].size
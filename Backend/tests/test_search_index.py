@@ -0,0 +1,95 @@
+import pytest
+
+from Modules.SearchIndex import TITLE_WEIGHT, CourseIndex
+
+CHUNKS = [
+    (1, 10, "Congestion control", "TCP congestion windows grow additively and shrink after loss.", 0),
+    (2, 10, "Congestion control", "Slow start doubles the window every round trip until the threshold.", 300),
+    (3, 11, "Routing", "Distance vector routing exchanges tables with neighbours.", 0),
+    (4, 12, "Retransmissions", "A retransmission timeout fires when no acknowledgement arrives in time.", 0),
+]
+
+
+@pytest.fixture
+def index():
+    index = CourseIndex()
+    index.add_many(CHUNKS)
+    return index
+
+
+def keyword(index, query, **kwargs):
+    return [chunk_id for chunk_id, _ in index.search(query, 10, mode="keyword", **kwargs)]
+
+
+# -------------------------------
+# BM25
+# -------------------------------
+def test_only_chunks_sharing_a_term_are_scored(index):
+    assert keyword(index, "neighbours") == [3]
+    assert keyword(index, "the and of") == []     # stopwords only
+    assert keyword(index, "quantum") == []
+
+
+def test_rare_terms_outweigh_common_ones():
+    index = CourseIndex()
+    index.add_many([(i, i, "Notes", f"packet header field {i}", 0) for i in range(1, 6)]
+                   + [(6, 6, "Notes", "packet checksum", 0)])
+    scores = dict(index.keyword_scores("packet checksum"))
+    assert max(scores, key=scores.get) == 6
+    assert scores[6] > 2 * scores[1]
+
+
+def test_shorter_chunk_wins_at_equal_term_frequency():
+    index = CourseIndex()
+    index.add_many([(1, 1, "Notes", "jitter", 0),
+                    (2, 2, "Notes", "jitter " + "buffer playout delay video audio stream " * 5, 0)])
+    scores = index.keyword_scores("jitter")
+    assert scores[1] > scores[2] > 0
+
+
+def test_title_terms_are_weighted():
+    index = CourseIndex()
+    index.add_many([(1, 1, "Firewalls", "Packets are filtered at the edge.", 0),
+                    (2, 2, "Notes", "A firewall filters packets at the edge.", 0)])
+    assert index.doc_terms[1]["firewall"] == TITLE_WEIGHT
+    assert keyword(index, "firewall") == [1, 2]
+
+
+def test_material_filter_and_removal(index):
+    assert keyword(index, "congestion window", material_id=10) == [1, 2]
+    assert keyword(index, "congestion window", material_id=11) == []
+    assert index.remove_material(10) == 2
+    assert keyword(index, "congestion window") == []
+    assert "congestion" not in index.postings
+    assert len(index) == 2 and index.total_len == sum(index.doc_len.values())
+
+
+# -------------------------------
+# Hybrid ranking
+# -------------------------------
+def test_dense_scores_find_reworded_questions(index):
+    assert keyword(index, "retransmitting") == []     # no shared term after stemming
+    assert index.search("retransmitting", 1, mode="dense")[0][0] == 4
+    assert index.search("retransmitting", 1)[0][0] == 4
+
+
+def test_hybrid_scores_are_scaled_to_the_best_match(index):
+    ranked = index.search("congestion window", 4)
+    assert ranked[0][0] in (1, 2)
+    assert ranked[0][1] == pytest.approx(1.0, abs=0.05)
+    assert all(0.0 <= score <= 1.0 + 1e-6 for _, score in ranked)
+    assert [score for _, score in ranked] == sorted((score for _, score in ranked), reverse=True)
+
+
+def test_keyword_and_dense_agreement_ranks_first():
+    index = CourseIndex()
+    index.add_many([(1, 1, "Notes", "Subnet masks split an address into network and host parts.", 0),
+                    (2, 2, "Notes", "Subnetting mask examples for class C networks.", 0),
+                    (3, 3, "Notes", "Host names resolve through DNS.", 0)])
+    ranked = [chunk_id for chunk_id, _ in index.search("subnet mask", 3)]
+    assert ranked[0] == 1 and 3 not in ranked[:2]
+
+
+def test_hybrid_search_respects_the_material_filter(index):
+    assert {chunk_id for chunk_id, _ in index.search("congestion retransmission", 5, material_id=12)} == {4}
+    assert index.search_materials("congestion window slow start", 2)[0] == 10
@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+import pytest
+
+from Modules.SingleFlight import ProcessLock, SingleFlight, fcntl, flight_key
+
+
+def test_followers_get_result_when_async_leader_is_cancelled():
+    flights = SingleFlight(lock_dir="")
+    key = flight_key("explain", "page")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do_async(key, work))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flights.do_async(key, work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    assert asyncio.run(main()) == ["answer"] * 3
+    assert calls == [1]
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+def test_lock_timeout_leaves_other_holders_file(tmp_path):
+    key = flight_key("explain", "page")
+    holder = ProcessLock(str(tmp_path), key)
+    assert holder.acquire() is False
+    waiter = ProcessLock(str(tmp_path), key)
+    assert waiter.acquire(timeout=0.1) is True
+    assert not waiter.held
+    waiter.release()
+    assert os.path.exists(holder.path)
+    holder.release()
+    assert not os.path.exists(holder.path)
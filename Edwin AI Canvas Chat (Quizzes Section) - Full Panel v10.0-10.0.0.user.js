@@ -1307,6 +1307,7 @@
                         'Content-Type': 'application/json',
                     },
                     body: JSON.stringify({
+                        userID: USER_ID,  // Leaves out bank questions this student already attempted
                         courseID: COURSE_ID,
                         topic: topic,
                         difficulty: difficulty,
@@ -1586,7 +1587,8 @@
                                 quizTitle: currentQuizTitle,
                                 selectedOption: optionIndex,
                                 correctOption: q.correct,
-                                isCorrect: isCorrect
+                                isCorrect: isCorrect,
+                                questionId: q.questionId  // Set on questions served from the quiz bank
                             })
                         }).catch(error => console.error('Failed to log quiz attempt:', error));
 
@@ -28,7 +28,9 @@ const CONFIG = {
         HEALTH: '/api/health',
         NEW_CONVERSATION: '/api/newConversation',
         SEND_MESSAGE: '/api/sendMessage',
+        SEND_MESSAGE_STREAM: '/api/sendMessage/stream',
         GENERATE_QUIZ: '/api/generateQuiz',
+        QUIZ_SESSION: '/api/quizSession',
         SYNC_PAGE_CONTENT: '/api/syncPageContent',
         QUIZ_ATTEMPT: '/api/quizAttempt',
         PROGRESS: '/api/progress',
@@ -54,7 +56,9 @@ const CONFIG = {
     // API timeouts
     TIMEOUT: {
         DEFAULT: 10000,  // 10 seconds
+        STREAM_IDLE: 30000,  // 30 seconds without a streamed event
         QUIZ_GENERATION: 30000,  // 30 seconds
+        QUIZ_POLL: 25000,  // 25 seconds (the server holds a poll for up to 20)
         PAGE_SYNC: 15000  // 15 seconds
     },
 
@@ -394,6 +398,90 @@ const API = {
         });
     },
 
+    /**
+     * Send message to Edwin AI and receive the answer as it is generated.
+     * onToken(text) is called for each piece of the answer; resolves like request()
+     * with data = the same final record /api/sendMessage returns.
+     * unsupported: true means the backend has no streaming endpoint (fall back to sendMessage).
+     */
+    async sendMessageStream(userToken, courseId, question, onToken) {
+        const controller = new AbortController();
+        let idleTimer = setTimeout(() => controller.abort(), CONFIG.TIMEOUT.STREAM_IDLE);
+        const resetIdle = () => {
+            clearTimeout(idleTimer);
+            idleTimer = setTimeout(() => controller.abort(), CONFIG.TIMEOUT.STREAM_IDLE);
+        };
+
+        try {
+            const response = await fetch(`${CONFIG.BACKEND_BASE_URL}${CONFIG.API.SEND_MESSAGE_STREAM}`, {
+                method: 'POST',
+                signal: controller.signal,
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    userID: userToken,
+                    courseID: courseId,
+                    question: question
+                })
+            });
+
+            if (response.status === 404 || response.status === 405) {
+                return { success: false, unsupported: true, error: 'Streaming not supported' };
+            }
+            if (!response.ok) {
+                const data = await response.json().catch(() => ({}));
+                return { success: false, error: data.message || `HTTP ${response.status}` };
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let final = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                resetIdle();
+                buffer += decoder.decode(value, { stream: true });
+
+                // Server-sent events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let event = 'message';
+                    let data = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    if (!data) continue;
+
+                    const payload = JSON.parse(data);
+                    if (event === 'token') {
+                        onToken(payload.text);
+                    } else if (event === 'done') {
+                        final = payload;
+                    } else if (event === 'error') {
+                        return { success: false, error: payload.message };
+                    }
+                }
+            }
+
+            if (!final) {
+                return { success: false, error: 'Stream ended before the answer completed' };
+            }
+            return { success: true, data: final };
+        } catch (error) {
+            if (error.name === 'AbortError') {
+                return { success: false, error: 'Request timeout - backend may be offline' };
+            }
+            return { success: false, error: error.message };
+        } finally {
+            clearTimeout(idleTimer);
+        }
+    },
+
     /**
      * Sync page content to backend
      */
@@ -414,11 +502,12 @@ const API = {
     /**
      * Generate quiz
      */
-    async generateQuiz(courseId, topic, difficulty, numQuestions) {
+    async generateQuiz(userToken, courseId, topic, difficulty, numQuestions) {
         return this.request(CONFIG.API.GENERATE_QUIZ, {
             method: 'POST',
             timeout: CONFIG.TIMEOUT.QUIZ_GENERATION,
             body: JSON.stringify({
+                userID: userToken,
                 courseID: courseId,
                 topic: topic,
                 difficulty: difficulty,
@@ -427,21 +516,50 @@ const API = {
         });
     },
 
+    /**
+     * Start a progressive quiz: resolves with data.sessionId while the questions are generated
+     */
+    async startQuizSession(userToken, courseId, topic, difficulty, numQuestions) {
+        return this.request(CONFIG.API.QUIZ_SESSION, {
+            method: 'POST',
+            body: JSON.stringify({
+                userID: userToken,
+                courseID: courseId,
+                topic: topic,
+                difficulty: difficulty,
+                numQuestions: numQuestions
+            })
+        });
+    },
+
+    /**
+     * Long-poll a quiz session for the questions after the first `after` ones
+     * (data: { status, questions, next, total, title, description, ... })
+     */
+    async pollQuizSession(sessionId, after, wait = 20) {
+        return this.request(`${CONFIG.API.QUIZ_SESSION}/${sessionId}?after=${after}&wait=${wait}`, {
+            method: 'GET',
+            timeout: CONFIG.TIMEOUT.QUIZ_POLL
+        });
+    },
+
     /**
      * Log quiz attempt (fire-and-forget)
      */
-    logQuizAttempt(userToken, question, quizTitle, selectedOption, correctOption, isCorrect) {
+    logQuizAttempt(userToken, courseId, question, quizTitle, selectedOption, correctOption, isCorrect, questionId) {
         // Non-blocking - don't wait for response
         fetch(`${CONFIG.BACKEND_BASE_URL}${CONFIG.API.QUIZ_ATTEMPT}`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 userID: userToken,
+                courseID: courseId,
                 question: question,
                 quizTitle: quizTitle,
                 selectedOption: selectedOption,
                 correctOption: correctOption,
-                isCorrect: isCorrect
+                isCorrect: isCorrect,
+                questionId: questionId
             })
         }).catch(error => console.error('Failed to log quiz attempt:', error));
     },
@@ -530,24 +648,7 @@ const UI = {
         if (sender === 'user') {
             textSpan.textContent = text;
         } else if (sender === 'edwin') {
-            // Add grounded badge if applicable
-            if (citations && citations.length > 0) {
-                const badge = document.createElement('span');
-                badge.className = 'grounded-badge grounded';
-                badge.innerHTML = '✅ Grounded';
-                messageContent.insertBefore(badge, textSpan);
-            } else if (grounded === false) {
-                const badge = document.createElement('span');
-                badge.className = 'grounded-badge ungrounded';
-                badge.innerHTML = '⚠️ Ungrounded';
-                messageContent.insertBefore(badge, textSpan);
-
-                // Add suggestion to sync
-                const suggestion = document.createElement('div');
-                suggestion.className = 'sync-suggestion';
-                suggestion.innerHTML = '💡 Tip: Click "Sync This Page" in settings to ground Edwin with course materials';
-                messageContent.appendChild(suggestion);
-            }
+            this.addGroundedBadge(messageContent, textSpan, citations, grounded);
 
             // Typing animation
             let i = 0;
@@ -569,6 +670,69 @@ const UI = {
         }
     },
 
+    /**
+     * Add grounded / ungrounded badge to an Edwin message
+     */
+    addGroundedBadge(messageContent, textSpan, citations, grounded) {
+        if (citations && citations.length > 0) {
+            const badge = document.createElement('span');
+            badge.className = 'grounded-badge grounded';
+            badge.innerHTML = '✅ Grounded';
+            messageContent.insertBefore(badge, textSpan);
+        } else if (grounded === false) {
+            const badge = document.createElement('span');
+            badge.className = 'grounded-badge ungrounded';
+            badge.innerHTML = '⚠️ Ungrounded';
+            messageContent.insertBefore(badge, textSpan);
+
+            // Add suggestion to sync
+            const suggestion = document.createElement('div');
+            suggestion.className = 'sync-suggestion';
+            suggestion.innerHTML = '💡 Tip: Click "Sync This Page" in settings to ground Edwin with course materials';
+            messageContent.appendChild(suggestion);
+        }
+    },
+
+    /**
+     * Start an Edwin message that is filled in as the answer streams.
+     * Returns { append(text), finish(citations, grounded) }
+     */
+    startStreamingMessage() {
+        const messagesContainer = document.getElementById('edwin-messages');
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message edwin';
+
+        const messageContent = document.createElement('div');
+        messageContent.className = 'message-content';
+
+        const textSpan = document.createElement('span');
+        textSpan.className = 'message-text';
+
+        messageContent.appendChild(textSpan);
+        messageDiv.appendChild(messageContent);
+        if (messagesContainer) {
+            messagesContainer.appendChild(messageDiv);
+        }
+
+        const scroll = () => {
+            if (messagesContainer) messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        };
+
+        return {
+            append: (text) => {
+                textSpan.textContent += text;
+                scroll();
+            },
+            finish: (citations, grounded) => {
+                this.addGroundedBadge(messageContent, textSpan, citations, grounded);
+                if (citations && citations.length > 0) {
+                    messageContent.appendChild(this.renderCitations(citations));
+                }
+                scroll();
+            }
+        };
+    },
+
     /**
      * Render citations block
      */
@@ -580,9 +744,9 @@ const UI = {
             <div class="citations-header">📚 Sources:</div>
             ${citations.map((cite, idx) => `
                 <div class="citation-item">
-                    <strong>${idx + 1}. ${cite.title || 'Source'}</strong>
+                    <strong>${idx + 1}. ${cite.title || 'Source'}${this.citationPage(cite)}</strong>
                     ${cite.url ? `<br><a href="${cite.url}" target="_blank" class="citation-link">View source →</a>` : ''}
-                    ${cite.snippet ? `<div class="citation-snippet">${cite.snippet}</div>` : ''}
+                    ${cite.snippet ? `<div class="citation-snippet">${this.citationSnippet(cite)}</div>` : ''}
                 </div>
             `).join('')}
         `;
@@ -590,6 +754,32 @@ const UI = {
         return citationsDiv;
     },
 
+    /**
+     * Citation snippet as HTML, with the question's terms (cite.highlights) marked
+     */
+    citationSnippet(cite) {
+        const escape = (text) => text
+            .replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+        const snippet = cite.snippet;
+        let html = '';
+        let last = 0;
+        for (const [start, end] of cite.highlights || []) {
+            if (start < last || end > snippet.length) continue;
+            html += escape(snippet.slice(last, start));
+            html += `<mark class="citation-highlight">${escape(snippet.slice(start, end))}</mark>`;
+            last = end;
+        }
+        return html + escape(snippet.slice(last));
+    },
+
+    /**
+     * Page label for a citation (slides are already titled "Slide N")
+     */
+    citationPage(cite) {
+        if (!cite.page || /^Slide \d+$/.test(cite.title || '')) return '';
+        return ` (p. ${cite.page})`;
+    },
+
     /**
      * Show status message in sync section
      */
@@ -1022,6 +1212,13 @@ const EdwinTemplate = {
                 color: var(--text-muted);
             }
 
+            .citation-highlight {
+                background: rgba(255, 213, 79, 0.35);
+                color: inherit;
+                border-radius: 2px;
+                padding: 0 1px;
+            }
+
             /* Footer Input */
             .edwin-footer {
                 display: flex;
@@ -1957,8 +2154,20 @@ const ExplainThisPage = {
         typingDiv.innerHTML = '<span></span><span></span><span></span>';
         document.getElementById('edwin-messages').appendChild(typingDiv);
 
-        // Send to backend
-        const result = await API.sendMessage(userToken, courseId, question);
+        // Stream the answer from the backend; the typing indicator stays until the first token
+        let streamingMessage = null;
+        let result = await API.sendMessageStream(userToken, courseId, question, (text) => {
+            if (!streamingMessage) {
+                typingDiv.remove();
+                streamingMessage = UI.startStreamingMessage();
+            }
+            streamingMessage.append(text);
+        });
+
+        // Older backend without the streaming endpoint
+        if (result.unsupported) {
+            result = await API.sendMessage(userToken, courseId, question);
+        }
 
         // Remove typing indicator
         typingDiv.remove();
@@ -1967,7 +2176,11 @@ const ExplainThisPage = {
             const data = result.data;
             const grounded = data.citations && data.citations.length > 0;
 
-            UI.addMessage('edwin', data.answer, data.citations, grounded);
+            if (streamingMessage) {
+                streamingMessage.finish(data.citations, grounded);
+            } else {
+                UI.addMessage('edwin', data.answer, data.citations, grounded);
+            }
         } else {
             UI.showError(result.error || 'Failed to get response');
         }
@@ -2036,7 +2249,7 @@ const ExplainThisPage = {
             return null;
         }
 
-        const result = await API.generateQuiz(courseId, topic, difficulty, numQuestions);
+        const result = await API.generateQuiz(userToken, courseId, topic, difficulty, numQuestions);
 
         if (result.success) {
             // Load progress after quiz generation
@@ -2049,13 +2262,67 @@ const ExplainThisPage = {
     }
 
     /**
-     * Log quiz attempt
+     * Generate quiz progressively: onQuestions(newQuestions, state) is called as questions
+     * become available, so the first can be shown while the rest are generated.
+     * Resolves with the whole quiz, like generateQuiz.
+     */
+    async function startQuiz(topic, difficulty, numQuestions, onQuestions) {
+        if (!backendOnline) {
+            UI.showError('Backend is offline');
+            return null;
+        }
+
+        if (!courseId) {
+            UI.showError('Please navigate to a Canvas course page');
+            return null;
+        }
+
+        const started = await API.startQuizSession(userToken, courseId, topic, difficulty, numQuestions);
+        if (!started.success) {
+            // Backends without quiz sessions: the whole quiz in one request
+            const data = await generateQuiz(topic, difficulty, numQuestions);
+            if (data && data.quiz && onQuestions) {
+                onQuestions(data.quiz.questions, { status: 'complete', next: data.quiz.questions.length });
+            }
+            return data;
+        }
+
+        const questions = [];
+        let state = null;
+        do {
+            const result = await API.pollQuizSession(started.data.sessionId, questions.length);
+            if (!result.success) {
+                UI.showError(result.error || 'Failed to generate quiz');
+                return null;
+            }
+            state = result.data;
+            if (state.questions.length) {
+                questions.push(...state.questions);
+                if (onQuestions) onQuestions(state.questions, state);
+            }
+        } while (state.status === 'generating');
+
+        if (!questions.length) {
+            UI.showError(state.message || 'Failed to generate quiz');
+            return null;
+        }
+
+        await loadProgress();
+        return {
+            success: true,
+            message: state.message,
+            quiz: { title: state.title, description: state.description, questions }
+        };
+    }
+
+    /**
+     * Log quiz attempt (questionId: set on questions served from the quiz bank)
      */
-    function logQuizAttempt(question, quizTitle, selectedOption, correctOption, isCorrect) {
+    function logQuizAttempt(question, quizTitle, selectedOption, correctOption, isCorrect, questionId) {
         if (!userToken) return;
 
         // Fire-and-forget
-        API.logQuizAttempt(userToken, question, quizTitle, selectedOption, correctOption, isCorrect);
+        API.logQuizAttempt(userToken, courseId, question, quizTitle, selectedOption, correctOption, isCorrect, questionId);
 
         // Reload progress after short delay
         setTimeout(() => loadProgress(), 1000);
@@ -2132,6 +2399,7 @@ const ExplainThisPage = {
         sendMessage,
         syncCurrentPage,
         generateQuiz,
+        startQuiz,
         logQuizAttempt,
         checkBackendHealth,
         getState: () => ({ userToken, courseId, backendOnline })
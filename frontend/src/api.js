@@ -63,6 +63,90 @@ const API = {
         });
     },
 
+    /**
+     * Send message to Edwin AI and receive the answer as it is generated.
+     * onToken(text) is called for each piece of the answer; resolves like request()
+     * with data = the same final record /api/sendMessage returns.
+     * unsupported: true means the backend has no streaming endpoint (fall back to sendMessage).
+     */
+    async sendMessageStream(userToken, courseId, question, onToken) {
+        const controller = new AbortController();
+        let idleTimer = setTimeout(() => controller.abort(), CONFIG.TIMEOUT.STREAM_IDLE);
+        const resetIdle = () => {
+            clearTimeout(idleTimer);
+            idleTimer = setTimeout(() => controller.abort(), CONFIG.TIMEOUT.STREAM_IDLE);
+        };
+
+        try {
+            const response = await fetch(`${CONFIG.BACKEND_BASE_URL}${CONFIG.API.SEND_MESSAGE_STREAM}`, {
+                method: 'POST',
+                signal: controller.signal,
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    userID: userToken,
+                    courseID: courseId,
+                    question: question
+                })
+            });
+
+            if (response.status === 404 || response.status === 405) {
+                return { success: false, unsupported: true, error: 'Streaming not supported' };
+            }
+            if (!response.ok) {
+                const data = await response.json().catch(() => ({}));
+                return { success: false, error: data.message || `HTTP ${response.status}` };
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let final = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                resetIdle();
+                buffer += decoder.decode(value, { stream: true });
+
+                // Server-sent events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let event = 'message';
+                    let data = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    if (!data) continue;
+
+                    const payload = JSON.parse(data);
+                    if (event === 'token') {
+                        onToken(payload.text);
+                    } else if (event === 'done') {
+                        final = payload;
+                    } else if (event === 'error') {
+                        return { success: false, error: payload.message };
+                    }
+                }
+            }
+
+            if (!final) {
+                return { success: false, error: 'Stream ended before the answer completed' };
+            }
+            return { success: true, data: final };
+        } catch (error) {
+            if (error.name === 'AbortError') {
+                return { success: false, error: 'Request timeout - backend may be offline' };
+            }
+            return { success: false, error: error.message };
+        } finally {
+            clearTimeout(idleTimer);
+        }
+    },
+
     /**
      * Sync page content to backend
      */
@@ -83,11 +167,28 @@ const API = {
     /**
      * Generate quiz
      */
-    async generateQuiz(courseId, topic, difficulty, numQuestions) {
+    async generateQuiz(userToken, courseId, topic, difficulty, numQuestions) {
         return this.request(CONFIG.API.GENERATE_QUIZ, {
             method: 'POST',
             timeout: CONFIG.TIMEOUT.QUIZ_GENERATION,
             body: JSON.stringify({
+                userID: userToken,
+                courseID: courseId,
+                topic: topic,
+                difficulty: difficulty,
+                numQuestions: numQuestions
+            })
+        });
+    },
+
+    /**
+     * Start a progressive quiz: resolves with data.sessionId while the questions are generated
+     */
+    async startQuizSession(userToken, courseId, topic, difficulty, numQuestions) {
+        return this.request(CONFIG.API.QUIZ_SESSION, {
+            method: 'POST',
+            body: JSON.stringify({
+                userID: userToken,
                 courseID: courseId,
                 topic: topic,
                 difficulty: difficulty,
@@ -96,21 +197,34 @@ const API = {
         });
     },
 
+    /**
+     * Long-poll a quiz session for the questions after the first `after` ones
+     * (data: { status, questions, next, total, title, description, ... })
+     */
+    async pollQuizSession(sessionId, after, wait = 20) {
+        return this.request(`${CONFIG.API.QUIZ_SESSION}/${sessionId}?after=${after}&wait=${wait}`, {
+            method: 'GET',
+            timeout: CONFIG.TIMEOUT.QUIZ_POLL
+        });
+    },
+
     /**
      * Log quiz attempt (fire-and-forget)
      */
-    logQuizAttempt(userToken, question, quizTitle, selectedOption, correctOption, isCorrect) {
+    logQuizAttempt(userToken, courseId, question, quizTitle, selectedOption, correctOption, isCorrect, questionId) {
         // Non-blocking - don't wait for response
         fetch(`${CONFIG.BACKEND_BASE_URL}${CONFIG.API.QUIZ_ATTEMPT}`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 userID: userToken,
+                courseID: courseId,
                 question: question,
                 quizTitle: quizTitle,
                 selectedOption: selectedOption,
                 correctOption: correctOption,
-                isCorrect: isCorrect
+                isCorrect: isCorrect,
+                questionId: questionId
             })
         }).catch(error => console.error('Failed to log quiz attempt:', error));
     },
@@ -8,7 +8,9 @@ const CONFIG = {
         HEALTH: '/api/health',
         NEW_CONVERSATION: '/api/newConversation',
         SEND_MESSAGE: '/api/sendMessage',
+        SEND_MESSAGE_STREAM: '/api/sendMessage/stream',
         GENERATE_QUIZ: '/api/generateQuiz',
+        QUIZ_SESSION: '/api/quizSession',
         SYNC_PAGE_CONTENT: '/api/syncPageContent',
         QUIZ_ATTEMPT: '/api/quizAttempt',
         PROGRESS: '/api/progress',
@@ -34,7 +36,9 @@ const CONFIG = {
     // API timeouts
     TIMEOUT: {
         DEFAULT: 10000,  // 10 seconds
+        STREAM_IDLE: 30000,  // 30 seconds without a streamed event
         QUIZ_GENERATION: 30000,  // 30 seconds
+        QUIZ_POLL: 25000,  // 25 seconds (the server holds a poll for up to 20)
         PAGE_SYNC: 15000  // 15 seconds
     },
 
@@ -115,8 +115,20 @@
         typingDiv.innerHTML = '<span></span><span></span><span></span>';
         document.getElementById('edwin-messages').appendChild(typingDiv);
 
-        // Send to backend
-        const result = await API.sendMessage(userToken, courseId, question);
+        // Stream the answer from the backend; the typing indicator stays until the first token
+        let streamingMessage = null;
+        let result = await API.sendMessageStream(userToken, courseId, question, (text) => {
+            if (!streamingMessage) {
+                typingDiv.remove();
+                streamingMessage = UI.startStreamingMessage();
+            }
+            streamingMessage.append(text);
+        });
+
+        // Older backend without the streaming endpoint
+        if (result.unsupported) {
+            result = await API.sendMessage(userToken, courseId, question);
+        }
 
         // Remove typing indicator
         typingDiv.remove();
@@ -125,7 +137,11 @@
             const data = result.data;
             const grounded = data.citations && data.citations.length > 0;
 
-            UI.addMessage('edwin', data.answer, data.citations, grounded);
+            if (streamingMessage) {
+                streamingMessage.finish(data.citations, grounded);
+            } else {
+                UI.addMessage('edwin', data.answer, data.citations, grounded);
+            }
         } else {
             UI.showError(result.error || 'Failed to get response');
         }
@@ -194,7 +210,7 @@
             return null;
         }
 
-        const result = await API.generateQuiz(courseId, topic, difficulty, numQuestions);
+        const result = await API.generateQuiz(userToken, courseId, topic, difficulty, numQuestions);
 
         if (result.success) {
             // Load progress after quiz generation
@@ -207,13 +223,67 @@
     }
 
     /**
-     * Log quiz attempt
+     * Generate quiz progressively: onQuestions(newQuestions, state) is called as questions
+     * become available, so the first can be shown while the rest are generated.
+     * Resolves with the whole quiz, like generateQuiz.
+     */
+    async function startQuiz(topic, difficulty, numQuestions, onQuestions) {
+        if (!backendOnline) {
+            UI.showError('Backend is offline');
+            return null;
+        }
+
+        if (!courseId) {
+            UI.showError('Please navigate to a Canvas course page');
+            return null;
+        }
+
+        const started = await API.startQuizSession(userToken, courseId, topic, difficulty, numQuestions);
+        if (!started.success) {
+            // Backends without quiz sessions: the whole quiz in one request
+            const data = await generateQuiz(topic, difficulty, numQuestions);
+            if (data && data.quiz && onQuestions) {
+                onQuestions(data.quiz.questions, { status: 'complete', next: data.quiz.questions.length });
+            }
+            return data;
+        }
+
+        const questions = [];
+        let state = null;
+        do {
+            const result = await API.pollQuizSession(started.data.sessionId, questions.length);
+            if (!result.success) {
+                UI.showError(result.error || 'Failed to generate quiz');
+                return null;
+            }
+            state = result.data;
+            if (state.questions.length) {
+                questions.push(...state.questions);
+                if (onQuestions) onQuestions(state.questions, state);
+            }
+        } while (state.status === 'generating');
+
+        if (!questions.length) {
+            UI.showError(state.message || 'Failed to generate quiz');
+            return null;
+        }
+
+        await loadProgress();
+        return {
+            success: true,
+            message: state.message,
+            quiz: { title: state.title, description: state.description, questions }
+        };
+    }
+
+    /**
+     * Log quiz attempt (questionId: set on questions served from the quiz bank)
      */
-    function logQuizAttempt(question, quizTitle, selectedOption, correctOption, isCorrect) {
+    function logQuizAttempt(question, quizTitle, selectedOption, correctOption, isCorrect, questionId) {
         if (!userToken) return;
 
         // Fire-and-forget
-        API.logQuizAttempt(userToken, question, quizTitle, selectedOption, correctOption, isCorrect);
+        API.logQuizAttempt(userToken, courseId, question, quizTitle, selectedOption, correctOption, isCorrect, questionId);
 
         // Reload progress after short delay
         setTimeout(() => loadProgress(), 1000);
@@ -290,6 +360,7 @@
         sendMessage,
         syncCurrentPage,
         generateQuiz,
+        startQuiz,
         logQuizAttempt,
         checkBackendHealth,
         getState: () => ({ userToken, courseId, backendOnline })
@@ -244,6 +244,13 @@ const EdwinTemplate = {
                 color: var(--text-muted);
             }
 
+            .citation-highlight {
+                background: rgba(255, 213, 79, 0.35);
+                color: inherit;
+                border-radius: 2px;
+                padding: 0 1px;
+            }
+
             /* Footer Input */
             .edwin-footer {
                 display: flex;
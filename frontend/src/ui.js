@@ -27,24 +27,7 @@ const UI = {
         if (sender === 'user') {
             textSpan.textContent = text;
         } else if (sender === 'edwin') {
-            // Add grounded badge if applicable
-            if (citations && citations.length > 0) {
-                const badge = document.createElement('span');
-                badge.className = 'grounded-badge grounded';
-                badge.innerHTML = '✅ Grounded';
-                messageContent.insertBefore(badge, textSpan);
-            } else if (grounded === false) {
-                const badge = document.createElement('span');
-                badge.className = 'grounded-badge ungrounded';
-                badge.innerHTML = '⚠️ Ungrounded';
-                messageContent.insertBefore(badge, textSpan);
-
-                // Add suggestion to sync
-                const suggestion = document.createElement('div');
-                suggestion.className = 'sync-suggestion';
-                suggestion.innerHTML = '💡 Tip: Click "Sync This Page" in settings to ground Edwin with course materials';
-                messageContent.appendChild(suggestion);
-            }
+            this.addGroundedBadge(messageContent, textSpan, citations, grounded);
 
             // Typing animation
             let i = 0;
@@ -66,6 +49,69 @@ const UI = {
         }
     },
 
+    /**
+     * Add grounded / ungrounded badge to an Edwin message
+     */
+    addGroundedBadge(messageContent, textSpan, citations, grounded) {
+        if (citations && citations.length > 0) {
+            const badge = document.createElement('span');
+            badge.className = 'grounded-badge grounded';
+            badge.innerHTML = '✅ Grounded';
+            messageContent.insertBefore(badge, textSpan);
+        } else if (grounded === false) {
+            const badge = document.createElement('span');
+            badge.className = 'grounded-badge ungrounded';
+            badge.innerHTML = '⚠️ Ungrounded';
+            messageContent.insertBefore(badge, textSpan);
+
+            // Add suggestion to sync
+            const suggestion = document.createElement('div');
+            suggestion.className = 'sync-suggestion';
+            suggestion.innerHTML = '💡 Tip: Click "Sync This Page" in settings to ground Edwin with course materials';
+            messageContent.appendChild(suggestion);
+        }
+    },
+
+    /**
+     * Start an Edwin message that is filled in as the answer streams.
+     * Returns { append(text), finish(citations, grounded) }
+     */
+    startStreamingMessage() {
+        const messagesContainer = document.getElementById('edwin-messages');
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message edwin';
+
+        const messageContent = document.createElement('div');
+        messageContent.className = 'message-content';
+
+        const textSpan = document.createElement('span');
+        textSpan.className = 'message-text';
+
+        messageContent.appendChild(textSpan);
+        messageDiv.appendChild(messageContent);
+        if (messagesContainer) {
+            messagesContainer.appendChild(messageDiv);
+        }
+
+        const scroll = () => {
+            if (messagesContainer) messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        };
+
+        return {
+            append: (text) => {
+                textSpan.textContent += text;
+                scroll();
+            },
+            finish: (citations, grounded) => {
+                this.addGroundedBadge(messageContent, textSpan, citations, grounded);
+                if (citations && citations.length > 0) {
+                    messageContent.appendChild(this.renderCitations(citations));
+                }
+                scroll();
+            }
+        };
+    },
+
     /**
      * Render citations block
      */
@@ -77,9 +123,9 @@ const UI = {
             <div class="citations-header">📚 Sources:</div>
             ${citations.map((cite, idx) => `
                 <div class="citation-item">
-                    <strong>${idx + 1}. ${cite.title || 'Source'}</strong>
+                    <strong>${idx + 1}. ${cite.title || 'Source'}${this.citationPage(cite)}</strong>
                     ${cite.url ? `<br><a href="${cite.url}" target="_blank" class="citation-link">View source →</a>` : ''}
-                    ${cite.snippet ? `<div class="citation-snippet">${cite.snippet}</div>` : ''}
+                    ${cite.snippet ? `<div class="citation-snippet">${this.citationSnippet(cite)}</div>` : ''}
                 </div>
             `).join('')}
         `;
@@ -87,6 +133,32 @@ const UI = {
         return citationsDiv;
     },
 
+    /**
+     * Citation snippet as HTML, with the question's terms (cite.highlights) marked
+     */
+    citationSnippet(cite) {
+        const escape = (text) => text
+            .replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+        const snippet = cite.snippet;
+        let html = '';
+        let last = 0;
+        for (const [start, end] of cite.highlights || []) {
+            if (start < last || end > snippet.length) continue;
+            html += escape(snippet.slice(last, start));
+            html += `<mark class="citation-highlight">${escape(snippet.slice(start, end))}</mark>`;
+            last = end;
+        }
+        return html + escape(snippet.slice(last));
+    },
+
+    /**
+     * Page label for a citation (slides are already titled "Slide N")
+     */
+    citationPage(cite) {
+        if (!cite.page || /^Slide \d+$/.test(cite.title || '')) return '';
+        return ` (p. ${cite.page})`;
+    },
+
     /**
      * Show status message in sync section
      */